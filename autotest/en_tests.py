@@ -136,6 +136,163 @@ def obs_gauss_draw_consistency_test():
         d = (oe - oe_org).apply(np.abs)
         assert d.max().max() < 1.0e-10,d.max().sort_values(ascending=False)
 
+def chunked_binary_test():
+    pst = pyemu.Pst(os.path.join("pst", "pest.pst"))
+    num_reals = 23
+    oe = pyemu.ObservationEnsemble.from_gaussian_draw(pst, num_reals=num_reals, fill=True)
+    fname = os.path.join("temp", "test.ens")
+    for dtype, compress, tol in [(np.float64, False, 1.0e-10), (np.float32, True, 1.0e-4)]:
+        oe.to_chunked_binary(fname, dtype=dtype, compress=compress, col_chunk=7)
+        oe1 = pyemu.ObservationEnsemble.from_chunked_binary(pst, fname)
+        assert list(oe1.index) == list(oe.index)
+        assert list(oe1.columns) == list(oe.columns)
+        d = ((oe1 - oe) / oe._df.abs().max()).apply(np.abs)
+        assert d.max().max() < tol, d.max().max()
+
+        cols = list(oe.columns[::-5])
+        reals = list(oe.index[3:9])
+        oe2 = pyemu.ObservationEnsemble.from_chunked_binary(pst, fname, columns=cols, reals=reals)
+        assert list(oe2.columns) == cols
+        assert list(oe2.index) == reals
+        d = ((oe2._df - oe._df.loc[reals, cols]) / oe._df.loc[:, cols].abs().max()).apply(np.abs)
+        assert d.max().max() < tol
+
+    oe_app = oe.copy()
+    oe_app._df.index = ["app_{0}".format(i) for i in range(num_reals)]
+    oe_app._df = oe_app._df.loc[:, oe.columns[::-1]]
+    oe_app.to_chunked_binary(fname, append=True)
+    ef = pyemu.en.ChunkedEnsembleFile(fname)
+    assert ef.shape == (2 * num_reals, oe.shape[1])
+    df = ef.read(reals=["app_3", 3], columns=cols)
+    d = (df.iloc[0, :] - df.iloc[1, :]).apply(np.abs)
+    assert d.max() == 0.0
+    nreal = 0
+    for batch in ef.iter_reals(batch_size=10):
+        nreal += batch.shape[0]
+    assert nreal == 2 * num_reals
+
+    # blocks tiled over realizations too
+    oe.to_chunked_binary(fname, col_chunk=7, real_chunk=5)
+    oe_app.to_chunked_binary(fname, append=True)
+    ef = pyemu.en.ChunkedEnsembleFile(fname)
+    assert ef.real_chunk == 5
+    assert ef.blocks[:, 1].max() == 5
+    assert ef.blocks.shape[0] == 2 * int(np.ceil(num_reals / 5.)) * int(np.ceil(oe.shape[1] / 7.))
+    df = ef.read(reals=["app_3", 3, 21], columns=cols)
+    assert np.array_equal(df.iloc[:2, :].values, oe._df.loc[[3, 3], cols].values)
+    assert np.array_equal(df.iloc[2, :].values, oe._df.loc[21, cols].values)
+    df = ef.read()
+    assert np.array_equal(df.values[:num_reals, :], oe._df.values)
+
+    # realization names must be unique
+    df = pd.DataFrame(np.arange(6, dtype=float).reshape(3, 2), columns=["a", "b"])
+    ef = pyemu.en.ChunkedEnsembleFile.write(fname, df, real_chunk=2)
+    for bad in [df + 100, df.iloc[[1], :].rename(index=str)]:
+        try:
+            ef.append(bad)
+        except Exception as e:
+            assert "duplicate" in str(e)
+        else:
+            raise Exception("should have failed")
+    assert ef.shape == (3, 2)
+    try:
+        pyemu.en.ChunkedEnsembleFile.write(fname, pd.concat([df, df + 100]))
+    except Exception as e:
+        assert "duplicate" in str(e)
+    else:
+        raise Exception("should have failed")
+    app = df + 100
+    app.index = [3, 4, 5]
+    ef.append(app)
+    batches = list(ef.iter_reals(batch_size=4))
+    assert [b.shape[0] for b in batches] == [4, 2]
+    allv = pd.concat(batches)
+    assert list(allv.index) == [0, 1, 2, 3, 4, 5]
+    assert np.array_equal(allv.values, np.vstack([df.values, df.values + 100]))
+
+    # a container with duplicate names (as written by earlier versions) is
+    # iterated by position and ambiguous names can't be read
+    ef = pyemu.en.ChunkedEnsembleFile.write(fname, df, real_chunk=2)
+    with open(fname, "r+b") as f:
+        f.seek(ef.index_offset)
+        blocks = ef.blocks.tolist() + ef._write_blocks(f, df.values + 100, 3, ef.real_chunk,
+                                                       ef.col_chunk, ef.dtype, ef.compress)
+        ef._write_index(f, ef.columns, ef.real_names + [0, 1, 2], ef.dtype, ef.compress,
+                        ef.real_chunk, ef.col_chunk, blocks)
+    ef = pyemu.en.ChunkedEnsembleFile(fname)
+    allv = pd.concat(list(ef.iter_reals(batch_size=3)))
+    assert allv.shape == (6, 2)
+    assert np.array_equal(allv.values, np.vstack([df.values, df.values + 100]))
+    try:
+        ef.read(reals=[0])
+    except Exception as e:
+        assert "not unique" in str(e)
+    else:
+        raise Exception("should have failed")
+
+
+def seeded_draw_test():
+    pst = pyemu.Pst(os.path.join("pst", "pest.pst"))
+    num_reals = 600
+    cov = pyemu.Cov.from_parameter_data(pst).to_2d()
+    how = {p: ["uniform", "triangular", "gaussian"][i % 3] for i, p in enumerate(pst.adj_par_names)}
+    draws = [lambda **kw: pyemu.ParameterEnsemble.from_gaussian_draw(pst, num_reals=num_reals, **kw),
+             lambda **kw: pyemu.ParameterEnsemble.from_gaussian_draw(pst, cov=cov, num_reals=num_reals, **kw),
+             lambda **kw: pyemu.ParameterEnsemble.from_uniform_draw(pst, num_reals=num_reals, **kw),
+             lambda **kw: pyemu.ParameterEnsemble.from_triangular_draw(pst, num_reals=num_reals, **kw),
+             lambda **kw: pyemu.ParameterEnsemble.from_mixed_draws(pst, how, num_reals=num_reals, **kw),
+             lambda **kw: pyemu.ObservationEnsemble.from_gaussian_draw(pst, num_reals=num_reals, **kw)]
+    for draw in draws:
+        pe1 = draw(seed=1234)
+        pe2 = draw(seed=np.random.SeedSequence(1234), num_threads=3)
+        pe3 = draw(seed=4321, num_threads=2)
+        assert pe1.shape[0] == num_reals
+        assert np.array_equal(pe1._df.values, pe2._df.values)
+        assert not np.array_equal(pe1._df.values, pe3._df.values)
+    # realization blocks do not depend on the total number of realizations
+    pe1 = pyemu.ParameterEnsemble.from_uniform_draw(pst, num_reals=num_reals, seed=99)
+    pe2 = pyemu.ParameterEnsemble.from_uniform_draw(pst, num_reals=pyemu.en.REAL_BLOCK_SIZE, seed=99)
+    assert np.array_equal(pe1._df.values[:pe2.shape[0], :], pe2._df.values)
+    pe1 = pyemu.ParameterEnsemble.from_uniform_draw(pst, num_reals=10, seed=np.random.default_rng(5))
+    pe2 = pyemu.ParameterEnsemble.from_uniform_draw(pst, num_reals=10, seed=np.random.default_rng(5))
+    assert np.array_equal(pe1._df.values, pe2._df.values)
+    # group sub-streams do not collide with the other streams, e.g. a group named "cov"
+    par = pst.parameter_data
+    par.loc[:, "pargp"] = "cov"
+    cov = pyemu.Cov.from_parameter_data(pst).to_2d()
+    pe1 = pyemu.ParameterEnsemble.from_gaussian_draw(pst, cov=cov, num_reals=10, seed=7)
+    pe2 = pyemu.ParameterEnsemble.from_gaussian_draw(pst, cov=cov, num_reals=10, seed=7,
+                                                     by_groups=False)
+    assert not np.allclose(pe1._df.values, pe2._df.values)
+
+
+def ensemble_res_stats_test():
+    pst = pyemu.Pst(os.path.join("pst", "pest.pst"))
+    num_reals = 25
+    oe = pyemu.ObservationEnsemble.from_gaussian_draw(pst, num_reals=num_reals, fill=True)
+    stats = pyemu.en_utils.ensemble_res_stats(oe, pst, quantiles=[0.1, 0.5, 0.9], batch_size=7)
+    assert np.abs(stats["phi"] - oe.phi_vector).max() < 1.0e-10
+
+    # each realization should match the single-residual stats from the pst
+    res_stats = pst.get_res_stats()
+    for real in oe.index[:3]:
+        pst.res.loc[oe.columns, "modelled"] = oe._df.loc[real, :].values
+        res_stats = pst.get_res_stats()
+        for sname in res_stats.index:
+            d = (res_stats.loc[sname, :] - stats[sname].loc[real, res_stats.columns]).apply(np.abs)
+            assert d.max() < 1.0e-10, sname
+    q = stats["quantiles"]
+    assert list(q.columns) == pst.nnz_obs_names
+    assert (q.loc[0.1, :] <= q.loc[0.9, :]).all()
+
+    fname = os.path.join("temp", "res_stats.ens")
+    oe.to_chunked_binary(fname, col_chunk=11)
+    fstats = pyemu.en_utils.ensemble_res_stats(fname, pst, quantiles=[0.1, 0.5, 0.9], batch_size=4)
+    for key in stats.keys():
+        d = np.abs(stats[key].values - fstats[key].values)
+        assert np.nanmax(d) < 1.0e-10, key
+
+
 def phi_vector_test():
     pst = pyemu.Pst(os.path.join("pst", "pest.pst"))
     num_reals = 10
@@ -443,6 +600,42 @@ def emp_cov_test():
     print(diff.max())
     assert diff.max() < 0.5,diff.max()
 
+def emp_cov_streaming_test():
+    import os
+    import numpy as np
+    import pyemu
+    pst = pyemu.Pst(os.path.join("pst", "pest.pst"))
+    num_reals = 50
+    pe = pyemu.ParameterEnsemble.from_gaussian_draw(pst, num_reals=num_reals)
+    pe.transform()
+    devs = pe._df.values - pe._df.values.mean(axis=0)
+    pe.back_transform()
+    truth = np.dot(devs.T, devs) / (num_reals - 1.0)
+    cov = pe.covariance_matrix()
+    assert np.abs(cov.x - truth).max() < 1.0e-10
+    cov = pe.covariance_matrix(batch_size=7)
+    assert np.abs(cov.x - truth).max() < 1.0e-10
+
+    loc = pyemu.Cov.identity_like(cov)
+    loc.x[0, 1] = 0.5
+    loc.x[1, 0] = 0.5
+    lcov = pe.covariance_matrix(localizer=loc, batch_size=9)
+    assert isinstance(lcov, pyemu.Cov)
+    assert np.abs(lcov.x - (truth * loc.x)).max() < 1.0e-10
+
+    acc = pe.covariance_accumulator(localizer=loc, batch_size=13)
+    acc.to_coo(os.path.join("temp", "loc_cov.jcb"))
+    lcov2 = pyemu.Cov.from_binary(os.path.join("temp", "loc_cov.jcb"))
+    assert lcov2.row_names == lcov.row_names
+    assert np.abs(lcov2.x - lcov.x).max() < 1.0e-10
+
+    cov = pe.covariance_matrix(center_on=pe.index[0], batch_size=11)
+    pe.transform()
+    devs = pe._df.values - pe._df.values[0, :]
+    pe.back_transform()
+    assert np.abs(cov.x - np.dot(devs.T, devs) / (num_reals - 1.0)).max() < 1.0e-10
+
+
 def factor_draw_test():
     import os
     import numpy as np
@@ -565,6 +565,40 @@ def csv_to_ins_test():
                                             only_cols="col",only_rows="row")
     assert len(names) == df.shape[0] * df.shape[1]
 
+    # the output reader that pairs with the instruction file
+    df = pd.DataFrame(np.random.random((25,8)),columns=cnames[:8],
+                      index=["row{0}".format(i % 7) for i in range(25)])
+    csv_file = os.path.join("temp", "temp.csv")
+    ins_file = csv_file + ".ins"
+    df.to_csv(csv_file)
+    names = pyemu.pst_utils.csv_to_ins_file(csv_file,only_cols=cnames[1:4],
+                                            only_rows=["row2","row5"],chunk_size=6)
+    assert os.path.exists(ins_file + ".plan.npz")
+    i = pyemu.pst_utils.InstructionFile(ins_file)
+    ins_df = i.read_output_file(csv_file)
+    csv_df = pyemu.pst_utils.read_csv_output_file(ins_file,csv_file)
+    assert list(csv_df.index) == list(ins_df.index)
+    assert np.array_equal(csv_df.obsval.values,ins_df.obsval.values)
+    assert np.allclose(csv_df.loc[names.obsnme,"obsval"].values,names.obsval.values)
+
+    pst = pyemu.Pst.from_io_files(ins_files=[ins_file],out_files=[csv_file],
+                                  tpl_files=[],in_files=[])
+    df.loc[:,:] = np.random.random(df.shape)
+    df.to_csv(csv_file)
+    pst_df = pst.process_output_files()
+    assert np.array_equal(pst_df.loc[ins_df.index,"obsval"].values,
+                          pyemu.pst_utils.InstructionFile(ins_file).read_output_file(csv_file).obsval.values)
+
+    # a changed instruction file is no longer read with the plan
+    with open(ins_file,'a') as f:
+        f.write("l1\n")
+    try:
+        pyemu.pst_utils.read_csv_output_file(ins_file,csv_file)
+    except Exception:
+        pass
+    else:
+        raise Exception("should have failed")
+
 
 
 def lt_gt_constraint_names_test():
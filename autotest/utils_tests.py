@@ -130,6 +130,50 @@ def covariance_matrix_test():
     print(struct.covariance_matrix(pts.x,pts.y,names=pts.name).x)
 
 
+def covariance_matrix_blocked_test():
+    import os
+    import numpy as np
+    import pyemu
+
+    np.random.seed(0)
+    x = np.random.uniform(0,10000,500)
+    y = np.random.uniform(0,10000,500)
+    names = ["pt{0}".format(i) for i in range(x.shape[0])]
+    v1 = pyemu.geostats.ExpVario(contribution=1.0,a=2000,anisotropy=2.0,bearing=45.0)
+    v2 = pyemu.geostats.SphVario(contribution=0.5,a=3000)
+    gs = pyemu.geostats.GeoStruct(nugget=0.1,variograms=[v1,v2])
+
+    cov = gs.covariance_matrix(x,y,names)
+    # brute force check of a few entries
+    for i,j in [(0,0),(0,10),(123,456),(499,1)]:
+        c = gs.covariance(np.array([x[i],y[i]]),np.array([x[j],y[j]]))
+        if i != j:
+            c -= gs.nugget
+        assert np.abs(cov.x[i,j] - c) < 1.0e-10,(i,j,cov.x[i,j],c)
+
+    cov_tiled = gs.covariance_matrix(x,y,names,tile_size=77,num_threads=3)
+    assert np.abs(cov.x - cov_tiled.x).max() < 1.0e-12
+    vcov = v1.covariance_matrix(x,y,names)
+    assert np.abs(np.diag(vcov.x) - v1.contribution).max() < 1.0e-12
+
+    # passing cov accumulates into a copy, leaving the caller's cov unchanged
+    base = pyemu.Cov(x=np.ones((x.shape[0],x.shape[0])),names=names)
+    cov_sum = gs.covariance_matrix(x,y,cov=base)
+    assert np.abs(cov_sum.x - (cov.x + 1.0)).max() < 1.0e-12
+    assert (base.x == 1.0).all()
+    vcov_sum = v1.covariance_matrix(x,y,cov=base)
+    assert np.abs(vcov_sum.x - (vcov.x + 1.0)).max() < 1.0e-12
+    assert (base.x == 1.0).all()
+
+    if not os.path.exists("temp"):
+        os.mkdir("temp")
+    coo_file = os.path.join("temp","gs_cov.jcb")
+    gs.covariance_matrix_to_coo(x,y,names,coo_file,tile_size=100,num_threads=2)
+    cov_coo = pyemu.Cov.from_binary(coo_file)
+    assert cov_coo.row_names == names
+    assert np.abs(cov_coo.x - cov.x).max() < 1.0e-12
+
+
 def setup_ppcov_simple():
     import os
     import platform
@@ -247,10 +291,50 @@ def ppcov_complex_test():
 
 def pp_to_tpl_test():
     import os
+    import numpy as np
     import pyemu
     pp_file = os.path.join("utils","points1.dat")
     pp_df = pyemu.pp_utils.pilot_points_to_tpl(pp_file,name_prefix="test_")
     print(pp_df.columns)
+    # round trip through the pp and tpl files
+    d = os.path.join("temp", "pp_io")
+    if not os.path.exists(d):
+        os.makedirs(d)
+    pp_df.loc[:, "x"] *= 1.0e-5
+    new_pp_file = os.path.join(d, "points1.dat")
+    pyemu.pp_utils.write_pp_file(new_pp_file, pp_df)
+    df = pyemu.pp_utils.pp_file_to_dataframe(new_pp_file)
+    assert list(df.name) == list(pp_df.name.str.lower())
+    assert np.allclose(df.x.values, pp_df.x.values)
+    pyemu.pp_utils.pilot_points_to_tpl(df, new_pp_file + ".tpl", name_prefix="test_")
+    tpl_df = pyemu.pp_utils.pp_tpl_to_dataframe(new_pp_file + ".tpl")
+    assert list(tpl_df.parnme) == list(pp_df.parnme)
+    assert np.allclose(tpl_df.y.values, pp_df.y.values)
+
+
+def grid_pilot_points_test():
+    import numpy as np
+    from pyemu.utils.pp_utils import _grid_pilot_points
+    nrow, ncol, every_n_cell = 23, 17, 3
+    ycentergrid, xcentergrid = np.mgrid[nrow:0:-1, 0:ncol] + 0.5
+    ib = np.random.randint(0, 4, (nrow, ncol))
+    for use_ibound_zones in [True, False]:
+        pp_df = _grid_pilot_points(ib, xcentergrid, ycentergrid, 2, every_n_cell,
+                                   use_ibound_zones)
+        start = int(float(every_n_cell) / 2.0)
+        ipp = 0
+        for i in range(start, nrow - start, every_n_cell):
+            for j in range(start, ncol - start, every_n_cell):
+                if ib[i, j] == 0:
+                    continue
+                row = pp_df.iloc[ipp]
+                assert row["name"] == "pp_{0:04d}".format(ipp)
+                assert (row.i, row.j, row.k) == (i, j, 2)
+                assert (row.x, row.y) == (xcentergrid[i, j], ycentergrid[i, j])
+                assert row.zone == (ib[i, j] if use_ibound_zones else 1)
+                ipp += 1
+        assert ipp == pp_df.shape[0]
+    assert _grid_pilot_points(np.zeros((nrow, ncol)), xcentergrid, ycentergrid, 0) is None
 
 
 def tpl_to_dataframe_test():
@@ -422,6 +506,62 @@ def first_order_pearson_regul_test():
     assert sc.pst.control_data.pestmode == "regularization"
     sc.pst.write(os.path.join('temp','test.pst'))
 
+def first_order_pearson_tikhonov_test():
+    import os
+    import numpy as np
+    import pyemu
+    pst = pyemu.Pst(os.path.join("pst","pest.pst"))
+    pst.parameter_data.loc[pst.par_names[:10],"partrans"] = "fixed"
+    pst.parameter_data.loc[pst.par_names[10:20],"partrans"] = "none"
+    x = np.random.uniform(0,100,pst.npar)
+    y = np.random.uniform(0,100,pst.npar)
+    gs = pyemu.geostats.GeoStruct(variograms=pyemu.geostats.ExpVario(1.0,30.0))
+    names = pst.par_names[::-1]
+    cov = gs.covariance_matrix(x,y,names=names)
+    pyemu.helpers.zero_order_tikhonov(pst)
+    nzero = pst.prior_information.shape[0]
+    assert nzero == pst.npar_adj
+    pyemu.helpers.first_order_pearson_tikhonov(pst,cov,reset=False,abs_drop_tol=0.1,
+                                               tile_size=37)
+    assert pst.control_data.pestmode == "regularization"
+
+    # brute force the pairs
+    cc = cov.to_pearson().x
+    adj = set(pst.adj_par_names)
+    ptrans = pst.parameter_data.partrans.to_dict()
+    tname = lambda n: "log({0})".format(n) if ptrans[n] == "log" else n
+    eqs,weights = [],[]
+    for i,iname in enumerate(names):
+        for j in range(i + 1,len(names)):
+            jname = names[j]
+            if iname in adj and jname in adj and cc[i,j] >= 0.1:
+                eqs.append("1.0 * {0} - 1.0 * {1} = 0.0".format(tname(iname),tname(jname)))
+                weights.append(cc[i,j])
+    pi = pst.prior_information.iloc[nzero:]
+    assert pi.shape[0] == len(eqs)
+    assert list(pi.equation) == eqs
+    assert np.abs(pi.weight.values - np.array(weights)).max() < 1.0e-10
+    assert list(pi.pilbl) == ["pcc_{0}".format(i + nzero + 1) for i in range(len(eqs))]
+
+    # both control file versions round trip the equations
+    for version in [1,2]:
+        pst_file = os.path.join("temp","pcc_test_v{0}.pst".format(version))
+        pst.write(pst_file,version=version)
+        pst2 = pyemu.Pst(pst_file)
+        assert list(pst2.prior_information.equation.str.split().str.join(' ')) == \
+               list(pst.prior_information.equation.str.split().str.join(' '))
+        assert np.abs(pst2.prior_information.weight.values -
+                      pst.prior_information.weight.values).max() < 1.0e-8
+        pst2.rectify_pi()
+        assert pst2.prior_information.shape[0] == pst.prior_information.shape[0]
+
+    # equations of a newly-fixed parameter are dropped
+    pname = pst.adj_par_names[-1]
+    pst.parameter_data.loc[pname,"partrans"] = "fixed"
+    pst.rectify_pi()
+    assert pst.prior_information.names.apply(lambda x: pname not in x).all()
+
+
 def zero_order_regul_test():
     import os
     import pyemu
@@ -464,12 +604,12 @@ def  kl_test():
                                              basis_file=basis_file,
                                             prefixes=prefixes,islog=False)
 
-    basis = pyemu.Matrix.from_binary(basis_file)
-    basis = basis[:,:num_eig]
+    basis = pyemu.geostats.KrigeFactors.from_file(basis_file).to_sparse().toarray()
+    assert basis.shape == (ml.nrow * ml.ncol,num_eig)
     arr_tru = np.atleast_2d(arr_tru.flatten()).transpose()
-    proj = np.dot(basis.T.x,arr_tru)[:num_eig]
+    proj = np.dot(basis.T,arr_tru)[:num_eig]
     #proj.autoalign = False
-    back = np.dot(basis.x, proj)
+    back = np.dot(basis, proj)
 
     back = back.reshape(ml.nrow,ml.ncol)
     df.parval1 = proj
@@ -485,6 +625,81 @@ def  kl_test():
 
 
 
+def kl_eigen_basis_test():
+    import os
+    import numpy as np
+    import pandas as pd
+    import pyemu
+    v = pyemu.geostats.ExpVario(contribution=1.0,a=250.0,anisotropy=2.0,bearing=30.0)
+    gs = pyemu.geostats.GeoStruct(variograms=v,nugget=0.1)
+    nrow,ncol,num_eig = 23,31,20
+    x,y = np.meshgrid(np.arange(ncol) * 10.0 + 5.0,np.arange(nrow)[::-1] * 7.0 + 3.5)
+
+    # full eigen decomposition of the dense covariance matrix
+    cov = gs.covariance_matrix(x.ravel(),y.ravel(),
+                               names=["n{0}".format(i) for i in range(x.size)]).x
+    vals,vecs = np.linalg.eigh(cov)
+    vals = vals[::-1][:num_eig]
+    vecs = vecs[:,::-1][:,:num_eig]
+
+    # dense, FFT (regular grid) and iterative (points) solutions
+    bases = []
+    for xx,yy,dense_max in [(x,y,5000),(x,y,10),(x.ravel(),y.ravel(),10)]:
+        e,b = pyemu.helpers.kl_eigen_basis(gs,xx,yy,num_eig,dense_max=dense_max)
+        assert b.shape == (nrow * ncol,num_eig)
+        assert np.abs(e - vals).max() < 1.0e-8
+        assert np.abs(np.abs(b.T.dot(vecs)) - np.eye(num_eig)).max() < 1.0e-8
+        bases.append(b)
+    for b in bases[1:]:
+        assert np.abs(b - bases[0]).max() < 1.0e-8
+
+    # matrix-free operators for irregular points
+    np.random.seed(1)
+    px,py = np.random.uniform(0,500,800),np.random.uniform(0,300,800)
+    pnames = ["p{0}".format(i) for i in range(px.shape[0])]
+    pcov = gs.covariance_matrix(px,py,names=pnames).x
+    op = pyemu.helpers._tiled_cov_operator(gs,px,py,tile_size=150,num_threads=2)
+    assert np.abs(op.matmat(np.eye(px.shape[0])) - pcov).max() < 1.0e-10
+    v = np.random.standard_normal(px.shape[0])
+    assert np.abs(op.matvec(v) - pcov.dot(v)).max() < 1.0e-10
+    sgs = pyemu.geostats.GeoStruct(variograms=[pyemu.geostats.SphVario(contribution=1.0,a=60.0,
+                                                                       anisotropy=0.5,bearing=70.0),
+                                               pyemu.geostats.SphVario(contribution=0.5,a=30.0)],
+                                   nugget=0.1)
+    scov = sgs.covariance_matrix(px,py,names=pnames).x
+    sop = pyemu.helpers._irregular_cov_operator(sgs,px,py)
+    assert sop.nnz < scov.size / 4
+    assert np.abs(sop.toarray() - scov).max() < 1.0e-10
+    e,b = pyemu.helpers.kl_eigen_basis(sgs,px,py,num_eig,dense_max=10)
+    svals,svecs = np.linalg.eigh(scov)
+    assert np.abs(e - svals[::-1][:num_eig]).max() < 1.0e-8
+    assert np.abs(np.abs(b.T.dot(svecs[:,::-1][:,:num_eig])) - np.eye(num_eig)).max() < 1.0e-6
+
+    # the basis round trip through the binary file and kl_apply()
+    basis = bases[0]
+    names = ["eig_{0:04d}".format(i) for i in range(num_eig)]
+    basis_file = os.path.join("temp","kl.basis")
+    pyemu.helpers._eigen_basis_to_factors(nrow,ncol,basis,names).to_binary(basis_file)
+    kf = pyemu.geostats.KrigeFactors.from_file(basis_file)
+    assert np.abs(kf.to_sparse().toarray() - basis).max() < 1.0e-6
+
+    factors = {"hk":np.random.uniform(1,2,num_eig),"vka":np.random.uniform(1,2,num_eig - 5)}
+    par_names,vals = [],[]
+    for prefix,f in factors.items():
+        par_names.extend(["{0}{1:02d}".format(prefix,i) for i in range(f.shape[0])])
+        vals.extend(f)
+    df = pd.DataFrame({"name":par_names,"org_val":1.0,"new_val":vals})
+    par_file = os.path.join("temp","kl_pars.csv")
+    df.iloc[::-1].to_csv(par_file,index=False)
+    arr_files = {p:os.path.join("temp","kl_{0}.ref".format(p)) for p in factors.keys()}
+    pyemu.helpers.kl_apply(par_file,basis_file,arr_files,(nrow,ncol))
+    for prefix,f in factors.items():
+        arr = np.loadtxt(arr_files[prefix])
+        arr_tru = basis[:,:f.shape[0]].dot(f).reshape(nrow,ncol)
+        arr_tru[arr_tru < 1.0e-10] = 1.0e-10
+        assert np.abs(arr - arr_tru).max() < 1.0e-5 * np.abs(arr_tru).max()
+
+
 def ok_test():
     import os
     import pandas as pd
@@ -502,6 +717,194 @@ def ok_test():
         assert sum(kf.loc[i,"ifacts"]) == 1.0
     print(kf)
 
+
+def ok_neighbors_test():
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    np.random.seed(0)
+    num_pts = 200
+    pts_data = pd.DataFrame({"x":np.random.uniform(0,1000,num_pts),
+                             "y":np.random.uniform(0,1000,num_pts),
+                             "name":["p{0}".format(i) for i in range(num_pts)],
+                             "zone":np.random.randint(1,3,num_pts)})
+    v = pyemu.geostats.ExpVario(contribution=1.0,a=300,anisotropy=3.0,bearing=20.0)
+    gs = pyemu.geostats.GeoStruct(nugget=0.1,variograms=[v])
+    ok = pyemu.geostats.OrdinaryKrige(gs,pts_data)
+    x = np.random.uniform(0,1000,500)
+    y = np.random.uniform(0,1000,500)
+    x[5] = np.NaN
+
+    kf = ok.calc_factors(x,y,maxpts_interp=10,search_radius=150.0,pt_zone=2)
+    zpts = pts_data.loc[pts_data.zone==2,:]
+    for i in range(x.shape[0]):
+        if np.isnan(x[i]):
+            assert len(kf.inames[i]) == 0
+            continue
+        # brute-force neighbor search
+        dist = np.sqrt((zpts.x.values - x[i])**2 + (zpts.y.values - y[i])**2)
+        order = np.argsort(dist)[:10]
+        names = set(zpts.name.values[order][dist[order] <= 150.0])
+        assert set(kf.inames[i]) == names,i
+        if len(names) > 0:
+            assert np.abs(np.sum(kf.ifacts[i]) - 1.0) < 1.0e-10
+
+    kf_aniso = ok.calc_factors(x,y,maxpts_interp=10,aniso_search=True)
+    dxx,dyy = v._apply_rotation(pts_data.x.values - x[0],pts_data.y.values - y[0])
+    order = np.argsort(dxx**2 + dyy**2)[:10]
+    assert set(kf_aniso.inames[0]) == set(pts_data.name.values[order])
+
+
+def ok_batch_solve_test():
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    np.random.seed(1)
+    num_pts = 25
+    pts_data = pd.DataFrame({"x":np.random.uniform(0,1000,num_pts),
+                             "y":np.random.uniform(0,1000,num_pts),
+                             "name":["p{0}".format(i) for i in range(num_pts)]})
+    gs = pyemu.geostats.GeoStruct(nugget=0.05,variograms=[pyemu.geostats.GauVario(1.0,500),
+                                                         pyemu.geostats.SphVario(0.3,800)])
+    ok = pyemu.geostats.OrdinaryKrige(gs,pts_data)
+    x = np.random.uniform(0,1000,300)
+    y = np.random.uniform(0,1000,300)
+    x[0],y[0] = pts_data.x.values[3],pts_data.y.values[3]
+    # both unique neighbor sets (5 points) and a single shared set (all points)
+    for maxpts in [5,num_pts]:
+        kf = ok.calc_factors(x,y,maxpts_interp=maxpts)
+        assert list(kf.inames[0]) == ["p3"]
+        assert kf.err_var[0] == gs.nugget
+        for i in range(1,x.shape[0]):
+            names = list(kf.inames[i])
+            d = len(names) + 1
+            A = np.ones((d,d))
+            A[:-1,:-1] = ok.point_cov_df.loc[names,names].values
+            A[-1,-1] = 0.0
+            rhs = np.ones(d)
+            rhs[:-1] = gs.covariance_points(x[i],y[i],ok.point_data.loc[names,"x"].values,
+                                            ok.point_data.loc[names,"y"].values)
+            facs = np.linalg.solve(A,rhs)
+            assert np.abs(facs[:-1] - kf.ifacts[i]).max() < 1.0e-8
+            err_var = gs.sill + facs[-1] - np.dot(facs[:-1],rhs[:-1])
+            assert np.abs(err_var - kf.err_var[i]) < 1.0e-8
+
+    # chunked, shared-memory workers
+    kf_mp = ok.calc_factors(x,y,maxpts_interp=5,num_threads=2)
+    kf = ok.calc_factors(x,y,maxpts_interp=5)
+    assert np.abs(kf.err_var.values - kf_mp.err_var.values).max() < 1.0e-12
+    for n1,n2,f1,f2 in zip(kf.inames,kf_mp.inames,kf.ifacts,kf_mp.ifacts):
+        assert list(n1) == list(n2)
+        assert np.abs(np.array(f1) - np.array(f2)).max() < 1.0e-12
+
+    # duplicate point locations give a singular system
+    pts_data = pd.DataFrame({"x":[0.0,0.0,10.0],"y":[0.0,0.0,0.0],"name":["a","b","c"]})
+    gs = pyemu.geostats.GeoStruct(variograms=[pyemu.geostats.ExpVario(1.0,10)])
+    ok = pyemu.geostats.OrdinaryKrige(gs,pts_data)
+    kf = ok.calc_factors([5.0,20.0],[1.0,1.0],forgive=True)
+    assert kf.err_var.isnull().all()
+    try:
+        ok.calc_factors([5.0],[1.0])
+    except Exception:
+        pass
+    else:
+        raise Exception("should have failed")
+
+
+def krige_factors_test():
+    import os
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    class GridRef(object):
+        # the parts of a flopy SpatialReference used by calc_factors_grid()
+        def __init__(self,nrow,ncol,delta):
+            self.nrow,self.ncol = nrow,ncol
+            self.xcentergrid,self.ycentergrid = np.meshgrid(np.arange(ncol) * delta + delta / 2.0,
+                                                            (np.arange(nrow) * delta + delta / 2.0)[::-1])
+    if not os.path.exists("temp"):
+        os.mkdir("temp")
+    np.random.seed(2)
+    num_pts = 40
+    sr = GridRef(30,40,10.0)
+    pp_df = pd.DataFrame({"name":["pp{0}".format(i) for i in range(num_pts)],
+                          "x":np.random.uniform(0,400,num_pts),
+                          "y":np.random.uniform(0,300,num_pts),
+                          "zone":np.random.randint(1,3,num_pts),
+                          "parval1":np.random.uniform(0.5,5.0,num_pts)})
+    pp_df.index = pp_df.name
+    zone_array = np.ones((sr.nrow,sr.ncol),dtype=int)
+    zone_array[:15,:] = 2
+    zone_array[:3,:3] = 0
+    gs = pyemu.geostats.GeoStruct(nugget=0.1,variograms=[pyemu.geostats.ExpVario(1.0,150)],
+                                  transform="log")
+    ok = pyemu.geostats.OrdinaryKrige(gs,pp_df)
+    bin_file = os.path.join("temp","ok_factors.bin")
+    txt_file = os.path.join("temp","ok_factors.dat")
+    ok.calc_factors_grid(sr,zone_array=zone_array,maxpts_interp=8,factors_file=bin_file)
+    ok.to_grid_factors_file(txt_file)
+    pp_file = os.path.join("temp","ok_factors_pp.dat")
+    pyemu.pp_utils.write_pp_file(pp_file,pp_df)
+
+    # brute force interpolation from interp_data
+    pp_log = np.log10(pp_df.parval1)
+    arr = np.zeros(sr.nrow * sr.ncol) + 1.0e+30
+    for inode,names,facts in zip(ok.interp_data.index,ok.interp_data.inames,ok.interp_data.ifacts):
+        if len(facts) > 0:
+            arr[inode] = 10**np.sum(pp_log.loc[names].values * np.array(facts))
+    arr = arr.reshape(sr.nrow,sr.ncol)
+    assert arr[0,0] == 1.0e+30
+
+    for fac_file,tol in [(txt_file,1.0e-6),(bin_file,1.0e-5)]:
+        kf = pyemu.geostats.KrigeFactors.from_file(fac_file)
+        assert kf.nrow == sr.nrow and kf.ncol == sr.ncol
+        arr2 = pyemu.geostats.fac2real(pp_file,fac_file,out_file=None)
+        assert np.abs((arr2 - arr) / arr).max() < tol,fac_file
+    # pilot points are matched by name, not position
+    rev_file = os.path.join("temp","ok_factors_pp_rev.dat")
+    pyemu.pp_utils.write_pp_file(rev_file,pp_df.iloc[::-1])
+    arr2 = pyemu.geostats.fac2real(rev_file,txt_file,out_file=None)
+    assert np.abs((arr2 - arr) / arr).max() < 1.0e-6
+    # a truncated factor line is an error
+    with open(txt_file) as f:
+        lines = f.readlines()
+    bad_file = os.path.join("temp","ok_factors_bad.dat")
+    with open(bad_file,'w') as f:
+        f.writelines(lines[:-1] + [" ".join(lines[-1].split()[:-1]) + "\n"])
+    try:
+        pyemu.geostats.KrigeFactors.from_text(bad_file)
+    except Exception as e:
+        assert "incomplete" in str(e)
+    else:
+        raise Exception("should have failed")
+    # exact factors survive a float64 binary round trip
+    kf = ok.get_grid_factors()
+    kf.to_binary(bin_file,dtype=np.float64)
+    kf2 = pyemu.geostats.KrigeFactors.from_binary(bin_file)
+    assert np.array_equal(kf.indptr,kf2.indptr)
+    assert np.array_equal(kf.indices,kf2.indices)
+    assert np.array_equal(kf.weights,kf2.weights)
+    assert kf2.point_names == list(pp_df.name)
+    assert os.path.getsize(bin_file) < os.path.getsize(txt_file)
+
+    # several pilot point files sharing one factors file in one pass
+    pp_files,out_files = [],[]
+    for i in range(3):
+        pp_df.loc[:,"parval1"] = np.random.uniform(0.5,5.0,num_pts)
+        pp_files.append(os.path.join("temp","ok_factors_pp{0}.dat".format(i)))
+        out_files.append(os.path.join("temp","ok_factors_pp{0}.ref".format(i)))
+        pyemu.pp_utils.write_pp_file(pp_files[-1],pp_df)
+    arrs = pyemu.geostats.fac2real(pp_files,bin_file,out_file=None)
+    pyemu.geostats.fac2real(pp_files,bin_file,out_file=out_files)
+    for pp_file,out_file,arr in zip(pp_files,out_files,arrs):
+        arr1 = pyemu.geostats.fac2real(pp_file,bin_file,out_file=None)
+        assert np.abs((arr1 - arr) / arr).max() < 1.0e-12
+        assert np.abs((np.loadtxt(out_file) - arr) / arr).max() < 1.0e-6
+
+
 def ok_grid_test():
 
     try:
@@ -629,28 +1032,71 @@ def ppk2fac_verf_test():
 def mflist_budget_test():
     import pyemu
     import os
-    try:
-        import flopy
-    except:
-        print("no flopy...")
-        return
-    model_ws = os.path.join("..","examples","Freyberg_transient")
-    ml = flopy.modflow.Modflow.load("freyberg.nam",model_ws=model_ws,check=False,load_only=[])
-    list_filename = os.path.join(model_ws,"freyberg.list")
+    import numpy as np
+    import pandas as pd
+    d = os.path.join("temp", "mflist")
+    if not os.path.exists(d):
+        os.makedirs(d)
+    # flux.dat and vol.dat were written by the flopy-based version
+    model_ws = os.path.join("da", "freyberg", "daily_template")
+    list_filename = os.path.join(model_ws, "freyberg_transient.list")
     assert os.path.exists(list_filename)
-    df = pyemu.gw_utils.setup_mflist_budget_obs(list_filename,start_datetime=ml.start_datetime)
+    flx_filename = os.path.join(d, "flux.dat")
+    vol_filename = os.path.join(d, "vol.dat")
+    df = pyemu.gw_utils.setup_mflist_budget_obs(list_filename, flx_filename=flx_filename,
+                                                vol_filename=vol_filename, start_datetime="1-1-1970")
     print(df)
+    for org, new in zip(["flux.dat", "vol.dat"], [flx_filename, vol_filename]):
+        org = pd.read_csv(os.path.join(model_ws, org), delim_whitespace=True, index_col=0)
+        new = pd.read_csv(new, delim_whitespace=True, index_col=0)
+        assert list(org.columns) == list(new.columns)
+        assert np.allclose(org.values, new.values)
+        assert list(org.index) == list(new.index)
+
+    list_filename = os.path.join("..", "examples", "Freyberg_Truth", "freyberg.list")
+    lst = pyemu.budget_utils.ListBudgetFile(list_filename)
+    assert len(lst.get_times()) == 3
+    flx, vol = lst.get_dataframes(start_datetime=None, diff=True)
+    # only the last two budgets, found from the end of the file
+    lst = pyemu.budget_utils.ListBudgetFile(list_filename, last=2)
+    assert lst.kstpkper == [(1, 2), (1, 3)]
+    flx2, vol2 = lst.get_dataframes(start_datetime=None, diff=True)
+    assert flx2.equals(flx.iloc[1:]) and vol2.equals(vol.iloc[1:])
+
+
+def _write_sft_list_file(gw_list_filename, list_filename):
+    """append stream (SFT) mass budgets to an MT3D list file"""
+    items_in = ["STREAM DEPLETION", "INFLOW TO STREAM", "GW TO STREAM", "PRECIPITATION",
+                "MASS GAIN"]
+    items_out = ["STREAM ACCUMULATION", "STREAM OUTFLOW", "STREAM TO GW", "EVAPORATION",
+                 "MASS LOSS"]
+    with open(gw_list_filename) as f:
+        lines = f.readlines()
+    with open(list_filename, 'w') as f:
+        f.writelines(lines)
+        for tkstp in range(1, 4):
+            f.write("\n STREAM MASS BUDGETS AT END OF TRANSPORT STEP{0:5d}, TIME STEP{1:5d}, "
+                    "STRESS PERIOD{1:5d} FOR COMPONENT  1\n".format(tkstp, 1))
+            f.write("      CUMULATIVE MASS [M]                  MASS FOR THIS TIME STEP [M]\n")
+            f.write("      IN:                                  IN:\n")
+            for items, total in zip([items_in, items_out], ["TOTAL IN", "TOTAL OUT"]):
+                for item in items + [total]:
+                    f.write("{0:>22s} = {1:12.5E}{0:>22s} = {2:12.5E}\n".format(
+                        item, float(tkstp), tkstp / 10.0))
+            f.write("{0:>22s} = {1:12.5E}{0:>22s} = {2:12.5E}\n".format("NET (IN - OUT)", 0.0, 0.0))
+
 
 def mtlist_budget_test():
     import pyemu
+    import numpy as np
     import pandas as pd
     import os
-    try:
-        import flopy
-    except:
-        print("no flopy...")
-        return
-    list_filename = os.path.join("utils","mt3d.list")
+    d = os.path.join("temp", "mtlist")
+    if not os.path.exists(d):
+        os.makedirs(d)
+    list_filename = os.path.join(d, "mt3d.list")
+    _write_sft_list_file(os.path.join("..", "examples", "freyberg_sfr_update", "freyberg_mt.list"),
+                         list_filename)
     assert os.path.exists(list_filename)
     frun_line,ins_files, df = pyemu.gw_utils.setup_mtlist_budget_obs(
         list_filename,start_datetime='1-1-1970')
@@ -664,10 +1110,21 @@ def mtlist_budget_test():
         list_filename, start_datetime=None)
     assert len(ins_files) == 2
 
+    gw, sw = pyemu.budget_utils.MtListBudgetFile(list_filename).parse()
+    assert gw.shape[0] == 3 and sw.shape[0] == 3
+    assert list(gw.index) == [1.0, 181.0, 3831.0]
+    # in and out items of the same process are paired
+    assert np.allclose(sw.loc[:, "stream_depletion_1_cum"].values, 0.0)
+    assert np.allclose(sw.loc[:, "total_1_flx"].values, 0.0)
+
     list_filename = os.path.join("utils", "mt3d_imm_sor.lst")
     assert os.path.exists(list_filename)
     frun_line, ins_files, df = pyemu.gw_utils.setup_mtlist_budget_obs(
         list_filename, start_datetime='1-1-1970')
+    gw, sw = pyemu.budget_utils.MtListBudgetFile(list_filename).parse(diff=False)
+    assert sw is None
+    assert "imm_mass_storage_(solute)_1_in" in gw.columns
+    assert np.allclose(gw.loc[:, "total_1_in"].values[:2], [86911.59, 173935.8])
 
 
 def geostat_prior_builder_test():
@@ -752,6 +1209,60 @@ def geostat_draws_test():
     pe = pyemu.helpers.geostatistical_draws(pst, {str_file: tpl_file})
     assert (pe.shape == pe.dropna().shape)
 
+def geostat_draws_scalable_test():
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    # two properties sharing the same regular grid of points
+    nrow, ncol = 50, 60
+    x, y = np.meshgrid(np.arange(ncol) * 10.0, np.arange(nrow) * 10.0)
+    dfs = []
+    for prefix in ["hk", "ss"]:
+        df = pd.DataFrame({"x": x.flatten(), "y": y.flatten()})
+        df.loc[:, "parnme"] = ["{0}_{1}".format(prefix, i) for i in range(df.shape[0])]
+        dfs.append(df)
+    pst = pyemu.Pst.from_par_obs_names(par_names=dfs[0].parnme.tolist() + dfs[1].parnme.tolist())
+    par = pst.parameter_data
+    par.loc[:, "partrans"] = "log"
+    par.loc[:, "parval1"] = 1.0
+    par.loc[:, "parlbnd"] = 0.01
+    par.loc[:, "parubnd"] = 100.0
+    par.loc[dfs[1].parnme, "parlbnd"] = 0.1
+    par.loc[dfs[1].parnme, "parubnd"] = 10.0
+    gs = pyemu.geostats.GeoStruct(variograms=pyemu.geostats.ExpVario(contribution=1.0, a=50.0))
+
+    # small zones use the (shared) eigen factor and the seed is reproducible
+    sub = [df.iloc[:100, :] for df in dfs]
+    pe1 = pyemu.helpers.geostatistical_draws(pst, {gs: sub}, num_reals=20, seed=3, verbose=False)
+    pe2 = pyemu.helpers.geostatistical_draws(pst, {gs: sub}, num_reals=20, seed=3, verbose=False)
+    assert np.allclose(pe1.values, pe2.values)
+    assert pe1.shape == (20, pst.npar)
+    # the same unit-sill factor scaled by the zone std
+    std = np.log10(pe1.loc[:, sub[0].parnme].values).std(axis=0).mean() / \
+          np.log10(pe1.loc[:, sub[1].parnme].values).std(axis=0).mean()
+    assert std > 1.5, std
+
+    # large regular grid zones switch to SpecSim2d
+    pe = pyemu.helpers.geostatistical_draws(pst, {gs: dfs}, num_reals=10, verbose=False)
+    assert pe.shape == pe.dropna().shape
+    lv = np.log10(pe.loc[:, dfs[0].parnme].values)
+    assert np.abs(lv.mean()) < 0.5
+    assert np.abs(lv.std() - 1.0) < 0.3, lv.std()
+    # the SpecSim2d draws respect the seed too
+    pe1 = pyemu.helpers.geostatistical_draws(pst, {gs: dfs}, num_reals=10, seed=3, verbose=False)
+    pe2 = pyemu.helpers.geostatistical_draws(pst, {gs: dfs}, num_reals=10, seed=3, verbose=False)
+    assert np.array_equal(pe1.values, pe2.values)
+    pe3 = pyemu.helpers.geostatistical_draws(pst, {gs: dfs}, num_reals=10, seed=4, verbose=False)
+    assert not np.allclose(pe1.values, pe3.values)
+    try:
+        pyemu.helpers.geostatistical_draws(pst, {gs: sub}, num_reals=10, method="specsim",
+                                           verbose=False)
+    except Exception:
+        pass
+    else:
+        raise Exception("should have failed")
+
 
 
 
@@ -970,6 +1481,90 @@ def hds_timeseries_test():
     # diff = df1.obsval - df2.obsval
 
 
+def binary_file_test():
+    import os
+    import shutil
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    m_ws = os.path.join("..", "examples", "freyberg_sfr_update")
+    hds_file = os.path.join("temp", "freyberg_bin.hds")
+    cbc_file = os.path.join("temp", "freyberg_bin.cbc")
+    shutil.copy2(os.path.join(m_ws, "freyberg.hds"), hds_file)
+    shutil.copy2(os.path.join(m_ws, "freyberg.cbc"), cbc_file)
+
+    # read the head file record by record for comparison
+    hdr = np.dtype([("kstp", "<i4"), ("kper", "<i4"), ("pertim", "<f4"), ("totim", "<f4"),
+                    ("text", "S16"), ("ncol", "<i4"), ("nrow", "<i4"), ("ilay", "<i4")])
+    raw = open(hds_file, "rb").read()
+    recs, pos = [], 0
+    while pos < len(raw):
+        h = np.frombuffer(raw, dtype=hdr, count=1, offset=pos)[0]
+        pos += hdr.itemsize
+        n = int(h["nrow"]) * int(h["ncol"])
+        recs.append((h, np.frombuffer(raw, dtype="<f4", count=n, offset=pos).
+                     reshape(h["nrow"], h["ncol"])))
+        pos += 4 * n
+
+    hds = pyemu.binary_utils.BinaryLayerFile(hds_file)
+    assert hds.real == np.float32
+    assert hds.nlay == max([int(h["ilay"]) for h, _ in recs])
+    assert len(hds.times) == len(recs) // hds.nlay
+    for h, arr in recs:
+        d = hds.get_data(kstpkper=(h["kstp"] - 1, h["kper"] - 1))
+        assert np.array_equal(d[h["ilay"] - 1], arr)
+    kij = [(0, 0, 0), (1, 10, 5), (2, 39, 19)]
+    ts = hds.get_ts(kij)
+    assert ts.shape == (len(hds.times), 1 + len(kij))
+    last = recs[-hds.nlay:]
+    for ii, (k, i, j) in enumerate(kij):
+        assert ts[-1, ii + 1] == last[k][1][i, j]
+    hds.close()
+
+    # the same file in double precision
+    dhdr = np.dtype([("kstp", "<i4"), ("kper", "<i4"), ("pertim", "<f8"), ("totim", "<f8"),
+                     ("text", "S16"), ("ncol", "<i4"), ("nrow", "<i4"), ("ilay", "<i4")])
+    dhds_file = os.path.join("temp", "freyberg_bin_dbl.hds")
+    with open(dhds_file, "wb") as f:
+        for h, arr in recs:
+            f.write(np.array([tuple(h)], dtype=dhdr).tobytes())
+            f.write(arr.astype("<f8").tobytes())
+    dhds = pyemu.binary_utils.BinaryLayerFile(dhds_file)
+    assert dhds.real == np.float64
+    assert np.allclose(dhds.get_ts(kij), ts)
+    dhds.close()
+
+    # setup/apply round trip without flopy
+    pyemu.gw_utils.setup_hds_obs(hds_file, skip=-999)
+    df1 = pd.read_csv(hds_file + ".dat", delim_whitespace=True)
+    pyemu.gw_utils.apply_hds_obs(hds_file)
+    df2 = pd.read_csv(hds_file + ".dat", delim_whitespace=True)
+    assert np.array_equal(df1.obsnme, df2.obsnme)
+    assert np.abs(df1.obsval - df2.obsval).max() < 1.0e-6
+
+    kij_dict = {"test1": [0, 0, 0], "test2": (1, 10, 5), "test3": (2, 39, 19)}
+    frun_line, df = pyemu.gw_utils.setup_hds_timeseries(hds_file, kij_dict, include_path=True,
+                                                        prefix="hds")
+    df3 = pd.read_csv(hds_file + "_timeseries.processed", delim_whitespace=True)
+    assert np.allclose(df3.loc[:, ["test1", "test2", "test3"]].values, ts[:, 1:])
+
+    cbb = pyemu.binary_utils.BinaryBudgetFile(cbc_file)
+    assert "STORAGE" in cbb.textlist
+    cmd, df4 = pyemu.gw_utils.setup_hds_timeseries(cbc_file, kij_dict, include_path=True,
+                                                   prefix="stor", text="storage", fill=0.0)
+    stor = cbb.get_ts(list(kij_dict.values()), text="storage")
+    assert df4.shape[0] == stor.size - stor.shape[0]
+    try:
+        pyemu.gw_utils.setup_hds_timeseries(cbc_file, kij_dict, include_path=True,
+                                            prefix="junk", text="JUNK")
+    except:
+        pass
+    else:
+        raise Exception("should have failed")
+    cbb.close()
+
+
 def grid_obs_test():
     import os
     import shutil
@@ -1269,6 +1864,61 @@ def sfr_obs_test():
     pyemu.gw_utils.setup_sfr_obs(sfr_file, seg_group_dict={"obs1": [1, 4], "obs2": [16, 17, 18, 19, 22, 23]},model=m)
 
 
+def load_sfr_out_test():
+    import os
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    sfr_file = os.path.join("utils", "freyberg.sfr.out")
+    # line-by-line reference parse
+    ref = {}
+    with open(sfr_file) as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        if line.lower().startswith(" stream listing"):
+            kper = int(line.split()[3]) - 1
+            rows = []
+            for dline in lines[i + 5:]:
+                if dline.strip() == '':
+                    break
+                raw = dline.split()
+                rows.append([int(raw[3]), int(raw[4]), float(raw[6]), float(raw[7])])
+            ref[kper] = pd.DataFrame(rows, columns=["segment", "reach", "flaqx", "flout"])
+
+    sfr_all = pyemu.gw_utils.load_sfr_out(sfr_file, selection="all")
+    sfr_seg = pyemu.gw_utils.load_sfr_out(sfr_file)
+    assert list(sfr_all.keys()) == list(ref.keys())
+    for kper, df in ref.items():
+        assert np.array_equal(sfr_all[kper].loc[:, df.columns].values, df.values)
+        assert sfr_all[kper].index[0] == "{0:03d}_{1:03d}".format(df.segment[0], df.reach[0])
+        gp = df.groupby("segment")
+        assert np.allclose(sfr_seg[kper].flaqx.values, gp.flaqx.sum().values)
+        last = df.loc[gp.reach.idxmax().values, "flout"].values
+        assert np.array_equal(sfr_seg[kper].flout.values, last)
+
+    sfr_kper = pyemu.gw_utils.load_sfr_out(sfr_file, kpers=[1])
+    assert list(sfr_kper.keys()) == [1]
+    assert sfr_kper[1].equals(sfr_seg[1])
+
+    selection = pd.DataFrame({"segment": [4, 1, 999], "reach": [1, 2, 1]}, index=["b", "a", "c"])
+    sfr_sel = pyemu.gw_utils.load_sfr_out(sfr_file, selection=selection)
+    for kper, df in sfr_sel.items():
+        assert list(df.index) == ["004_001", "001_002"]
+        assert df.equals(sfr_all[kper].loc[["004_001", "001_002"], :])
+
+    # upper case headers and a header on the first line of the file
+    with open(sfr_file) as f:
+        text = f.read()
+    up_file = os.path.join("temp", "freyberg_upper.sfr.out")
+    with open(up_file, 'w') as f:
+        f.write(text[text.lower().index(" stream listing"):].upper())
+    sfr_up = pyemu.gw_utils.load_sfr_out(up_file)
+    assert list(sfr_up.keys()) == list(sfr_seg.keys())
+    for kper, df in sfr_up.items():
+        assert df.equals(sfr_seg[kper])
+
+
 def sfr_reach_obs_test():
     import os
     import pyemu
@@ -1307,6 +1957,46 @@ def sfr_reach_obs_test():
     assert proc.shape[0] == 3*2  # (nper*nobs)
 
 
+def extraction_plan_test():
+    import os
+    import shutil
+    import time
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    bd = os.getcwd()
+    sfr_file = os.path.join("temp", "freyberg.sfr.out")
+    shutil.copy2(os.path.join("utils", "freyberg.sfr.out"), sfr_file)
+    pyemu.gw_utils.setup_sfr_obs(sfr_file, seg_group_dict={"obs1": [1, 4], "obs2": [16, 17]},
+                                 include_path=True)
+    os.chdir("temp")
+    try:
+        assert os.path.exists("sfr_obs.config.plan.npz")
+        df1 = pd.read_csv("freyberg.sfr.out.processed", delim_whitespace=True)
+        df2 = pyemu.gw_utils.apply_sfr_obs()
+        assert (df1.obs_base == df2.obs_base).all()
+        assert np.allclose(df1.loc[:, ["kper", "flaqx", "flout"]].values,
+                           df2.loc[:, ["kper", "flaqx", "flout"]].values)
+
+        # editing the config file invalidates the plan
+        time.sleep(0.01)
+        df_key = pd.read_csv("sfr_obs.config", index_col=0)
+        df_key.loc[df_key.obs_base == "obs2", "obs_base"] = "obs3"
+        df_key.to_csv("sfr_obs.config")
+        df3 = pyemu.gw_utils.apply_sfr_obs()
+        assert set(df3.obs_base) == {"obs1", "obs3"}
+        assert (df3.flaqx.values == df2.flaqx.values).all()
+
+        # a config without a plan still works
+        os.remove("sfr_obs.config.plan.npz")
+        df4 = pyemu.gw_utils.apply_sfr_obs()
+        assert (df4.values == df3.values).all()
+        assert os.path.exists("sfr_obs.config.plan.npz")
+    finally:
+        os.chdir(bd)
+
+
 def gage_obs_test():
     import os
     import pyemu
@@ -1514,6 +2204,7 @@ def read_runstor_test():
 
 def smp_test():
     import os
+    import numpy as np
     from pyemu.utils import smp_to_dataframe, dataframe_to_smp, \
         smp_to_ins
     from pyemu.pst.pst_utils import parse_ins_file
@@ -1533,6 +2224,18 @@ def smp_test():
     smp_to_ins(smp_filename)
     obs_names = parse_ins_file(smp_filename + ".ins")
     print(len(obs_names))
+    # round trip, including a file handle and month-first dates
+    df2 = smp_to_dataframe(smp_filename + ".test")
+    assert df2.shape == df.shape
+    assert (df2.datetime == df.datetime).all()
+    assert np.allclose(df2.value.values, df.value.values)
+    with open(smp_filename + ".test", 'w') as f:
+        dataframe_to_smp(df, f, datetime_format="mm/dd/yyyy")
+    df2 = smp_to_dataframe(smp_filename + ".test", datetime_format="%m/%d/%Y %H:%M:%S")
+    assert (df2.datetime == df.datetime).all()
+    ins_df = smp_to_ins(smp_filename + ".test", use_generic_names=True)
+    assert ins_df.observation_names.iloc[0] == df.name.iloc[0] + "_0"
+    assert len(parse_ins_file(smp_filename + ".test.ins")) == df.shape[0]
 
 
 def smp_dateparser_test():
@@ -1636,6 +2339,189 @@ def ok_grid_invest():
     assert diff < 1.0e-10
 
 
+def specsim_batch_test():
+    import numpy as np
+    import pyemu
+
+    nrow,ncol = 40,30
+    delr = np.ones((ncol)) * 100.0
+    delc = np.ones((nrow)) * 100.0
+    v = pyemu.geostats.ExpVario(contribution=1.0,a=1000.0)
+    gs = pyemu.geostats.GeoStruct(variograms=[v],transform="log")
+    ss = pyemu.geostats.SpecSim2d(geostruct=gs,delx=delr,dely=delc)
+    mean_arr = np.random.uniform(1.0,10.0,(nrow,ncol))
+
+    np.random.seed(11)
+    reals = ss.draw_arrays(num_reals=7,mean_value=mean_arr,batch_size=7)
+    assert reals.shape == (7,nrow,ncol)
+    assert reals.dtype == np.float64
+    # the same realizations regardless of batching
+    np.random.seed(11)
+    reals2 = ss.draw_arrays(num_reals=7,mean_value=mean_arr,batch_size=2,num_threads=2)
+    assert np.abs((reals - reals2) / reals).max() < 1.0e-10
+    np.random.seed(11)
+    blocks = list(ss.draw_arrays_iter(num_reals=7,mean_value=mean_arr,batch_size=3))
+    assert [b.shape[0] for b in blocks] == [3,3,1]
+    assert all([b.dtype == np.float32 for b in blocks])
+    assert np.abs((np.concatenate(blocks) - reals) / reals).max() < 1.0e-6
+
+
+def apply_array_pars_test():
+    import os
+    import shutil
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    d = os.path.join("temp", "apply_array_pars")
+    if os.path.exists(d):
+        shutil.rmtree(d)
+    os.makedirs(d)
+    nrow, ncol = 20, 15
+    # a constant mult shared by all kper and a grid mult per kper
+    cn_mlt = os.path.join(d, "cn.dat")
+    np.savetxt(cn_mlt, np.zeros((nrow, ncol)) + 2.0, fmt="%15.6E")
+    rows = []
+    for kper in range(6):
+        org_file = os.path.join(d, "org_{0}.dat".format(kper))
+        np.savetxt(org_file, np.random.uniform(1.0, 10.0, (nrow, ncol)))
+        gr_mlt = os.path.join(d, "gr_{0}.dat".format(kper))
+        np.savetxt(gr_mlt, np.random.uniform(0.5, 1.5, (nrow, ncol)), fmt="%15.6E")
+        model_file = os.path.join(d, "model_{0}.dat".format(kper))
+        for mlt in [cn_mlt, gr_mlt]:
+            rows.append({"model_file": model_file, "org_file": org_file, "mlt_file": mlt,
+                         "upper_bound": 25.0, "lower_bound": np.NaN})
+    df = pd.DataFrame(rows)
+    arr_par_file = os.path.join(d, "arr_pars.csv")
+    df.to_csv(arr_par_file)
+
+    for num_threads, cache_dir in zip([1, 2, 1, 1], [None, None, "cache", "cache"]):
+        if cache_dir is not None:
+            cache_dir = os.path.join(d, cache_dir)
+        pyemu.helpers.apply_array_pars(arr_par_file, num_threads=num_threads,
+                                       cache_dir=cache_dir)
+        for model_file, df_mf in df.groupby("model_file"):
+            arr = np.loadtxt(df_mf.org_file.iloc[0])
+            for mlt in df_mf.mlt_file:
+                arr *= np.loadtxt(mlt)
+            arr[arr > 25.0] = 25.0
+            # same bytes as np.savetxt()
+            np.savetxt(os.path.join(d, "test.dat"), arr, fmt="%15.6E", delimiter='')
+            with open(os.path.join(d, "test.dat")) as f:
+                expected = f.read()
+            with open(model_file) as f:
+                assert f.read() == expected, model_file
+
+    assert len(os.listdir(os.path.join(d, "cache"))) == 6
+
+
+def apply_list_pars_test():
+    import os
+    import shutil
+    import numpy as np
+    import pandas as pd
+    import pyemu
+
+    d = os.path.join("temp", "apply_list_pars")
+    if os.path.exists(d):
+        shutil.rmtree(d)
+    for dd in ["list_org", "list_mlt", "model"]:
+        os.makedirs(os.path.join(d, dd))
+    names = ["k", "i", "j", "flux"]
+    nrow, ncol = 30, 20
+    kij = np.array([[k, i, j] for k in range(1, 3) for i in range(1, nrow + 1)
+                    for j in range(1, ncol + 1)])
+    kij = kij[np.random.uniform(size=kij.shape[0]) < 0.3]
+    org_vals = {}
+    temp_rows, spat_rows = [], []
+    for kper in range(4):
+        # the last stress period lists a different set of cells
+        kper_kij = kij if kper < 3 else kij[::2]
+        vals = np.hstack([kper_kij, np.random.uniform(-1000.0, 0.0, (kper_kij.shape[0], 1))])
+        fname = "wel_{0:03d}.dat".format(kper)
+        np.savetxt(os.path.join(d, "list_org", fname), vals, fmt=" %9d %9d %9d %9G")
+        org_vals[fname] = np.loadtxt(os.path.join(d, "list_org", fname))
+        row = {"filename": os.path.join("list_org", fname), "dtype_names": ",".join(names),
+               "list_org": "list_org", "model_ext_path": "model", "col": "flux",
+               "kper": kper, "pak": "wel", "val": 1.0 + kper / 10.0, "list_mlt": "list_mlt"}
+        temp_rows.append(row)
+        spat_rows.append(row)
+    pd.DataFrame(temp_rows).to_csv(os.path.join(d, "temporal_list_pars.dat"), sep=' ', index=False)
+    pd.DataFrame(spat_rows).to_csv(os.path.join(d, "spatial_list_pars.dat"), sep=' ', index=False)
+    # spatial multipliers for most of the cells, zero-based
+    mlt_df = pd.DataFrame(kij[:-5] - 1, columns=["k", "i", "j"])
+    mlt_df.loc[:, "flux"] = np.random.uniform(0.5, 1.5, mlt_df.shape[0])
+    mlt_df.index = mlt_df.apply(lambda x: "{0:02.0f}{1:04.0f}{2:04.0f}".format(x.k, x.i, x.j), axis=1)
+    mlt_df.loc[:, "idx"] = mlt_df.index
+    mlt_df.to_csv(os.path.join(d, "list_mlt", "wel.csv"), sep=' ')
+
+    bd = os.getcwd()
+    os.chdir(d)
+    try:
+        pyemu.helpers.apply_list_pars()
+    finally:
+        os.chdir(bd)
+
+    mlt = mlt_df.loc[:, "flux"]
+    mlt.index = [tuple(kk) for kk in mlt_df.loc[:, ["k", "i", "j"]].values]
+    for kper in range(4):
+        fname = "wel_{0:03d}.dat".format(kper)
+        vals = org_vals[fname]
+        vals[:, 3] *= mlt.reindex([tuple(kk) for kk in vals[:, :3].astype(int) - 1]).values
+        vals[:, 3] *= 1.0 + kper / 10.0
+        np.savetxt(os.path.join(d, "test.dat"), vals, fmt=" %9d %9d %9d %9G")
+        with open(os.path.join(d, "test.dat")) as f:
+            expected = f.read()
+        with open(os.path.join(d, "model", fname)) as f:
+            assert f.read() == expected, fname
+
+
+def array_utils_test():
+    import os
+    import numpy as np
+    import pyemu
+
+    d = os.path.join("temp", "array_utils")
+    if not os.path.exists(d):
+        os.makedirs(d)
+    arr = np.random.standard_normal((50, 40)) * 10.0 ** np.random.randint(-20, 20, (50, 40))
+    arr[0, :8] = [0.0, -0.0, np.NaN, np.inf, -np.inf, 1.0e-310, 1.0e200, 9.9999995]
+    # rounding ties
+    arr[1, :] = (np.random.randint(1000000, 9999999, 40) * 10.0 + 5.0) / 1.0e7
+    fname = os.path.join(d, "arr.dat")
+    tname = os.path.join(d, "test.dat")
+    for fmt in ["%15.6E", "%20.8E", "%12.4e", "%9.3E", "%15.6G"]:
+        for delimiter in ["", " ", ","]:
+            for a in [arr, arr[:, 0], arr.astype(np.float32)]:
+                pyemu.array_utils.write_array(fname, a, fmt=fmt, delimiter=delimiter)
+                np.savetxt(tname, a, fmt=fmt, delimiter=delimiter)
+                with open(fname) as f1, open(tname) as f2:
+                    assert f1.read() == f2.read(), fmt
+    # row formats, like those used for list-type files
+    lst = np.hstack([np.random.randint(1, 1000, (500, 3)), arr.reshape(500, 4)])
+    for fmt in [" %9d %9d %9d %9G %9G %9G %9G", ["%4i", "%d", "%6d", "%E", "%12.3g", "%9.1G", "%G"]]:
+        pyemu.array_utils.write_array(fname, lst, fmt=fmt)
+        np.savetxt(tname, lst, fmt=fmt)
+        with open(fname) as f1, open(tname) as f2:
+            assert f1.read() == f2.read(), fmt
+
+    arr = np.random.uniform(0.0, 1.0, (20, 30))
+    np.savetxt(fname, arr)
+    assert np.array_equal(pyemu.array_utils.read_array(fname), np.loadtxt(fname))
+    cache_dir = os.path.join(d, "cache")
+    a1 = pyemu.array_utils.read_array(fname, cache_dir=cache_dir)
+    a2 = pyemu.array_utils.read_array(fname, cache_dir=cache_dir)
+    assert isinstance(a2, np.memmap)
+    assert np.array_equal(a1, arr) and np.array_equal(a2, arr)
+    # fall back to np.loadtxt() for things like comments
+    with open(fname, 'w') as f:
+        f.write("# a comment\n1.0 2.0\n3.0 4.0\n")
+    assert np.array_equal(pyemu.array_utils._parse_array(fname), np.loadtxt(fname))
+    # a changed file is parsed again
+    assert np.array_equal(pyemu.array_utils.read_array(fname, cache_dir=cache_dir),
+                          np.loadtxt(fname))
+
+
 def specsim_test():
     try:
         import flopy
@@ -1816,6 +2702,7 @@ if __name__ == "__main__":
     #mtlist_budget_test()
     # tpl_to_dataframe_test()
     # kl_test()
+    # kl_eigen_basis_test()
     # hfb_test()
     # hfb_zn_mult_test()
     #more_kl_test()
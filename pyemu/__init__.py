@@ -15,7 +15,7 @@ from .en import Ensemble, ParameterEnsemble, ObservationEnsemble
 # from .inf import Influence
 from .mat import Matrix, Jco, Cov
 from .pst import Pst, pst_utils
-from .utils import helpers, gw_utils, optimization, geostats, pp_utils, os_utils, smp_utils
+from .utils import helpers, gw_utils, optimization, geostats, pp_utils, os_utils, smp_utils, en_utils, array_utils, binary_utils, budget_utils
 from .plot import plot_utils
 from .logger import Logger
 
@@ -27,5 +27,6 @@ __version__ = get_versions()['version']
 __all__ = ["LinearAnalysis", "Schur", "ErrVar", "Ensemble",
            "ParameterEnsemble", "ObservationEnsemble", "Matrix",
            "Jco", "Cov", "Pst", "pst_utils", "helpers", "gw_utils",
-           "geostats", "pp_utils", "os_utils", "smp_utils", "plot_utils"]
+           "geostats", "pp_utils", "os_utils", "smp_utils", "en_utils", "array_utils", "binary_utils", "budget_utils",
+           "plot_utils"]
 # del get_versions
@@ -8,6 +8,7 @@ import pyemu
 from .pyemu_warnings import PyemuWarning
 
 SEED = 358183147 #from random.org on 5 Dec 2016
+REAL_BLOCK_SIZE = 250 # realizations per independently-seeded random sub-stream
 
 class Loc(object):
     """thin wrapper around `pandas.DataFrame.loc` to make sure returned type
@@ -58,6 +59,497 @@ class Iloc(object):
         self._ensemble._df.iloc[idx] = value
 
 
+class CovarianceAccumulator(object):
+    """streaming (online) accumulation of an empirical covariance matrix
+    from batches of realizations
+
+    Args:
+        names ([`str`]): the column names of the realizations that will be
+            passed to `CovarianceAccumulator.add()`
+        localizer (`pyemu.Matrix` or `scipy.sparse` matrix, optional): a
+            localizing matrix.  If passed, only the covariates at the non-zero
+            entries of `localizer` are accumulated (and the result is the
+            localized covariance).  A `scipy.sparse` localizer is assumed to
+            be square and ordered the same as `names`.  Default is None
+        center (`numpy.ndarray`, optional): a fixed centering vector.  If None,
+            the covariates are accumulated around the running mean (Welford-style).
+            Default is None
+        pair_chunk (`int`): the number of localized entries to process in a
+            single vectorized pass.  Default is 100000
+
+    Note:
+        batches are merged with the pairwise update of Chan et al (1979), so the
+        result is identical (to round off) to the covariance of the stacked
+        realizations regardless of how the realizations are batched.
+
+        memory use is proportional to the number of non-zero `localizer` entries
+        when a localizer is used, otherwise to the square of the number of columns.
+
+    Example::
+
+        ca = pyemu.en.CovarianceAccumulator(pe.columns)
+        for i in range(0,pe.shape[0],100):
+            ca.add(pe._df.values[i:i+100,:])
+        cov = ca.to_cov()
+
+    """
+    def __init__(self, names, localizer=None, center=None, pair_chunk=100000):
+        self.names = [str(n).lower() for n in names]
+        self.row_names = self.names
+        self.col_names = self.names
+        n = len(self.names)
+        self.count = 0
+        self.pair_chunk = int(pair_chunk)
+        self.mean = np.zeros(n)
+        self.center = None
+        if center is not None:
+            self.center = np.asarray(center, dtype=np.float64).flatten()
+            if self.center.shape[0] != n:
+                raise Exception("CovarianceAccumulator error: 'center' length {0} != len(names) {1}".
+                                format(self.center.shape[0], n))
+        self._rows, self._cols, self._loc_vals = None, None, None
+        if localizer is None:
+            self._comoment = np.zeros((n, n))
+        else:
+            self._set_localizer(localizer)
+            self._comoment = np.zeros(self._loc_vals.shape[0])
+
+    def _set_localizer(self, localizer):
+        if isinstance(localizer, pyemu.Matrix):
+            name_map = {name: i for i, name in enumerate(self.names)}
+            rnames = [n for n in localizer.row_names if n in name_map]
+            cnames = [n for n in localizer.col_names if n in name_map]
+            if len(rnames) == 0 or len(cnames) == 0:
+                raise Exception("CovarianceAccumulator error: no common names between " +
+                                "localizer and ensemble")
+            loc = localizer.get(row_names=rnames, col_names=cnames)
+            rows, cols = np.nonzero(loc.as_2d)
+            self._loc_vals = loc.as_2d[rows, cols].astype(np.float64)
+            ridx = np.array([name_map[n] for n in rnames], dtype=np.int64)
+            cidx = np.array([name_map[n] for n in cnames], dtype=np.int64)
+            self.row_names, self.col_names = rnames, cnames
+            self._out_rows, self._out_cols = rows, cols
+            self._rows, self._cols = ridx[rows], cidx[cols]
+        else:
+            try:
+                import scipy.sparse as sparse
+            except Exception as e:
+                raise Exception(("CovarianceAccumulator error: unrecognized localizer type " +
+                                 "{0}: {1}").format(type(localizer), str(e)))
+            if not sparse.issparse(localizer):
+                raise Exception("CovarianceAccumulator error: localizer must be 'pyemu.Matrix' " +
+                                "or 'scipy.sparse', not {0}".format(type(localizer)))
+            n = len(self.names)
+            if localizer.shape != (n, n):
+                raise Exception(("CovarianceAccumulator error: sparse localizer shape {0} " +
+                                 "not compatible with {1} names").format(localizer.shape, n))
+            loc = localizer.tocoo()
+            self._rows = loc.row.astype(np.int64)
+            self._cols = loc.col.astype(np.int64)
+            self._loc_vals = loc.data.astype(np.float64)
+            self._out_rows, self._out_cols = self._rows, self._cols
+
+    def _batch_comoment(self, devs):
+        if self._rows is None:
+            return np.dot(devs.T, devs)
+        result = np.zeros(self._rows.shape[0])
+        for s in range(0, self._rows.shape[0], self.pair_chunk):
+            e = s + self.pair_chunk
+            result[s:e] = np.einsum("ij,ij->j", devs[:, self._rows[s:e]], devs[:, self._cols[s:e]])
+        return result
+
+    def _outer(self, vec):
+        if self._rows is None:
+            return np.outer(vec, vec)
+        return vec[self._rows] * vec[self._cols]
+
+    def add(self, x):
+        """accumulate a batch of realizations
+
+        Args:
+            x (`numpy.ndarray` or `pandas.DataFrame`): a 2-D array of realizations
+                (rows) by columns (ordered as `names`).  A DataFrame is
+                reindexed to `names`.
+
+        """
+        if isinstance(x, pd.DataFrame):
+            x = x.loc[:, self.names].values
+        x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+        if x.shape[1] != len(self.names):
+            raise Exception("CovarianceAccumulator.add() error: batch has {0} columns, expected {1}".
+                            format(x.shape[1], len(self.names)))
+        nb = x.shape[0]
+        if nb == 0:
+            return
+        if self.center is not None:
+            self._comoment += self._batch_comoment(x - self.center)
+            self.mean += (x.sum(axis=0) - (nb * self.mean)) / (self.count + nb)
+            self.count += nb
+            return
+        batch_mean = x.mean(axis=0)
+        batch_comoment = self._batch_comoment(x - batch_mean)
+        delta = batch_mean - self.mean
+        total = self.count + nb
+        self._comoment += batch_comoment + self._outer(delta) * (self.count * nb / float(total))
+        self.mean += delta * (nb / float(total))
+        self.count = total
+
+    def _values(self):
+        if self.count < 2:
+            raise Exception("CovarianceAccumulator error: need at least two realizations, " +
+                            "only {0} accumulated".format(self.count))
+        vals = self._comoment / float(self.count - 1)
+        if self._loc_vals is not None:
+            vals = vals * self._loc_vals
+        return vals
+
+    def to_cov(self):
+        """get the accumulated (and optionally localized) covariance matrix
+
+        Returns:
+            `pyemu.Cov`: the empirical covariance matrix.  If the localizer rows
+            and columns differ, a `pyemu.Matrix` is returned
+
+        """
+        vals = self._values()
+        if self._rows is None:
+            return pyemu.Cov(x=vals, names=self.names)
+        x = np.zeros((len(self.row_names), len(self.col_names)))
+        x[self._out_rows, self._out_cols] = vals
+        if self.row_names == self.col_names:
+            return pyemu.Cov(x=x, names=self.row_names)
+        return pyemu.Matrix(x=x, row_names=self.row_names, col_names=self.col_names)
+
+    def to_sparse(self):
+        """get the accumulated localized covariance as a sparse matrix
+
+        Returns:
+            `scipy.sparse.coo_matrix`: the localized covariance, with rows and columns
+            ordered as `CovarianceAccumulator.row_names` and `CovarianceAccumulator.col_names`
+
+        """
+        if self._rows is None:
+            raise Exception("CovarianceAccumulator.to_sparse() requires a localizer")
+        import scipy.sparse as sparse
+        return sparse.coo_matrix((self._values(), (self._out_rows, self._out_cols)),
+                                 shape=(len(self.row_names), len(self.col_names)))
+
+    def to_coo(self, filename):
+        """write the accumulated localized covariance to a PEST-style binary
+        file that only stores the localized (non-zero) entries
+
+        Args:
+            filename (`str`): the file to write
+
+        """
+        x = self.to_sparse()
+        pyemu.mat.save_coo(x, row_names=self.row_names, col_names=self.col_names,
+                           filename=filename)
+
+
+class ChunkedEnsembleFile(object):
+    """a columnar, chunked binary container for ensembles that supports
+    reading subsets of columns and/or realizations and appending realizations
+
+    Args:
+        filename (`str`): the container file name
+
+    Note:
+        the file is a sequence of data blocks followed by a json index and a
+        fixed-length trailer.  The blocks tile the ensemble over both axes: each
+        block holds one chunk of (at most `real_chunk`) realizations by one chunk
+        of (at most `col_chunk`) columns, stored column-major so that the values
+        of a column are contiguous.  Blocks are optionally compressed with `zlib`.
+        Reading a subset of columns and/or realizations only reads the blocks that
+        hold them.
+
+        Appending realizations overwrites the index with new blocks and rewrites
+        the index at the end of the file.
+
+    Example::
+
+        pe.to_chunked_binary("prior.ens",dtype=np.float32,compress=True)
+        ef = pyemu.en.ChunkedEnsembleFile("prior.ens")
+        df = ef.read(columns=pst.nnz_obs_names[:10])
+
+    """
+    magic = b"PYEMUENS"
+    version = 1
+    trailer_dt = np.dtype([("index_offset", np.int64), ("index_nbytes", np.int64)])
+
+    def __init__(self, filename):
+        self.filename = filename
+        if not os.path.exists(filename):
+            raise Exception("ChunkedEnsembleFile error: file '{0}' not found".format(filename))
+        self._read_index()
+
+    def _read_index(self):
+        import json
+        with open(self.filename, "rb") as f:
+            if f.read(len(self.magic)) != self.magic:
+                raise Exception("ChunkedEnsembleFile error: '{0}' is not an ensemble container".
+                                format(self.filename))
+            f.seek(-(self.trailer_dt.itemsize + len(self.magic)), os.SEEK_END)
+            trailer = np.frombuffer(f.read(self.trailer_dt.itemsize), dtype=self.trailer_dt)[0]
+            if f.read(len(self.magic)) != self.magic:
+                raise Exception("ChunkedEnsembleFile error: '{0}' is truncated or corrupt".
+                                format(self.filename))
+            self.index_offset = int(trailer["index_offset"])
+            f.seek(self.index_offset)
+            index = json.loads(f.read(int(trailer["index_nbytes"])).decode())
+        self.columns = index["columns"]
+        self.real_names = index["real_names"]
+        self.dtype = np.dtype(index["dtype"])
+        self.compress = index["compress"]
+        self.col_chunk = index["col_chunk"]
+        # older containers hold all the realizations of each write in one block
+        self.real_chunk = index.get("real_chunk", 0)
+        # blocks are [real_start, nreal, col_start, ncol, offset, nbytes]
+        self.blocks = np.array(index["blocks"], dtype=np.int64).reshape(-1, 6)
+        self._col_map = {c: i for i, c in enumerate(self.columns)}
+
+    @staticmethod
+    def _index_values(index):
+        vals = []
+        for v in index:
+            if isinstance(v, (int, np.integer)):
+                vals.append(int(v))
+            else:
+                vals.append(str(v))
+        return vals
+
+    @staticmethod
+    def _duplicate_names(names):
+        """realization names that occur more than once.  Names are compared as
+        strings, the same way they are looked up"""
+        counts = pd.Series([str(n) for n in names], dtype=object).value_counts()
+        return counts.index[counts.values > 1].tolist()
+
+    @staticmethod
+    def _write_blocks(f, values, real_start, real_chunk, col_chunk, dtype, compress):
+        import zlib
+        blocks = []
+        if real_chunk < 1:
+            real_chunk = max(1, values.shape[0])
+        for rs in range(0, values.shape[0], real_chunk):
+            for cs in range(0, values.shape[1], col_chunk):
+                block = np.ascontiguousarray(values[rs:rs + real_chunk, cs:cs + col_chunk].T,
+                                             dtype=dtype)
+                buf = block.tobytes()
+                if compress:
+                    buf = zlib.compress(buf)
+                blocks.append([real_start + rs, block.shape[1], cs, block.shape[0],
+                               f.tell(), len(buf)])
+                f.write(buf)
+        return blocks
+
+    @classmethod
+    def _write_index(cls, f, columns, real_names, dtype, compress, real_chunk, col_chunk,
+                     blocks):
+        import json
+        index = {"version": cls.version, "columns": list(columns),
+                 "real_names": list(real_names), "dtype": np.dtype(dtype).str,
+                 "compress": bool(compress), "real_chunk": int(real_chunk),
+                 "col_chunk": int(col_chunk),
+                 "blocks": [[int(v) for v in b] for b in blocks]}
+        buf = json.dumps(index).encode()
+        offset = f.tell()
+        f.write(buf)
+        np.array([(offset, len(buf))], dtype=cls.trailer_dt).tofile(f)
+        f.write(cls.magic)
+        f.truncate()
+
+    @classmethod
+    def write(cls, filename, df, dtype=np.float64, compress=False, col_chunk=1000,
+              real_chunk=1000):
+        """write a dataframe of realizations to a new container file
+
+        Args:
+            filename (`str`): the file to write
+            df (`pandas.DataFrame`): realizations (rows) by columns
+            dtype (`numpy.dtype`): the storage precision.  Can be `numpy.float64` or
+                `numpy.float32`. Default is `numpy.float64`
+            compress (`bool`): flag to `zlib` compress each block.  Default is False
+            col_chunk (`int`): number of columns in each block.  Default is 1000
+            real_chunk (`int`): number of realizations in each block.  Default is 1000
+
+        Returns:
+            `ChunkedEnsembleFile`: the new container
+
+        Note:
+            realization names must be unique
+
+        """
+        dup = cls._duplicate_names(cls._index_values(df.index))
+        if len(dup) > 0:
+            raise Exception("ChunkedEnsembleFile.write() error: duplicate realization names, e.g. {0}".
+                            format(dup[:5]))
+        dtype = np.dtype(dtype)
+        if dtype not in [np.dtype(np.float64), np.dtype(np.float32)]:
+            raise Exception("ChunkedEnsembleFile.write() error: unsupported dtype {0}".format(dtype))
+        col_chunk = max(1, int(col_chunk))
+        real_chunk = max(1, int(real_chunk))
+        values = df.values.astype(np.float64)
+        with open(filename, "wb") as f:
+            f.write(cls.magic)
+            blocks = cls._write_blocks(f, values, 0, real_chunk, col_chunk, dtype, compress)
+            cls._write_index(f, [str(c) for c in df.columns], cls._index_values(df.index),
+                             dtype, compress, real_chunk, col_chunk, blocks)
+        return cls(filename)
+
+    def append(self, df):
+        """append realizations to the container file
+
+        Args:
+            df (`pandas.DataFrame`): realizations to append.  Must have the
+                same columns as the container (in any order) and realization
+                names that are not already in the container
+
+        """
+        missing = set(self.columns) - set([str(c) for c in df.columns])
+        if len(missing) > 0:
+            raise Exception("ChunkedEnsembleFile.append() error: {0} columns missing, e.g. {1}".
+                            format(len(missing), list(missing)[:5]))
+        real_names = self.real_names + self._index_values(df.index)
+        dup = self._duplicate_names(real_names)
+        if len(dup) > 0:
+            raise Exception("ChunkedEnsembleFile.append() error: duplicate realization names, e.g. {0}".
+                            format(dup[:5]))
+        df = df.copy()
+        df.columns = [str(c) for c in df.columns]
+        values = df.loc[:, self.columns].values.astype(np.float64)
+        with open(self.filename, "r+b") as f:
+            f.seek(self.index_offset)
+            blocks = self._write_blocks(f, values, len(self.real_names), self.real_chunk,
+                                        self.col_chunk, self.dtype, self.compress)
+            blocks = self.blocks.tolist() + blocks
+            self._write_index(f, self.columns, real_names, self.dtype, self.compress,
+                              self.real_chunk, self.col_chunk, blocks)
+        self._read_index()
+
+    @property
+    def shape(self):
+        """the shape (realizations, columns) of the container
+
+        Returns:
+            `tuple`: number of realizations and number of columns
+
+        """
+        return len(self.real_names), len(self.columns)
+
+    def _read_block(self, f, block):
+        import zlib
+        real_start, nreal, col_start, ncol, offset, nbytes = block
+        f.seek(offset)
+        buf = f.read(nbytes)
+        if self.compress:
+            buf = zlib.decompress(buf)
+        return np.frombuffer(buf, dtype=self.dtype).reshape(ncol, nreal)
+
+    def _real_positions(self, reals):
+        if reals is None:
+            return np.arange(len(self.real_names))
+        rmap = {r: i for i, r in enumerate(self.real_names)}
+        rmap.update({str(r): i for i, r in enumerate(self.real_names)})
+        missing = [r for r in reals if r not in rmap and str(r) not in rmap]
+        if len(missing) > 0:
+            raise Exception("ChunkedEnsembleFile error: realizations not found: {0}".format(missing[:5]))
+        # containers written by earlier versions can hold duplicate names
+        dup = set(self._duplicate_names(self.real_names))
+        ambiguous = [r for r in reals if str(r) in dup]
+        if len(ambiguous) > 0:
+            raise Exception("ChunkedEnsembleFile error: realization names are not unique: {0}".
+                            format(ambiguous[:5]))
+        return np.array([rmap[r] if r in rmap else rmap[str(r)] for r in reals], dtype=np.int64)
+
+    def _col_positions(self, columns):
+        if columns is None:
+            return np.arange(len(self.columns))
+        columns = [str(c) for c in columns]
+        missing = [c for c in columns if c not in self._col_map]
+        if len(missing) > 0:
+            raise Exception("ChunkedEnsembleFile error: columns not found: {0}".format(missing[:5]))
+        return np.array([self._col_map[c] for c in columns], dtype=np.int64)
+
+    def read_values(self, columns=None, reals=None):
+        """read a subset of the container into a 2-D array
+
+        Args:
+            columns ([`str`], optional): columns to read.  If None, all columns
+                are read.  Default is None
+            reals ([`object`], optional): realization names to read.  If None,
+                all realizations are read.  Default is None
+
+        Returns:
+            `numpy.ndarray`: the (float64) values ordered as `reals` by `columns`
+
+        """
+        return self._read_positions(self._real_positions(reals), self._col_positions(columns))
+
+    def _read_positions(self, rpos, cpos):
+        """read the realizations and columns at positions `rpos` and `cpos`"""
+        out = np.empty((rpos.shape[0], cpos.shape[0]))
+        if out.size == 0:
+            return out
+        # only the blocks whose realization and column ranges hold a requested
+        # realization and column are read
+        srpos, scpos = np.sort(rpos), np.sort(cpos)
+        b_rs, b_nr = self.blocks[:, 0], self.blocks[:, 1]
+        b_cs, b_nc = self.blocks[:, 2], self.blocks[:, 3]
+        need = (np.searchsorted(srpos, b_rs + b_nr) > np.searchsorted(srpos, b_rs)) & \
+               (np.searchsorted(scpos, b_cs + b_nc) > np.searchsorted(scpos, b_cs))
+        with open(self.filename, "rb") as f:
+            for block in self.blocks[need]:
+                rs, nr, cs, nc = block[:4]
+                rmask = (rpos >= rs) & (rpos < rs + nr)
+                cmask = (cpos >= cs) & (cpos < cs + nc)
+                data = self._read_block(f, block)
+                sub = data[np.ix_(cpos[cmask] - cs, rpos[rmask] - rs)]
+                out[np.ix_(np.where(rmask)[0], np.where(cmask)[0])] = sub.T
+        return out
+
+    def read(self, columns=None, reals=None):
+        """read a subset of the container into a dataframe
+
+        Args:
+            columns ([`str`], optional): columns to read.  If None, all columns
+                are read.  Default is None
+            reals ([`object`], optional): realization names to read.  If None,
+                all realizations are read.  Default is None
+
+        Returns:
+            `pandas.DataFrame`: realizations by columns
+
+        """
+        return self._read_frame(self._real_positions(reals), self._col_positions(columns))
+
+    def _read_frame(self, rpos, cpos):
+        """read the realizations and columns at positions `rpos` and `cpos` into a
+        dataframe"""
+        return pd.DataFrame(self._read_positions(rpos, cpos),
+                            index=[self.real_names[i] for i in rpos],
+                            columns=[self.columns[i] for i in cpos])
+
+    def iter_reals(self, batch_size=100, columns=None):
+        """iterate over the realizations in the container in batches
+
+        Args:
+            batch_size (`int`): the number of realizations in each batch.
+                Default is 100
+            columns ([`str`], optional): columns to read.  If None, all columns
+                are read.  Default is None
+
+        Yields:
+            `pandas.DataFrame`: a batch of realizations
+
+        """
+        cpos = self._col_positions(columns)
+        nreal = len(self.real_names)
+        # batches are sliced by position, not looked up by name
+        for s in range(0, nreal, int(batch_size)):
+            yield self._read_frame(np.arange(s, min(s + int(batch_size), nreal)), cpos)
+
+
 class Ensemble(object):
     """based class for handling ensembles of numeric values
 
@@ -127,6 +619,81 @@ class Ensemble(object):
         """
         np.random.seed(SEED)
 
+    @staticmethod
+    def _seed_sequence(seed):
+        """process the `seed` argument of the draw routines into a
+        `numpy.random.SeedSequence` (or None for the global `numpy.random` stream)
+        """
+        if seed is None:
+            return None
+        if isinstance(seed, np.random.SeedSequence):
+            return seed
+        if isinstance(seed, np.random.Generator):
+            return np.random.SeedSequence(int(seed.integers(0, 2**63 - 1)))
+        return np.random.SeedSequence(seed)
+
+    @staticmethod
+    def _sub_seed(seed, tag):
+        """the `numpy.random.SeedSequence` of the sub-stream named `tag` of the root
+        `seed` (or None for the global `numpy.random` stream)
+        """
+        import zlib
+        if seed is None:
+            return None
+        key = zlib.crc32(str(tag).encode())
+        return np.random.SeedSequence(entropy=seed.entropy,
+                                      spawn_key=tuple(seed.spawn_key) + (key,))
+
+    @staticmethod
+    def _blocked_draw(seed, tag, num_reals, func, num_threads=1):
+        """draw `num_reals` rows using one independent random sub-stream per
+        block of `REAL_BLOCK_SIZE` realizations.
+
+        Args:
+            seed (`numpy.random.SeedSequence`): the root seed sequence
+            tag (`str`): name of the stream (e.g. covariance group name).  Each tag
+                gets its own family of sub-streams.
+            num_reals (`int`): number of realizations (rows) to draw
+            func (`callable`): function with signature func(`numpy.random.Generator`,nrow)
+                that returns an (nrow,ncol) array of draws
+            num_threads (`int`): number of threads to draw blocks with.  numpy
+                releases the GIL while filling large arrays.
+
+        Note:
+            the sub-streams only depend on `seed`, `tag` and the realization block, so the
+            result is bit-reproducible regardless of `num_threads`
+
+        """
+        sub = Ensemble._sub_seed(seed, tag)
+        starts = list(range(0, num_reals, REAL_BLOCK_SIZE))
+
+        def draw_block(iblock):
+            ss = np.random.SeedSequence(entropy=sub.entropy,
+                                        spawn_key=tuple(sub.spawn_key) + (iblock,))
+            nrow = min(REAL_BLOCK_SIZE, num_reals - starts[iblock])
+            return func(np.random.Generator(np.random.PCG64(ss)), nrow)
+
+        if num_threads > 1 and len(starts) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=num_threads) as pool:
+                blocks = list(pool.map(draw_block, range(len(starts))))
+        else:
+            blocks = [draw_block(i) for i in range(len(starts))]
+        if len(blocks) == 0:
+            return func(np.random.default_rng(0), 0)
+        return np.vstack(blocks)
+
+    @staticmethod
+    def _standard_normal(num_reals, ncol, seed=None, tag=None, num_threads=1):
+        """standard normal deviates from either the global `numpy.random` stream or
+        the blocked sub-streams of `seed`
+        """
+        if seed is None:
+            return np.random.randn(num_reals, ncol)
+        return Ensemble._blocked_draw(seed, tag, num_reals,
+                                      lambda rng, n: rng.standard_normal((n, ncol)),
+                                      num_threads=num_threads)
+
     def copy(self):
         """get a copy of `Ensemble`
 
@@ -360,6 +927,75 @@ class Ensemble(object):
         if retrans:
             self.transform()
 
+    @classmethod
+    def from_chunked_binary(cls, pst, filename, columns=None, reals=None):
+        """create an `Ensemble` from a `ChunkedEnsembleFile` container
+
+        Args:
+            pst (`pyemu.Pst`): a control file instance
+            filename (`str`): the container file
+            columns ([`str`], optional): subset of columns to read.  If None,
+                all columns are read.  Default is None
+            reals ([`object`], optional): subset of realization names to read.
+                If None, all realizations are read.  Default is None
+
+        Returns:
+            `Ensemble`
+
+        Note:
+            only the blocks holding the requested columns and realizations are read
+
+        Example::
+
+            pst = pyemu.Pst("my.pst")
+            oe = pyemu.ObservationEnsemble.from_chunked_binary(pst,"obs.ens",
+                                                               columns=pst.nnz_obs_names)
+
+        """
+        df = ChunkedEnsembleFile(filename).read(columns=columns, reals=reals)
+        return cls(pst=pst, df=df)
+
+    def to_chunked_binary(self, filename, dtype=np.float64, compress=False,
+                          col_chunk=1000, real_chunk=1000, append=False):
+        """write `Ensemble` to a `ChunkedEnsembleFile` container
+
+        Args:
+            filename (`str`): file to write
+            dtype (`numpy.dtype`): storage precision, either `numpy.float64`
+                or `numpy.float32`. Default is `numpy.float64`
+            compress (`bool`): flag to `zlib` compress the blocks. Default is False
+            col_chunk (`int`): number of columns per block.  Default is 1000
+            real_chunk (`int`): number of realizations per block.  Default is 1000
+            append (`bool`): flag to append the realizations to an existing
+                container.  If True, `dtype`, `compress`, `col_chunk` and `real_chunk`
+                are taken from the existing container and the realization names must
+                not already be in it.  Default is False
+
+        Example::
+
+            pst = pyemu.Pst("my.pst")
+            oe = pyemu.ObservationEnsemble.from_gaussian_draw(pst)
+            oe.to_chunked_binary("obs.ens",dtype=np.float32,compress=True)
+
+        Note:
+            back transforms `ParameterEnsemble` before writing so that
+            values are in arithmatic space
+
+        """
+        retrans = False
+        if self.istransformed:
+            self.back_transform()
+            retrans = True
+        if self.isnull().values.any():
+            warnings.warn("NaN in ensemble",PyemuWarning)
+        if append and os.path.exists(filename):
+            ChunkedEnsembleFile(filename).append(self._df)
+        else:
+            ChunkedEnsembleFile.write(filename, self._df, dtype=dtype, compress=compress,
+                                      col_chunk=col_chunk, real_chunk=real_chunk)
+        if retrans:
+            self.transform()
+
     @classmethod
     def from_dataframe(cls,pst,df,istransformed=False):
         warnings.warn("Ensemble.from_dataframe() is deprecated and has been "
@@ -369,7 +1005,8 @@ class Ensemble(object):
 
 
     @staticmethod
-    def _gaussian_draw(cov,mean_values,num_reals,grouper=None,fill=True, factor="eigen"):
+    def _gaussian_draw(cov,mean_values,num_reals,grouper=None,fill=True, factor="eigen",
+                       seed=None, num_threads=1):
 
         factor = factor.lower()
         if factor not in ["eigen","svd"]:
@@ -383,15 +1020,20 @@ class Ensemble(object):
             raise Exception("Ensemble._gaussian_draw() error: the following cov names are not in "
                             "mean_values: {0}".format(','.join(missing)))
         if cov.isdiagonal:
-            stds = {name: std for name, std in zip(cov.row_names, np.sqrt(cov.x.flatten()))}
-            snv = np.random.randn(num_reals, mean_values.shape[0])
-            reals = np.zeros_like(snv)
+            stds = pd.Series(np.sqrt(cov.x.flatten()), index=cov.row_names)
+            mvals = mean_values.values
+            in_cov = mean_values.index.isin(cov_names)
+            if seed is None:
+                snv = np.random.randn(num_reals, mean_values.shape[0])[:, in_cov]
+            else:
+                snv = Ensemble._standard_normal(num_reals, int(in_cov.sum()), seed=seed,
+                                                tag="diagonal", num_threads=num_threads)
+            reals = np.zeros((num_reals, mean_values.shape[0]))
             reals[:, :] = np.NaN
-            for i, name in enumerate(mean_values.index):
-                if name in cov_names:
-                    reals[:, i] = (snv[:, i] * stds[name]) + mean_values.loc[name]
-                elif fill:
-                   reals[:, i] = mean_values.loc[name]
+            reals[:, in_cov] = (snv * stds.loc[mean_values.index[in_cov]].values) + \
+                               mvals[in_cov]
+            if fill:
+                reals[:, ~in_cov] = mvals[~in_cov]
         else:
             reals = np.zeros((num_reals, mean_values.shape[0]))
             reals[:, :] = np.NaN
@@ -404,7 +1046,9 @@ class Ensemble(object):
 
                 for grp_name,names in grouper.items():
                     idxs = [mv_map[name] for name in names]
-                    snv = np.random.randn(num_reals, len(names))
+                    snv = Ensemble._standard_normal(num_reals, len(names), seed=seed,
+                                                    tag="gaussian:" + str(grp_name),
+                                                    num_threads=num_threads)
                     cov_grp = cov.get(names)
                     if len(names) == 1:
                         std = np.sqrt(cov_grp.x)
@@ -425,13 +1069,13 @@ class Ensemble(object):
                         elif factor == "svd":
                             a, i = Ensemble._get_svd_projection_matrix(cov_grp.as_2d)
                             snv[:,i:] = 0.0
-                        # process each realization
-                        group_mean_values = mean_values.loc[names]
-                        for i in range(num_reals):
-                            reals[i, idxs] = group_mean_values + np.dot(a, snv[i, :])
+                        # process all realizations at once
+                        group_mean_values = mean_values.loc[names].values
+                        reals[:, idxs] = group_mean_values + np.dot(snv, a.T)
 
             else:
-                snv = np.random.randn(num_reals, cov.shape[0])
+                snv = Ensemble._standard_normal(num_reals, cov.shape[0], seed=seed,
+                                                tag="cov", num_threads=num_threads)
                 if factor == "eigen":
                     a, i = Ensemble._get_eigen_projection_matrix(cov.as_2d)
                 elif factor == "svd":
@@ -439,8 +1083,7 @@ class Ensemble(object):
                     snv[:,i:] = 0.0
                 cov_mean_values = mean_values.loc[cov.row_names].values
                 idxs = [mv_map[name] for name in cov.row_names]
-                for i in range(num_reals):
-                    reals[i, idxs] = cov_mean_values + np.dot(a, snv[i, :])
+                reals[:, idxs] = cov_mean_values + np.dot(snv, a.T)
 
         df = pd.DataFrame(reals,columns=mean_values.index.values)
         df.dropna(inplace=True,axis=1)
@@ -556,7 +1199,48 @@ class Ensemble(object):
             typ = pyemu.Matrix
         return typ.from_dataframe(self._df)
 
-    def covariance_matrix(self,localizer=None,center_on=None):
+    def covariance_accumulator(self,localizer=None,center_on=None,batch_size=None):
+        """get a `CovarianceAccumulator` loaded with the realizations in `Ensemble`
+
+        Args:
+            localizer (`pyemu.Matrix` or `scipy.sparse` matrix, optional): a matrix
+                to localize covariates.  Only the covariates at the non-zero
+                entries of `localizer` are calculated.  Default is None
+            center_on (`str`, optional): a realization name to use as the centering
+                point in ensemble space.  If `None`, the mean vector is
+                treated as the centering point.  Default is None
+            batch_size (`int`, optional): number of realizations to process in
+                a single pass.  If None, all realizations are processed at once.
+                Default is None
+
+        Returns:
+            `CovarianceAccumulator`: the loaded accumulator, which can be added to
+            with more realizations
+
+        Note:
+            respects log-transformation status, same as `Ensemble.get_deviations()`
+
+        """
+        retrans = False
+        if not self.istransformed:
+            self.transform()
+            retrans = True
+        vals = self._df.values
+        center = None
+        if center_on is not None:
+            if center_on not in self.index:
+                raise Exception("'center_on' realization {0} not found".format(center_on))
+            center = self._df.loc[center_on,:].values.astype(np.float64)
+        acc = CovarianceAccumulator(self.columns,localizer=localizer,center=center)
+        if batch_size is None:
+            batch_size = max(1,vals.shape[0])
+        for s in range(0,vals.shape[0],int(batch_size)):
+            acc.add(vals[s:s+int(batch_size),:])
+        if retrans:
+            self.back_transform()
+        return acc
+
+    def covariance_matrix(self,localizer=None,center_on=None,batch_size=None):
         """get a empirical covariance matrix implied by the
         correlations between realizations
 
@@ -566,20 +1250,20 @@ class Ensemble(object):
             center_on (`str`, optional): a realization name to use as the centering
                 point in ensemble space.  If `None`, the mean vector is
                 treated as the centering point.  Default is None
+            batch_size (`int`, optional): number of realizations to process in
+                a single pass.  Default is None (all realizations at once)
 
         Returns:
             `pyemu.Cov`: the empirical (and optionally localized) covariance matrix
 
-        """
-
-        devs = self.get_deviations(center_on=center_on).as_pyemu_matrix()
-        devs *= (1.0 / np.sqrt(float(self.shape[0] - 1.0)))
-
-        if localizer is not None:
-            devs = devs.T * devs
-            return devs.hadamard_product(localizer)
+        Note:
+            with a `localizer`, only the entries where `localizer` is non-zero
+            are calculated.  Use `Ensemble.covariance_accumulator().to_coo()` to
+            write the localized covariance without forming a dense matrix.
 
-        return pyemu.Cov((devs.T * devs).x,names=devs.col_names)
+        """
+        return self.covariance_accumulator(localizer=localizer,center_on=center_on,
+                                           batch_size=batch_size).to_cov()
 
 
     def dropna(self, *args, **kwargs):
@@ -618,7 +1302,7 @@ class ObservationEnsemble(Ensemble):
 
     @classmethod
     def from_gaussian_draw(cls,pst,cov=None,num_reals=100,by_groups=True,fill=False,
-                           factor="eigen"):
+                           factor="eigen", seed=None, num_threads=1):
         """generate an `ObservationEnsemble` from a (multivariate) gaussian
         distribution
 
@@ -639,6 +1323,13 @@ class ObservationEnsemble(Ensemble):
                 be "eigen" or "svd". The "eigen" option is default and is faster.  But
                 for (nearly) singular cov matrices (such as those generated empirically
                 from ensembles), "svd" is the only way.  Ignored for diagonal `cov`.
+            seed (`int`, `numpy.random.SeedSequence` or `numpy.random.Generator`, optional):
+                seed for reproducible parallel draws.  If passed, each block of realizations
+                (and covariance group) is drawn from an independent sub-stream of `seed`
+                instead of the global `numpy.random` stream.  Default is None
+            num_threads (`int`): number of threads to draw the realization blocks with.
+                Only used with `seed`.  The result does not depend on `num_threads`.
+                Default is 1
 
         Returns:
             `ObservationEnsemble`: the realized `ObservationEnsemble` instance
@@ -688,7 +1379,9 @@ class ObservationEnsemble(Ensemble):
                 grouper[grp] = list(grouper[grp])
         df = Ensemble._gaussian_draw(cov=nz_cov,mean_values=mean_values,
                                      num_reals=num_reals,grouper=grouper,
-                                     fill=fill, factor=factor)
+                                     fill=fill, factor=factor,
+                                     seed=Ensemble._seed_sequence(seed),
+                                     num_threads=num_threads)
         if fill:
             df.loc[:,pst.zero_weight_obs_names] = pst.observation_data.loc[pst.zero_weight_obs_names,
                                                                            "obsval"].values
@@ -707,14 +1400,10 @@ class ObservationEnsemble(Ensemble):
 
         """
         cols = self._df.columns
-        pst = self.pst
-        weights = self.pst.observation_data.loc[cols, "weight"]
-        obsval = self.pst.observation_data.loc[cols, "obsval"]
-        phi_vec = []
-        for idx in self._df.index.values:
-            simval = self._df.loc[idx, cols]
-            phi = (((simval - obsval) * weights) ** 2).sum()
-            phi_vec.append(phi)
+        weights = self.pst.observation_data.loc[cols, "weight"].values
+        obsval = self.pst.observation_data.loc[cols, "obsval"].values
+        phi_vec = pyemu.utils.en_utils.phi_vector(self._df.values.astype(np.float64),
+                                                  obsval, weights)
         return pd.Series(data=phi_vec, index=self.index)
 
     def add_base(self):
@@ -768,7 +1457,7 @@ class ParameterEnsemble(Ensemble):
 
     @classmethod
     def from_gaussian_draw(cls,pst,cov=None,num_reals=100,by_groups=True,
-                           fill=True, factor="eigen"):
+                           fill=True, factor="eigen", seed=None, num_threads=1):
         """generate a `ParameterEnsemble` from a (multivariate) (log) gaussian
         distribution
 
@@ -791,6 +1480,13 @@ class ParameterEnsemble(Ensemble):
                 be "eigen" or "svd". The "eigen" option is default and is faster.  But
                 for (nearly) singular cov matrices (such as those generated empirically
                 from ensembles), "svd" is the only way.  Ignored for diagonal `cov`.
+            seed (`int`, `numpy.random.SeedSequence` or `numpy.random.Generator`, optional):
+                seed for reproducible parallel draws.  If passed, each block of realizations
+                (and covariance group) is drawn from an independent sub-stream of `seed`
+                instead of the global `numpy.random` stream.  Default is None
+            num_threads (`int`): number of threads to draw the realization blocks with.
+                Only used with `seed`.  The result does not depend on `num_threads`.
+                Default is 1
 
         Returns:
             `ParameterEnsemble`: the parameter ensemble realized from the gaussian
@@ -834,12 +1530,80 @@ class ParameterEnsemble(Ensemble):
                 grouper[grp] = list(grouper[grp])
         df = Ensemble._gaussian_draw(cov=cov,mean_values=mean_values,
                                      num_reals=num_reals,grouper=grouper,
-                                     fill=fill)
+                                     fill=fill, factor=factor,
+                                     seed=Ensemble._seed_sequence(seed),
+                                     num_threads=num_threads)
         df.loc[:,li] = 10.0**df.loc[:,li]
         return cls(pst,df,istransformed=False)
 
+    @staticmethod
+    def _transformed_par_arrays(par):
+        """get the (log-transformed) bound and initial value arrays for
+        `parameter_data`.  Used by the draw routines.
+        """
+        li = (par.partrans == "log").values
+        lb = par.parlbnd.values.astype(np.float64)
+        ub = par.parubnd.values.astype(np.float64)
+        pv = par.parval1.values.astype(np.float64)
+        lb[li] = np.log10(lb[li])
+        ub[li] = np.log10(ub[li])
+        pv[li] = np.log10(pv[li])
+        adj = ~par.partrans.isin(["fixed", "tied"]).values
+        return lb, ub, pv, li, adj
+
+    @staticmethod
+    def _uniform_fill(arr, idxs, lb, ub, seed=None, num_threads=1):
+        """fill columns `idxs` of `arr` with uniform draws.  With the global
+        stream, the draws are generated parameter-by-parameter (each parameter
+        takes a contiguous block of the random stream) in a single call.  With
+        `seed`, each block of realizations is drawn from its own sub-stream.
+        """
+        if len(idxs) == 0:
+            return
+        lb, ub = lb[idxs], ub[idxs]
+        if seed is None:
+            arr[:, idxs] = np.random.uniform(lb[:, None], ub[:, None],
+                                             size=(len(idxs), arr.shape[0])).T
+        else:
+            arr[:, idxs] = Ensemble._blocked_draw(seed, "uniform", arr.shape[0],
+                                                  lambda rng, n: rng.uniform(lb, ub, size=(n, lb.shape[0])),
+                                                  num_threads=num_threads)
+
+    @staticmethod
+    def _triangular_fill(arr, idxs, lb, pv, ub, seed=None, num_threads=1):
+        """fill columns `idxs` of `arr` with triangular draws.  With the global
+        stream, the draws are generated parameter-by-parameter (each parameter
+        takes a contiguous block of the random stream) in a single call.  With
+        `seed`, each block of realizations is drawn from its own sub-stream.
+        """
+        if len(idxs) == 0:
+            return
+        lb, pv, ub = lb[idxs], pv[idxs], ub[idxs]
+        if seed is None:
+            arr[:, idxs] = np.random.triangular(lb[:, None], pv[:, None], ub[:, None],
+                                                size=(len(idxs), arr.shape[0])).T
+        else:
+            arr[:, idxs] = Ensemble._blocked_draw(seed, "triangular", arr.shape[0],
+                                                  lambda rng, n: rng.triangular(lb, pv, ub,
+                                                                                size=(n, lb.shape[0])),
+                                                  num_threads=num_threads)
+
     @classmethod
-    def from_triangular_draw(cls, pst, num_reals=100,fill=True):
+    def _from_block(cls, pst, arr, li, keep, real_names=None):
+        """back transform and wrap a realization block from the draw routines
+        """
+        arr[:, li] = 10.0 ** arr[:, li]
+        if real_names is None:
+            real_names = np.arange(arr.shape[0], dtype=np.int64)
+        par_names = pst.parameter_data.parnme.values
+        if not keep.all():
+            arr = arr[:, keep]
+            par_names = par_names[keep]
+        df = pd.DataFrame(arr, index=real_names, columns=par_names)
+        return cls(pst=pst, df=df)
+
+    @classmethod
+    def from_triangular_draw(cls, pst, num_reals=100,fill=True, seed=None, num_threads=1):
         """generate a `ParameterEnsemble` from a (multivariate) (log) triangular distribution
 
         Args:
@@ -847,6 +1611,13 @@ class ParameterEnsemble(Ensemble):
             num_reals (`int`, optional): number of realizations to generate.  Default is 100
             fill (`bool`): flag to fill in fixed and/or tied parameters with control file
                 values.  Default is True.
+            seed (`int`, `numpy.random.SeedSequence` or `numpy.random.Generator`, optional):
+                seed for reproducible parallel draws.  If passed, each block of realizations
+                (and covariance group) is drawn from an independent sub-stream of `seed`
+                instead of the global `numpy.random` stream.  Default is None
+            num_threads (`int`): number of threads to draw the realization blocks with.
+                Only used with `seed`.  The result does not depend on `num_threads`.
+                Default is 1
 
         Returns:
             `ParameterEnsemble`: a parameter ensemble drawn from the multivariate (log) triangular
@@ -858,7 +1629,8 @@ class ParameterEnsemble(Ensemble):
             log-transformed parameters are drawn in log space.  The returned `ParameterEnsemble`
             is back transformed (not in log space)
 
-            uses numpy.random.triangular
+            uses numpy.random.triangular with the bound vectors of all adjustable
+            parameters in a single call
 
         Example::
 
@@ -867,48 +1639,20 @@ class ParameterEnsemble(Ensemble):
             pe.to_csv("my_tri_pe.csv")
 
         """
-
-        li = pst.parameter_data.partrans == "log"
-        ub = pst.parameter_data.parubnd.copy()
-        ub.loc[li] = ub.loc[li].apply(np.log10)
-
-        lb = pst.parameter_data.parlbnd.copy()
-        lb.loc[li] = lb.loc[li].apply(np.log10)
-
-        pv = pst.parameter_data.parval1.copy()
-        pv.loc[li] = pv[li].apply(np.log10)
-
-        ub = ub.to_dict()
-        lb = lb.to_dict()
-        pv = pv.to_dict()
-
-        # set up some column names
-        # real_names = ["{0:d}".format(i)
-        #              for i in range(num_reals)]
-        real_names = np.arange(num_reals, dtype=np.int64)
-        arr = np.empty((num_reals, len(ub)))
+        par = pst.parameter_data
+        lb, ub, pv, li, adj = ParameterEnsemble._transformed_par_arrays(par)
+        arr = np.empty((num_reals, par.shape[0]))
         arr[:, :] = np.NaN
-        adj_par_names = set(pst.adj_par_names)
-        for i, pname in enumerate(pst.parameter_data.parnme):
-            # print(pname, lb[pname], ub[pname])
-            if pname in adj_par_names:
-                arr[:, i] = np.random.triangular(lb[pname],
-                                                 pv[pname],
-                                                 ub[pname],
-                                                 size=num_reals)
-            elif fill:
-                arr[:, i] = np.zeros((num_reals)) + \
-                            pst.parameter_data. \
-                                loc[pname, "parval1"]
-
-        df = pd.DataFrame(arr, index=real_names, columns=pst.par_names)
-        df.dropna(inplace=True,axis=1)
-        df.loc[:, li] = 10.0 ** df.loc[:, li]
-        new_pe = cls(pst=pst, df=df)
-        return new_pe
+        ParameterEnsemble._triangular_fill(arr, np.where(adj)[0], lb, pv, ub,
+                                           seed=Ensemble._seed_sequence(seed),
+                                           num_threads=num_threads)
+        if fill:
+            arr[:, ~adj] = par.parval1.values[~adj]
+        keep = adj | fill
+        return cls._from_block(pst, arr, li & keep, keep)
 
     @classmethod
-    def from_uniform_draw(cls, pst, num_reals,fill=True):
+    def from_uniform_draw(cls, pst, num_reals,fill=True, seed=None, num_threads=1):
         """ generate a `ParameterEnsemble` from a (multivariate) (log) uniform
         distribution
 
@@ -917,6 +1661,13 @@ class ParameterEnsemble(Ensemble):
             num_reals (`int`, optional): number of realizations to generate.  Default is 100
             fill (`bool`): flag to fill in fixed and/or tied parameters with control file
                 values.  Default is True.
+            seed (`int`, `numpy.random.SeedSequence` or `numpy.random.Generator`, optional):
+                seed for reproducible parallel draws.  If passed, each block of realizations
+                (and covariance group) is drawn from an independent sub-stream of `seed`
+                instead of the global `numpy.random` stream.  Default is None
+            num_threads (`int`): number of threads to draw the realization blocks with.
+                Only used with `seed`.  The result does not depend on `num_threads`.
+                Default is 1
 
         Returns:
             `ParameterEnsemble`: a parameter ensemble drawn from the multivariate (log) uniform
@@ -927,7 +1678,8 @@ class ParameterEnsemble(Ensemble):
             log-transformed parameters are drawn in log space.  The returned `ParameterEnsemble`
             is back transformed (not in log space)
 
-            uses numpy.random.uniform
+            uses numpy.random.uniform with the bound vectors of all adjustable
+            parameters in a single call
 
         Example::
 
@@ -937,40 +1689,21 @@ class ParameterEnsemble(Ensemble):
 
 
         """
-
-        li = pst.parameter_data.partrans == "log"
-        ub = pst.parameter_data.parubnd.copy()
-        ub.loc[li] = ub.loc[li].apply(np.log10)
-        ub = ub.to_dict()
-        lb = pst.parameter_data.parlbnd.copy()
-        lb.loc[li] = lb.loc[li].apply(np.log10)
-        lb = lb.to_dict()
-
-        real_names = np.arange(num_reals, dtype=np.int64)
-        arr = np.empty((num_reals, len(ub)))
-        arr[:,:] = np.NaN
-        adj_par_names = set(pst.adj_par_names)
-        for i, pname in enumerate(pst.parameter_data.parnme):
-            # print(pname,lb[pname],ub[pname])
-            if pname in adj_par_names:
-                arr[:, i] = np.random.uniform(lb[pname],
-                                              ub[pname],
-                                              size=num_reals)
-            elif fill:
-                arr[:, i] = np.zeros((num_reals)) + \
-                            pst.parameter_data. \
-                                loc[pname, "parval1"]
-
-        df = pd.DataFrame(arr, index=real_names, columns=pst.par_names)
-        df.dropna(inplace=True,axis=1)
-        df.loc[:, li] = 10.0 ** df.loc[:, li]
-
-        new_pe = cls(pst=pst, df=df)
-        return new_pe
+        par = pst.parameter_data
+        lb, ub, pv, li, adj = ParameterEnsemble._transformed_par_arrays(par)
+        arr = np.empty((num_reals, par.shape[0]))
+        arr[:, :] = np.NaN
+        ParameterEnsemble._uniform_fill(arr, np.where(adj)[0], lb, ub,
+                                        seed=Ensemble._seed_sequence(seed),
+                                        num_threads=num_threads)
+        if fill:
+            arr[:, ~adj] = par.parval1.values[~adj]
+        keep = adj | fill
+        return cls._from_block(pst, arr, li & keep, keep)
 
     @classmethod
     def from_mixed_draws(cls, pst, how_dict, default="gaussian", num_reals=100, cov=None, sigma_range=6,
-                         enforce_bounds=True, partial=False, fill=True):
+                         enforce_bounds=True, partial=False, fill=True, seed=None, num_threads=1):
         """generate a `ParameterEnsemble` using a mixture of
         distributions.  Available distributions include (log) "uniform", (log) "triangular",
         and (log) "gaussian". log transformation is respected.
@@ -995,13 +1728,24 @@ class ParameterEnsemble(Ensemble):
                 Default is `False`.
             fill (`bool`): flag to fill in fixed and/or tied parameters with control file
                 values.  Default is True.
+            seed (`int`, `numpy.random.SeedSequence` or `numpy.random.Generator`, optional):
+                seed for reproducible parallel draws.  If passed, each block of realizations
+                (and covariance group) is drawn from an independent sub-stream of `seed`
+                instead of the global `numpy.random` stream.  Default is None
+            num_threads (`int`): number of threads to draw the realization blocks with.
+                Only used with `seed`.  The result does not depend on `num_threads`.
+                Default is 1
+
+        Note:
+            all distributions are drawn into a single preallocated realization block.
+            Within each distribution, parameters are drawn in sorted name order.
 
         """
 
         # error checking
         accept = {"uniform", "triangular", "gaussian"}
         assert default in accept, "ParameterEnsemble.from_mixed_draw() error: 'default' must be in {0}".format(accept)
-        par_org = pst.parameter_data.copy()
+        par = pst.parameter_data
         pset = set(pst.adj_par_names)
         hset = set(how_dict.keys())
         missing = pset.difference(hset)
@@ -1022,66 +1766,51 @@ class ParameterEnsemble(Ensemble):
             raise Exception("ParameterEnsemble.from_mixed_draws() error: the following hows are not recognized:{0}" \
                             .format(','.join(unknown_draw)))
 
-        # work out 'how' grouping
-        how_groups = {how: [] for how in accept}
-        for pname, how in how_dict.items():
-            how_groups[how].append(pname)
+        # work out 'how' grouping as integer column positions in sorted name order
+        how = pd.Series(how_dict)
+        how = how.loc[how.index.sort_values()]
+        par_idx = pd.Series(np.arange(par.shape[0]), index=par.parnme.values)
+        how_groups = {h: par_idx.loc[how.index[how.values == h]].values for h in accept}
 
-        # gaussian
-        pes = []
-        if len(how_groups["gaussian"]) > 0:
-            gset = set(how_groups["gaussian"])
-            par_gaussian = par_org.loc[gset, :]
-            # par_gaussian.sort_values(by="parnme", inplace=True)
-            par_gaussian.sort_index(inplace=True)
-            pst.parameter_data = par_gaussian
+        lb, ub, pv, li, adj = ParameterEnsemble._transformed_par_arrays(par)
+        arr = np.empty((num_reals, par.shape[0]))
+        arr[:, :] = np.NaN
+        seed = Ensemble._seed_sequence(seed)
 
+        # gaussian
+        gidxs = how_groups["gaussian"]
+        if len(gidxs) > 0:
+            gnames = par.parnme.values[gidxs]
             if cov is not None:
-                cset = set(cov.row_names)
-                # gset = set(how_groups["gaussian"])
-                diff = gset.difference(cset)
+                diff = set(gnames).difference(set(cov.row_names))
                 assert len(diff) == 0, "ParameterEnsemble.from_mixed_draws() error: the 'cov' is not compatible with " + \
                                        " the parameters listed as 'gaussian' in how_dict, the following are not in the cov:{0}". \
                                            format(','.join(diff))
+                gcov = cov.get(list(gnames))
             else:
+                gcov = pyemu.Cov.from_parameter_data(pst, sigma_range=sigma_range).get(list(gnames))
+            mean_values = pd.Series(pv[gidxs], index=gnames)
+            grouper = None
+            if not gcov.isdiagonal:
+                grouper = par.iloc[gidxs, :].groupby("pargp").groups
+                for grp in grouper.keys():
+                    grouper[grp] = list(grouper[grp])
+            gdf = Ensemble._gaussian_draw(cov=gcov, mean_values=mean_values,
+                                          num_reals=num_reals, grouper=grouper, fill=True,
+                                          seed=seed, num_threads=num_threads)
+            arr[:, gidxs] = gdf.loc[:, gnames].values
+
+        ParameterEnsemble._uniform_fill(arr, how_groups["uniform"], lb, ub,
+                                        seed=seed, num_threads=num_threads)
+        ParameterEnsemble._triangular_fill(arr, how_groups["triangular"], lb, pv, ub,
+                                           seed=seed, num_threads=num_threads)
 
-                cov = pyemu.Cov.from_parameter_data(pst, sigma_range=sigma_range)
-            pe_gauss = ParameterEnsemble.from_gaussian_draw(pst, cov, num_reals=num_reals)
-            pes.append(pe_gauss)
-
-        if len(how_groups["uniform"]) > 0:
-            par_uniform = par_org.loc[how_groups["uniform"], :]
-            # par_uniform.sort_values(by="parnme",inplace=True)
-            par_uniform.sort_index(inplace=True)
-            pst.parameter_data = par_uniform
-            pe_uniform = ParameterEnsemble.from_uniform_draw(pst, num_reals=num_reals)
-            pes.append(pe_uniform)
-
-        if len(how_groups["triangular"]) > 0:
-            par_tri = par_org.loc[how_groups["triangular"], :]
-            # par_tri.sort_values(by="parnme", inplace=True)
-            par_tri.sort_index(inplace=True)
-            pst.parameter_data = par_tri
-            pe_tri = ParameterEnsemble.from_triangular_draw(pst, num_reals=num_reals)
-            pes.append(pe_tri)
-
-        df = pd.DataFrame(index=np.arange(num_reals), columns=par_org.parnme.values)
-
-        df.loc[:, :] = np.NaN
         if fill:
-            fixed_tied = par_org.loc[par_org.partrans.apply(lambda x: x in ["fixed", "tied"]), "parval1"].to_dict()
-            for p, v in fixed_tied.items():
-                df.loc[:, p] = v
-
-        for pe in pes:
-            df.loc[pe.index, pe.columns] = pe
-
-
-        # this dropna covers both "fill" and "partial"
-        df = df.dropna(axis=1)
+            arr[:, ~adj] = par.parval1.values[~adj]
 
-        pst.parameter_data = par_org
-        pe = ParameterEnsemble(df=df, pst=pst)
+        # this covers both "fill" and "partial"
+        keep = ~np.isnan(arr).any(axis=0)
+        pe = cls._from_block(pst, arr, li & keep, keep)
         if enforce_bounds:
             pe.enforce()
         return pe
@@ -1455,10 +2184,9 @@ class ParameterEnsemble(Ensemble):
         violating vals to bound
         """
 
-        ub = (self.ubnd * (1.0 - bound_tol)).to_dict()
-        lb = (self.lbnd * (1.0 + bound_tol)).to_dict()
+        ub = (self.ubnd * (1.0 - bound_tol)).loc[self.columns].values
+        lb = (self.lbnd * (1.0 + bound_tol)).loc[self.columns].values
 
         val_arr = self._df.values
-        for iname, name in enumerate(self.columns):
-            val_arr[val_arr[:,iname] > ub[name],iname] = ub[name]
-            val_arr[val_arr[:, iname] < lb[name],iname] = lb[name]
+        np.minimum(val_arr, ub, out=val_arr)
+        np.maximum(val_arr, lb, out=val_arr)
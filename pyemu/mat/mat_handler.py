@@ -38,6 +38,20 @@ def save_coo(x, row_names, col_names,  filename, chunk=None):
     data = np.core.records.fromarrays([x.row, x.col, x.data], dtype=Matrix.coo_rec_dt)
     data.tofile(f)
 
+    _write_coo_names(f, row_names, col_names)
+    f.close()
+
+
+def _write_coo_names(f, row_names, col_names):
+    """write the fixed-width row and column names that trail the
+    records of a PEST-compatible coo binary file
+
+    Args:
+        f (`file`): open binary file handle
+        row_names ([`str`]): list of row names
+        col_names (['str]): list of col_names
+
+    """
     for name in col_names:
         if len(name) > Matrix.new_par_length:
             name = name[:Matrix.new_par_length - 1]
@@ -52,7 +66,6 @@ def save_coo(x, row_names, col_names,  filename, chunk=None):
             for i in range(len(name), Matrix.new_obs_length):
                 name = name + ' '
         f.write(name.encode())
-    f.close()
 
 
 def concat(mats):
@@ -2456,38 +2469,32 @@ class Cov(Matrix):
             Calls `Cov.from_parameter_data()`
 
         """
-        npar = pst.npar_adj
-        x = np.zeros((npar, 1))
-        names = []
-        idx = 0
-        for i, row in pst.parameter_data.iterrows():
-            t = row["partrans"]
-            if t in ["fixed", "tied"]:
-                continue
-            if scale_offset:
-                lb = row.parlbnd * row.scale + row.offset
-                ub = row.parubnd * row.scale + row.offset
-            else:
-                lb = row.parlbnd
-                ub = row.parubnd
-
-            if t == "log":
-                var = ((np.log10(np.abs(ub)) - np.log10(np.abs(lb))) / sigma_range) ** 2
-            else:
-                var = ((ub - lb) / sigma_range) ** 2
-            if np.isnan(var) or not np.isfinite(var):
-                raise Exception("Cov.from_parameter_data() error: " +\
-                                "variance for parameter {0} is nan".\
-                                format(row["parnme"]))
-            if (var == 0.0):
-                s = "Cov.from_parameter_data() error: " +\
-                                "variance for parameter {0} is 0.0.".format(row["parnme"])
-                s += "  This might be from enforcement of scale/offset and log transform."
-                s += "  Try changing 'scale_offset' arg"
-                raise Exception(s)
-            x[idx] = var
-            names.append(row["parnme"].lower())
-            idx += 1
+        par = pst.parameter_data
+        par = par.loc[~par.partrans.isin(["fixed", "tied"]), :]
+        lb = par.parlbnd.values.astype(np.float64)
+        ub = par.parubnd.values.astype(np.float64)
+        if scale_offset:
+            lb = lb * par.scale.values + par.offset.values
+            ub = ub * par.scale.values + par.offset.values
+        islog = (par.partrans == "log").values
+        with np.errstate(divide="ignore", invalid="ignore"):
+            var = ((ub - lb) / sigma_range) ** 2
+            var[islog] = ((np.log10(np.abs(ub[islog])) -
+                           np.log10(np.abs(lb[islog]))) / sigma_range) ** 2
+        bad = ~np.isfinite(var)
+        if bad.any():
+            raise Exception("Cov.from_parameter_data() error: " +\
+                            "variance for parameter {0} is nan".\
+                            format(par.parnme.values[bad][0]))
+        zero = var == 0.0
+        if zero.any():
+            s = "Cov.from_parameter_data() error: " +\
+                            "variance for parameter {0} is 0.0.".format(par.parnme.values[zero][0])
+            s += "  This might be from enforcement of scale/offset and log transform."
+            s += "  Try changing 'scale_offset' arg"
+            raise Exception(s)
+        x = var.reshape(-1, 1)
+        names = [n.lower() for n in par.parnme.values]
 
         return cls(x=x,names=names,isdiagonal=True)
 
@@ -2645,26 +2652,14 @@ class Cov(Matrix):
             on purpose so that it is clear the returned instance is not a Cov
 
         """
-        std_dict = self.get_diagonal_vector().to_dataframe()["diag"].\
-            apply(np.sqrt).to_dict()
         pearson = self.identity.as_2d
         if self.isdiagonal:
             return Matrix(x=pearson,row_names=self.row_names,
                           col_names=self.col_names)
-        df = self.to_dataframe()
-        # fill the lower triangle
-        for i,iname in enumerate(self.row_names):
-            for j,jname in enumerate(self.row_names[i+1:]):
-                # cv = df.loc[iname,jname]
-                # std1,std2 = std_dict[iname],std_dict[jname]
-                # cc = cv / (std1*std2)
-                # v1 = np.sqrt(df.loc[iname,iname])
-                # v2 = np.sqrt(df.loc[jname,jname])
-                pearson[i,j+i+1] = df.loc[iname,jname] / (std_dict[iname] * std_dict[jname])
-
-        # replicate across diagonal
-        for i,iname in enumerate(self.row_names[:-1]):
-             pearson[i+1:,i] = pearson[i,i+1:]
+        std = np.sqrt(np.diag(self.x))
+        # the upper triangle, replicated across the diagonal
+        upper = np.triu(self.x / np.outer(std,std),1)
+        pearson += upper + upper.T
         return Matrix(x=pearson,row_names=self.row_names,
                       col_names=self.col_names)
 
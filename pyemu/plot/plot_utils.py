@@ -1176,6 +1176,12 @@ def ensemble_res_1to1(ensemble, pst,facecolor='0.5',logger=None,filename=None,
         for skip_group in skip_groups:
             grouper.pop(skip_group)
 
+    # the simulated range of each observation, calculated once for all groups
+    ens_ranges = {c: (en.min(), en.max()) for c, en in ensembles.items()}
+    base_ranges = None
+    if base_ensemble is not None:
+        base_ranges = {c: (en.min(), en.max()) for c, en in base_ensemble.items()}
+
     fig = plt.figure(figsize=figsize)
     if "fig_title" in kwargs:
         plt.figtext(0.5,0.5,kwargs["fig_title"])
@@ -1225,17 +1231,15 @@ def ensemble_res_1to1(ensemble, pst,facecolor='0.5',logger=None,filename=None,
         if base_ensemble is not None:
             obs_gg = obs_g.sort_values(by="obsval")
 
-            for c, en in base_ensemble.items():
-                en_g = en.loc[:, obs_gg.obsnme]
-                ex = en_g.max()
-                en = en_g.min()
+            for c, (en, ex) in base_ranges.items():
+                en = en.loc[obs_gg.obsnme]
+                ex = ex.loc[obs_gg.obsnme]
                 #[ax.plot([ov, ov], [een, eex], color=c,alpha=0.3) for ov, een, eex in zip(obs_g.obsval.values, en.values, ex.values)]
                 ax.fill_between(obs_gg.obsval,en,ex,facecolor=c,alpha=0.2)
         #ax.scatter([obs_g.sim], [obs_g.obsval], marker='.', s=10, color='b')
-        for c,en in ensembles.items():
-            en_g = en.loc[:,obs_g.obsnme]
-            ex = en_g.max()
-            en = en_g.min()
+        for c,(en,ex) in ens_ranges.items():
+            en = en.loc[obs_g.obsnme]
+            ex = ex.loc[obs_g.obsnme]
             [ax.plot([ov,ov],[een,eex],color=c) for ov,een,eex in zip(obs_g.obsval.values,en.values,ex.values)]
 
 
@@ -1260,17 +1264,15 @@ def ensemble_res_1to1(ensemble, pst,facecolor='0.5',logger=None,filename=None,
         if base_ensemble is not None:
             obs_gg = obs_g.sort_values(by="obsval")
 
-            for c, en in base_ensemble.items():
-                en_g = en.loc[:, obs_gg.obsnme].subtract(obs_gg.obsval)
-                ex = en_g.max()
-                en = en_g.min()
+            for c, (en, ex) in base_ranges.items():
+                en = en.loc[obs_gg.obsnme].subtract(obs_gg.obsval)
+                ex = ex.loc[obs_gg.obsnme].subtract(obs_gg.obsval)
                 #[ax.plot([ov, ov], [een, eex], color=c,alpha=0.3) for ov, een, eex in zip(obs_g.obsval.values, en.values, ex.values)]
                 ax.fill_between(obs_gg.obsval,en,ex,facecolor=c,alpha=0.2)
 
-        for c,en in ensembles.items():
-            en_g = en.loc[:,obs_g.obsnme].subtract(obs_g.obsval,axis=1)
-            ex = en_g.max()
-            en = en_g.min()
+        for c,(en,ex) in ens_ranges.items():
+            en = en.loc[obs_g.obsnme].subtract(obs_g.obsval)
+            ex = ex.loc[obs_g.obsnme].subtract(obs_g.obsval)
             [ax.plot([ov,ov],[een,eex],color=c) for ov,een,eex in zip(obs_g.obsval.values,en.values,ex.values)]
         # if base_ensemble is not None:
         #     if base_ensemble is not None:
@@ -1193,25 +1193,10 @@ class Pst(object):
             self.prior_information.pop("names")
         if "rhs" in self.prior_information.columns:
             self.prior_information.pop("rhs")
-        def parse(eqs):
-            raw = eqs.split('=')
-            #rhs = float(raw[1])
-            raw = [i for i in re.split('[###]',
-                    raw[0].lower().strip().replace(' + ','###').replace(' - ','###')) if i != '']
-            # in case of a leading '-' or '+'
-            if len(raw[0]) == 0:
-                raw = raw[1:]
-            # pnames = []
-            # for r in raw:
-            #     if '*' not in r:
-            #         continue
-            #     pname =  r.split('*')[1].replace("log(", '').replace(')', '').strip()
-            #     pnames.append(pname)
-            # return pnames
-            return [r.split('*')[1].replace("log(",'').replace(')','').strip() for r in raw if '*' in r]
-
-        self.prior_information.loc[:,"names"] =\
-            self.prior_information.equation.apply(lambda x: parse(x))
+        # the names follow the '*' of each term, with any log() transform removed
+        lhs = self.prior_information.equation.astype(str).str.split('=').str[0].str.lower()
+        self.prior_information.loc[:,"names"] = \
+            lhs.str.findall(r"\*\s*(?:log\(\s*)?([^\s*()]+)").values
 
 
     def add_pi_equation(self,par_names,pilbl=None,rhs=0.0,weight=1.0,
@@ -1279,14 +1264,27 @@ class Pst(object):
             return
         self._parse_pi_par_names()
         adj_names = self.adj_par_names
-        def is_good(names):
-            for n in names:
-                if n not in adj_names:
-                    return False
-            return True
-        keep_idx = self.prior_information.names.\
-            apply(lambda x: is_good(x))
-        self.prior_information = self.prior_information.loc[keep_idx,:]
+        names = pd.Series(self.prior_information.names.values).explode()
+        keep_idx = (names.isin(adj_names) | names.isnull()).groupby(level=0).all()
+        self.prior_information = self.prior_information.loc[keep_idx.values,:]
+
+    def _write_pi_lines(self,f,eq_width,chunk_size=100000):
+        """ private method to write the prior information equation lines in
+        chunks of `chunk_size` equations, building the lines of each chunk with
+        vectorized string operations (same format as `pst_utils.SFMT` and
+        `pst_utils.FFMT`)"""
+        def sfmt(s):
+            return s.apply(lambda x: x.decode() if isinstance(x,bytes) else str(x)).\
+                str.ljust(20) + ' '
+        pi = self.prior_information
+        for start in range(0,pi.shape[0],chunk_size):
+            chunk = pi.iloc[start:start + chunk_size]
+            lines = sfmt(chunk.pilbl) + ' ' + chunk.equation.astype(str).str.ljust(eq_width) + ' ' +\
+                np.char.mod("%-20.10E ",chunk.weight.values.astype(np.float64)) +\
+                sfmt(chunk.obgnme)
+            if self.with_comments and 'extra' in chunk.columns:
+                lines += " # " + chunk.extra.astype(str)
+            f.write('\n'.join(lines.values) + '\n')
 
     def _write_df(self,name,f,df,formatters,columns):
         if name.startswith('*'):
@@ -1410,7 +1408,9 @@ class Pst(object):
         if self.prior_information.shape[0] > 0:
             f_out.write("* prior information\n")
             pi_filename = new_filename.lower().replace(".pst", ".pi_data.csv")
-            self.prior_information.to_csv(pi_filename,index=False)
+            # the parsed "names" lists are not written
+            columns = [c for c in self.prior_information.columns if c != "names"]
+            self.prior_information.to_csv(pi_filename,index=False,columns=columns)
             f_out.write("external {0}\n".format(pi_filename))
 
 
@@ -1522,9 +1522,7 @@ class Pst(object):
                 warnings.warn("NaNs in prior_information dataframe",PyemuWarning)
             f_out.write("* prior information\n")
             #self.prior_information.index = self.prior_information.pop("pilbl")
-            max_eq_len = self.prior_information.equation.apply(lambda x:len(x)).max()
-            eq_fmt_str =  " {0:<" + str(max_eq_len) + "s} "
-            eq_fmt_func = lambda x:eq_fmt_str.format(x)
+            max_eq_len = self.prior_information.equation.astype(str).str.len().max()
             #  17/9/2016 - had to go with a custom writer loop b/c pandas doesn't want to
             # output strings longer than 100, even with display.max_colwidth
             #f_out.write(self.prior_information.to_string(col_space=0,
@@ -1539,14 +1537,7 @@ class Pst(object):
             #     f_out.write(eq_fmt_func(row["equation"]))
             #     f_out.write(pst_utils.FFMT(row["weight"]))
             #     f_out.write(pst_utils.SFMT(row["obgnme"]) + '\n')
-            for _, row in self.prior_information.iterrows():
-                f_out.write(pst_utils.SFMT(row["pilbl"]))
-                f_out.write(eq_fmt_func(row["equation"]))
-                f_out.write(pst_utils.FFMT(row["weight"]))
-                f_out.write(pst_utils.SFMT(row["obgnme"]))
-                if self.with_comments and 'extra' in row:
-                    f_out.write(" # {0}".format(row['extra']))
-                f_out.write('\n')
+            self._write_pi_lines(f_out,max_eq_len)
 
         if self.control_data.pestmode.startswith("regul"):
             #f_out.write("* regularisation\n")
@@ -2325,67 +2316,20 @@ class Pst(object):
             the normalized RMSE is normalized against the obsval range (max - min)
 
         """
-        res = self.res.copy()
-        res.loc[:,"obsnme"] = res.pop("name")
-        res.index = res.obsnme
+        res = self.res
         if nonzero:
             obs = self.observation_data.loc[self.nnz_obs_names,:]
-        #print(obs.shape,res.shape)
-        res = res.loc[obs.obsnme,:]
-        #print(obs.shape, res.shape)
-
-        #reset the res parts to current obs values and remove
-        #duplicate attributes
-        res.loc[:,"weight"] = obs.weight
-        res.loc[:,"obsval"] = obs.obsval
-        res.loc[:,"obgnme"] = obs.obgnme
-        res.pop("group")
-        res.pop("measured")
-
-        #build these attribute lists for faster lookup later
-        og_dict = {og:res.loc[res.obgnme==og,"obsnme"] for og in res.obgnme.unique()}
-        og_names = list(og_dict.keys())
-
-        # the list of functions and names
-        sfuncs = [self._stats_rss, self._stats_mean,self._stats_mae,
-                         self._stats_rmse,self._stats_nrmse]
-        snames = ["rss","mean","mae","rmse","nrmse"]
-
-        data = []
-        for sfunc in sfuncs:
-            full = sfunc(res)
-            groups = [full]
-            for og in og_names:
-                onames = og_dict[og]
-                res_og = res.loc[onames,:]
-                groups.append(sfunc(res_og))
-            data.append(groups)
-
-        og_names.insert(0,"all")
-        stats = pd.DataFrame(data,columns=og_names,index=snames)
+        else:
+            obs = self.observation_data
+        modelled = res.loc[:,["name","modelled"]].set_index("name").modelled
+        ers = pyemu.utils.en_utils.EnsembleResStats(obs)
+        ers.add(modelled.loc[obs.obsnme].values,real_names=["res"])
+        stats = ers.to_dataframes()
+        data = [stats[sname].iloc[0,:].values for sname in pyemu.utils.en_utils.STAT_NAMES]
+        stats = pd.DataFrame(data,columns=["all"] + ers.groups,
+                             index=pyemu.utils.en_utils.STAT_NAMES)
         return stats
 
-    @staticmethod
-    def _stats_rss(df):
-        return (((df.modelled - df.obsval) * df.weight)**2).sum()
-
-    @staticmethod
-    def _stats_mean(df):
-        return (df.modelled - df.obsval).mean()
-
-    @staticmethod
-    def _stats_mae(df):
-        return ((df.modelled - df.obsval).apply(np.abs)).sum() / df.shape[0]
-
-    @staticmethod
-    def _stats_rmse(df):
-        return np.sqrt(((df.modelled - df.obsval)**2).sum() / df.shape[0])
-
-    @staticmethod
-    def _stats_nrmse(df):
-        return Pst._stats_rmse(df) / (df.obsval.max() - df.obsval.min())
-
-
     def plot(self,kind=None,**kwargs):
         """method to plot various parts of the control.  This is sweet as!
 
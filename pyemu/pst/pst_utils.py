@@ -592,7 +592,9 @@ def try_process_output_file(ins_file,output_file=None):
     """
     if output_file is None:
         output_file = ins_file.replace(".ins","")
-    df = None
+    df = _try_read_csv_output_file(ins_file,output_file)
+    if df is not None:
+        return df
     try:
         i = InstructionFile(ins_file)
         df = i.read_output_file(output_file)
@@ -622,10 +624,11 @@ def try_process_output_pst(pst):
 
     """
     for ins_file,out_file in zip(pst.instruction_files,pst.output_files):
-        df = None
+        df = _try_read_csv_output_file(ins_file,out_file,pst=pst)
         try:
-            i = InstructionFile(ins_file,pst=pst)
-            df = i.read_output_file(out_file)
+            if df is None:
+                i = InstructionFile(ins_file,pst=pst)
+                df = i.read_output_file(out_file)
         except Exception as e:
             warnings.warn("error processing instruction file {0}, trying inschek: {1}".format(ins_file,str(e)))
             df = _try_run_inschek(ins_file,out_file)
@@ -741,8 +744,68 @@ def clean_missing_exponent(pst_filename,clean_filename="clean.pst"):
         for line in lines:
             f.write(line+'\n')
 
+def _plan_filename(config_file):
+    """the name of the extraction plan file that goes with a post-processor config file"""
+    return config_file + ".plan.npz"
+
+
+def _save_plan(config_file, plan):
+    """write an extraction plan (a dict of numpy arrays) for a post-processor config
+    file.  The plan is keyed to the size and modification time of the config file,
+    so a plan is never used with a config file that changed after it was written
+
+    """
+    st = os.stat(config_file)
+    arrays = dict(plan)
+    arrays["_key"] = np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+    plan_file = _plan_filename(config_file)
+    # write to a temp file and move so concurrent readers never see a partial file
+    tmp_file = "{0}.{1}.tmp".format(plan_file, os.getpid())
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_file, plan_file)
+
+
+def _load_plan(config_file):
+    """load the extraction plan for a config file.  Returns None if there is no
+    plan or the config file has changed since the plan was written
+
+    """
+    plan_file = _plan_filename(config_file)
+    if not os.path.exists(plan_file):
+        return None
+    try:
+        with np.load(plan_file, allow_pickle=False) as npz:
+            plan = {name: npz[name] for name in npz.files}
+    except Exception:
+        return None
+    st = os.stat(config_file)
+    key = plan.pop("_key", None)
+    if key is None or not np.array_equal(key, [st.st_size, st.st_mtime_ns]):
+        return None
+    return plan
+
+
+def _get_plan(config_file, build_plan):
+    """load the extraction plan for a config file, building (and saving) it with
+    `build_plan(config_file)` if needed.  Setup functions save the plan, so it is
+    normally only built here for configs written by older versions or edited by hand
+
+    """
+    plan = _load_plan(config_file)
+    if plan is None:
+        plan = build_plan(config_file)
+        try:
+            _save_plan(config_file, plan)
+        except Exception as e:
+            warnings.warn("error saving extraction plan for {0}: {1}".
+                          format(config_file, str(e)), PyemuWarning)
+    return plan
+
+
 def csv_to_ins_file(csv_filename,ins_filename=None,only_cols=None,only_rows=None,
-                    marker='~',includes_header=True,includes_index=True,prefix=''):
+                    marker='~',includes_header=True,includes_index=True,prefix='',
+                    chunk_size=10000):
     """write a PEST-style instruction file from an existing CSV file
 
     Args:
@@ -761,6 +824,8 @@ def csv_to_ins_file(csv_filename,ins_filename=None,only_cols=None,only_rows=None
             index column as the first column.  Default is True.
         prefix (`str`, optional): a prefix to prepend to observation names.
             Default is ""
+        chunk_size (`int`, optional): number of csv rows that are read and
+            written to `ins_filename` at once.  Default is 10000
 
     Returns:
         `pandas.DataFrame`: a dataframe of observation names and values found in
@@ -770,97 +835,175 @@ def csv_to_ins_file(csv_filename,ins_filename=None,only_cols=None,only_rows=None
         resulting observation names in `ins_filename` are a combiation of index and
         header values.
 
+        the instruction lines are written in blocks of `chunk_size` rows and
+        observation names are only formed for the selected rows and columns.
+
+        an extraction plan (`ins_filename` + ".plan.npz") is saved with the
+        instruction file, so that `process_output_files()` can read the model
+        output csv with `read_csv_output_file()` instead of `InstructionFile`
+
 
     """
     # process the csv_filename in case it is a dataframe
     if isinstance(csv_filename,str):
-        df = pd.read_csv(csv_filename,index_col=0)
-        df.columns = df.columns.map(str.lower)
-        df.index = df.index.map(lambda x: str(x).lower())
-    else:
-        df = csv_filename
-
-    # process only_cols
-    if only_cols is None:
-        only_cols = set(df.columns.map(str.lower))
+        chunks = pd.read_csv(csv_filename,index_col=0,chunksize=chunk_size)
     else:
-        if isinstance(only_cols,str): # incase it is a single name
-            only_cols = [only_cols]
-        only_cols = set(only_cols)
+        chunks = (csv_filename.iloc[start:start + chunk_size]
+                  for start in range(0,max(csv_filename.shape[0],1),chunk_size))
 
-    if only_rows is None:
-        only_rows = set(df.index.map(str.lower))
-    else:
-        if isinstance(only_rows,str): # incase it is a single name
-            only_rows = [only_rows]
-        only_rows = set(only_rows)
-
-    # process the row labels, handling duplicates
-    rlabels = []
-    row_visit = {}
-    only_rlabels = []
-    for rname in df.index:
-        rname = str(rname).strip().lower()
-
-        if rname in row_visit:
-            rsuffix = str(int(row_visit[rname] + 1))
-            row_visit[rname] += 1
-        else:
-            row_visit[rname] = 1
-            rsuffix = ''
-        rlabel = rname + rsuffix
-        rlabels.append(rlabel)
-        if rname in only_rows:
-            only_rlabels.append(rlabel)
-    only_rlabels = set(only_rlabels)
-
-    #process the col labels, handling duplicates
-    clabels = []
-    col_visit = {}
-    only_clabels = []
-    for cname in df.columns:
-        cname = str(cname).strip().lower()
-        if cname in col_visit:
-            csuffix = str(int(col_visit[cname]+1))
-            col_visit[cname] += 1
-        else:
-            col_visit[cname] = 1
-            csuffix = ''
-        clabel = cname + csuffix
-        clabels.append(clabel)
-        if cname in only_cols:
-            only_clabels.append(clabel)
+    if isinstance(only_cols,str): # incase it is a single name
+        only_cols = [only_cols]
+    if isinstance(only_rows,str): # incase it is a single name
+        only_rows = [only_rows]
 
     if ins_filename is None:
         if not isinstance(csv_filename,str):
             raise Exception("ins_filename is None but csv_filename is not string")
         ins_filename = csv_filename + ".ins"
-    row_visit, col_visit = {},{}
-    onames = []
-    ovals = []
+
+    sep = " {0},{0} ".format(marker)
+    row_visit = {}
+    onames,ovals = [],[]
+    rows,fields = [],[]
+    nrow = 0
     with open(ins_filename,'w') as f:
         f.write("pif ~\nl1\n")
-        for i,rlabel in enumerate(rlabels):
-            if includes_header:
-                f.write("l1 ") #skip the row (index) label
-            for j,clabel in enumerate(clabels):
-                if rlabel in only_rlabels and clabel in only_clabels:
-                    oname = prefix+rlabel+"_"+clabel
-                    onames.append(oname)
-                    ovals.append(df.iloc[i,j])
+        for ichunk,df in enumerate(chunks):
+            if isinstance(csv_filename,str):
+                df.columns = df.columns.map(str.lower)
+                df.index = df.index.map(lambda x: str(x).lower())
+            if ichunk == 0:
+                cnames = pd.Index(df.columns).map(lambda x: str(x).strip().lower())
+                clabels = _dup_labels(cnames,{})
+                if only_cols is None:
+                    sel_cols = cnames.isin(set(df.columns.map(str.lower)))
                 else:
-                    oname = "dum"
-                if j == 0:
-                    if includes_index:
-                        f.write(" {0},{0} ".format(marker))
-                else:
-                    f.write(" {0},{0} ".format(marker))
-                f.write(" !{0}! ".format(oname))
-            f.write('\n')
-    odf = pd.DataFrame({"obsnme":onames,"obsval":ovals},index=onames)
+                    sel_cols = cnames.isin(set(only_cols))
+                sel_cols = np.where(sel_cols)[0]
+                is_sel_col = set(sel_cols)
+                # the text between the row labels of a selected row and the
+                # line of an unselected row
+                pieces,dum_line = [],[]
+                current = "l1 " if includes_header else ''
+                for j,clabel in enumerate(clabels):
+                    if j > 0 or includes_index:
+                        current += sep
+                        dum_line.append(sep)
+                    dum_line.append(" !dum! ")
+                    if j in is_sel_col:
+                        pieces.append(current + " !" + prefix)
+                        current = "_" + clabel + "! "
+                    else:
+                        current += " !dum! "
+                pieces.append(current + '\n')
+                dum_line = ("l1 " if includes_header else '') + ''.join(dum_line) + '\n'
+
+            rnames = df.index.map(lambda x: str(x).strip().lower())
+            rlabels = _dup_labels(rnames,row_visit)
+            if only_rows is None:
+                sel_rows = rnames.isin(set(df.index.map(lambda x: str(x).lower())))
+            else:
+                sel_rows = rnames.isin(set(only_rows))
+            f.write(''.join([rlabel.join(pieces) if sel else dum_line
+                             for rlabel,sel in zip(rlabels,sel_rows)]))
+
+            isel = np.where(sel_rows)[0]
+            if isel.shape[0] > 0 and sel_cols.shape[0] > 0:
+                names = np.char.add(np.char.add(np.char.add(prefix,rlabels[isel].astype(str))[:,None],
+                                                "_"),clabels[sel_cols].astype(str)[None,:])
+                onames.append(names.ravel())
+                ovals.append(df.values[np.ix_(isel,sel_cols)].ravel())
+                rows.append(np.repeat(isel + nrow,sel_cols.shape[0]))
+                fields.append(np.tile(sel_cols + int(includes_index),isel.shape[0]))
+            nrow += df.shape[0]
+
+    if len(onames) > 0:
+        onames,ovals = np.concatenate(onames),np.concatenate(ovals)
+        rows,fields = np.concatenate(rows),np.concatenate(fields)
+    else:
+        onames,ovals = np.array([],dtype=str),np.array([])
+        rows,fields = np.array([],dtype=np.int64),np.array([],dtype=np.int64)
+    odf = pd.DataFrame({"obsnme":onames,"obsval":ovals},index=onames).infer_objects()
+    if includes_header:
+        _save_plan(ins_filename,{"obsnme":onames.astype(str),"row":rows.astype(np.int64),
+                                 "field":fields.astype(np.int64),
+                                 "nrow":np.array([nrow],dtype=np.int64)})
     return odf
 
 
+def _dup_labels(names,visit):
+    """private method to label repeated names as name, name2, name3,...  `visit`
+    holds the number of occurrences of each name in earlier calls and is updated"""
+    names = pd.Series(np.asarray(names,dtype=object))
+    count = names.groupby(names).cumcount().values + 1
+    if len(visit) > 0:
+        count += names.map(visit).fillna(0).values.astype(np.int64)
+    labels = np.where(count > 1,names.values + pd.Series(count).astype(str).values,
+                      names.values)
+    for name,n in names.value_counts().items():
+        visit[name] = visit.get(name,0) + n
+    return labels
+
+
+def read_csv_output_file(ins_filename,output_file):
+    """read the observation values of a model output csv file with the
+    extraction plan saved by `csv_to_ins_file()`, without processing
+    `ins_filename` with `InstructionFile`
+
+    Args:
+        ins_filename (`str`): an instruction file written by `csv_to_ins_file()`
+        output_file (`str`): the model output csv file
+
+    Returns:
+        `pandas.DataFrame`: a dataframe with observation names and simulated values
+        extracted from `output_file`, in the same form as
+        `InstructionFile.read_output_file()`
+
+    Note:
+        raises an exception if there is no (current) extraction plan for
+        `ins_filename`, such as if the instruction file was edited
+
+    Example::
+
+        pyemu.pst_utils.csv_to_ins_file("heads.csv")
+        df = pyemu.pst_utils.read_csv_output_file("heads.csv.ins","heads.csv")
+
+    """
+    plan = _load_plan(ins_filename)
+    if plan is None or "field" not in plan:
+        raise Exception("read_csv_output_file() error: no csv extraction plan for '{0}'".
+                        format(ins_filename))
+    nrow = int(plan["nrow"][0])
+    fields = np.unique(plan["field"])
+    if fields.shape[0] == 0:
+        return pd.DataFrame({"obsval":[]},index=pd.Index([],dtype=object))
+    df = pd.read_csv(output_file,header=None,skiprows=1,nrows=nrow,usecols=list(fields),
+                     skip_blank_lines=False,float_precision="round_trip")
+    if df.shape[0] < nrow:
+        raise Exception("read_csv_output_file() error: '{0}' has {1} rows, expecting {2}".
+                        format(output_file,df.shape[0],nrow))
+    values = df.loc[:,fields].values.astype(np.float64)
+    obsval = values[plan["row"],np.searchsorted(fields,plan["field"])]
+    s = pd.Series(obsval,index=plan["obsnme"].astype(object))
+    s.sort_index(inplace=True)
+    return pd.DataFrame({"obsval":s},index=s.index)
+
+
+def _try_read_csv_output_file(ins_filename,output_file,pst=None):
+    """private method to read an output file with `read_csv_output_file()`.
+    Returns None if the instruction file has no csv extraction plan or if
+    `InstructionFile` is needed (e.g. to report an error)"""
+    try:
+        df = read_csv_output_file(ins_filename,output_file)
+    except Exception:
+        return None
+    if df.obsval.isnull().any() or df.index.duplicated().any():
+        return None
+    if pst is not None and not df.index.isin(pst.obs_names).all():
+        return None
+    return df
+
+
 
 
 class InstructionFile(object):
@@ -1140,7 +1283,8 @@ class InstructionFile(object):
 
 def process_output_files(pst,pst_path='.'):
     """helper function to process output files using the
-     InstructionFile class
+     InstructionFile class.  Output files of instruction files written by
+     `csv_to_ins_file()` are read with `read_csv_output_file()`
 
    Args:
         pst (`pyemu.Pst`): control file instance
@@ -1167,7 +1311,10 @@ def process_output_files(pst,pst_path='.'):
         out = os.path.join(pst_path,out)
         if not os.path.exists(out):
             warnings.warn("out file '{0}' not found".format(out),PyemuWarning)
-        f = os.path.join(pst_path,ins)
+        s = _try_read_csv_output_file(ins,out,pst=pst)
+        if s is not None:
+            series.append(s)
+            continue
         i = InstructionFile(ins,pst=pst)
         try:
             s = i.read_output_file(out)
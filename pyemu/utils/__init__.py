@@ -10,4 +10,8 @@ from .pp_utils import *
 from .gw_utils import *
 from .os_utils import *
 from .smp_utils import *
+from .en_utils import *
+from .array_utils import *
+from .binary_utils import *
+from .budget_utils import *
 
@@ -0,0 +1,444 @@
+"""fast reading and writing of (MODFLOW/PEST style) ASCII array files
+"""
+import os
+import re
+import warnings
+import numpy as np
+
+# np.loadtxt() is implemented in C as of numpy 1.23
+_LOADTXT_IS_C = tuple(int(v) for v in np.__version__.split(".")[:2]) >= (1, 23)
+
+
+def read_array(filename, cache_dir=None):
+    """read a whitespace-delimited ASCII array file
+
+    Args:
+        filename (`str`): the array file
+        cache_dir (`str`, optional): directory to keep a binary (.npy) copy of the
+            array in.  If the file has not changed (size and modification time)
+            since the copy was made, the copy is memory-mapped instead of
+            parsing the text file.  If None, no copy is used.  Default is None
+
+    Returns:
+        `numpy.ndarray`: the same array as `np.loadtxt(filename)`.  The array is
+        a read-only memory map if it is loaded from `cache_dir`
+
+    Note:
+        `cache_dir` is intended for arrays that do not change between model runs, such
+        as the original arrays used by `pyemu.helpers.apply_array_pars()`
+
+    Example::
+
+        arr = pyemu.array_utils.read_array("hk_layer_1.ref")
+        arr = pyemu.array_utils.read_array("arr_org/hk_layer_1.ref",cache_dir="arr_cache")
+
+    """
+    if cache_dir is None:
+        return _parse_array(filename)
+    st = os.stat(filename)
+    cache_file = os.path.join(cache_dir, "{0}.{1}.{2}.npy".format(
+        os.path.basename(filename), st.st_size, st.st_mtime_ns))
+    if os.path.exists(cache_file):
+        try:
+            return np.load(cache_file, mmap_mode="r")
+        except Exception:
+            pass
+    arr = _parse_array(filename)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    # write to a temp file and move so concurrent readers never see a partial file
+    tmp_file = "{0}.{1}.tmp.npy".format(cache_file[:-4], os.getpid())
+    np.save(tmp_file, arr)
+    os.replace(tmp_file, cache_file)
+    return arr
+
+
+def _parse_array(filename):
+    if _LOADTXT_IS_C:
+        return np.loadtxt(filename)
+    with open(filename, 'r') as f:
+        text = f.read()
+    lines = [line for line in text.split("\n") if line.strip() != ""]
+    if len(lines) > 0:
+        ncol = len(lines[0].split())
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            arr = np.fromstring(text, sep=" ")
+        # fall back to loadtxt for anything fromstring can't parse
+        # (comments, ragged rows, bad values)
+        if ncol > 0 and arr.shape[0] == len(lines) * ncol and \
+                arr.shape[0] == len(text.split()):
+            return np.squeeze(arr.reshape(len(lines), ncol))
+    return np.loadtxt(filename)
+
+
+def write_array(filename, arr, fmt="%15.6E", delimiter=" "):
+    """write an array to an ASCII file
+
+    Args:
+        filename (`str`): the file to write
+        arr (`numpy.ndarray`): a 1-D or 2-D array.  A 1-D array is written as
+            a single column
+        fmt (`str` or [`str`]): a single format for all the values, a row format
+            with one format per column (e.g. " %9d %9d %9G") or a list of formats,
+            one per column.  Default is "%15.6E"
+        delimiter (`str`): the string between values.  Not used if `fmt` is a
+            row format.  Default is " "
+
+    Note:
+        the file is identical to `np.savetxt(filename,arr,fmt=fmt,delimiter=delimiter)`.
+        Fixed-width "%W.PE", "%W.PG" and "%Wd" formats are formatted with numpy
+        array operations, other formats are formatted row by row.
+
+    Example::
+
+        pyemu.array_utils.write_array("hk_layer_1.ref",arr,delimiter='')
+        pyemu.array_utils.write_array("wel_0001.dat",wel_arr,fmt=" %9d %9d %9d %9G")
+
+    """
+    arr = _check_array(arr)
+    row_fmt = _row_format(arr, fmt, delimiter)
+    text = _format_table(arr, row_fmt, os.linesep)
+    if text is not None:
+        with open(filename, 'wb') as f:
+            f.write(text)
+        return
+    with open(filename, 'w') as f:
+        f.write(_format_rows(arr, row_fmt))
+
+
+def format_array(arr, fmt="%15.6E", delimiter=" "):
+    """format an array as text.  See `write_array()`
+
+    Args:
+        arr (`numpy.ndarray`): a 1-D or 2-D array.  A 1-D array is formatted as
+            a single column
+        fmt (`str` or [`str`]): a single format for all the values, a row format
+            with one format per column or a list of formats, one per column.
+            Default is "%15.6E"
+        delimiter (`str`): the string between values.  Default is " "
+
+    Returns:
+        `str`: the formatted array, with a newline after each row
+
+    """
+    arr = _check_array(arr)
+    row_fmt = _row_format(arr, fmt, delimiter)
+    text = _format_table(arr, row_fmt, "\n")
+    if text is not None:
+        return text.decode("ascii")
+    return _format_rows(arr, row_fmt)
+
+
+def _check_array(arr):
+    arr = np.asarray(arr)
+    if arr.ndim == 1:
+        arr = arr.reshape(-1, 1)
+    if arr.ndim != 2:
+        raise Exception("write_array() error: array must be 1-D or 2-D, not {0}-D".
+                        format(arr.ndim))
+    return arr
+
+
+def _row_format(arr, fmt, delimiter):
+    """the format of a row, built the same way as `np.savetxt()`"""
+    ncol = arr.shape[1]
+    if isinstance(fmt, (list, tuple)):
+        if len(fmt) != ncol:
+            raise Exception("write_array() error: fmt has wrong shape: {0}".format(str(fmt)))
+        return delimiter.join(fmt)
+    if not isinstance(fmt, str):
+        raise Exception("write_array() error: invalid fmt: {0}".format(str(fmt)))
+    n_fmt_chars = fmt.count('%')
+    if n_fmt_chars == 1:
+        return delimiter.join([fmt] * ncol)
+    if n_fmt_chars != ncol:
+        raise Exception("write_array() error: fmt has wrong number of % formats: {0}".
+                        format(fmt))
+    return fmt
+
+
+def _format_rows(arr, row_fmt):
+    row_fmt += "\n"
+    return "".join([row_fmt % tuple(row) for row in arr.tolist()])
+
+
+# the format specs that are formatted with array operations
+_SPEC = re.compile(r"%(\d*)(?:\.(\d+))?([dieEgG])")
+
+# powers of ten for the mantissa scaling (2-digit exponents only)
+_POW10 = 10.0 ** np.arange(-120, 121)
+# thresholds for counting integer digits
+_INT_POW10 = 10 ** np.arange(1, 19, dtype=np.int64)
+
+
+def _format_table(arr, row_fmt, newline):
+    """vectorized formatting of the rows of a 2-D array.  Returns the `bytes` or
+    None if the row format or the array can't be formatted with array operations
+
+    """
+    nrow, ncol = arr.shape
+    if arr.size == 0 or not np.issubdtype(arr.dtype, np.number) or np.iscomplexobj(arr):
+        return None
+    if np.issubdtype(arr.dtype, np.integer) and np.abs(arr).max() >= 2 ** 53:
+        return None
+    try:
+        row_fmt.encode("ascii")
+        newline = newline.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+    specs = list(_SPEC.finditer(row_fmt))
+    if len(specs) != ncol:
+        return None
+    literals = [row_fmt[:specs[0].start()]]
+    literals += [row_fmt[m1.end():m2.start()] for m1, m2 in zip(specs[:-1], specs[1:])]
+    literals += [row_fmt[specs[-1].end():]]
+    if any(["%" in lit for lit in literals]):
+        return None
+    literals = [lit.encode("ascii") for lit in literals]
+    specs = [(int(m.group(1) or 0), None if m.group(2) is None else int(m.group(2)),
+              m.group(3)) for m in specs]
+    x = arr.astype(np.float64, copy=False)
+
+    pieces = [(np.frombuffer(literals[0], dtype=np.uint8), None)]
+    if len(set(specs)) == 1 and len(set(literals[1:-1])) <= 1:
+        # the same format for every column: format all the values at once
+        cells, start = _spec_cells(x.ravel(), specs[0])
+        if cells is None:
+            return None
+        delim = literals[1] if ncol > 1 else b""
+        nd, cw = len(delim), cells.shape[1] + len(delim)
+        row_len = ncol * cw - nd
+        block = np.empty((nrow * ncol, cw), dtype=np.uint8)
+        block[:, :cells.shape[1]] = cells
+        block[:, cells.shape[1]:] = np.frombuffer(delim, dtype=np.uint8)
+        keep = None
+        if start is not None:
+            keep = np.ones(block.shape, dtype=bool)
+            keep[:, :cells.shape[1]] = np.arange(cells.shape[1])[None, :] >= start[:, None]
+            keep = keep.reshape(nrow, ncol * cw)[:, :row_len]
+        pieces.append((block.reshape(nrow, ncol * cw)[:, :row_len], keep))
+    else:
+        for icol, spec in enumerate(specs):
+            cells, start = _spec_cells(x[:, icol], spec)
+            if cells is None:
+                return None
+            if icol > 0:
+                pieces.append((np.frombuffer(literals[icol], dtype=np.uint8), None))
+            keep = None
+            if start is not None:
+                keep = np.arange(cells.shape[1])[None, :] >= start[:, None]
+            pieces.append((cells, keep))
+    pieces.append((np.frombuffer(literals[-1] + newline, dtype=np.uint8), None))
+
+    width = sum([p.shape[-1] for p, _ in pieces])
+    rows = np.empty((nrow, width), dtype=np.uint8)
+    keep = None
+    if any([k is not None for _, k in pieces]):
+        keep = np.ones((nrow, width), dtype=bool)
+    i = 0
+    for p, k in pieces:
+        rows[:, i:i + p.shape[-1]] = p
+        if k is not None:
+            keep[:, i:i + p.shape[-1]] = k
+        i += p.shape[-1]
+    if keep is not None:
+        return rows[keep].tobytes()
+    return rows.tobytes()
+
+
+def _spec_cells(x, spec):
+    """vectorized "%{width}d", "%{width}.{prec}E" or "%{width}.{prec}G" formatting
+    of a 1-D array.  Values that can't be formatted exactly with array operations
+    (near rounding ties, 3-digit exponents, nan, inf) are formatted individually.
+
+    Returns a `uint8` array with each value right-justified in a row and the first
+    column of each value's field (None if every field starts at column 0).
+    Returns (None,None) if the values can't be formatted
+
+    """
+    width, prec, conv = spec
+    if conv in "di":
+        if not np.all(np.isfinite(x)) or np.abs(x).max() >= 1.0e18:
+            return None, None
+        return _justify(*_int_cells(x, width), width)
+    if conv in "eE":
+        prec = 6 if prec is None else prec
+        sig = prec + 1
+    else:
+        prec = 6 if prec is None else max(prec, 1)
+        sig = prec
+    if sig > 9:
+        return None, None
+    digits, exp, special, zero = _sig_digits(x, sig)
+    neg = np.signbit(x)
+    fmt = "%{0}.{1}{2}".format(width, prec, conv)
+    sidx = np.where(special)[0]
+    sstr = [(fmt % x[i]).encode("ascii") for i in sidx]
+    echar = ord("E") if conv in "EG" else ord("e")
+    if conv in "eE":
+        cells, length = _e_cells(digits, exp, neg, special, sstr, width, echar)
+    else:
+        cells, length = _g_cells(digits, exp, neg, special, zero, sstr, width, echar)
+    ncell = cells.shape[1]
+    for i, ss in zip(sidx, sstr):
+        cells[i, :] = ord(" ")
+        cells[i, ncell - len(ss):] = np.frombuffer(ss, dtype=np.uint8)
+    return _justify(cells, length, width)
+
+
+def _justify(cells, length, width):
+    if cells.shape[1] == width:
+        return cells, None
+    return cells, cells.shape[1] - np.maximum(width, length)
+
+
+def _new_cells(n, length, width):
+    return np.full((n, max(width, int(length.max()))), ord(" "), dtype=np.uint8)
+
+
+def _sig_digits(x, sig):
+    """the `sig` significant (decimal) digits and exponents of the values of `x`.
+    Returns the digits (as characters, most significant first), the exponents and
+    flags for values that must be formatted individually and for zeros
+
+    """
+    ax = np.abs(x)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        exp = np.floor(np.log10(ax))
+        bad = ~np.isfinite(exp) | (np.abs(exp) >= 100)
+        exp[bad] = 0.0
+        exp = exp.astype(np.int64)
+        # scale the mantissa digits to an integer
+        scaled = ax * _POW10[sig - 1 - exp + 120]
+        mant = np.floor(scaled + 0.5)
+        frac = scaled - np.floor(scaled)
+    lo, hi = 10.0 ** (sig - 1), 10.0 ** sig
+    # the scaled value is within a few ulps of the exact value, so only values
+    # this close to a rounding tie might be rounded differently than printf
+    tol = hi * 2.0 ** -48
+    zero = ax == 0.0
+    special = bad | (mant < lo) | (mant >= hi) | (np.abs(frac - 0.5) <= tol)
+    special &= ~zero
+    mant[special | zero] = 0.0
+    mant = mant.astype(np.uint32)
+    digits = np.empty((x.shape[0], sig), dtype=np.uint8)
+    for q in range(sig - 1, -1, -1):
+        mant, d = np.divmod(mant, 10)
+        digits[:, q] = d + 48
+    exp[zero] = 0
+    return digits, exp, special, zero
+
+
+def _exp_chars(exp):
+    """the sign and the two digits of (2-digit) exponents"""
+    tens, ones = np.divmod(np.abs(exp).astype(np.uint8), np.uint8(10))
+    return np.where(exp < 0, np.uint8(ord("-")), np.uint8(ord("+"))), tens + 48, ones + 48
+
+
+def _int_cells(x, width):
+    """right-justified "%d" formatting"""
+    t = np.trunc(x)
+    neg = t < 0
+    a = np.abs(t)
+    a = a.astype(np.uint32 if a.max() < 2 ** 32 else np.int64)
+    ndig = np.searchsorted(_INT_POW10, a, side="right") + 1
+    length = ndig + neg
+    cells = _new_cells(x.shape[0], length, width)
+    ncell = cells.shape[1]
+    for q in range(int(ndig.max())):
+        a, d = np.divmod(a, 10)
+        cells[:, ncell - 1 - q] = np.where(ndig > q, d + 48, ord(" "))
+    rows = np.where(neg)[0]
+    cells[rows, ncell - 1 - ndig[rows]] = ord("-")
+    return cells, length
+
+
+def _e_cells(digits, exp, neg, special, sstr, width, echar):
+    """right-justified "%E" formatting: [-]d.dddE+dd"""
+    n, sig = digits.shape
+    body = sig + 4 + (1 if sig > 1 else 0)
+    length = body + neg
+    if len(sstr) > 0:
+        length[special] = [len(ss) for ss in sstr]
+    cells = _new_cells(n, length, width)
+    ncell = cells.shape[1]
+    p0 = ncell - body
+    cells[:, p0] = digits[:, 0]
+    if sig > 1:
+        cells[:, p0 + 1] = ord(".")
+        cells[:, p0 + 2:p0 + 1 + sig] = digits[:, 1:]
+    cells[:, ncell - 4] = echar
+    cells[:, ncell - 3], cells[:, ncell - 2], cells[:, ncell - 1] = _exp_chars(exp)
+    if p0 > 0:
+        cells[:, p0 - 1] = np.where(neg, np.uint8(ord("-")), np.uint8(ord(" ")))
+    return cells, length
+
+
+def _g_cells(digits, exp, neg, special, zero, sstr, width, echar):
+    """right-justified "%G" formatting: fixed point if -4 <= exp < precision,
+    otherwise exponential, without trailing zeros.  Values are written in groups
+    that share the same layout
+
+    """
+    n, sig = digits.shape
+    # the number of significant digits without trailing zeros
+    nkeep = np.full(n, sig, dtype=np.int64)
+    trailing = np.ones(n, dtype=bool)
+    for q in range(sig - 1, 0, -1):
+        trailing &= digits[:, q] == 48
+        nkeep -= trailing
+    digits[zero, 0] = ord("0")
+    fixed = (exp >= -4) & (exp < sig)
+    # layouts: 0 - ddd.ddd, 1 - 0.000ddd, 2 - d.dddE+dd
+    case = np.where(fixed, np.where(exp >= 0, 0, 1), 2)
+    param = np.where(case == 0, exp + 1, np.where(case == 1, -exp - 1, 0))
+    length = np.where(case == 0, np.maximum(param, nkeep) + (nkeep > param),
+                      np.where(case == 1, 2 + param + nkeep,
+                               1 + np.where(nkeep > 1, nkeep, 0) + 4)) + neg
+    if len(sstr) > 0:
+        length[special] = [len(ss) for ss in sstr]
+    cells = _new_cells(n, length, width)
+    ncell = cells.shape[1]
+    esign, etens, eones = _exp_chars(exp)
+
+    code = (((case * 16 + param) * 16 + nkeep) * 2 + neg).astype(np.int16)
+    code[special] = -1
+    order = np.argsort(code, kind="stable")
+    bounds = np.r_[0, np.flatnonzero(np.diff(code[order])) + 1, n]
+    for b0, b1 in zip(bounds[:-1], bounds[1:]):
+        rows = order[b0:b1]
+        c = int(code[rows[0]])
+        if c < 0:
+            continue
+        sgn, c = c % 2, c // 2
+        nk, c = c % 16, c // 16
+        prm, cs = c % 16, c // 16
+        if cs == 0:
+            # integer digits (with any zeros) then the fraction digits
+            nint = prm
+            ndig = max(nint, nk)
+            p = ncell - ndig - (1 if nk > nint else 0)
+            cells[rows, p:p + nint] = digits[rows, :nint]
+            if nk > nint:
+                cells[rows, p + nint] = ord(".")
+                cells[rows, p + nint + 1:ncell] = digits[rows, nint:nk]
+        elif cs == 1:
+            p = ncell - 2 - prm - nk
+            cells[rows, p] = ord("0")
+            cells[rows, p + 1] = ord(".")
+            cells[rows, p + 2:p + 2 + prm] = ord("0")
+            cells[rows, p + 2 + prm:ncell] = digits[rows, :nk]
+        else:
+            p = ncell - 4 - (nk if nk > 1 else 0) - 1
+            cells[rows, p] = digits[rows, 0]
+            if nk > 1:
+                cells[rows, p + 1] = ord(".")
+                cells[rows, p + 2:p + 1 + nk] = digits[rows, 1:nk]
+            cells[rows, ncell - 4] = echar
+            cells[rows, ncell - 3] = esign[rows]
+            cells[rows, ncell - 2] = etens[rows]
+            cells[rows, ncell - 1] = eones[rows]
+        if sgn:
+            cells[rows, p - 1] = ord("-")
+    return cells, length
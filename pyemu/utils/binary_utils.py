@@ -0,0 +1,451 @@
+"""native readers for MODFLOW and MT3D binary output files: head save (and
+drawdown), UCN concentration and cell-by-cell budget files.  The record
+headers are indexed once and values are gathered from a memory map of
+the file, so extracting many cells at many times is a single pass over
+the file.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+_REALS = {"single": np.dtype("<f4"), "double": np.dtype("<f8")}
+
+
+def _layer_header_dtype(real, ucn=False):
+    if ucn:
+        return np.dtype([("ntrans", "<i4"), ("kstp", "<i4"), ("kper", "<i4"),
+                         ("totim", real), ("text", "S16"), ("ncol", "<i4"),
+                         ("nrow", "<i4"), ("ilay", "<i4")])
+    return np.dtype([("kstp", "<i4"), ("kper", "<i4"), ("pertim", real),
+                     ("totim", real), ("text", "S16"), ("ncol", "<i4"),
+                     ("nrow", "<i4"), ("ilay", "<i4")])
+
+
+def _valid_text(text):
+    try:
+        text = text.decode("ascii")
+    except UnicodeDecodeError:
+        return False
+    return text.strip() != "" and text.isprintable()
+
+
+def _gather(mm, pos, real):
+    """gather the `real` values that start at byte positions `pos` of the
+    memory map `mm`, reading the file in order
+    """
+    pos = np.asarray(pos, dtype=np.int64)
+    values = np.empty(pos.shape[0], dtype=real)
+    if pos.shape[0] == 0:
+        return values
+    order = np.argsort(pos, kind="stable")
+    raw = mm[pos[order][:, None] + np.arange(real.itemsize)]
+    values[order] = np.ascontiguousarray(raw).view(real).ravel()
+    return values
+
+
+class BinaryLayerFile(object):
+    """reader for MODFLOW head save (and drawdown) and MT3D UCN files.
+
+    Args:
+        filename (`str`): the binary file
+        precision (`str`): "single", "double" or "auto".  If "auto", the
+            precision is inferred from the record headers.  Default is "auto"
+        ucn (`bool`, optional): flag for the MT3D UCN header layout.  If None,
+            files ending with "ucn" are treated as UCN files.  Default is None
+        text (`str`, optional): the record text to use (e.g. "HEAD") if the file
+            holds more than one type of record.  If None, the text of the first record
+            is used.  Default is None
+
+    Note:
+        `BinaryLayerFile` supports the parts of the `flopy.utils.HeadFile` interface
+        used by `pyemu` (`nlay`, `nrow`, `ncol`, `kstpkper`, `times`, `get_data()`,
+        `get_ts()`), does not require `flopy` and extracts any number of cells
+        in one pass with `BinaryLayerFile.get_values()`.
+
+        `kstpkper` holds one-based (kstp,kper) pairs, while the `kstpkper` argument of
+        `get_data()` is zero-based, the same as `flopy`
+
+    Example::
+
+        hds = pyemu.binary_utils.BinaryLayerFile("freyberg.hds")
+        ts = hds.get_ts([(0,10,10),(0,20,5)])
+        arr = hds.get_data(kstpkper=(0,0))
+
+    """
+    def __init__(self, filename, precision="auto", ucn=None, text=None):
+        if not os.path.exists(filename):
+            raise Exception("BinaryLayerFile error: file {0} not found".format(filename))
+        self.filename = filename
+        if ucn is None:
+            ucn = filename.lower().endswith("ucn")
+        self.ucn = bool(ucn)
+        self._mm = np.memmap(filename, dtype=np.uint8, mode="r")
+        precision = precision.lower()
+        if precision == "auto":
+            precision = self._infer_precision()
+        if precision not in _REALS:
+            raise Exception("BinaryLayerFile error: unrecognized precision: {0}".format(precision))
+        self.precision = precision
+        self.real = _REALS[precision]
+        self._hdr = _layer_header_dtype(self.real, self.ucn)
+        self._build_index(text)
+
+    def _infer_precision(self):
+        for precision in ["single", "double"]:
+            hdr = _layer_header_dtype(_REALS[precision], self.ucn)
+            if self._mm.shape[0] < hdr.itemsize:
+                continue
+            h = np.frombuffer(self._mm[:hdr.itemsize].tobytes(), dtype=hdr)[0]
+            size = hdr.itemsize + int(h["ncol"]) * int(h["nrow"]) * _REALS[precision].itemsize
+            if _valid_text(h["text"]) and h["ncol"] > 0 and h["nrow"] > 0 and h["ilay"] > 0 and \
+                    size <= self._mm.shape[0]:
+                return precision
+        raise Exception("BinaryLayerFile error: unable to infer precision of {0}".
+                        format(self.filename))
+
+    def _build_index(self, text):
+        mm, hdr = self._mm, self._hdr
+        nbytes = mm.shape[0]
+        first = np.frombuffer(mm[:hdr.itemsize].tobytes(), dtype=hdr)[0]
+        ncol, nrow = int(first["ncol"]), int(first["nrow"])
+        rec_size = hdr.itemsize + ncol * nrow * self.real.itemsize
+        headers = None
+        if nbytes % rec_size == 0:
+            # all records the same size: view all headers at once
+            headers = np.ndarray((nbytes // rec_size,), dtype=hdr, buffer=mm,
+                                 offset=0, strides=(rec_size,))
+            if not ((headers["ncol"] == ncol).all() and (headers["nrow"] == nrow).all()):
+                headers = None
+            else:
+                headers = headers.copy()
+                offsets = np.arange(headers.shape[0], dtype=np.int64) * rec_size
+        if headers is None:
+            headers, offsets = [], []
+            offset = 0
+            while offset < nbytes:
+                if offset + hdr.itemsize > nbytes:
+                    raise Exception("BinaryLayerFile error: incomplete record at byte {0}".
+                                    format(offset))
+                h = np.frombuffer(mm[offset:offset + hdr.itemsize].tobytes(), dtype=hdr)[0]
+                headers.append(h)
+                offsets.append(offset)
+                offset += hdr.itemsize + int(h["ncol"]) * int(h["nrow"]) * self.real.itemsize
+            headers = np.array(headers, dtype=hdr)
+            offsets = np.array(offsets, dtype=np.int64)
+        texts = np.array([t.decode("ascii", errors="replace").strip().upper()
+                          for t in headers["text"]])
+        if text is None:
+            text = texts[0]
+        text = text.strip().upper()
+        keep = texts == text
+        if keep.sum() == 0:
+            raise Exception("BinaryLayerFile error: text {0} not found in {1}".
+                            format(text, self.filename))
+        headers, offsets = headers[keep], offsets[keep]
+        if not ((headers["ncol"] == headers["ncol"][0]).all() and
+                (headers["nrow"] == headers["nrow"][0]).all()):
+            raise Exception("BinaryLayerFile error: records with different shapes")
+        self.text = text
+        self.nrow, self.ncol = int(headers["nrow"][0]), int(headers["ncol"][0])
+        self.nlay = int(headers["ilay"].max())
+        records = pd.DataFrame({"kstp": headers["kstp"], "kper": headers["kper"],
+                                "totim": headers["totim"].astype(np.float64),
+                                "ilay": headers["ilay"],
+                                "offset": offsets + hdr.itemsize})
+        if self.ucn:
+            records.loc[:, "ntrans"] = headers["ntrans"]
+        else:
+            records.loc[:, "pertim"] = headers["pertim"].astype(np.float64)
+        # one time slot for each unique totim
+        slot, times = pd.factorize(records.totim)
+        records.loc[:, "slot"] = slot
+        self.records = records
+        self.times = list(times)
+        first = records.groupby("slot", sort=True).first()
+        self.kstpkper = [(int(kstp), int(kper)) for kstp, kper in zip(first.kstp, first.kper)]
+        # the record number of each slot and layer
+        self._slot_table = np.zeros((len(self.times), self.nlay), dtype=np.int64) - 1
+        self._slot_table[records.slot.values, records.ilay.values - 1] = np.arange(records.shape[0])
+
+    def close(self):
+        """release the memory map of the file"""
+        self._mm = None
+
+    def time_index(self, kstpkper=None, totim=None, idx=None):
+        """get the time slot index of a zero-based (kstp,kper) pair, a totim or an index
+
+        Args:
+            kstpkper ((`int`,`int`), optional): zero-based time step and stress period
+            totim (`float`, optional): simulation time
+            idx (`int`, optional): time index.  If all args are None, the last
+                time is used
+
+        Returns:
+            `int`: time slot index
+
+        """
+        if kstpkper is not None:
+            key = (int(kstpkper[0]) + 1, int(kstpkper[1]) + 1)
+            if key not in self.kstpkper:
+                raise Exception("BinaryLayerFile error: kstpkper {0} not found".format(kstpkper))
+            # the first slot with this kstp,kper, the same as flopy
+            return self.kstpkper.index(key)
+        if totim is not None:
+            t = np.array(self.times)
+            i = np.where(np.isclose(t, totim))[0]
+            if i.shape[0] == 0:
+                raise Exception("BinaryLayerFile error: totim {0} not found".format(totim))
+            return int(i[0])
+        if idx is not None:
+            return int(idx)
+        return len(self.times) - 1
+
+    def get_values(self, k, i, j, time_idx):
+        """extract the values of (zero-based) cells at time slots in one pass
+
+        Args:
+            k (`numpy.ndarray`): layer indices
+            i (`numpy.ndarray`): row indices
+            j (`numpy.ndarray`): column indices
+            time_idx (`numpy.ndarray`): time slot indices (see `BinaryLayerFile.time_index()`).
+                `k`, `i`, `j` and `time_idx` are broadcast against each other
+
+        Returns:
+            `numpy.ndarray`: the values (in the precision of the file), with NaN where
+            there is no record for a layer at a time
+
+        """
+        k, i, j, time_idx = np.broadcast_arrays(*[np.asarray(a, dtype=np.int64)
+                                                  for a in [k, i, j, time_idx]])
+        shape = k.shape
+        k, i, j, time_idx = k.ravel(), i.ravel(), j.ravel(), time_idx.ravel()
+        if np.any((k < 0) | (k >= self.nlay) | (i < 0) | (i >= self.nrow) |
+                  (j < 0) | (j >= self.ncol)):
+            raise Exception("BinaryLayerFile error: cell index out of range")
+        rec = self._slot_table[time_idx, k]
+        found = rec >= 0
+        values = np.full(k.shape[0], np.NaN, dtype=self.real)
+        pos = self.records.offset.values[rec[found]] + \
+              (i[found] * self.ncol + j[found]) * self.real.itemsize
+        values[found] = _gather(self._mm, pos, self.real)
+        return values.reshape(shape)
+
+    def get_data(self, kstpkper=None, totim=None, idx=None):
+        """get the 3-D array of values at one time
+
+        Args:
+            kstpkper ((`int`,`int`), optional): zero-based time step and stress period
+            totim (`float`, optional): simulation time
+            idx (`int`, optional): time index.  If all args are None, the last
+                time is used
+
+        Returns:
+            `numpy.ndarray`: array of shape (nlay,nrow,ncol).  Missing layers are NaN
+
+        """
+        slot = self.time_index(kstpkper=kstpkper, totim=totim, idx=idx)
+        data = np.full((self.nlay, self.nrow, self.ncol), np.NaN, dtype=self.real)
+        for k, rec in enumerate(self._slot_table[slot]):
+            if rec < 0:
+                continue
+            data[k] = np.ndarray((self.nrow, self.ncol), dtype=self.real, buffer=self._mm,
+                                 offset=int(self.records.offset.values[rec]))
+        return data
+
+    def get_ts(self, kij):
+        """get time series of values at one or more cells
+
+        Args:
+            kij ([(`int`,`int`,`int`)]): a zero-based (k,i,j) tuple or a list of them
+
+        Returns:
+            `numpy.ndarray`: array of shape (ntimes, 1 + len(`kij`)) in the precision
+            of the file.  The first column is totim
+
+        """
+        kij = np.atleast_2d(np.asarray(kij, dtype=np.int64))
+        ntime = len(self.times)
+        values = self.get_values(kij[:, 0][None, :], kij[:, 1][None, :], kij[:, 2][None, :],
+                                 np.arange(ntime)[:, None])
+        return np.hstack([np.array(self.times, dtype=self.real)[:, None], values])
+
+
+class BinaryBudgetFile(object):
+    """reader for MODFLOW cell-by-cell budget files (full and compact formats)
+
+    Args:
+        filename (`str`): the binary budget file
+        precision (`str`): "single", "double" or "auto".  If "auto", the
+            precision is inferred from the record headers.  Default is "auto"
+
+    Note:
+        values of list-based records (e.g. wells) are summed for each cell and are
+        NaN for cells without entries.  Full-format records have no time information,
+        so their totim is 0.0, the same as `flopy`.
+
+    Example::
+
+        cbb = pyemu.binary_utils.BinaryBudgetFile("freyberg.cbc")
+        ts = cbb.get_ts([(0,10,10),(0,20,5)],text="constant head")
+
+    """
+    def __init__(self, filename, precision="auto"):
+        if not os.path.exists(filename):
+            raise Exception("BinaryBudgetFile error: file {0} not found".format(filename))
+        self.filename = filename
+        self._mm = np.memmap(filename, dtype=np.uint8, mode="r")
+        precision = precision.lower()
+        precisions = ["single", "double"] if precision == "auto" else [precision]
+        error = None
+        for precision in precisions:
+            if precision not in _REALS:
+                raise Exception("BinaryBudgetFile error: unrecognized precision: {0}".
+                                format(precision))
+            try:
+                self._build_index(_REALS[precision])
+            except Exception as e:
+                error = e
+                continue
+            self.precision = precision
+            self.real = _REALS[precision]
+            break
+        else:
+            raise Exception("BinaryBudgetFile error: unable to index {0}: {1}".
+                            format(filename, str(error)))
+
+    def _read(self, offset, dtype):
+        dtype = np.dtype(dtype)
+        if offset + dtype.itemsize > self._mm.shape[0]:
+            raise Exception("incomplete record at byte {0}".format(offset))
+        return np.frombuffer(self._mm[offset:offset + dtype.itemsize].tobytes(), dtype=dtype)[0]
+
+    def _build_index(self, real):
+        hdr1 = np.dtype([("kstp", "<i4"), ("kper", "<i4"), ("text", "S16"),
+                         ("ncol", "<i4"), ("nrow", "<i4"), ("nlay", "<i4")])
+        hdr2 = np.dtype([("imeth", "<i4"), ("delt", real), ("pertim", real), ("totim", real)])
+        rs = real.itemsize
+        nbytes = self._mm.shape[0]
+        rows = []
+        offset = 0
+        while offset < nbytes:
+            h = self._read(offset, hdr1)
+            if not _valid_text(h["text"]) or h["ncol"] <= 0 or h["nrow"] <= 0 or h["nlay"] == 0:
+                raise Exception("invalid record header at byte {0}".format(offset))
+            ncol, nrow, nlay = int(h["ncol"]), int(h["nrow"]), int(h["nlay"])
+            offset += hdr1.itemsize
+            row = {"kstp": int(h["kstp"]), "kper": int(h["kper"]),
+                   "text": h["text"].decode("ascii").strip().upper(),
+                   "ncol": ncol, "nrow": nrow, "nlay": abs(nlay), "imeth": 0,
+                   "totim": 0.0, "nlist": 0, "ndat": 1, "aux": 0}
+            if nlay < 0:
+                h2 = self._read(offset, hdr2)
+                offset += hdr2.itemsize
+                imeth = int(h2["imeth"])
+                row["imeth"] = imeth
+                row["totim"] = float(h2["totim"])
+                row["pertim"] = float(h2["pertim"])
+                if imeth == 6:
+                    # MODFLOW 6: model and package names
+                    offset += 64
+                if imeth in [5, 6]:
+                    row["ndat"] = int(self._read(offset, "<i4"))
+                    offset += 4 + (row["ndat"] - 1) * 16
+                if imeth in [2, 5, 6]:
+                    row["nlist"] = int(self._read(offset, "<i4"))
+                    offset += 4
+            else:
+                imeth = 0
+            row["offset"] = offset
+            if imeth in [0, 1]:
+                offset += abs(nlay) * nrow * ncol * rs
+            elif imeth == 2:
+                offset += row["nlist"] * (4 + rs)
+            elif imeth == 3:
+                offset += nrow * ncol * (4 + rs)
+            elif imeth == 4:
+                offset += nrow * ncol * rs
+            elif imeth == 5:
+                offset += row["nlist"] * (4 + row["ndat"] * rs)
+            elif imeth == 6:
+                offset += row["nlist"] * (8 + row["ndat"] * rs)
+            else:
+                raise Exception("unsupported imeth {0} at byte {1}".format(imeth, offset))
+            if offset > nbytes:
+                raise Exception("incomplete record at byte {0}".format(row["offset"]))
+            rows.append(row)
+        if len(rows) == 0:
+            raise Exception("no records")
+        self.records = pd.DataFrame(rows)
+        self.nrow, self.ncol = int(self.records.nrow.iloc[0]), int(self.records.ncol.iloc[0])
+        self.nlay = int(self.records.nlay.max())
+        self.textlist = list(self.records.text.unique())
+        self.times = list(pd.unique(self.records.totim))
+        self.kstpkper = list(dict.fromkeys(zip(self.records.kstp, self.records.kper)))
+
+    def close(self):
+        """release the memory map of the file"""
+        self._mm = None
+
+    def _record_values(self, rec, nodes, k, i, j):
+        """values of one record at zero-based `nodes` (and the k,i,j of the nodes)"""
+        real, rs = self.real, self.real.itemsize
+        imeth, offset = int(rec.imeth), int(rec.offset)
+        ncell = self.nrow * self.ncol
+        if imeth in [0, 1]:
+            return _gather(self._mm, offset + nodes * rs, real).astype(np.float64)
+        if imeth in [3, 4]:
+            ij = i * self.ncol + j
+            vals = _gather(self._mm, offset + (ncell * 4 if imeth == 3 else 0) + ij * rs,
+                           real).astype(np.float64)
+            if imeth == 3:
+                lay = np.ndarray((ncell,), dtype="<i4", buffer=self._mm, offset=offset)[ij]
+                vals[lay - 1 != k] = 0.0
+            else:
+                vals[k != 0] = 0.0
+            return vals
+        # list records: sum the values of each node
+        nlist, ndat = int(rec.nlist), int(rec.ndat)
+        fields = [("node", "<i4")]
+        if imeth == 6:
+            fields.append(("node2", "<i4"))
+        fields.append(("q", real))
+        if ndat > 1:
+            fields.append(("aux", real, (ndat - 1,)))
+        data = np.ndarray((nlist,), dtype=np.dtype(fields), buffer=self._mm, offset=offset)
+        nnode = self.nlay * ncell
+        node = data["node"].astype(np.int64) - 1
+        ok = (node >= 0) & (node < nnode)
+        sums = np.bincount(node[ok], weights=data["q"][ok].astype(np.float64), minlength=nnode)
+        counts = np.bincount(node[ok], minlength=nnode)
+        vals = sums[nodes]
+        vals[counts[nodes] == 0] = np.NaN
+        return vals
+
+    def get_ts(self, kij, text):
+        """get time series of values at one or more cells for a budget term
+
+        Args:
+            kij ([(`int`,`int`,`int`)]): a zero-based (k,i,j) tuple or a list of them
+            text (`str`): the budget term (e.g. "constant head")
+
+        Returns:
+            `numpy.ndarray`: array of shape (ntimes, 1 + len(`kij`)) in the precision
+            of the file.  The first column is totim
+
+        """
+        text = text.strip().upper()
+        recs = self.records.loc[self.records.text == text, :]
+        if recs.shape[0] == 0:
+            raise Exception("BinaryBudgetFile error: text {0} not found in {1}".
+                            format(text, self.textlist))
+        kij = np.atleast_2d(np.asarray(kij, dtype=np.int64))
+        k, i, j = kij[:, 0], kij[:, 1], kij[:, 2]
+        if np.any((k < 0) | (k >= self.nlay) | (i < 0) | (i >= self.nrow) |
+                  (j < 0) | (j >= self.ncol)):
+            raise Exception("BinaryBudgetFile error: cell index out of range")
+        nodes = (k * self.nrow + i) * self.ncol + j
+        result = np.zeros((recs.shape[0], 1 + kij.shape[0]), dtype=self.real)
+        for irec, (_, rec) in enumerate(recs.iterrows()):
+            result[irec, 0] = rec.totim
+            result[irec, 1:] = self._record_values(rec, nodes, k, i, j)
+        return result
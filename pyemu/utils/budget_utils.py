@@ -0,0 +1,454 @@
+"""native parsers for the budget tables in MODFLOW and MT3D list files.  The
+list file is memory mapped and only the budget blocks are read: the parsers
+jump from one budget header to the next, so the (often huge) solver and
+package output between them is never parsed.  The dataframes follow the
+`flopy.utils.MfListBudget` and `flopy.utils.MtListBudget` conventions, so
+instruction files written for those still match.
+"""
+import os
+import re
+import mmap
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+_MF_BUDGET_KEY = b"VOLUMETRIC BUDGET FOR ENTIRE MODEL"
+_MF_TIME_KEY = b"TIME SUMMARY AT END"
+_MF_TS_SP = re.compile(r"TIME STEP\s*(\d+)\s*,?\s*STRESS PERIOD\s*(\d+)")
+_MF_TIME_UNITS = {"SECONDS": 0, "MINUTES": 1, "HOURS": 2, "DAYS": 3, "YEARS": 4}
+
+_MT_GW_KEY = b">>>FOR COMPONENT NO."
+_MT_SW_KEY = b"STREAM MASS BUDGETS AT END OF TRANSPORT STEP"
+_MT_STEPS = re.compile(r"TRANSPORT STEP\s*([\d*]+)\s*,\s*TIME STEP\s*([\d*]+)\s*,"
+                       r"\s*STRESS PERIOD\s*([\d*]+)")
+_MT_COMP = re.compile(r"COMPONENT(?: NO\.)?\s*(\d+)")
+# flopy pairs these stream (SFT) out items with the in items of the same process
+_MT_SW_OUT_NAMES = {"stream_accumulation": "stream_depletion",
+                    "stream_outflow": "inflow_to_stream",
+                    "stream_to_gw": "gw_to_stream",
+                    "mass_loss": "mass_gain",
+                    "evaporation": "precipitation"}
+
+
+def _map_file(filename):
+    """memory map a (non-empty) text file"""
+    if not os.path.exists(filename):
+        raise Exception("list file '{0}' not found".format(filename))
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _find_lines(mm, key, last=None):
+    """the start of each line in `mm` that contains `key`.  If `last` is not None,
+    only the last `last` lines are found, scanning backwards from the end
+    """
+    starts = []
+    if last is None:
+        pos = mm.find(key)
+        while pos >= 0:
+            starts.append(mm.rfind(b"\n", 0, pos) + 1)
+            pos = mm.find(b"\n", pos)
+            if pos < 0:
+                break
+            pos = mm.find(key, pos)
+    else:
+        end = len(mm)
+        while len(starts) < last:
+            pos = mm.rfind(key, 0, end)
+            if pos < 0:
+                break
+            end = mm.rfind(b"\n", 0, pos) + 1
+            starts.append(end)
+        starts.reverse()
+    return starts
+
+
+def _lines(mm, start, end_key, stop):
+    """decoded lines from `start` up to and including the first line that
+    contains `end_key`, never reading past `stop`
+    """
+    end = mm.find(end_key, start, stop)
+    if end < 0:
+        end = stop
+    else:
+        end = mm.find(b"\n", end, stop)
+        if end < 0:
+            end = stop
+    return mm[start:end].decode("ascii", errors="replace").split("\n")
+
+
+def _to_float(s):
+    try:
+        return float(s)
+    except ValueError:
+        return np.NaN
+
+
+class ListBudgetFile(object):
+    """the volumetric budget tables of a MODFLOW(-2005, -NWT, -USG) list file.
+
+    Args:
+        filename (`str`): the list file
+        timeunit (`str`, optional): the column of the time summary tables used for
+            the budget times.  Can be "seconds", "minutes", "hours", "days" or
+            "years".  Default is "days"
+        last (`int`, optional): only read the last `last` budget tables, found by
+            scanning backwards from the end of the file.  Default is None (all tables)
+
+    Note:
+        The budget table values are stored as single precision, like
+        `flopy.utils.MfListBudget`
+
+    Example::
+
+        lst = pyemu.budget_utils.ListBudgetFile("my.list")
+        flx, vol = lst.get_dataframes(start_datetime="1-1-2000")
+
+    """
+
+    def __init__(self, filename, timeunit="days", last=None):
+        self.filename = filename
+        self.timeunit = timeunit
+        if timeunit.upper() not in _MF_TIME_UNITS:
+            raise Exception("ListBudgetFile error: unrecognized timeunit '{0}'".format(timeunit))
+        self.entries = []
+        self.kstpkper = []
+        inc, cum, totim = [], [], []
+        mm = _map_file(filename)
+        try:
+            starts = _find_lines(mm, _MF_BUDGET_KEY, last=last)
+            stops = starts[1:] + [len(mm)]
+            for start, stop in zip(starts, stops):
+                lines = _lines(mm, start, b"PERCENT DISCREPANCY", stop)
+                ts_sp = _MF_TS_SP.search(lines[0].replace("*", ""))
+                if ts_sp is None:
+                    break
+                self.kstpkper.append((int(ts_sp.group(1)), int(ts_sp.group(2))))
+                i, c = self._parse_budget(lines[1:])
+                inc.append(i)
+                cum.append(c)
+                time_start = mm.find(_MF_TIME_KEY, start, stop)
+                totim.append(np.NaN if time_start < 0 else
+                             self._parse_totim(mm[time_start:min(time_start + 2000, stop)]))
+        finally:
+            if not isinstance(mm, bytes):
+                mm.close()
+        if len(inc) > 0:
+            for i in inc:
+                for entry in i.keys():
+                    if entry not in self.entries:
+                        self.entries.append(entry)
+        self.inc = self._to_array(inc)
+        self.cum = self._to_array(cum)
+        self.totim = np.array(totim, dtype=np.float32)
+
+    def _to_array(self, records):
+        arr = np.zeros((len(records), len(self.entries)), dtype=np.float32) + np.NaN
+        for irec, rec in enumerate(records):
+            for ientry, entry in enumerate(self.entries):
+                arr[irec, ientry] = rec.get(entry, np.NaN)
+        return arr
+
+    @staticmethod
+    def _parse_budget(lines):
+        """the flux and cumulative entries of one budget table"""
+        tag = "IN"
+        inc, cum = {}, {}
+        counts = {}
+        for line in lines:
+            if line.count("=") != 2:
+                if "OUT:" in line.upper():
+                    tag = "OUT"
+                    counts = {}
+                continue
+            entry, rest = line.split("=", 1)
+            entry = entry.strip()
+            cu_str = rest.split()[0]
+            fx_str = rest.split("=", 1)[1].split()[0]
+            if entry.endswith(tag):
+                if " - " in entry:
+                    key = entry.replace(" ", "")
+                else:
+                    key = entry.replace(" ", "_")
+            elif "PERCENT DISCREPANCY" in entry.upper():
+                key = entry.replace(" ", "_")
+            else:
+                entry = entry.replace(" ", "_")
+                # repeated budget items (one per package instance) are numbered
+                if entry in counts:
+                    counts[entry] += 1
+                    entry = "{0}{1}".format(entry, counts[entry] + 1)
+                else:
+                    counts[entry] = 0
+                key = "{0}_{1}".format(entry, tag)
+            inc[key] = _to_float(fx_str)
+            cum[key] = _to_float(cu_str)
+        return inc, cum
+
+    def _parse_totim(self, block):
+        """total time from a time summary table"""
+        lines = block.decode("ascii", errors="replace").split("\n")
+        try:
+            if "SECONDS" in lines[1].upper():
+                # header, time units, dashes, step length, period time, total time
+                return float(lines[5][20:].split()[_MF_TIME_UNITS[self.timeunit.upper()]])
+            # without time units, each table line has a single value
+            return float(lines[3][45:].split()[0])
+        except (IndexError, ValueError):
+            return np.NaN
+
+    def get_times(self):
+        """get the simulation times of the budget tables
+
+        Returns:
+            [`float`]: the total simulation time of each budget table
+
+        """
+        return self.totim.tolist()
+
+    def get_dataframes(self, start_datetime="1-1-1970", diff=False):
+        """get the flux and cumulative volume budgets as dataframes
+
+        Args:
+            start_datetime (`str`, optional): a string that can be cast to a
+                `pandas.Timestamp` that is the start of the simulation.  If None,
+                the dataframe index is the simulation time.  Default is "1-1-1970"
+            diff (`bool`): flag to return the in minus out difference of each
+                budget item instead of the in and out values.  Default is False
+
+        Returns:
+            tuple containing
+
+            - **pandas.DataFrame**: the flux budget
+            - **pandas.DataFrame**: the cumulative volume budget
+
+        """
+        if len(self.entries) == 0:
+            return None
+        index = self.get_times()
+        if start_datetime is not None:
+            if self.timeunit.upper() == "YEARS":
+                key, fact = "days", 365.25
+            else:
+                key, fact = self.timeunit.lower(), 1.0
+            start = pd.to_datetime(start_datetime)
+            index = [start + timedelta(**{key: t * fact}) for t in index]
+        df_flux = pd.DataFrame(self.inc, index=index, columns=self.entries)
+        df_vol = pd.DataFrame(self.cum, index=index, columns=self.entries)
+        if not diff:
+            return df_flux, df_vol
+
+        for df in [df_flux, df_vol]:
+            in_names = [col for col in df.columns if col.endswith("_IN")]
+            for in_name in in_names:
+                name = in_name[:-3]
+                out_name = name + "_OUT"
+                out_vals = df.pop(out_name) if out_name in df.columns else 0.0
+                df.loc[:, name.lower()] = df.pop(in_name) - out_vals
+            df.columns = [col.lower() for col in df.columns]
+        df_flux = df_flux.loc[:, sorted(df_flux.columns)]
+        df_vol = df_vol.loc[:, sorted(df_vol.columns)]
+        return df_flux, df_vol
+
+
+class MtListBudgetFile(object):
+    """the mass budget tables of an MT3DMS or MT3D-USGS list file: the
+    groundwater budgets of each component and, if the SFT process is
+    active, the stream budgets.
+
+    Args:
+        filename (`str`): the list file
+
+    Example::
+
+        mt = pyemu.budget_utils.MtListBudgetFile("my.list")
+        gw, sw = mt.parse(start_datetime="1-1-2000")
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.gw_data = {}
+        self.sw_data = {}
+        mm = _map_file(filename)
+        try:
+            gw_starts = _find_lines(mm, _MT_GW_KEY)
+            sw_starts = _find_lines(mm, _MT_SW_KEY)
+            starts = sorted([(s, "gw") for s in gw_starts] + [(s, "sw") for s in sw_starts])
+            stops = [s for s, _ in starts[1:]] + [len(mm)]
+            for (start, kind), stop in zip(starts, stops):
+                if kind == "gw":
+                    lines = _lines(mm, start, b"DISCREPANCY", stop)
+                    self._parse_gw(lines)
+                else:
+                    lines = _lines(mm, start, b"NET (IN - OUT)", stop)
+                    self._parse_sw(lines)
+        finally:
+            if not isinstance(mm, bytes):
+                mm.close()
+
+    @staticmethod
+    def _append(data, key, value):
+        if key not in data:
+            data[key] = []
+        data[key].append(value)
+
+    @staticmethod
+    def _steps(line):
+        steps = _MT_STEPS.search(line.upper())
+        if steps is None:
+            raise Exception("error parsing time steps from '{0}'".format(line.strip()))
+        return [int(s) if "*" not in s else np.NaN for s in steps.groups()]
+
+    def _parse_gw(self, lines):
+        comp = int(_MT_COMP.search(lines[0].upper()).group(1))
+        totim, steps, ibudget = None, None, None
+        for iline, line in enumerate(lines):
+            uline = line.upper()
+            if totim is None and "TOTAL ELAPSED TIME" in uline:
+                totim = float(line.split()[-2])
+            elif "MASS BUDGETS AT END OF TRANSPORT STEP" in uline:
+                steps = self._steps(line)
+                ibudget = iline + 1
+                break
+        if totim is None or steps is None:
+            raise Exception("incomplete groundwater mass budget for component {0}".format(comp))
+        tkstp, kstp, kper = steps
+        for lab, val in zip(["totim", "kper", "kstp", "tkstp"], [totim, kper, kstp, tkstp]):
+            self._append(self.gw_data, "{0}_{1}".format(lab, comp), val)
+        imm = False
+        for line in lines[ibudget:]:
+            if "immobile domain" in line.lower():
+                imm = True
+                continue
+            # the totals are for both domains
+            if "-----" in line:
+                imm = False
+            if ":" not in line:
+                continue
+            item, vals = line.lower().split(":", 1)
+            item = item.strip().strip("[\\|]").replace(" ", "_")
+            if imm:
+                item = "imm_" + item
+            vals = vals.split()
+            item += "_{0}".format(comp)
+            # net (in-out) and discrepancy only have one value
+            if len(vals) < 2:
+                if "discrepancy" in item:
+                    item = "perc_discrepancy_{0}".format(comp)
+                self._append(self.gw_data, item, float(vals[0]))
+            else:
+                # the total line has units after each value
+                ioval = 2 if "total" in item else 1
+                self._append(self.gw_data, item + "_in", float(vals[0]))
+                self._append(self.gw_data, item + "_out", -1.0 * float(vals[ioval]))
+
+    def _parse_sw(self, lines):
+        comp = _MT_COMP.search(lines[0].upper())
+        comp = 1 if comp is None else int(comp.group(1))
+        tkstp, kstp, kper = self._steps(lines[0])
+        for lab, val in zip(["kper", "kstp", "tkstp"], [kper, kstp, tkstp]):
+            self._append(self.sw_data, "{0}_{1}".format(lab, comp), val)
+        inout = "in"
+        for line in lines[1:]:
+            raw = line.lower().strip().split("=")
+            if len(raw) < 2:
+                continue
+            item = raw[0].strip().replace(" ", "_")
+            cval = float(raw[1].split()[0])
+            fval = float(raw[2]) if len(raw) > 2 else cval
+            item += "_{0}".format(comp)
+            if item.startswith("net_"):
+                labs = ["_cum", "_flx"]
+            else:
+                labs = ["_cum_" + inout, "_flx_" + inout]
+            for lab, val in zip(labs, [cval, fval]):
+                self._append(self.sw_data, item + lab, val)
+            if item.startswith("total_in"):
+                inout = "out"
+
+    @staticmethod
+    def _trim(data, min_len=None):
+        """trim the records so they all have the same length, in case of
+        an incomplete last budget
+        """
+        if min_len is None:
+            min_len = min([len(lst) for lst in data.values()])
+        return pd.DataFrame({key: lst[:min_len] for key, lst in data.items()})
+
+    @staticmethod
+    def _diff(df):
+        """in minus out of each budget item, paired the same way as flopy"""
+        out_cols = [c for c in df.columns if "_out" in c]
+        in_cols = [c for c in df.columns if "_in" in c]
+        add_cols = [c for c in df.columns if c not in out_cols + in_cols + ["totim"]]
+        out_base = [c.replace("_out", "") for c in out_cols]
+        in_base = [c.replace("_in", "") for c in in_cols]
+        out_base_mapped = []
+        for base in out_base:
+            for key, new in _MT_SW_OUT_NAMES.items():
+                if key in base:
+                    base = base.replace(key, new)
+                    break
+            out_base_mapped.append(base)
+        in_dict = {ib: ic for ib, ic in zip(in_base, in_cols)}
+        out_dict = {ob: oc for ob, oc in zip(out_base_mapped, out_cols)}
+        new = {"totim": df.totim}
+        for col in sorted(set(out_base_mapped).union(in_base)):
+            odata = df.loc[:, out_dict[col]] if col in out_dict else 0.0
+            idata = df.loc[:, in_dict[col]] if col in in_dict else 0.0
+            new[col] = idata - odata
+        return pd.concat([pd.DataFrame(new, index=df.index), df.loc[:, add_cols]], axis=1)
+
+    def parse(self, start_datetime=None, diff=True, time_unit="d"):
+        """get the groundwater and stream mass budgets as dataframes
+
+        Args:
+            start_datetime (`str`, optional): a string that can be cast to a
+                `pandas.Timestamp` that is the start of the simulation.  If None,
+                the dataframe index is the simulation time.  Default is None
+            diff (`bool`): flag to return the in minus out difference of each
+                budget item instead of the in and out values.  Default is True
+            time_unit (`str`): the `pandas.to_timedelta()` unit of the simulation
+                times.  Default is "d"
+
+        Returns:
+            tuple containing
+
+            - **pandas.DataFrame**: the groundwater mass budget
+            - **pandas.DataFrame**: the stream mass budget.  None if there are no
+              stream budgets in the list file
+
+        """
+        if len(self.gw_data) == 0:
+            raise Exception("MtListBudgetFile error: no gw budget info found in '{0}'".
+                            format(self.filename))
+        df_gw = self._trim(self.gw_data)
+        totim_cols = [c for c in df_gw.columns if c.startswith("totim_")]
+        df_gw.loc[:, "totim"] = df_gw.pop(totim_cols[0])
+        if diff:
+            df_gw = self._diff(df_gw)
+        if start_datetime is not None:
+            df_gw.index = pd.to_datetime(start_datetime) + \
+                          pd.to_timedelta(df_gw.totim, unit=time_unit)
+        else:
+            df_gw.index = df_gw.totim
+
+        df_sw = None
+        if len(self.sw_data) > 0:
+            min_len = min([len(lst) for lst in self.sw_data.values()] + [df_gw.shape[0]])
+            df_sw = self._trim(self.sw_data, min_len)
+            df_sw.loc[:, "totim"] = df_gw.totim.iloc[:min_len].values
+            if diff:
+                df_sw = self._diff(df_sw)
+            if start_datetime is not None:
+                df_sw.index = pd.to_datetime(start_datetime) + \
+                              pd.to_timedelta(df_sw.pop("totim"), unit=time_unit)
+            else:
+                df_sw.index = df_sw.pop("totim")
+        for col in df_gw.columns:
+            if "totim" in col:
+                df_gw.pop(col)
+        return df_gw, df_sw
@@ -0,0 +1,235 @@
+"""vectorized residual statistics for (observation) ensembles
+"""
+import os
+import numpy as np
+import pandas as pd
+
+import pyemu
+
+STAT_NAMES = ["rss", "mean", "mae", "rmse", "nrmse"]
+
+
+def phi_vector(values, obsval, weight):
+    """calculate the weighted sum of squared residuals (phi) for each row of
+    a 2-D array of simulated values
+
+    Args:
+        values (`numpy.ndarray`): 2-D array of simulated values (realizations by
+            observations)
+        obsval (`numpy.ndarray`): observed values
+        weight (`numpy.ndarray`): observation weights
+
+    Returns:
+        `numpy.ndarray`: phi for each row of `values`
+
+    """
+    wres = (np.atleast_2d(values) - obsval) * weight
+    return np.einsum("ij,ij->i", wres, wres)
+
+
+class EnsembleResStats(object):
+    """single-pass accumulator of residual statistics by observation group for
+    blocks of realizations
+
+    Args:
+        obs (`pandas.DataFrame`): observation data with "obsnme", "obsval", "weight"
+            and "obgnme" columns (e.g. `Pst.observation_data`).  Only these observations
+            are used, in this order
+
+    Note:
+        the statistics are the same as those in `pyemu.Pst.get_res_stats()`:
+        "rss" (the weighted sum of squared residuals, that is, phi), "mean",
+        "mae", "rmse" and "nrmse" (rmse normalized by the obsval range of the group).
+        Each is calculated for each realization and each group as well as for
+        "all" observations.
+
+        residuals are `simulated - obsval`
+
+    Example::
+
+        ers = pyemu.en_utils.EnsembleResStats(pst.observation_data.loc[pst.nnz_obs_names,:])
+        for df in pyemu.en.ChunkedEnsembleFile("obs.ens").iter_reals(columns=ers.names):
+            ers.add(df)
+        stats = ers.to_dataframes()
+
+    """
+    def __init__(self, obs):
+        self.names = list(obs.obsnme.values)
+        self.obsval = obs.obsval.values.astype(np.float64)
+        self.weight = obs.weight.values.astype(np.float64)
+        codes, groups = pd.factorize(obs.obgnme.values)
+        self.groups = list(groups)
+        # sort columns by group so group sums are contiguous slices
+        self._order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[self._order]
+        self._starts = np.searchsorted(sorted_codes, np.arange(len(self.groups)))
+        self._counts = np.bincount(codes, minlength=len(self.groups)).astype(np.float64)
+        self._obsval = self.obsval[self._order]
+        self._weight = self.weight[self._order]
+        ranges = []
+        for s, c in zip(self._starts, self._counts.astype(int)):
+            ov = self._obsval[s:s + c]
+            ranges.append(ov.max() - ov.min())
+        self._ranges = np.array(ranges)
+        if len(self.obsval) > 0:
+            self._all_range = self.obsval.max() - self.obsval.min()
+        else:
+            self._all_range = np.NaN
+        self.real_names = []
+        self._sums = {"rss": [], "sum": [], "abs": [], "sq": []}
+
+    def _group_sums(self, x):
+        if x.shape[1] == 0:
+            return np.zeros((x.shape[0], 0))
+        return np.add.reduceat(x, self._starts, axis=1)
+
+    def add(self, values, real_names=None):
+        """accumulate the statistics for a block of realizations
+
+        Args:
+            values (`pandas.DataFrame` or `numpy.ndarray`): simulated values.  A
+                DataFrame is reindexed to `EnsembleResStats.names` and its index is
+                used for the realization names.  An array must be ordered as `names`
+            real_names ([`object`], optional): realization names for an array
+                `values`.  If None, an integer counter is used.  Default is None
+
+        """
+        if isinstance(values, pd.DataFrame):
+            if real_names is None:
+                real_names = list(values.index)
+            values = values.loc[:, self.names].values
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        if real_names is None:
+            start = len(self.real_names)
+            real_names = list(range(start, start + values.shape[0]))
+        res = values[:, self._order] - self._obsval
+        wres = res * self._weight
+        sq = res * res
+        self._sums["rss"].append(self._group_sums(wres * wres))
+        self._sums["sum"].append(self._group_sums(res))
+        self._sums["abs"].append(self._group_sums(np.abs(res)))
+        self._sums["sq"].append(self._group_sums(sq))
+        self.real_names.extend(list(real_names))
+
+    def to_dataframes(self):
+        """get the accumulated statistics
+
+        Returns:
+            `dict`: a dictionary of stat name keys ("rss", "mean", "mae", "rmse",
+            "nrmse") and `pandas.DataFrame` values of realizations by
+            ["all"] + group names.  The "phi" key holds the `pandas.Series`
+            of total phi (the "all" column of "rss")
+
+        """
+        ngrp = len(self.groups)
+        sums = {}
+        for k, v in self._sums.items():
+            if len(v) == 0:
+                sums[k] = np.zeros((0, ngrp))
+            else:
+                sums[k] = np.vstack(v)
+        count = np.append(self._counts.sum(), self._counts)
+        ranges = np.append(self._all_range, self._ranges)
+        full = {k: np.hstack([v.sum(axis=1)[:, None], v]) for k, v in sums.items()}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rmse = np.sqrt(full["sq"] / count)
+            stats = {"rss": full["rss"],
+                     "mean": full["sum"] / count,
+                     "mae": full["abs"] / count,
+                     "rmse": rmse,
+                     "nrmse": rmse / ranges}
+        columns = ["all"] + self.groups
+        dfs = {k: pd.DataFrame(stats[k], index=self.real_names, columns=columns) for k in STAT_NAMES}
+        dfs["phi"] = dfs["rss"].loc[:, "all"].copy()
+        return dfs
+
+
+def _get_obs(pst, names, nonzero):
+    obs = pst.observation_data
+    if names is not None:
+        obs = obs.loc[names, :]
+    if nonzero:
+        obs = obs.loc[obs.weight > 0, :]
+    return obs
+
+
+def ensemble_quantiles(ensemble, q=(0.05, 0.5, 0.95), columns=None, col_chunk=5000):
+    """calculate quantiles across the realizations of an ensemble for each column
+
+    Args:
+        ensemble (varies): a `pyemu.Ensemble`, `pandas.DataFrame` or the name of
+            a `pyemu.en.ChunkedEnsembleFile` container
+        q ([`float`]): the quantiles to calculate.  Default is (0.05, 0.5, 0.95)
+        columns ([`str`], optional): the columns to calculate.  If None, all columns are used
+        col_chunk (`int`): number of columns to read at once from a container file.
+            Default is 5000
+
+    Returns:
+        `pandas.DataFrame`: quantiles (index) by columns
+
+    """
+    q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+    if isinstance(ensemble, str):
+        ef = pyemu.en.ChunkedEnsembleFile(ensemble)
+        if columns is None:
+            columns = ef.columns
+        columns = list(columns)
+        result = np.empty((q.shape[0], len(columns)))
+        for s in range(0, len(columns), col_chunk):
+            vals = ef.read_values(columns=columns[s:s + col_chunk])
+            result[:, s:s + col_chunk] = np.quantile(vals, q, axis=0)
+        return pd.DataFrame(result, index=q, columns=columns)
+    if isinstance(ensemble, pyemu.Ensemble):
+        ensemble = ensemble._df
+    if columns is not None:
+        ensemble = ensemble.loc[:, columns]
+    return pd.DataFrame(np.quantile(ensemble.values, q, axis=0), index=q, columns=ensemble.columns)
+
+
+def ensemble_res_stats(ensemble, pst, nonzero=True, obs_names=None, quantiles=None,
+                       batch_size=1000):
+    """calculate phi, per-group phi contributions and per-group residual
+    statistics for each realization of an ensemble in a single pass
+
+    Args:
+        ensemble (varies): a `pyemu.ObservationEnsemble`, `pandas.DataFrame` or the name
+            of a `pyemu.en.ChunkedEnsembleFile` container, which is streamed in blocks
+            of `batch_size` realizations
+        pst (`pyemu.Pst`): control file with the current obsvals, weights and groups
+        nonzero (`bool`): flag to only use non-zero weighted observations.  Default is True
+        obs_names ([`str`], optional): subset of observations to use.  If None,
+            all observations in `pst` are used.  Default is None
+        quantiles ([`float`], optional): quantiles to calculate across realizations for
+            each observation.  If None, quantiles are not calculated.  Default is None
+        batch_size (`int`): number of realizations to process at once.  Default is 1000
+
+    Returns:
+        `dict`: "phi" (`pandas.Series`) and stat name keys ("rss", "mean", "mae", "rmse", "nrmse")
+        with `pandas.DataFrame` values of realizations by ["all"] + group names (see
+        `EnsembleResStats`).  If `quantiles` is passed, the "quantiles" key holds a
+        `pandas.DataFrame` of quantiles by observations.
+
+    Example::
+
+        oe = pyemu.ObservationEnsemble.from_csv(pst,"sweep_out.csv")
+        stats = pyemu.en_utils.ensemble_res_stats(oe,pst,quantiles=[0.05,0.95])
+        stats["rmse"].to_csv("rmse.csv")
+
+    """
+    obs = _get_obs(pst, obs_names, nonzero)
+    ers = EnsembleResStats(obs)
+    if isinstance(ensemble, str):
+        ef = pyemu.en.ChunkedEnsembleFile(ensemble)
+        for df in ef.iter_reals(batch_size=batch_size, columns=ers.names):
+            ers.add(df)
+    else:
+        if isinstance(ensemble, pyemu.Ensemble):
+            ensemble = ensemble._df
+        values = ensemble.loc[:, ers.names].values
+        index = list(ensemble.index)
+        for s in range(0, values.shape[0], batch_size):
+            ers.add(values[s:s + batch_size, :], real_names=index[s:s + batch_size])
+    stats = ers.to_dataframes()
+    if quantiles is not None:
+        stats["quantiles"] = ensemble_quantiles(ensemble, q=quantiles, columns=ers.names)
+    return stats
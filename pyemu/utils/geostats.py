@@ -10,30 +10,551 @@ import numpy as np
 import pandas as pd
 from pyemu.mat.mat_handler import Cov
 from pyemu.utils.pp_utils import pp_file_to_dataframe
+from pyemu.utils.array_utils import write_array
 from ..pyemu_warnings import PyemuWarning
 
 EPSILON = 1.0e-7
+TILE_SIZE = 1000 # number of points in each tile of blocked covariance calculations
 
-# class KrigeFactors(pd.DataFrame):
-#     def __init__(self,*args,**kwargs):
-#         super(KrigeFactors,self).__init__(*args,**kwargs)
-#
-#     def to_factors(self,filename,nrow,ncol,
-#                    points_file="points.junk",
-#                    zone_file="zone.junk"):
-#         with open(filename,'w') as f:
-#             f.write(points_file+'\n')
-#             f.write(zone_file+'\n')
-#             f.write("{0} {1}\n".format(ncol,nrow))
-#             f.write("{0}\n".format(self.shape[0]))
-#
-#
-#
-#     def from_factors(self,filename):
-#         raise NotImplementedError()
 
+def _tile_pairs(npts, tile_size):
+    """ the (row start, row end, col start, col end) of the upper-triangle tiles
+    of a symmetric `npts` by `npts` matrix
+    """
+    starts = list(range(0, npts, tile_size))
+    pairs = []
+    for i, rs in enumerate(starts):
+        for cs in starts[i:]:
+            pairs.append((rs, min(rs + tile_size, npts), cs, min(cs + tile_size, npts)))
+    return pairs
+
+
+def _blocked_covariance(x, y, tile_func, nugget=0.0, out=None, tile_size=TILE_SIZE,
+                        num_threads=1, coo_file=None):
+    """ calculate a symmetric covariance matrix in tiles of point pairs.
+
+    Args:
+        x (`numpy.ndarray`): x-coordinates
+        y (`numpy.ndarray`): y-coordinates
+        tile_func (`callable`): function with signature tile_func(x0,y0,x1,y1) that returns
+            the 2-D covariance array between the points x0,y0 and x1,y1
+        nugget (`float`): value added to the diagonal
+        out (`numpy.ndarray`, optional): 2-D array to add the covariance to in place.
+        tile_size (`int`): number of points in a tile
+        num_threads (`int`): number of threads to calculate tiles with.  numpy releases the
+            GIL for the array operations, so tiles are calculated concurrently
+        coo_file (`file`, optional): an open binary file handle to write the non-zero
+            entries of each tile to as `Matrix.coo_rec_dt` records
+
+    Returns:
+        `int`: the number of records written to `coo_file`
+
+    """
+    from pyemu.mat.mat_handler import Matrix
+
+    def calc_tile(pair):
+        rs, re, cs, ce = pair
+        c = tile_func(x[rs:re], y[rs:re], x[cs:ce], y[cs:ce])
+        if np.any(np.isnan(c)):
+            raise Exception("nans in covariance tile rows {0}:{1}, cols {2}:{3}".
+                            format(rs, re, cs, ce))
+        if rs == cs:
+            c[np.diag_indices_from(c)] += nugget
+        if out is not None:
+            out[rs:re, cs:ce] += c
+            if rs != cs:
+                out[cs:ce, rs:re] += c.T
+        if coo_file is None:
+            return None
+        return c
+
+    def write_tile(pair, c):
+        rs, re, cs, ce = pair
+        i, j = np.nonzero(c)
+        recs = [(i + rs, j + cs, c[i, j])]
+        if rs != cs:
+            recs.append((j + cs, i + rs, c[i, j]))
+        nrec = 0
+        for ii, jj, vv in recs:
+            data = np.core.records.fromarrays([ii, jj, vv], dtype=Matrix.coo_rec_dt)
+            data.tofile(coo_file)
+            nrec += data.shape[0]
+        return nrec
+
+    pairs = _tile_pairs(x.shape[0], int(tile_size))
+    nrec = 0
+    if num_threads > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=num_threads) as pool:
+            # process the tiles in batches to bound the memory of pending tiles
+            for b in range(0, len(pairs), 2 * num_threads):
+                batch = pairs[b:b + 2 * num_threads]
+                for pair, c in zip(batch, pool.map(calc_tile, batch)):
+                    if c is not None:
+                        nrec += write_tile(pair, c)
+    else:
+        for pair in pairs:
+            c = calc_tile(pair)
+            if c is not None:
+                nrec += write_tile(pair, c)
+    return nrec
+
+
+def _nearest_points(ptx, pty, x, y, k, search_radius, chunk_size=2000):
+    """private method to find the (at most) `k` nearest points in ptx,pty
+    within `search_radius` of each x,y location in a single batched query.
+
+    Uses `scipy.spatial.cKDTree` if scipy is available, otherwise a chunked,
+    vectorized brute-force search.  Returns an integer array of point
+    indices (-1 for "not found") and the corresponding distances (np.inf for
+    "not found"), each of shape (len(x),k) and sorted by increasing distance.
+    Locations with NaN coordinates find no points.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ptx = np.asarray(ptx, dtype=np.float64)
+    pty = np.asarray(pty, dtype=np.float64)
+    n, npts = x.shape[0], ptx.shape[0]
+    idx = np.zeros((n, k), dtype=np.int64) - 1
+    dist = np.zeros((n, k)) + np.inf
+    valid = np.where(np.isfinite(x) & np.isfinite(y))[0]
+    if k == 0 or npts == 0 or valid.shape[0] == 0:
+        return idx, dist
+    kk = min(k, npts)
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        cKDTree = None
+
+    if cKDTree is not None:
+        tree = cKDTree(np.column_stack((ptx, pty)))
+        # inclusive radius like the legacy "dist <= search_radius" test
+        d, i = tree.query(np.column_stack((x[valid], y[valid])), k=kk,
+                          distance_upper_bound=np.nextafter(search_radius, np.inf))
+        d, i = d.reshape(-1, kk), i.reshape(-1, kk)
+        i[~np.isfinite(d)] = -1
+        idx[valid, :kk] = i
+        dist[valid, :kk] = d
+        return idx, dist
+
+    sqradius = search_radius ** 2
+    for s in range(0, valid.shape[0], chunk_size):
+        v = valid[s:s + chunk_size]
+        d2 = (x[v, None] - ptx[None, :]) ** 2 + (y[v, None] - pty[None, :]) ** 2
+        if kk < npts:
+            part = np.argpartition(d2, kk - 1, axis=1)[:, :kk]
+        else:
+            part = np.tile(np.arange(npts), (v.shape[0], 1))
+        pd2 = np.take_along_axis(d2, part, axis=1)
+        order = np.argsort(pd2, axis=1, kind="stable")
+        part = np.take_along_axis(part, order, axis=1)
+        pd2 = np.take_along_axis(pd2, order, axis=1)
+        missing = pd2 > sqradius
+        part[missing] = -1
+        pd2[missing] = np.inf
+        idx[v, :kk] = part
+        dist[v, :kk] = np.sqrt(pd2)
+    return idx, dist
+
+
+def _share_arrays(arrays):
+    """private method to copy a dict of arrays into shared memory blocks for
+    multiprocessing workers.  Returns the list of `SharedMemory` instances (the
+    caller must close and unlink them) and the specs used by `_attach_arrays()`.
+    The workers only attach to the blocks, the creating process owns them.
+    If `multiprocessing.shared_memory` is not available (python < 3.8), the
+    arrays themselves are passed (and pickled to each worker)."""
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        return [], arrays
+    shms, specs = [], {}
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        shms.append(shm)
+        specs[name] = (shm.name, arr.shape, arr.dtype.str)
+    return shms, specs
+
+
+def _attach_arrays(specs):
+    """private method to get the arrays shared with `_share_arrays()` in a worker"""
+    arrays, shms = {}, []
+    for name, spec in specs.items():
+        if isinstance(spec, np.ndarray):
+            arrays[name] = spec
+            continue
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(name=spec[0])
+        shms.append(shm)
+        arrays[name] = np.ndarray(spec[1], dtype=np.dtype(spec[2]), buffer=shm.buf)
+    return arrays, shms
+
+
+_OK_WORKER = {}
+
+
+def _ok_worker_init(specs, geostruct, minpts_interp, forgive):
+    """private: initialize a kriging factor worker process"""
+    arrays, shms = _attach_arrays(specs)
+    _OK_WORKER.update(arrays)
+    _OK_WORKER["shms"] = shms
+    _OK_WORKER["geostruct"] = geostruct
+    _OK_WORKER["minpts_interp"] = minpts_interp
+    _OK_WORKER["forgive"] = forgive
+
+
+def _ok_worker(task):
+    """private: solve the kriging systems for a contiguous chunk of interp points"""
+    start, end, x, y, nbr_idx, nbr_dist = task
+    w = _OK_WORKER
+    idx, dist, facts, err_var = OrdinaryKrige._batch_factors(x, y, w["ptx"], w["pty"],
+                                                             w["point_cov"], nbr_idx, nbr_dist,
+                                                             w["geostruct"],
+                                                             minpts_interp=w["minpts_interp"],
+                                                             forgive=w["forgive"],
+                                                             cov_index=w["cov_index"])
+    return start, end, idx, dist, facts, err_var
+
+
+class KrigeFactors(object):
+    """compressed sparse row (CSR) storage of the kriging factors (weights) for the
+    nodes of a structured grid
+
+    Args:
+        nrow (`int`): number of rows in the grid
+        ncol (`int`): number of columns in the grid
+        point_names ([`str`]): names of the interpolation (e.g. pilot) points
+        indptr (`numpy.ndarray`): row pointer of length nrow * ncol + 1.  The
+            factors of (row-major) grid node i are entries indptr[i]:indptr[i+1]
+            of `indices` and `weights`
+        indices (`numpy.ndarray`): zero-based indices into `point_names`
+        weights (`numpy.ndarray`): the kriging factors
+        transform (`int` or `numpy.ndarray`): the transform flag (0 for none,
+            1 for log10) of all or each grid node.  Default is 0
+        points_file (`str`): points filename for the header of a PEST-style factors
+            file. Default is "points.junk"
+        zone_file (`str`): zone filename for the header of a PEST-style factors
+            file. Default is "zone.junk"
+
+    Note:
+        `KrigeFactors` can be written to (and read from) both the PEST-style text
+        factors file and a compact binary file.  The binary file is the `magic`
+        string, a fixed-length header, a json block of the point names, file names and
+        array types and then the transform, factor count, point index and weight arrays.
+
+    Example::
+
+        ok.calc_factors_grid(sr)
+        kf = ok.get_grid_factors()
+        kf.to_binary("hk.fac")
+        kf = pyemu.geostats.KrigeFactors.from_file("hk.fac")
+        arr = kf.interpolate(pp_df.parval1.values)
+
+    """
+    magic = b"PYEMUFAC"
+    header_dt = np.dtype([("nrow", np.int64), ("ncol", np.int64), ("npts", np.int64),
+                          ("nnz", np.int64), ("meta_nbytes", np.int64)])
+
+    def __init__(self, nrow, ncol, point_names, indptr, indices, weights, transform=0,
+                 points_file="points.junk", zone_file="zone.junk"):
+        self.nrow = int(nrow)
+        self.ncol = int(ncol)
+        self.point_names = list(point_names)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.transform = np.zeros(self.nnode, dtype=np.int8) + \
+                         np.asarray(transform, dtype=np.int8)
+        self.points_file = points_file
+        self.zone_file = zone_file
+        self._sparse = None
+        if self.indptr.shape[0] != self.nnode + 1:
+            raise Exception("KrigeFactors error: indptr length {0} != nrow * ncol + 1 ({1})".
+                            format(self.indptr.shape[0], self.nnode + 1))
+        if self.indices.shape[0] != self.weights.shape[0] or \
+                self.indptr[-1] != self.indices.shape[0]:
+            raise Exception("KrigeFactors error: indptr, indices and weights are not consistent")
+
+    @property
+    def nnode(self):
+        """ number of grid nodes
+
+        Returns:
+            `int`: nrow * ncol
+        """
+        return self.nrow * self.ncol
+
+    @property
+    def nnz(self):
+        """ number of stored factors
+
+        Returns:
+            `int`: length of `indices` and `weights`
+        """
+        return self.indices.shape[0]
+
+    @classmethod
+    def from_triplets(cls, nrow, ncol, point_names, nodes, indices, weights, **kwargs):
+        """ create a `KrigeFactors` from (node, point index, weight) triplets
+
+        Args:
+            nrow (`int`): number of rows in the grid
+            ncol (`int`): number of columns in the grid
+            point_names ([`str`]): names of the interpolation points
+            nodes (`numpy.ndarray`): zero-based, row-major grid node of each factor
+            indices (`numpy.ndarray`): zero-based point index of each factor
+            weights (`numpy.ndarray`): the factors
+            **kwargs (`dict`): optional args passed to `KrigeFactors()`
+
+        Returns:
+            `KrigeFactors`
+
+        Note:
+            the order of the factors of each node is retained
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        order = np.argsort(nodes, kind="stable")
+        counts = np.bincount(nodes, minlength=int(nrow) * int(ncol))
+        indptr = np.zeros(counts.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(nrow, ncol, point_names, indptr, np.asarray(indices)[order],
+                   np.asarray(weights)[order], **kwargs)
+
+    @staticmethod
+    def _uint_dtype(max_value):
+        for dt in [np.uint8, np.uint16, np.uint32]:
+            if max_value <= np.iinfo(dt).max:
+                return np.dtype(dt)
+        return np.dtype(np.int64)
+
+    def to_binary(self, filename, dtype=np.float32):
+        """ write a compact binary factors file
+
+        Args:
+            filename (`str`): the file to write
+            dtype (`numpy.dtype`): the floating point type to store the factors with.
+                Default is `np.float32`, which retains about the same precision as the
+                PEST-style text file.  Use `np.float64` to store the factors exactly
+
+        Note:
+            the number of factors of each node and the point indices are stored
+            with the smallest unsigned integer type that holds them
+
+        """
+        import json
+        counts = np.diff(self.indptr)
+        count_dtype = self._uint_dtype(counts.max() if counts.shape[0] > 0 else 0)
+        index_dtype = self._uint_dtype(max(len(self.point_names) - 1, 0))
+        dtype = np.dtype(dtype)
+        meta = json.dumps({"point_names": self.point_names,
+                           "points_file": self.points_file,
+                           "zone_file": self.zone_file,
+                           "count_dtype": count_dtype.str,
+                           "index_dtype": index_dtype.str,
+                           "weight_dtype": dtype.str}).encode()
+        header = np.array([(self.nrow, self.ncol, len(self.point_names), self.nnz, len(meta))],
+                          dtype=self.header_dt)
+        with open(filename, "wb") as f:
+            f.write(self.magic)
+            header.tofile(f)
+            f.write(meta)
+            self.transform.tofile(f)
+            counts.astype(count_dtype).tofile(f)
+            self.indices.astype(index_dtype).tofile(f)
+            self.weights.astype(dtype).tofile(f)
+
+    @classmethod
+    def from_binary(cls, filename):
+        """ load a binary factors file written by `KrigeFactors.to_binary()`
+
+        Args:
+            filename (`str`): the file to read
+
+        Returns:
+            `KrigeFactors`
+
+        """
+        import json
+        with open(filename, "rb") as f:
+            if f.read(len(cls.magic)) != cls.magic:
+                raise Exception("KrigeFactors.from_binary() error: '{0}' is not a binary factors file".
+                                format(filename))
+            header = np.fromfile(f, dtype=cls.header_dt, count=1)[0]
+            nnode = int(header["nrow"]) * int(header["ncol"])
+            nnz = int(header["nnz"])
+            meta = json.loads(f.read(int(header["meta_nbytes"])).decode())
+            transform = np.fromfile(f, dtype=np.int8, count=nnode)
+            counts = np.fromfile(f, dtype=np.dtype(meta["count_dtype"]), count=nnode)
+            indices = np.fromfile(f, dtype=np.dtype(meta["index_dtype"]), count=nnz)
+            weights = np.fromfile(f, dtype=np.dtype(meta["weight_dtype"]), count=nnz)
+        if weights.shape[0] != nnz:
+            raise Exception("KrigeFactors.from_binary() error: '{0}' is truncated".format(filename))
+        indptr = np.zeros(nnode + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(header["nrow"], header["ncol"], meta["point_names"], indptr, indices,
+                   weights, transform=transform, points_file=meta["points_file"],
+                   zone_file=meta["zone_file"])
+
+    def to_text(self, filename):
+        """ write a PEST-style (text) factors file
+
+        Args:
+            filename (`str`): the file to write
+
+        """
+        counts = np.diff(self.indptr)
+        with open(filename, 'w') as f:
+            f.write(self.points_file + '\n')
+            f.write(self.zone_file + '\n')
+            f.write("{0} {1}\n".format(self.ncol, self.nrow))
+            f.write("{0}\n".format(len(self.point_names)))
+            [f.write("{0}\n".format(name)) for name in self.point_names]
+            for inode in np.where(counts > 0)[0]:
+                s, e = self.indptr[inode], self.indptr[inode + 1]
+                f.write("{0} {1} {2} {3:8.5e} ".format(inode + 1, self.transform[inode],
+                                                       e - s, 0.0))
+                [f.write("{0} {1:12.8g} ".format(i + 1, w)) for i, w in
+                 zip(self.indices[s:e], self.weights[s:e])]
+                f.write("\n")
+
+    @classmethod
+    def from_text(cls, filename):
+        """ load a PEST-style (text) factors file
+
+        Args:
+            filename (`str`): the file to read
+
+        Returns:
+            `KrigeFactors`
+
+        """
+        with open(filename, 'rb') as f:
+            points_file = f.readline().decode().strip()
+            zone_file = f.readline().decode().strip()
+            ncol, nrow = [int(i) for i in f.readline().decode().strip().split()[:2]]
+            npp = int(f.readline().decode().strip())
+            point_names = [f.readline().decode().strip().lower() for _ in range(npp)]
+            data = f.read()
+        tokens = np.fromstring(data, sep=' ')
+        # each line is "inode itrans nfac var" and then nfac "point weight" pairs, so
+        # the line offsets are the cumulative token counts of the (non-blank) lines
+        buf = np.frombuffer(data, dtype=np.uint8)
+        space = buf <= ord(' ')
+        tok_start = ~space
+        tok_start[1:] &= space[:-1]
+        # number of tokens before the end of each line
+        line_end = np.append(np.flatnonzero(buf == ord('\n')), buf.shape[0])
+        counts = np.diff(np.searchsorted(np.flatnonzero(tok_start), line_end), prepend=0)
+        counts = counts[counts > 0]
+        starts = np.cumsum(counts) - counts
+        if counts.sum() != tokens.shape[0] or (counts < 4).any() or \
+                not np.array_equal(counts, 4 + 2 * tokens[starts + 2].astype(np.int64)):
+            raise Exception("KrigeFactors.from_text() error: '{0}' has an incomplete factor line".
+                            format(filename))
+        nodes = tokens[starts].astype(np.int64) - 1
+        nfac = tokens[starts + 2].astype(np.int64)
+        transform = np.zeros(nrow * ncol, dtype=np.int8)
+        transform[nodes] = tokens[starts + 1].astype(np.int8)
+        first = np.repeat(starts + 4, nfac)
+        within = np.arange(first.shape[0]) - np.repeat(np.cumsum(nfac) - nfac, nfac)
+        pair = first + 2 * within
+        return cls.from_triplets(nrow, ncol, point_names, np.repeat(nodes, nfac),
+                                 tokens[pair].astype(np.int64) - 1, tokens[pair + 1],
+                                 transform=transform, points_file=points_file,
+                                 zone_file=zone_file)
+
+    @classmethod
+    def from_file(cls, filename):
+        """ load a binary or PEST-style (text) factors file
 
+        Args:
+            filename (`str`): the file to read
 
+        Returns:
+            `KrigeFactors`
+
+        """
+        if not os.path.exists(filename):
+            raise Exception("KrigeFactors.from_file() error: file '{0}' not found".format(filename))
+        with open(filename, "rb") as f:
+            magic = f.read(len(cls.magic))
+        if magic == cls.magic:
+            return cls.from_binary(filename)
+        return cls.from_text(filename)
+
+    def to_sparse(self):
+        """ get the factors as a sparse interpolation matrix
+
+        Returns:
+            `scipy.sparse.csr_matrix`: a (nrow * ncol) by number-of-points matrix
+
+        Note:
+            requires scipy
+        """
+        import scipy.sparse as sparse
+        return sparse.csr_matrix((self.weights, self.indices, self.indptr),
+                                 shape=(self.nnode, len(self.point_names)))
+
+    def _apply(self, vals):
+        """ private method to multiply the factors by a 2-D array of point values.
+        Uses a scipy sparse mat-mat product if scipy is available and a
+        segmented (`np.add.reduceat`) sum otherwise."""
+        if self._sparse is None:
+            try:
+                self._sparse = self.to_sparse()
+            except ImportError:
+                self._sparse = False
+        if self._sparse is not False:
+            return np.asarray(self._sparse.dot(vals))
+        out = np.zeros((self.nnode, vals.shape[1]))
+        counts = np.diff(self.indptr)
+        rows = np.where(counts > 0)[0]
+        if rows.shape[0] > 0:
+            out[rows] = np.add.reduceat(self.weights[:, None] * vals[self.indices, :],
+                                        self.indptr[rows], axis=0)
+        return out
+
+    def interpolate(self, values, fill_value=np.NaN):
+        """ interpolate point values to the grid nodes
+
+        Args:
+            values (`numpy.ndarray`): point values, in the order of `point_names`.
+                A 2-D array of shape (number of points, number of arrays) interpolates
+                several sets of point values that share these factors in one pass
+            fill_value (`float`): the value to assign grid nodes without factors.
+                Default is np.NaN
+
+        Returns:
+            `numpy.ndarray`: the 2-D interpolated array or, for 2-D `values`, a 3-D
+            array of interpolated arrays
+
+        Note:
+            nodes with a transform flag of 1 are interpolated in log10 space
+        """
+        values = np.asarray(values, dtype=np.float64)
+        single = values.ndim == 1
+        if single:
+            values = values[:, None]
+        if values.shape[0] != len(self.point_names):
+            raise Exception("KrigeFactors.interpolate() error: values has {0} rows, not {1}".
+                            format(values.shape[0], len(self.point_names)))
+        islog = self.transform != 0
+        if islog.all():
+            with np.errstate(divide="ignore", invalid="ignore"):
+                arr = 10 ** self._apply(np.log10(values))
+        elif islog.any():
+            arr = self._apply(values)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                arr[islog] = 10 ** self._apply(np.log10(values))[islog]
+        else:
+            arr = self._apply(values)
+        arr[np.diff(self.indptr) == 0] = fill_value
+        arr = arr.T.reshape(values.shape[1], self.nrow, self.ncol)
+        if single:
+            return arr[0]
+        return arr
 
 
 class GeoStruct(object):
@@ -102,7 +623,7 @@ class GeoStruct(object):
         for v in self.variograms:
             v.to_struct_file(f)
 
-    def covariance_matrix(self,x,y,names=None,cov=None):
+    def covariance_matrix(self,x,y,names=None,cov=None,tile_size=TILE_SIZE,num_threads=1):
         """build a `pyemu.Cov` instance from `GeoStruct`
 
         Args:
@@ -111,8 +632,12 @@ class GeoStruct(object):
             names ([`str`] (optional)): names of location. If None,
                 cov must not be None.  Default is None.
             cov (`pyemu.Cov`): an existing Cov instance.  The contribution
-                of this GeoStruct is added to cov.  If cov is None,
+                of this GeoStruct is added to (a copy of) cov.  If cov is None,
                 names must not be None. Default is None
+            tile_size (`int`): number of points in each block of point pairs
+                that is calculated at once.  Default is `TILE_SIZE`
+            num_threads (`int`): number of threads to use to calculate the
+                blocks.  Default is 1
 
         Returns:
             `pyemu.Cov`: the covariance matrix implied by this
@@ -124,6 +649,9 @@ class GeoStruct(object):
             either "names" or "cov" must be passed.  If "cov" is passed, cov.shape
             must equal len(x) and len(y).
 
+            the contributions of all variograms and the nugget are accumulated
+            in a single pass over the blocks of point pairs
+
         Example::
 
             pp_df = pyemu.pp_utils.pp_file_to_dataframe("hkpp.dat")
@@ -133,32 +661,73 @@ class GeoStruct(object):
 
         """
 
-        if not isinstance(x,np.ndarray):
-            x = np.array(x)
-        if not isinstance(y,np.ndarray):
-            y = np.array(y)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
         assert x.shape[0] == y.shape[0]
 
         if names is not None:
             assert x.shape[0] == len(names)
             c = np.zeros((len(names),len(names)))
-            np.fill_diagonal(c,self.nugget)
             cov = Cov(x=c,names=names)
         elif cov is not None:
             assert cov.shape[0] == x.shape[0]
-            names = cov.row_names
-            c = np.zeros((len(names),1))
-            c += self.nugget
-            cont = Cov(x=c,names=names,isdiagonal=True)
-            cov += cont
-
+            # accumulate into a copy so the caller's cov is not changed
+            cov = Cov(x=np.array(cov.as_2d,dtype=np.float64),names=cov.row_names)
         else:
             raise Exception("GeoStruct.covariance_matrix() requires either " +
                             "names or cov arg")
-        for v in self.variograms:
-            v.covariance_matrix(x,y,cov=cov)
+        _blocked_covariance(x,y,self._covariance_tile,nugget=self.nugget,out=cov.x,
+                            tile_size=tile_size,num_threads=num_threads)
         return cov
 
+    def covariance_matrix_to_coo(self,x,y,names,filename,tile_size=TILE_SIZE,num_threads=1):
+        """write the covariance matrix implied by `GeoStruct` directly to a
+        PEST-compatible (coo) binary file, one block of point pairs at a time, without
+        forming the full matrix in memory
+
+        Args:
+            x ([`floats`]): x-coordinate locations
+            y ([`float`]): y-coordinate locations
+            names ([`str`]): names of locations
+            filename (`str`): the binary file to write
+            tile_size (`int`): number of points in each block of point pairs
+                that is calculated at once.  Default is `TILE_SIZE`
+            num_threads (`int`): number of threads to use to calculate the
+                blocks.  Default is 1
+
+        Example::
+
+            pp_df = pyemu.pp_utils.pp_file_to_dataframe("hkpp.dat")
+            gs.covariance_matrix_to_coo(pp_df.x,pp_df.y,pp_df.name,"cov.jcb",num_threads=4)
+            cov = pyemu.Cov.from_binary("cov.jcb")
+
+        """
+        from pyemu.mat.mat_handler import Matrix, _write_coo_names
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        assert x.shape[0] == y.shape[0]
+        assert x.shape[0] == len(names)
+        names = [str(n).lower() for n in names]
+        npts = x.shape[0]
+        with open(filename,'wb') as f:
+            # the header is rewritten once the number of records is known
+            np.array((npts, npts, 0), dtype=Matrix.binary_header_dt).tofile(f)
+            nrec = _blocked_covariance(x,y,self._covariance_tile,nugget=self.nugget,
+                                       tile_size=tile_size,num_threads=num_threads,
+                                       coo_file=f)
+            _write_coo_names(f,names,names)
+            f.seek(0)
+            np.array((npts, npts, nrec), dtype=Matrix.binary_header_dt).tofile(f)
+
+    def _covariance_tile(self,x0,y0,x1,y1):
+        """ private method to get the 2-D covariance array between the points
+        x0,y0 and x1,y1 for all variograms (excluding the nugget)
+        """
+        c = np.zeros((x0.shape[0],x1.shape[0]))
+        for v in self.variograms:
+            c += v._covariance_tile(x0,y0,x1,y1)
+        return c
+
     def covariance(self,pt0,pt1):
         """get the covariance between two points implied by the `GeoStruct`.
         This is used during the ordinary kriging process to get the RHS
@@ -372,12 +941,7 @@ class SpecSim2d(object):
         ydist = np.cumsum(full_dely)
         xdist -= xdist.min()
         ydist -= ydist.min()
-        xgrid = np.zeros((ydist.shape[0], xdist.shape[0]))
-        ygrid = np.zeros_like(xgrid)
-        for j, d in enumerate(xdist):
-            xgrid[:, j] = d
-        for i, d in enumerate(ydist):
-            ygrid[i, :] = d
+        xgrid, ygrid = np.meshgrid(xdist, ydist)
         grid = np.array((xgrid, ygrid))
         domainsize = np.array((full_dely.shape[0], full_delx.shape[0]))
         for i in range(2):
@@ -395,12 +959,21 @@ class SpecSim2d(object):
         self.num_pts = np.prod(xgrid.shape)
         self.sqrt_fftc = np.sqrt(fftc / self.num_pts)
 
-    def draw_arrays(self,num_reals=1,mean_value=1.0):
+    def draw_arrays(self,num_reals=1,mean_value=1.0,batch_size=10,num_threads=1,
+                    dtype=np.float64,seed=None):
         """draw realizations
 
         Args:
             num_reals (`int`): number of realizations to generate
             mean_value (`float`): the mean value of the realizations
+            batch_size (`int`): number of realizations to generate with each
+                (batched) inverse FFT.  Default is 10
+            num_threads (`int`): number of FFT workers to use if `scipy.fft`
+                is available.  Default is 1
+            dtype (`numpy.dtype`): the type of the returned array.  Default is `np.float64`
+            seed (`int`, `numpy.random.SeedSequence` or `numpy.random.Generator`): seed of
+                the random stream to draw with.  If None, the global `np.random` stream
+                is used.  Default is None
 
         Returns:
             `numpy.ndarray`: a 3-D array of realizations.  Shape
@@ -409,26 +982,78 @@ class SpecSim2d(object):
             log transformation is respected and the returned `reals` array is
             in arithmatic space
 
-        """
-        reals = []
-
-        for ireal in range(num_reals):
-            real = np.random.standard_normal(size=self.sqrt_fftc.shape)
-            imag = np.random.standard_normal(size=self.sqrt_fftc.shape)
-            epsilon = real + 1j * imag
-            rand = epsilon * self.sqrt_fftc
-            real = np.real(np.fft.ifftn(rand)) * self.num_pts
-            real = real[:self.dely.shape[0], :self.delx.shape[0]]
-            reals.append(real)
-        reals = np.array(reals)
-        if self.geostruct.transform == "log":
-            reals += np.log10(mean_value)
-            reals = 10**reals
+            use `SpecSim2d.draw_arrays_iter()` to generate realizations in blocks
+            without holding all of them in memory
 
-        else:
-            reals += mean_value
+        """
+        reals = np.empty((num_reals,self.dely.shape[0],self.delx.shape[0]),dtype=dtype)
+        i = 0
+        for block in self.draw_arrays_iter(num_reals=num_reals,mean_value=mean_value,
+                                           batch_size=batch_size,num_threads=num_threads,
+                                           dtype=dtype,seed=seed):
+            reals[i:i + block.shape[0]] = block
+            i += block.shape[0]
         return reals
 
+    def draw_arrays_iter(self,num_reals=1,mean_value=1.0,batch_size=10,num_threads=1,
+                         dtype=np.float32,seed=None):
+        """generator that draws realizations in blocks
+
+        Args:
+            num_reals (`int`): number of realizations to generate
+            mean_value (`float`): the mean value of the realizations
+            batch_size (`int`): number of realizations in each block.  Default is 10
+            num_threads (`int`): number of FFT workers to use if `scipy.fft`
+                is available.  Default is 1
+            dtype (`numpy.dtype`): the type of the yielded arrays.  Default is `np.float32`
+            seed (`int`, `numpy.random.SeedSequence` or `numpy.random.Generator`): seed of
+                the random stream to draw with.  If None, the global `np.random` stream
+                is used.  Default is None
+
+        Yields:
+            `numpy.ndarray`: 3-D arrays of (at most) `batch_size` realizations. Shape
+            is (batch_size,self.dely.shape[0],self.delx.shape[0])
+
+        Note:
+            the realizations are drawn with the same sequence of random calls
+            as with `SpecSim2d.draw_arrays()`, so a seeded draw yields the same
+            realizations regardless of `batch_size`
+
+        Example::
+
+            ss = pyemu.geostats.SpecSim2d(delx,dely,gs)
+            for i,block in enumerate(ss.draw_arrays_iter(num_reals=1000,batch_size=50)):
+                np.save("reals_{0}.npy".format(i),block)
+
+        """
+        try:
+            import scipy.fft as fft
+            fft_kwargs = {"workers":num_threads,"overwrite_x":True}
+        except ImportError:
+            fft = np.fft
+            fft_kwargs = {}
+        nrow,ncol = self.dely.shape[0],self.delx.shape[0]
+        batch_size = max(1,min(int(batch_size),num_reals))
+        shape = self.sqrt_fftc.shape
+        islog = self.geostruct.transform == "log"
+        if islog:
+            mean_value = np.log10(mean_value)
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        buf = np.empty((batch_size,) + shape,dtype=np.complex128)
+        for start in range(0,num_reals,batch_size):
+            nb = min(batch_size,num_reals - start)
+            b = buf[:nb]
+            for k in range(nb):
+                b[k].real = rng.standard_normal(size=shape)
+                b[k].imag = rng.standard_normal(size=shape)
+            b *= self.sqrt_fftc
+            field = fft.ifftn(b,axes=(1,2),**fft_kwargs)
+            block = field.real[:,:nrow,:ncol] * self.num_pts
+            block += mean_value
+            if islog:
+                np.power(10.0,block,out=block)
+            yield block.astype(dtype,copy=False)
+
     def grid_par_ensemble_helper(self,pst,gr_df,num_reals,sigma_range=6,logger=None):
         """wrapper around `SpecSim2d.draw()` designed to support `pyemu.PstFromFlopy`
             grid-based parameters
@@ -505,9 +1130,14 @@ class SpecSim2d(object):
                 logger.log("SpecSim: drawing {0} realization for group {1} with {4} pars, (log) variance {2} (sill {3})".\
                   format(num_reals, gr_grp, var,self.geostruct.sill,gp_df.shape[0]))
             self.initialize()
-            reals = self.draw_arrays(num_reals=num_reals,mean_value=mean_arr)
-            # put the pieces into the par en
-            reals = reals[:,gp_df.i,gp_df.j].reshape(num_reals,gp_df.shape[0])
+            # put the pieces into the par en, a block of realizations at a time
+            reals = np.empty((num_reals,gp_df.shape[0]))
+            ii,jj = gp_df.i.values,gp_df.j.values
+            i = 0
+            for block in self.draw_arrays_iter(num_reals=num_reals,mean_value=mean_arr,
+                                               dtype=np.float64):
+                reals[i:i + block.shape[0]] = block[:,ii,jj]
+                i += block.shape[0]
             real_arrs.append(reals)
             names.extend(list(gp_df.parnme.values))
             if logger is not None:
@@ -516,10 +1146,7 @@ class SpecSim2d(object):
                     format(num_reals, gr_grp, var, self.geostruct.sill, gp_df.shape[0]))
 
         # get into a dataframe
-        reals = real_arrs[0]
-        for r in real_arrs[1:]:
-            reals = np.append(reals,r,axis=1)
-        pe = pd.DataFrame(data=reals,columns=names)
+        pe = pd.DataFrame(data=np.hstack(real_arrs),columns=names)
         # reset to org conditions
         self.geostruct.nugget = org_nug
         self.geostruct.variograms[0].contribution = org_var
@@ -585,6 +1212,7 @@ class OrdinaryKrige(object):
         self.point_data.index = self.point_data.name
         self.check_point_data_dist()
         self.interp_data = None
+        self._factor_triplets = []
         self.spatial_reference = None
         #X, Y = np.meshgrid(point_data.x,point_data.y)
         #self.point_data_dist = pd.DataFrame(data=np.sqrt((X - X.T) ** 2 + (Y - Y.T) ** 2),
@@ -636,7 +1264,8 @@ class OrdinaryKrige(object):
 
     def calc_factors_grid(self,spatial_reference,zone_array=None,minpts_interp=1,
                           maxpts_interp=20,search_radius=1.0e+10,verbose=False,
-                          var_filename=None, forgive=False,num_threads=1):
+                          var_filename=None, forgive=False,num_threads=1,
+                          aniso_search=False,factors_file=None):
         """ calculate kriging factors (weights) for a structured grid.
 
         Args:
@@ -669,6 +1298,12 @@ class OrdinaryKrige(object):
                 is raised for failed matrix inversion.
             num_threads (`int`): number of multiprocessing workers to use to try to speed up
                 kriging in python.  Default is 1.
+            aniso_search (`bool`): flag to search for `point_data` entries along the
+                direction of variogram anisotropy (see `OrdinaryKrige.calc_factors()`).
+                Default is False
+            factors_file (`str`): a filename to save the factors to in the compact binary
+                format of `KrigeFactors.to_binary()`.  Use `OrdinaryKrige.to_grid_factors_file()`
+                for the PEST-style text format.  Default is None.
 
         Returns:
             `pandas.DataFrame`: a dataframe with information summarizing the ordinary kriging
@@ -718,11 +1353,12 @@ class OrdinaryKrige(object):
                                maxpts_interp=maxpts_interp,
                                search_radius=search_radius,
                                verbose=verbose, forgive=forgive,
-                               num_threads=num_threads)
+                               num_threads=num_threads,
+                               aniso_search=aniso_search)
 
             if var_filename is not None:
                 arr = df.err_var.values.reshape(x.shape)
-                np.savetxt(var_filename,arr,fmt="%15.6E")
+                write_array(var_filename,arr,fmt="%15.6E")
 
         if zone_array is not None:
             assert zone_array.shape == x.shape
@@ -745,7 +1381,8 @@ class OrdinaryKrige(object):
                                        maxpts_interp=maxpts_interp,
                                        search_radius=search_radius,
                                        verbose=verbose,pt_zone=pt_data_zone,
-                                       forgive=forgive,num_threads=num_threads)
+                                       forgive=forgive,num_threads=num_threads,
+                                       aniso_search=aniso_search)
 
                 dfs.append(df)
                 if var_filename is not None:
@@ -756,42 +1393,149 @@ class OrdinaryKrige(object):
                 raise Exception("no interpolation took place...something is wrong")
             df = pd.concat(dfs)
         if var_filename is not None:
-            np.savetxt(var_filename,arr,fmt="%15.6E")
+            write_array(var_filename,arr,fmt="%15.6E")
+        if factors_file is not None:
+            self.to_grid_factors_file(factors_file,binary=True)
         return df
 
-    def _dist_calcs(self,ix, iy, ptx_array, pty_array, ptnames, sqradius):
-        """private: find nearby points"""
-        #  calc dist from this interp point to all point data...slow
-        dist = pd.Series((ptx_array - ix) ** 2 + (pty_array - iy) ** 2, ptnames)
-        dist.sort_values(inplace=True)
-        dist = dist.loc[dist <= sqradius]
-        return dist
-
-    def _cov_points(self,ix, iy, pt_names):
-        """private: get covariance between points"""
-        interp_cov = self.geostruct.covariance_points(ix, iy, self.point_data.loc[pt_names, "x"],
-                                                      self.point_data.loc[pt_names, "y"])
-        return interp_cov
-
-    def _form(self,pt_names, point_cov, interp_cov):
-        """private: form the kriging equations"""
-
-        d = len(pt_names) + 1  # +1 for lagrange mult
-        A = np.ones((d, d))
-        A[:-1, :-1] = point_cov.values
-        A[-1, -1] = 0.0  # unbiaised constraint
-        rhs = np.ones((d, 1))
-        rhs[:-1, 0] = interp_cov
-        return A, rhs
-
-    def _solve(self,A, rhs):
-        return np.linalg.solve(A, rhs)
+    def _find_neighbors(self,x,y,maxpts_interp,search_radius,pt_zone=None,
+                        aniso_search=False):
+        """private: batched nearest-neighbor search for all interpolation points.
 
+        Returns the (zone-filtered) point data, an integer array of shape
+        (len(x),maxpts_interp) of row indices into that point data (-1 for "not found")
+        and the corresponding distances (np.inf for "not found").  If
+        `aniso_search`, the search (and `search_radius`) is applied in the
+        rotated and stretched coordinates of the largest-contribution variogram
+        while the distances returned are the usual (isotropic) distances.
+        """
+        pt_data = self.point_data
+        if pt_zone is not None:
+            pt_data = pt_data.loc[pt_data.zone == pt_zone, :]
+        ptx = pt_data.x.values.astype(np.float64)
+        pty = pt_data.y.values.astype(np.float64)
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if not aniso_search or len(self.geostruct.variograms) == 0:
+            idx, dist = _nearest_points(ptx, pty, x, y, maxpts_interp, search_radius)
+            return pt_data, idx, dist
+        vario = max(self.geostruct.variograms, key=lambda v: v.contribution)
+        sptx, spty = vario._apply_rotation(ptx, pty)
+        sx, sy = vario._apply_rotation(x, y)
+        idx, _ = _nearest_points(sptx, spty, sx, sy, maxpts_interp, search_radius)
+        found = idx >= 0
+        safe = np.where(found, idx, 0)
+        dist = np.sqrt((x[:, None] - ptx[safe]) ** 2 + (y[:, None] - pty[safe]) ** 2)
+        dist[~found] = np.inf
+        return pt_data, idx, dist
 
+    @staticmethod
+    def _batch_factors(x,y,ptx,pty,point_cov,nbr_idx,nbr_dist,geostruct,
+                       minpts_interp=1,forgive=False,epsilon=EPSILON,
+                       cov_index=None,chunk_size=10000,verbose=False):
+        """private: solve the ordinary kriging systems for many interpolation points.
+
+        Interpolation points are grouped by the number of neighbors k and the
+        (k+1) x (k+1) systems of each group are formed by integer indexing into
+        `point_cov` and solved with batched `numpy.linalg.solve()` calls.  Points
+        that share the same neighbor set share one factorization (inverse).
+
+        Returns the neighbor index, distance and factor arrays (padded with -1,
+        np.inf and 0.0 respectively) and the kriging variance of each point.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        idx = np.array(nbr_idx, dtype=np.int64)
+        dist = np.array(nbr_dist, dtype=np.float64)
+        n, kmax = idx.shape
+        if cov_index is None:
+            cov_index = np.arange(ptx.shape[0])
+        sill = geostruct.sill
+        facts = np.zeros((n, kmax))
+        err_var = np.zeros(n) + np.NaN
+        count = (idx >= 0).sum(axis=1)
+        valid = np.isfinite(x) & np.isfinite(y)
+
+        # too few points found
+        few = valid & ((count < minpts_interp) | (count == 0))
+        err_var[few] = sill
+        idx[few] = -1
+        dist[few] = np.inf
+
+        # one of the points is super close, just use it
+        close = np.where(valid & ~few & (dist.min(axis=1) <= epsilon))[0]
+        imin = idx[close, dist[close].argmin(axis=1)]
+        idx[close] = -1
+        idx[close, 0] = imin
+        dist[close] = np.inf
+        dist[close, 0] = epsilon
+        facts[close, 0] = 1.0
+        err_var[close] = geostruct.nugget
+
+        solve = valid & ~few
+        solve[close] = False
+        idx[~valid] = -1
+        dist[~valid] = np.inf
+        for k in np.unique(count[solve]):
+            rows = np.where(solve & (count == k))[0]
+            if verbose:
+                print("solving {0} kriging systems with {1} points".format(rows.shape[0], k))
+            for s in range(0, rows.shape[0], chunk_size):
+                crows = rows[s:s + chunk_size]
+                nb = idx[crows, :k]
+                # canonical (sorted) neighbor order so identical sets can be shared
+                perm = np.argsort(nb, axis=1)
+                snb = np.take_along_axis(nb, perm, axis=1)
+                uniq, inv = np.unique(snb, axis=0, return_inverse=True)
+                inv = inv.ravel()
+                cu = cov_index[uniq]
+                A = np.ones((uniq.shape[0], k + 1, k + 1))
+                A[:, :k, :k] = point_cov[cu[:, :, None], cu[:, None, :]]
+                A[:, k, k] = 0.0 #unbiased constraint
+                rhs = np.ones((crows.shape[0], k + 1))
+                rhs[:, :k] = geostruct.nugget
+                for v in geostruct.variograms:
+                    rhs[:, :k] += v.covariance_points(x[crows, None], y[crows, None],
+                                                      ptx[snb], pty[snb])
+                failed = np.zeros(uniq.shape[0], dtype=bool)
+                try:
+                    if uniq.shape[0] < crows.shape[0]:
+                        Ainv = np.linalg.solve(A, np.broadcast_to(np.eye(k + 1), A.shape))
+                        f = np.einsum("mij,mj->mi", Ainv[inv], rhs)
+                    else:
+                        f = np.linalg.solve(A[inv], rhs[:, :, None])[:, :, 0]
+                except np.linalg.LinAlgError:
+                    # find the singular system(s)
+                    Ainv = np.zeros_like(A) + np.NaN
+                    for iu in range(uniq.shape[0]):
+                        try:
+                            Ainv[iu] = np.linalg.inv(A[iu])
+                        except np.linalg.LinAlgError as e:
+                            failed[iu] = True
+                            pts = crows[inv == iu]
+                            print("error solving for factors: {0}".format(str(e)))
+                            print("points:", x[pts], y[pts])
+                            print("A:", A[iu])
+                            if not forgive:
+                                raise Exception("error solving for factors:{0}".format(str(e)))
+                    f = np.einsum("mij,mj->mi", Ainv[inv], rhs)
+                evar = sill + f[:, k] - (f[:, :k] * rhs[:, :k]).sum(axis=1)
+                # back to the (distance) order of the neighbors
+                fk = np.empty((crows.shape[0], k))
+                np.put_along_axis(fk, perm, f[:, :k], axis=1)
+                facts[crows, :k] = fk
+                err_var[crows] = evar
+                bad = crows[failed[inv]]
+                idx[bad] = -1
+                dist[bad] = np.inf
+                facts[bad] = 0.0
+                err_var[bad] = np.NaN
+        return idx, dist, facts, err_var
 
     def calc_factors(self,x,y,minpts_interp=1,maxpts_interp=20,
                      search_radius=1.0e+10,verbose=False,
-                     pt_zone=None,forgive=False,num_threads=1):
+                     pt_zone=None,forgive=False,num_threads=1,
+                     aniso_search=False):
         """ calculate ordinary kriging factors (weights) for the points
         represented by arguments x and y
 
@@ -818,6 +1562,10 @@ class OrdinaryKrige(object):
                 is raised for failed matrix inversion.
             num_threads (`int`): number of multiprocessing workers to use to try to speed up
                 kriging in python.  Default is 1.
+            aniso_search (`bool`): flag to search for `point_data` entries in the rotated
+                and stretched coordinates of the (largest contribution) variogram so that
+                the nearest points are selected along the direction of anisotropy.  In this
+                case `search_radius` is measured along the major axis.  Default is False
 
         Returns:
             `pandas.DataFrame`: a dataframe with information summarizing the ordinary kriging
@@ -826,149 +1574,72 @@ class OrdinaryKrige(object):
         Note:
             this method calls either `OrdinaryKrige.calc_factors_org()` or
             `OrdinaryKrige.calc_factors_mp()` depending on the value of `num_threads`
+
+            the `maxpts_interp` nearest `point_data` entries of all interpolation points
+            are found in a single spatial-index (KD-tree) query if scipy is available
         """
         if num_threads == 1:
             return self._calc_factors_org(x,y,minpts_interp,maxpts_interp,
                                          search_radius,verbose,pt_zone,
-                                         forgive)
+                                         forgive,aniso_search)
         else:
             return self._calc_factors_mp(x,y,minpts_interp,maxpts_interp,
                                          search_radius,verbose,pt_zone,
-                                         forgive, num_threads)
+                                         forgive, num_threads,aniso_search)
 
     def _calc_factors_org(self,x,y,minpts_interp=1,maxpts_interp=20,
                      search_radius=1.0e+10,verbose=False,
-                     pt_zone=None,forgive=False):
+                     pt_zone=None,forgive=False,aniso_search=False):
 
         assert len(x) == len(y)
-        # find the point data to use for each interp point
-        sqradius = search_radius**2
         df = pd.DataFrame(data={'x':x,'y':y})
-        inames,idist,ifacts,err_var = [],[],[],[]
-        sill = self.geostruct.sill
-        if pt_zone is None:
-            ptx_array = self.point_data.x.values
-            pty_array = self.point_data.y.values
-            ptnames = self.point_data.name.values
-        else:
-            pt_data = self.point_data
-            ptx_array = pt_data.loc[pt_data.zone==pt_zone,"x"].values
-            pty_array = pt_data.loc[pt_data.zone==pt_zone,"y"].values
-            ptnames = pt_data.loc[pt_data.zone==pt_zone,"name"].values
-        #if verbose:
-
-
+        # find the point data to use for each interp point in one pass
+        pt_data,nbr_idx,nbr_dist = self._find_neighbors(df.x.values,df.y.values,
+                                                        maxpts_interp,search_radius,
+                                                        pt_zone,aniso_search)
+        ptnames = pt_data.name.values
 
         print("starting interp point loop for {0} points".format(df.shape[0]))
         start_loop = datetime.now()
-        for idx,(ix,iy) in enumerate(zip(df.x,df.y)):
-            if np.isnan(ix) or np.isnan(iy): #if nans, skip
-                inames.append([])
-                idist.append([])
-                ifacts.append([])
-                err_var.append(np.NaN)
-                continue
-            if verbose:
-                istart = datetime.now()
-                print("processing interp point:{0} of {1}".format(idx,df.shape[0]))
-            # if verbose == 2:
-            #     start = datetime.now()
-            #     print("calc ipoint dist...",end='')
-
-            #  calc dist from this interp point to all point data...slow
-            #dist = pd.Series((ptx_array-ix)**2 + (pty_array-iy)**2,ptnames)
-            #dist.sort_values(inplace=True)
-            #dist = dist.loc[dist <= sqradius]
-            #def _dist_calcs(self, ix, iy, ptx_array, pty_array, ptnames, sqradius):
-            dist = self._dist_calcs(ix,iy, ptx_array, pty_array, ptnames, sqradius)
-
-            # if too few points were found, skip
-            if len(dist) < minpts_interp:
+        idx,dist,facts,err_var = OrdinaryKrige._batch_factors(df.x.values,df.y.values,
+                                        pt_data.x.values.astype(np.float64),
+                                        pt_data.y.values.astype(np.float64),
+                                        self.point_cov_df.values,nbr_idx,nbr_dist,
+                                        self.geostruct,minpts_interp=minpts_interp,
+                                        forgive=forgive,
+                                        cov_index=self.point_cov_df.index.get_indexer(ptnames),
+                                        verbose=verbose)
+        self._store_factors(df,ptnames,idx,dist,facts,err_var,pt_zone)
+        td = (datetime.now() - start_loop).total_seconds()
+        print("took {0} seconds".format(td))
+        return df
+
+    def _store_factors(self,df,ptnames,idx,dist,facts,err_var,pt_zone=None):
+        """private: add the (padded) factor arrays from `OrdinaryKrige._batch_factors()`
+        to `df` as per-point name, distance and factor lists and update `interp_data`"""
+        count = (idx >= 0).sum(axis=1)
+        inames,idist,ifacts = [],[],[]
+        for i,c in enumerate(count):
+            if c == 0:
                 inames.append([])
                 idist.append([])
                 ifacts.append([])
-                err_var.append(sill)
-                continue
-
-            # only the maxpts_interp points
-            dist = dist.iloc[:maxpts_interp].apply(np.sqrt)
-            pt_names = dist.index.values
-            # if one of the points is super close, just use it and skip
-            if dist.min() <= EPSILON:
-                ifacts.append([1.0])
-                idist.append([EPSILON])
-                inames.append([dist.idxmin()])
-                err_var.append(self.geostruct.nugget)
                 continue
-            # if verbose == 2:
-            #     td = (datetime.now()-start).total_seconds()
-            #     print("...took {0}".format(td))
-            #     start = datetime.now()
-            #     print("extracting pt cov...",end='')
-
-            #vextract the point-to-point covariance matrix
-            point_cov = self.point_cov_df.loc[pt_names,pt_names]
-            # if verbose == 2:
-            #     td = (datetime.now()-start).total_seconds()
-            #     print("...took {0}".format(td))
-            #     print("forming ipt-to-point cov...",end='')
-
-            # calc the interp point to points covariance
-            # interp_cov = self.geostruct.covariance_points(ix,iy,self.point_data.loc[pt_names,"x"],
-            #                                               self.point_data.loc[pt_names,"y"])
-            interp_cov = self._cov_points(ix,iy,pt_names)
-            if verbose == 2:
-                td = (datetime.now()-start).total_seconds()
-                print("...took {0} seconds".format(td))
-                print("forming lin alg components...",end='')
-
-            # form the linear algebra parts and solve
-            # d = len(pt_names) + 1 # +1 for lagrange mult
-            # A = np.ones((d,d))
-            # A[:-1,:-1] = point_cov.values
-            # A[-1,-1] = 0.0 #unbiaised constraint
-            # rhs = np.ones((d,1))
-            # rhs[:-1,0] = interp_cov
-            A, rhs = self._form(pt_names,point_cov,interp_cov)
-
-            # if verbose == 2:
-            #     td = (datetime.now()-start).total_seconds()
-            #     print("...took {0}".format(td))
-            #     print("solving...",end='')
-            # # solve
-            try:
-                facs = self._solve(A, rhs)
-            except Exception as e:
-                print("error solving for factors: {0}".format(str(e)))
-                print("point:",ix,iy)
-                print("dist:",dist)
-                print("A:", A)
-                print("rhs:", rhs)
-                if forgive:
-                    inames.append([])
-                    idist.append([])
-                    ifacts.append([])
-                    err_var.append(np.NaN)
-                    continue
-                else:
-                    raise Exception("error solving for factors:{0}".format(str(e)))
-            assert len(facs) - 1 == len(dist)
-
-            err_var.append(float(sill + facs[-1] - sum([f*c for f,c in zip(facs[:-1],interp_cov)])))
-            inames.append(pt_names)
-
-            idist.append(dist.values)
-            ifacts.append(facs[:-1,0])
-            # if verbose == 2:
-            #     td = (datetime.now()-start).total_seconds()
-            #     print("...took {0}".format(td))
-            if verbose:
-                td = (datetime.now()-istart).total_seconds()
-                print("point took {0}".format(td))
+            inames.append(ptnames[idx[i,:c]])
+            idist.append(dist[i,:c])
+            ifacts.append(facts[i,:c])
         df["idist"] = idist
         df["inames"] = inames
         df["ifacts"] = ifacts
         df["err_var"] = err_var
+        # compact (node, point index, factor) triplets for KrigeFactors
+        found = idx >= 0
+        gidx = self.point_data.index.get_indexer(ptnames)
+        triplets = (np.repeat(df.index.values,count),gidx[idx[found]],facts[found])
+        if pt_zone is None or self.interp_data is None:
+            self._factor_triplets = [triplets]
+        else:
+            self._factor_triplets.append(triplets)
         if pt_zone is None:
             self.interp_data = df
         else:
@@ -976,177 +1647,86 @@ class OrdinaryKrige(object):
                 self.interp_data = df
             else:
                 self.interp_data = self.interp_data.append(df)
-        td = (datetime.now() - start_loop).total_seconds()
-        print("took {0} seconds".format(td))
-        return df
 
 
     def _calc_factors_mp(self,x,y,minpts_interp=1,maxpts_interp=20,
                      search_radius=1.0e+10,verbose=False,
-                     pt_zone=None,forgive=False,num_threads=1):
+                     pt_zone=None,forgive=False,num_threads=1,aniso_search=False):
 
         assert len(x) == len(y)
         start_loop = datetime.now()
         df = pd.DataFrame(data={'x': x, 'y': y})
+        # the neighbor search is done once here, the workers only solve
+        pt_data,nbr_idx,nbr_dist = self._find_neighbors(df.x.values,df.y.values,
+                                                        maxpts_interp,search_radius,
+                                                        pt_zone,aniso_search)
+        ptnames = pt_data.name.values
         print("starting interp point loop for {0} points".format(df.shape[0]))
-        with mp.Manager() as manager:
-
-            point_pairs = manager.list()
-            idist = manager.list()
-            inames = manager.list()
-            ifacts = manager.list()
-            err_var = manager.list()
-            #start = mp.Value('d',0)
-            for i,(xx, yy) in enumerate(zip(x, y)):
-                point_pairs.append((i, xx, yy))
-                idist.append([])
-                inames.append([])
-                ifacts.append([])
-                err_var.append(np.NaN)
-            lock = mp.Lock()
-            procs = []
-            for i in range(num_threads):
-                print("starting",i)
-                p = mp.Process(target=OrdinaryKrige._worker,args=(i,self.point_data,point_pairs,inames,idist,ifacts,err_var,
-                                                                 self.point_cov_df,self.geostruct,EPSILON,search_radius,
-                                                                 pt_zone,minpts_interp,maxpts_interp,lock))
-                p.start()
-                procs.append(p)
-            for p in procs:
-                p.join()
-
-            df["idist"] = idist
-            df["inames"] = inames
-            df["ifacts"] = ifacts
-            df["err_var"] = err_var
-        if pt_zone is None:
-            self.interp_data = df
-        else:
-            if self.interp_data is None:
-                self.interp_data = df
-            else:
-                self.interp_data = self.interp_data.append(df)
+        xx,yy = df.x.values.astype(np.float64),df.y.values.astype(np.float64)
+        arrays = {"ptx":pt_data.x.values.astype(np.float64),
+                  "pty":pt_data.y.values.astype(np.float64),
+                  "point_cov":self.point_cov_df.values,
+                  "cov_index":self.point_cov_df.index.get_indexer(ptnames)}
+        # contiguous chunks of interp points, a few per worker to balance the load
+        nchunk = max(1,min(df.shape[0],num_threads * 4))
+        bounds = np.linspace(0,df.shape[0],nchunk + 1).astype(int)
+        tasks = [(s,e,xx[s:e],yy[s:e],nbr_idx[s:e],nbr_dist[s:e]) for s,e in
+                 zip(bounds[:-1],bounds[1:]) if e > s]
+        idx = np.zeros_like(nbr_idx) - 1
+        dist = np.zeros_like(nbr_dist) + np.inf
+        facts = np.zeros(nbr_idx.shape)
+        err_var = np.zeros(df.shape[0]) + np.NaN
+        shms,specs = _share_arrays(arrays)
+        try:
+            with mp.Pool(num_threads,initializer=_ok_worker_init,
+                         initargs=(specs,self.geostruct,minpts_interp,forgive)) as pool:
+                for s,e,cidx,cdist,cfacts,cerr_var in pool.imap_unordered(_ok_worker,tasks):
+                    idx[s:e] = cidx
+                    dist[s:e] = cdist
+                    facts[s:e] = cfacts
+                    err_var[s:e] = cerr_var
+                    if verbose:
+                        print("interp points {0} to {1} done".format(s,e))
+        finally:
+            for shm in shms:
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+        self._store_factors(df,ptnames,idx,dist,facts,err_var,pt_zone)
         td = (datetime.now() - start_loop).total_seconds()
         print("took {0} seconds".format(td))
         return df
 
+    def get_grid_factors(self,points_file="points.junk",zone_file="zone.junk"):
+        """ get the grid-based kriging factors in compressed sparse row form
 
-    @staticmethod
-    def _worker(ithread,point_data,point_pairs,inames,idist,ifacts,err_var,point_cov_df,
-               geostruct,epsilon,search_radius,pt_zone,minpts_interp,maxpts_interp,lock):
-        # find the point data to use for each interp point
-        sqradius = search_radius ** 2
-
-        sill = geostruct.sill
-        if pt_zone is None:
-            ptx_array = point_data.x.values
-            pty_array = point_data.y.values
-            ptnames = point_data.name.values
-        else:
-            pt_data = point_data
-            ptx_array = pt_data.loc[pt_data.zone == pt_zone, "x"].values
-            pty_array = pt_data.loc[pt_data.zone == pt_zone, "y"].values
-            ptnames = pt_data.loc[pt_data.zone == pt_zone, "name"].values
-        while True:
-            if len(point_pairs) == 0:
-                return
-            else:
-                try:
-                    idx, ix,iy = point_pairs.pop(0)
-                except IndexError:
-                    return
-
-            #if idx % 1000 == 0 and idx != 0:
-            #    print (ithread, idx,"done",datetime.now())
-            if np.isnan(ix) or np.isnan(iy): #if nans, skip
-                #inames.append([])
-                #idist.append([])
-                #ifacts.append([])
-                #err_var.append(np.NaN)
-                #err_var.insert(idx,np.NaN)
-                continue
-
-            #  calc dist from this interp point to all point data...slow
-            dist = pd.Series((ptx_array-ix)**2 + (pty_array-iy)**2,ptnames)
-            dist.sort_values(inplace=True)
-            dist = dist.loc[dist <= sqradius]
-
-            # if too few points were found, skip
-            if len(dist) < minpts_interp:
-                #inames.append([])
-                #idist.append([])
-                #ifacts.append([])
-                #err_var.append(sill)
-                err_var[idx] = sill
-                continue
-
-            # only the maxpts_interp points
-            dist = dist.iloc[:maxpts_interp].apply(np.sqrt)
-            pt_names = dist.index.values
-            # if one of the points is super close, just use it and skip
-            if dist.min() <= epsilon:
-                #ifacts.append([1.0])
-                ifacts[idx] = [1.0]
-                #idist.append([epsilon])
-                idist[idx] = [epsilon]
-                #inames.append([dist.idxmin()])
-                inames[idx] = [dist.idxmin()]
-                #err_var.append(geostruct.nugget)
-                err_var[idx] = geostruct.nugget
-                continue
-
-            #vextract the point-to-point covariance matrix
-            point_cov = point_cov_df.loc[pt_names,pt_names]
-
-            # calc the interp point to points covariance
-            interp_cov = geostruct.covariance_points(ix,iy,point_data.loc[pt_names,"x"],
-                                                          point_data.loc[pt_names,"y"])
-
-            # form the linear algebra parts and solve
-            d = len(pt_names) + 1 # +1 for lagrange mult
-            A = np.ones((d,d))
-            A[:-1,:-1] = point_cov.values
-            A[-1,-1] = 0.0 #unbiaised constraint
-            rhs = np.ones((d,1))
-            rhs[:-1,0] = interp_cov
-
-            try:
-                facs = np.linalg.solve(A, rhs)
-            except Exception as e:
-                print("error solving for factors: {0}".format(str(e)))
-                print("point:",ix,iy)
-                print("dist:",dist)
-                print("A:", A)
-                print("rhs:", rhs)
-
-                #inames.append([])
-                #idist.append([])
-                #ifacts.append([])
-                #err_var.append(np.NaN)
-                #err_var.insert(np.NaN)
-                continue
-
-            assert len(facs) - 1 == len(dist)
-
-            #err_var.append(float(sill + facs[-1] - sum([f*c for f,c in zip(facs[:-1],interp_cov)])))
-            err_var[idx] = float(sill + facs[-1] - sum([f*c for f,c in zip(facs[:-1],interp_cov)]))
-            #inames.append(pt_names)
-            inames[idx] = pt_names
-
-            #idist.append(dist.values)
-            idist[idx] = dist.values
-
-            #ifacts.append(facs[:-1,0])
-            ifacts[idx] = facs[:-1,0]
-            # if verbose == 2:
-            #     td = (datetime.now()-start).total_seconds()
-            #     print("...took {0}".format(td))
+        Args:
+            points_file (`str`): points filename to record with the factors.
+                Default is "points.junk"
+            zone_file (`str`): zone filename to record with the factors.
+                Default is "zone.junk"
 
+        Returns:
+            `KrigeFactors`: the factors of each grid node, indexed into `point_data`
 
+        Note:
+            this method should be called after OrdinaryKirge.calc_factors_grid()
 
+        """
+        if self.interp_data is None:
+            raise Exception("ok.interp_data is None, must call calc_factors_grid() first")
+        if self.spatial_reference is None:
+            raise Exception("ok.spatial_reference is None, must call calc_factors_grid() first")
+        nodes,indices,weights = [np.concatenate(t) for t in zip(*self._factor_triplets)]
+        t = 0
+        if self.geostruct.transform == "log":
+            t = 1
+        return KrigeFactors.from_triplets(self.spatial_reference.nrow,self.spatial_reference.ncol,
+                                          self.point_data.name.values,nodes,indices,weights,
+                                          transform=t,points_file=points_file,zone_file=zone_file)
 
     def to_grid_factors_file(self, filename,points_file="points.junk",
-                             zone_file="zone.junk"):
+                             zone_file="zone.junk",binary=False):
         """ write a grid-based PEST-style factors file.  This file can be used with
         the fac2real() method to write an interpolated structured array
 
@@ -1156,32 +1736,19 @@ class OrdinaryKrige(object):
                 This is not used by the fac2real() method.  Default is "points.junk"
             zone_file (`str`): zone filename to add to the header of the factors file.
                 This is notused by the fac2real() method.  Default is "zone.junk"
+            binary (`bool`): flag to write the compact binary format of
+                `KrigeFactors.to_binary()` instead of the PEST-style text format.
+                The binary format can only be read by pyemu.  Default is False
 
         Note:
             this method should be called after OrdinaryKirge.calc_factors_grid()
 
         """
-        if self.interp_data is None:
-            raise Exception("ok.interp_data is None, must call calc_factors_grid() first")
-        if self.spatial_reference is None:
-            raise Exception("ok.spatial_reference is None, must call calc_factors_grid() first")
-        with open(filename, 'w') as f:
-            f.write(points_file + '\n')
-            f.write(zone_file + '\n')
-            f.write("{0} {1}\n".format(self.spatial_reference.ncol, self.spatial_reference.nrow))
-            f.write("{0}\n".format(self.point_data.shape[0]))
-            [f.write("{0}\n".format(name)) for name in self.point_data.name]
-            t = 0
-            if self.geostruct.transform == "log":
-                t = 1
-            pt_names = list(self.point_data.name)
-            for idx,names,facts in zip(self.interp_data.index,self.interp_data.inames,self.interp_data.ifacts):
-                if len(facts) == 0:
-                    continue
-                n_idxs = [pt_names.index(name) for name in names]
-                f.write("{0} {1} {2} {3:8.5e} ".format(idx+1, t, len(names), 0.0))
-                [f.write("{0} {1:12.8g} ".format(i+1, w)) for i, w in zip(n_idxs, facts)]
-                f.write("\n")
+        kf = self.get_grid_factors(points_file=points_file,zone_file=zone_file)
+        if binary:
+            kf.to_binary(filename)
+        else:
+            kf.to_text(filename)
 
 
 class Vario2d(object):
@@ -1299,8 +1866,8 @@ class Vario2d(object):
             x ([`float`]): x-coordinate locations
             y ([`float`]): y-coordinate locations
             names ([`str`]): names of locations. If None, cov must not be None
-            cov (`pyemu.Cov`): an existing Cov instance.  Vario2d contribution is added to cov
-            in place
+            cov (`pyemu.Cov`): an existing Cov instance.  Vario2d contribution is added to
+                (a copy of) cov
 
         Returns:
             `pyemu.Cov`: the covariance matrix for `x`, `y` implied by `Vario2d`
@@ -1318,34 +1885,27 @@ class Vario2d(object):
         if names is not None:
             assert x.shape[0] == len(names)
             c = np.zeros((len(names),len(names)))
-            np.fill_diagonal(c,self.contribution)
             cov = Cov(x=c,names=names)
         elif cov is not None:
             assert cov.shape[0] == x.shape[0]
-            names = cov.row_names
-            c = np.zeros((len(names),1)) + self.contribution
-            cont = Cov(x=c,names=names,isdiagonal=True)
-            cov += cont
-
+            # accumulate into a copy so the caller's cov is not changed
+            cov = Cov(x=np.array(cov.as_2d,dtype=np.float64),names=cov.row_names)
         else:
             raise Exception("Vario2d.covariance_matrix() requires either" +
                             "names or cov arg")
-        rc = self.rotation_coefs
-        for i1,(n1,x1,y1) in enumerate(zip(names,x,y)):
-            dx = x1 - x[i1+1:]
-            dy = y1 - y[i1+1:]
-            dxx,dyy = self._apply_rotation(dx,dy)
-            h = np.sqrt(dxx*dxx + dyy*dyy)
-
-            h[h<0.0] = 0.0
-            h = self._h_function(h)
-            if np.any(np.isnan(h)):
-                raise Exception("nans in h for i1 {0}".format(i1))
-            cov.x[i1,i1+1:] += h
-        for i in range(len(names)):
-            cov.x[i+1:,i] = cov.x[i,i+1:]
+        _blocked_covariance(x,y,self._covariance_tile,out=cov.x)
         return cov
 
+    def _covariance_tile(self,x0,y0,x1,y1):
+        """ private method to get the 2-D covariance array between the points
+        x0,y0 and x1,y1 implied by `Vario2d`
+        """
+        dx = x0[:,None] - x1[None,:]
+        dy = y0[:,None] - y1[None,:]
+        dxx,dyy = self._apply_rotation(dx,dy)
+        h = np.sqrt(dxx*dxx + dyy*dyy)
+        return self._h_function(h)
+
     def _specsim_grid_contrib(self,grid):
         rot_grid = grid
         if self.bearing % 90. != 0:
@@ -1840,16 +2400,64 @@ def load_sgems_exp_var(filename):
 
 
 
+FACTORS_CACHE_SIZE = 4 # number of factors files fac2real() keeps loaded
+_factors_cache = {}
+
+
+def _load_factors(factors_file):
+    """private method to load a factors file, reusing the `KrigeFactors`
+    of the (unchanged) file from an earlier call in this process"""
+    assert os.path.exists(factors_file)
+    key = os.path.abspath(factors_file)
+    stat = os.stat(factors_file)
+    sig = (stat.st_mtime_ns, stat.st_size)
+    cached = _factors_cache.pop(key, None)
+    if cached is None or cached[0] != sig:
+        cached = (sig, KrigeFactors.from_file(factors_file))
+    _factors_cache[key] = cached
+    while len(_factors_cache) > FACTORS_CACHE_SIZE:
+        _factors_cache.pop(next(iter(_factors_cache)))
+    return cached[1]
+
+
+def _pp_values(pp_file, pp_names):
+    """private method to get the parval1 values of a pilot points file or
+    dataframe in the order of `pp_names`"""
+    if isinstance(pp_file,str):
+        assert os.path.exists(pp_file)
+        pp_data = pp_file_to_dataframe(pp_file)
+    elif isinstance(pp_file,pd.DataFrame):
+        assert "name" in pp_file.columns
+        assert "parval1" in pp_file.columns
+        pp_data = pp_file
+    else:
+        raise Exception("unrecognized pp_file arg: must be str or pandas.DataFrame, not {0}"\
+                        .format(type(pp_file)))
+    pp_vals = pd.Series(pp_data.parval1.values,
+                        index=[str(name).lower() for name in pp_data.name])
+    # check that pp_names is sync'd with pp_data
+    diff = set(list(pp_vals.index)).symmetric_difference(set(pp_names))
+    if len(diff) > 0:
+        raise Exception("the following pilot point names are not common " +\
+                        "between the factors file and the pilot points file " +\
+                        ','.join(list(diff)))
+    return pp_vals.loc[pp_names].values.astype(np.float64)
+
+
 def fac2real(pp_file=None,factors_file="factors.dat",out_file="test.ref",
              upper_lim=1.0e+30,lower_lim=-1.0e+30,fill_value=1.0e+30):
     """A python replication of the PEST fac2real utility for creating a
     structure grid array from previously calculated kriging factors (weights)
 
     Args:
-        pp_file (`str`): PEST-type pilot points file
-        factors_file (`str`): PEST-style factors file
+        pp_file (`str`): PEST-type pilot points file.  Can also be a list of pilot
+            points files (or dataframes) that share `factors_file`, which are then
+            interpolated together
+        factors_file (`str`): PEST-style factors file or binary factors file
+            (see `KrigeFactors`)
         out_file (`str`): filename of array to write.  If None, array is returned, else
-            value of out_file is returned.  Default is "test.ref".
+            value of out_file is returned.  Default is "test.ref".  If `pp_file` is a list,
+            `out_file` must be a list of the same length (or None)
         upper_lim (`float`): maximum interpolated value in the array.  Values greater than
             `upper_lim` are set to fill_value
         lower_lim (`float`): minimum interpolated value in the array.  Values less than
@@ -1862,94 +2470,53 @@ def fac2real(pp_file=None,factors_file="factors.dat",out_file="test.ref",
 
         `str`: if out_file it not None
 
-    Example::
+        for a list of `pp_file`, a list of the above
 
-        pyemu.utils.geostats.fac2real("hkpp.dat",out_file="hk_layer_1.ref")
+    Note:
+        pilot point values are matched to the factors by pilot point name.  This is
+        a change from earlier versions (and PEST's fac2real), which used the position
+        of each pilot point in `pp_file`, so the pilot points no longer need to be
+        listed in the same order as in the factors file
 
-    """
+        the factors are applied as a (sparse) matrix product.  The last
+        `FACTORS_CACHE_SIZE` factors files are kept loaded, so repeated calls
+        with the same (unchanged) factors file do not read it again
 
-    if pp_file is not None and isinstance(pp_file,str):
-        assert os.path.exists(pp_file)
-        # pp_data = pd.read_csv(pp_file,delim_whitespace=True,header=None,
-        #                       names=["name","parval1"],usecols=[0,4])
-        pp_data = pp_file_to_dataframe(pp_file)
-        pp_data.loc[:,"name"] = pp_data.name.apply(lambda x: x.lower())
-    elif pp_file is not None and isinstance(pp_file,pd.DataFrame):
-        assert "name" in pp_file.columns
-        assert "parval1" in pp_file.columns
-        pp_data = pp_file
-    else:
-        raise Exception("unrecognized pp_file arg: must be str or pandas.DataFrame, not {0}"\
-                        .format(type(pp_file)))
-    assert os.path.exists(factors_file)
-    f_fac = open(factors_file,'r')
-    fpp_file = f_fac.readline()
-    if pp_file is None and pp_data is None:
-        pp_data = pp_file_to_dataframe(fpp_file)
-        pp_data.loc[:, "name"] = pp_data.name.apply(lambda x: x.lower())
+    Example::
 
-    fzone_file = f_fac.readline()
-    ncol,nrow = [int(i) for i in f_fac.readline().strip().split()]
-    npp = int(f_fac.readline().strip())
-    pp_names = [f_fac.readline().strip().lower() for _ in range(npp)]
+        pyemu.utils.geostats.fac2real("hkpp.dat",out_file="hk_layer_1.ref")
 
-    # check that pp_names is sync'd with pp_data
-    diff = set(list(pp_data.name)).symmetric_difference(set(pp_names))
-    if len(diff) > 0:
-        raise Exception("the following pilot point names are not common " +\
-                        "between the factors file and the pilot points file " +\
-                        ','.join(list(diff)))
+        pyemu.utils.geostats.fac2real(["hk1pp.dat","hk2pp.dat"],factors_file="pp.fac",
+                                      out_file=["hk1.ref","hk2.ref"])
 
-    arr = np.zeros((nrow,ncol),dtype=np.float) + fill_value
-    pp_dict = {int(name):val for name,val in zip(pp_data.index,pp_data.parval1)}
-    try:
-        pp_dict_log = {name:np.log10(val) for name,val in zip(pp_data.index,pp_data.parval1)}
-    except:
-        pp_dict_log = {}
-    #for i in range(nrow):
-    #    for j in range(ncol):
-    while True:
-        line = f_fac.readline()
-        if len(line) == 0:
-            #raise Exception("unexpected EOF in factors file")
-            break
-        try:
-            inode,itrans,fac_data = _parse_factor_line(line)
-        except Exception as e:
-            raise Exception("error parsing factor line {0}:{1}".format(line,str(e)))
-        #fac_prods = [pp_data.loc[pp,"value"]*fac_data[pp] for pp in fac_data]
-        if itrans == 0:
-            fac_sum = sum([pp_dict[pp] * fac_data[pp] for pp in fac_data])
-        else:
-            fac_sum = sum([pp_dict_log[pp] * fac_data[pp] for pp in fac_data])
-        if itrans != 0:
-            fac_sum = 10**fac_sum
-        #col = ((inode - 1) // nrow) + 1
-        #row = inode - ((col - 1) * nrow)
-        row = ((inode-1) // ncol) + 1
-        col = inode - ((row - 1) * ncol)
-        #arr[row-1,col-1] = np.sum(np.array(fac_prods))
-        arr[row - 1, col - 1] = fac_sum
-    arr[arr<lower_lim] = lower_lim
-    arr[arr>upper_lim] = upper_lim
-
-    #print(out_file,arr.min(),pp_data.parval1.min(),lower_lim)
-
-    if out_file is not None:
-        np.savetxt(out_file,arr,fmt="%15.6E",delimiter='')
-        return out_file
-    return arr
-
-def _parse_factor_line(line):
-    """ function to parse a factor file line.  Used by fac2real()
     """
 
-    raw = line.strip().split()
-    inode,itrans,nfac = [int(i) for i in raw[:3]]
-    fac_data = {int(raw[ifac])-1:float(raw[ifac+1]) for ifac in range(4,4+nfac*2,2)}
-    # fac_data = {}
-    # for ifac in range(4,4+nfac*2,2):
-    #     pnum = int(raw[ifac]) - 1 #zero based to sync with pandas
-    #     fac = float(raw[ifac+1])
-    #     fac_data[pnum] = fac
-    return inode,itrans,fac_data
\ No newline at end of file
+    kf = _load_factors(factors_file)
+    if pp_file is None:
+        pp_file = kf.points_file
+    single = not isinstance(pp_file,(list,tuple))
+    pp_files = [pp_file] if single else list(pp_file)
+    if single:
+        out_files = [out_file]
+    elif out_file is None:
+        out_files = [None] * len(pp_files)
+    else:
+        out_files = list(out_file)
+        if len(out_files) != len(pp_files):
+            raise Exception("fac2real() error: pp_file and out_file must be the same length")
+
+    pp_names = [name.lower() for name in kf.point_names]
+    vals = np.array([_pp_values(pf,pp_names) for pf in pp_files]).T
+    arrs = kf.interpolate(vals,fill_value=fill_value)
+    results = []
+    for arr,of in zip(arrs,out_files):
+        arr[arr<lower_lim] = lower_lim
+        arr[arr>upper_lim] = upper_lim
+        if of is not None:
+            write_array(of,arr,fmt="%15.6E",delimiter='')
+            results.append(of)
+        else:
+            results.append(arr)
+    if single:
+        return results[0]
+    return results
@@ -1,5 +1,7 @@
 """MODFLOW support utilities"""
 import os
+import io
+import mmap
 from datetime import datetime
 import shutil
 import warnings
@@ -8,15 +10,32 @@ import pandas as pd
 import re
 pd.options.display.max_colwidth = 100
 from pyemu.pst.pst_utils import SFMT,IFMT,FFMT,pst_config,\
-    parse_tpl_file,try_process_output_file
+    parse_tpl_file,try_process_output_file,_save_plan,_get_plan
 from pyemu.utils.os_utils import run
 from pyemu.utils.helpers import _write_df_tpl
+from pyemu.utils.binary_utils import BinaryLayerFile, BinaryBudgetFile
+from pyemu.utils.budget_utils import ListBudgetFile, MtListBudgetFile
 from ..pyemu_warnings import PyemuWarning
 PP_FMT = {"name": SFMT, "x": FFMT, "y": FFMT, "zone": IFMT, "tpl": SFMT,
           "parval1": FFMT}
 PP_NAMES = ["name","x","y","zone","parval1"]
 
 
+def _isclose_any(values, targets):
+    """vectorized `[np.isclose(v, targets).any() for v in values]`, comparing each
+    value with its nearest targets
+
+    """
+    values = np.asarray(values, dtype=float)
+    targets = np.sort(np.asarray(targets, dtype=float))
+    if targets.shape[0] == 0:
+        return np.zeros(values.shape, dtype=bool)
+    idx = np.searchsorted(targets, values)
+    lo = targets[np.clip(idx - 1, 0, targets.shape[0] - 1)]
+    hi = targets[np.clip(idx, 0, targets.shape[0] - 1)]
+    return np.isclose(values, lo) | np.isclose(values, hi)
+
+
 def modflow_pval_to_template_file(pval_file,tpl_file=None):
     """write a template file for a modflow parameter value file.
 
@@ -280,12 +299,10 @@ def apply_mtlist_budget_obs(list_filename,gw_filename="mtlist_gw.dat",
 
     Note:
         this is the companion function of `gw_utils.setup_mtlist_budget_obs()`.
+
+        the list file is parsed with `pyemu.budget_utils`, so `flopy` is not needed
     """
-    try:
-        import flopy
-    except Exception as e:
-        raise Exception("error import flopy: {0}".format(str(e)))
-    mt = flopy.utils.MtListBudget(list_filename)
+    mt = MtListBudgetFile(list_filename)
     gw, sw = mt.parse(start_datetime=start_datetime, diff=True)
     gw = gw.drop([col for col in gw.columns
                   for drop_col in ["kper", "kstp", "tkstp"]
@@ -370,6 +387,8 @@ def apply_mflist_budget_obs(list_filename,flx_filename="flux.dat",
     Note:
         this is the companion function of `gw_utils.setup_mflist_budget_obs()`.
 
+        the list file is parsed with `pyemu.budget_utils`, so `flopy` is not needed
+
     Returns:
         tuple containing
 
@@ -378,12 +397,11 @@ def apply_mflist_budget_obs(list_filename,flx_filename="flux.dat",
         - **pandas.DataFrame**: a dataframe with cumulative budget information
 
     """
-    try:
-        import flopy
-    except Exception as e:
-        raise Exception("error import flopy: {0}".format(str(e)))
-    mlf = flopy.utils.MfListBudget(list_filename)
-    flx,vol = mlf.get_dataframes(start_datetime=start_datetime,diff=True)
+    mlf = ListBudgetFile(list_filename)
+    dfs = mlf.get_dataframes(start_datetime=start_datetime,diff=True)
+    if dfs is None:
+        raise Exception("no budget information found in list file {0}".format(list_filename))
+    flx,vol = dfs
     flx.to_csv(flx_filename,sep=' ',index_label="datetime",date_format="%Y%m%d")
     vol.to_csv(vol_filename,sep=' ',index_label="datetime",date_format="%Y%m%d")
     return flx,vol
@@ -450,40 +468,27 @@ def setup_hds_timeseries(bin_file, kij_dict, prefix=None, include_path=False,
 
         this is the companion function of `gw_utils.apply_hds_timeseries()`.
 
-    """
+        the binary file is read with `pyemu.binary_utils`, so `flopy` is not needed
 
-    try:
-        import flopy
-    except Exception as e:
-        print("error importing flopy, returning {0}".format(str(e)))
-        return
+    """
 
     assert os.path.exists(bin_file), "binary file not found"
 
     if text is not None:
         text = text.upper()
         try:
-            # hack: if model is passed and its None, it trips up CellBudgetFile...
-            if model is not None:
-                bf = flopy.utils.CellBudgetFile(bin_file,precision=precision,model=model)
-            else:
-                bf = flopy.utils.CellBudgetFile(bin_file, precision=precision)
+            bf = BinaryBudgetFile(bin_file, precision=precision)
         except Exception as e:
-            raise Exception("error instantiating CellBudgetFile:{0}".format(str(e)))
-        tl = [t.decode().strip() for t in bf.textlist]
+            raise Exception("error instantiating BinaryBudgetFile:{0}".format(str(e)))
+        tl = bf.textlist
         if text not in tl:
-            raise Exception("'text' {0} not found in CellBudgetFile.textlist:{1}".\
+            raise Exception("'text' {0} not found in BinaryBudgetFile.textlist:{1}".\
                             format(text,tl))
-    elif bin_file.lower().endswith(".ucn"):
-        try:
-            bf = flopy.utils.UcnFile(bin_file)
-        except Exception as e:
-            raise Exception("error instantiating UcnFile:{0}".format(str(e)))
     else:
         try:
-            bf = flopy.utils.HeadFile(bin_file)
+            bf = BinaryLayerFile(bin_file)
         except Exception as e:
-            raise Exception("error instantiating HeadFile:{0}".format(str(e)))
+            raise Exception("error instantiating BinaryLayerFile:{0}".format(str(e)))
 
     if text is None:
         text = "none"
@@ -510,30 +515,28 @@ def setup_hds_timeseries(bin_file, kij_dict, prefix=None, include_path=False,
         f_config.write("{0},none,none,{1},{2},{3}\n".format(os.path.split(bin_file)[-1],
                                                         text, fill,precision))
     f_config.write("site,k,i,j\n")
-    dfs = []
+    sites, kij = [], []
 
     for site,(k,i,j) in kij_dict.items():
         assert k >= 0 and k < nlay, k
         assert i >= 0 and i < nrow, i
         assert j >= 0 and j < ncol, j
         site = site.lower().replace(" ",'')
-        if text.upper() != "NONE":
-            ts = bf.get_ts((k, i, j),text=text)
-            #print(ts)
-            df = pd.DataFrame(data=ts, columns=["totim", site])
-        else:
-            df = pd.DataFrame(data=bf.get_ts((k,i,j)),columns=["totim",site])
-
-        if model is not None:
-            dts = start + pd.to_timedelta(df.totim,unit='d')
-            df.loc[:,"totim"] = dts
-        #print(df)
         f_config.write("{0},{1},{2},{3}\n".format(site,k,i,j))
-        df.index = df.pop("totim")
-        dfs.append(df)
+        sites.append(site)
+        kij.append((k,i,j))
 
     f_config.close()
-    df = pd.concat(dfs,axis=1)
+    # all sites in one pass
+    if text.upper() != "NONE":
+        ts = bf.get_ts(kij,text=text)
+    else:
+        ts = bf.get_ts(kij)
+    bf.close()
+    df = pd.DataFrame(data=ts[:,1:],columns=sites,index=ts[:,0])
+    if model is not None:
+        df.index = start + pd.to_timedelta(df.index,unit='d')
+    df.index.name = "totim"
     df.to_csv(bin_file + "_timeseries.processed", sep=' ')
     if model is not None:
         t_str = df.index.map(lambda x: x.strftime("%Y%m%d"))
@@ -597,8 +600,9 @@ def apply_hds_timeseries(config_file=None, postprocess_inact=None):
     Note:
         this is the companion function of `gw_utils.setup_hds_timeseries()`.
 
+        all sites are extracted in one pass over the binary file with `pyemu.binary_utils`
+
     """
-    import flopy
 
     if config_file is None:
         config_file = "hds_timeseries.config"
@@ -614,34 +618,23 @@ def apply_hds_timeseries(config_file=None, postprocess_inact=None):
     assert os.path.exists(bf_file), "head save file not found"
     if text != "NONE":
         try:
-            bf = flopy.utils.CellBudgetFile(bf_file,precision=precision)
-        except Exception as e:
-            raise Exception("error instantiating CellBudgetFile:{0}".format(str(e)))
-    elif bf_file.lower().endswith(".ucn"):
-        try:
-            bf = flopy.utils.UcnFile(bf_file)
+            bf = BinaryBudgetFile(bf_file,precision=precision)
         except Exception as e:
-            raise Exception("error instantiating UcnFile:{0}".format(str(e)))
+            raise Exception("error instantiating BinaryBudgetFile:{0}".format(str(e)))
     else:
         try:
-            bf = flopy.utils.HeadFile(bf_file)
+            bf = BinaryLayerFile(bf_file)
         except Exception as e:
-            raise Exception("error instantiating HeadFile:{0}".format(str(e)))
-
-    nlay, nrow, ncol = bf.nlay, bf.nrow, bf.ncol
+            raise Exception("error instantiating BinaryLayerFile:{0}".format(str(e)))
 
-    dfs = []
-    for site,k,i,j in zip(site_df.site,site_df.k,site_df.i,site_df.j):
-        assert k >= 0 and k < nlay
-        assert i >= 0 and i < nrow
-        assert j >= 0 and j < ncol
-        if text.upper() != "NONE":
-            df = pd.DataFrame(data=bf.get_ts((k, i, j), text=text), columns=["totim", site])
-        else:
-            df = pd.DataFrame(data=bf.get_ts((k,i,j)),columns=["totim",site])
-        df.index = df.pop("totim")
-        dfs.append(df)
-    df = pd.concat(dfs,axis=1)
+    kij = _site_kij(site_df, bf)
+    if text.upper() != "NONE":
+        ts = bf.get_ts(kij, text=text)
+    else:
+        ts = bf.get_ts(kij)
+    bf.close()
+    df = pd.DataFrame(data=ts[:,1:],columns=site_df.site.values,
+                      index=pd.Index(ts[:,0],name="totim"))
     if df.shape != df.dropna().shape:
         warnings.warn("NANs in processed timeseries file",PyemuWarning)
         if fill.upper() != "NONE":
@@ -683,7 +676,6 @@ def _setup_postprocess_hds_timeseries(hds_file, df, config_file, prefix=None, mo
 
 def _apply_postprocess_hds_timeseries(config_file=None, cinact=1e30):
     """private function to post processing binary files"""
-    import flopy
 
     if config_file is None:
         config_file = "hds_timeseries.config"
@@ -697,43 +689,36 @@ def _apply_postprocess_hds_timeseries(config_file=None, cinact=1e30):
     #print(site_df)
 
     assert os.path.exists(hds_file), "head save file not found"
-    if hds_file.lower().endswith(".ucn"):
-        try:
-            hds = flopy.utils.UcnFile(hds_file)
-        except Exception as e:
-            raise Exception("error instantiating UcnFile:{0}".format(str(e)))
-    else:
-        try:
-            hds = flopy.utils.HeadFile(hds_file)
-        except Exception as e:
-            raise Exception("error instantiating HeadFile:{0}".format(str(e)))
-
-    nlay, nrow, ncol = hds.nlay, hds.nrow, hds.ncol
+    try:
+        hds = BinaryLayerFile(hds_file)
+    except Exception as e:
+        raise Exception("error instantiating BinaryLayerFile:{0}".format(str(e)))
 
-    dfs = []
-    for site, k, i, j in zip(site_df.site, site_df.k, site_df.i, site_df.j):
-        assert k >= 0 and k < nlay
-        assert i >= 0 and i < nrow
-        assert j >= 0 and j < ncol
-        if text.upper() != "NONE":
-            df = pd.DataFrame(data=hds.get_ts((k, i, j),text=text), columns=["totim", site])
-        else:
-            df = pd.DataFrame(data=hds.get_ts((k, i, j)), columns=["totim", site])
-        df.index = df.pop("totim")
-        inact_obs = df[site].apply(lambda x: np.isclose(x, cinact))
+    kij = _site_kij(site_df, hds)
+    ts = hds.get_ts(kij)
+    for isite, (site, (k, i, j)) in enumerate(zip(site_df.site, kij)):
+        vals = ts[:, isite + 1]
+        inact_obs = np.isclose(vals, cinact)
         if inact_obs.sum() > 0:
-            assert k+1 < nlay, "Inactive observation in lowest layer"
-            df_lower = pd.DataFrame(data=hds.get_ts((k+1, i, j)), columns=["totim", site])
-            df_lower.index = df_lower.pop("totim")
-            df.loc[inact_obs] = df_lower.loc[inact_obs]
+            assert k+1 < hds.nlay, "Inactive observation in lowest layer"
+            vals[inact_obs] = hds.get_ts((k+1, i, j))[inact_obs, 1]
             print("{0} observation(s) post-processed for site {1} at kij ({2},{3},{4})".
                   format(inact_obs.sum(), site, k, i, j))
-        dfs.append(df)
-    df = pd.concat(dfs, axis=1)
+    hds.close()
+    df = pd.DataFrame(data=ts[:,1:],columns=site_df.site.values,
+                      index=pd.Index(ts[:,0],name="totim"))
     #print(df)
     df.to_csv(hds_file+"_timeseries.post_processed", sep=' ')
     return df
 
+def _site_kij(site_df, bf):
+    """check and stack the zero-based k,i,j of the sites in a timeseries config file"""
+    kij = site_df.loc[:, ["k", "i", "j"]].values.astype(int)
+    for col, n in zip(range(3), [bf.nlay, bf.nrow, bf.ncol]):
+        assert kij[:, col].min() >= 0 and kij[:, col].max() < n
+    return kij
+
+
 def setup_hds_obs(hds_file,kperk_pairs=None,skip=None,prefix="hds"):
     """a function to setup using all values from a layer-stress period
     pair for observations.
@@ -768,23 +753,12 @@ def setup_hds_obs(hds_file,kperk_pairs=None,skip=None,prefix="hds"):
 
 
     """
-    try:
-        import flopy
-    except Exception as e:
-        print("error importing flopy, returning {0}".format(str(e)))
-        return
 
     assert os.path.exists(hds_file),"head save file not found"
-    if hds_file.lower().endswith(".ucn"):
-        try:
-            hds = flopy.utils.UcnFile(hds_file)
-        except Exception as e:
-            raise Exception("error instantiating UcnFile:{0}".format(str(e)))
-    else:
-        try:
-            hds = flopy.utils.HeadFile(hds_file)
-        except Exception as e:
-            raise Exception("error instantiating HeadFile:{0}".format(str(e)))
+    try:
+        hds = BinaryLayerFile(hds_file)
+    except Exception as e:
+        raise Exception("error instantiating BinaryLayerFile:{0}".format(str(e)))
 
     if kperk_pairs is None:
         kperk_pairs = []
@@ -878,6 +852,7 @@ def setup_hds_obs(hds_file,kperk_pairs=None,skip=None,prefix="hds"):
 
     #write the corresponding output file
     df.loc[:,["obsnme","obsval"]].to_csv(hds_file+".dat",sep=' ',index=False)
+    _save_plan(hds_file+".dat.ins",_hds_obs_plan(hds_file+".dat.ins"))
 
     hds_path = os.path.dirname(hds_file)
     setup_file = os.path.join(hds_path,"_setup_{0}.csv".format(os.path.split(hds_file)[-1]))
@@ -887,12 +862,24 @@ def setup_hds_obs(hds_file,kperk_pairs=None,skip=None,prefix="hds"):
     return fwd_run_line, df
 
 
+def _hds_obs_plan(ins_file):
+    """build the extraction plan for `apply_hds_obs()` from the instruction file"""
+    from .. import pst_utils
+    obsnme = np.array(pst_utils.parse_ins_file(ins_file))
+    parts = pd.Series(obsnme).str.split('_',expand=True)
+    plan = {"obsnme":obsnme}
+    for i,item in enumerate(["k","i","j","kper"]):
+        plan[item] = parts.loc[:,i+1].values.astype(np.int64)
+    return plan
+
+
 def last_kstp_from_kper(hds,kper):
     """ function to find the last time step (kstp) for a
     give stress period (kper) in a modflow head save file.
 
     Args:
-        hds (`flopy.utils.HeadFile`): head save file
+        hds (`pyemu.binary_utils.BinaryLayerFile`): head save file.  A
+            `flopy.utils.HeadFile` also works
 
         kper (`int`): the zero-index stress period number
 
@@ -927,42 +914,38 @@ def apply_hds_obs(hds_file, inact_abs_val=1.0e+20):
     Note:
         This is the companion function to `gw_utils.setup_hds_obs()`.
 
+        The values are read with a single indexed pass over the binary file with
+        `pyemu.binary_utils.BinaryLayerFile`.  The observation names and cell indices
+        are loaded from the extraction plan written by `gw_utils.setup_hds_obs()`
+
     """
 
-    try:
-        import flopy
-    except Exception as e:
-        raise Exception("apply_hds_obs(): error importing flopy: {0}".\
-                        format(str(e)))
-    from .. import pst_utils
     assert os.path.exists(hds_file)
     out_file = hds_file+".dat"
     ins_file = out_file + ".ins"
     assert os.path.exists(ins_file)
-    df = pd.DataFrame({"obsnme":pst_utils.parse_ins_file(ins_file)})
+    plan = _get_plan(ins_file,_hds_obs_plan)
+    df = pd.DataFrame({"obsnme":plan["obsnme"]})
     df.index = df.obsnme
 
     # populate metdata
     items = ["k","i","j","kper"]
-    for i,item in enumerate(items):
-        df.loc[:,item] = df.obsnme.apply(lambda x: int(x.split('_')[i+1]))
-
-    if hds_file.lower().endswith('ucn'):
-        hds = flopy.utils.UcnFile(hds_file)
-    else:
-        hds = flopy.utils.HeadFile(hds_file)
-    kpers = df.kper.unique()
-    df.loc[:,"obsval"] = np.NaN
-    for kper in kpers:
-        kstp = last_kstp_from_kper(hds,kper)
-        data = hds.get_data(kstpkper=(kstp,kper))
-        #jwhite 15jan2018 fix for really large values that are getting some
-        #trash added to them...
-        data[np.isnan(data)] = 0.0
-        data[data>np.abs(inact_abs_val)] = np.abs(inact_abs_val)
-        data[data<-np.abs(inact_abs_val)] = -np.abs(inact_abs_val)
-        df_kper = df.loc[df.kper==kper,:]
-        df.loc[df_kper.index,"obsval"] = data[df_kper.k,df_kper.i,df_kper.j]
+    for item in items:
+        df.loc[:,item] = plan[item]
+
+    hds = BinaryLayerFile(hds_file)
+    # the time slot of the last kstp of each kper
+    slots = {kper:hds.time_index(kstpkper=(last_kstp_from_kper(hds,kper),kper))
+             for kper in df.kper.unique()}
+    data = hds.get_values(df.k.values,df.i.values,df.j.values,
+                          df.kper.map(slots).values)
+    hds.close()
+    #jwhite 15jan2018 fix for really large values that are getting some
+    #trash added to them...
+    data[np.isnan(data)] = 0.0
+    data[data>np.abs(inact_abs_val)] = np.abs(inact_abs_val)
+    data[data<-np.abs(inact_abs_val)] = -np.abs(inact_abs_val)
+    df.loc[:,"obsval"] = data
     assert df.dropna().shape[0] == df.shape[0]
     df.loc[:,["obsnme","obsval"]].to_csv(out_file,index=False,sep=" ")
     return df
@@ -1007,6 +990,7 @@ def setup_sft_obs(sft_file,ins_file=None,start_datetime=None,times=None,ncomp=1)
     with open("sft_obs.config",'w') as f:
         f.write(sft_file+'\n')
         [f.write("{0:15.6E}\n".format(t)) for t in times]
+    _save_plan("sft_obs.config",_sft_obs_plan("sft_obs.config"))
     df = apply_sft_obs()
     utimes = df.time.unique()
     for t in times:
@@ -1052,6 +1036,16 @@ def setup_sft_obs(sft_file,ins_file=None,start_datetime=None,times=None,ncomp=1)
     return df
 
 
+def _sft_obs_plan(config_file):
+    """build the extraction plan for `apply_sft_obs()` from the config file"""
+    times = []
+    with open(config_file) as f:
+        sft_file = f.readline().strip()
+        for line in f:
+            times.append(float(line.strip()))
+    return {"sft_file":np.array(sft_file),"times":np.array(times,dtype=float)}
+
+
 def apply_sft_obs():
     """process an mt3d-usgs sft ASCII output file using a previous-written
     config file
@@ -1070,24 +1064,26 @@ def apply_sft_obs():
         except:
             return 0.0
 
-    times = []
-    with open("sft_obs.config") as f:
-        sft_file = f.readline().strip()
-        for line in f:
-            times.append(float(line.strip()))
+    plan = _get_plan("sft_obs.config",_sft_obs_plan)
+    sft_file = str(plan["sft_file"])
     df = pd.read_csv(sft_file,skiprows=1,delim_whitespace=True)#,nrows=10000000)
     df.columns = [c.lower().replace("-", "_") for c in df.columns]
-    df = df.loc[df.time.apply(lambda x: x in times), :]
+    df = df.loc[df.time.isin(plan["times"]), :]
     #print(df.dtypes)
     #normalize
     for c in df.columns:
         #print(c)
         if not "node" in c:
-            df.loc[:,c] = df.loc[:,c].apply(try_cast)
+            vals = pd.to_numeric(df.loc[:,c],errors="coerce")
+            # only the entries that didn't parse need the slow cast
+            bad = vals.isna()
+            if bad.any():
+                vals.loc[bad] = df.loc[bad,c].apply(try_cast)
+            df.loc[:,c] = vals.astype(float)
         #print(df.loc[df.loc[:,c].apply(lambda x : type(x) == str),:])
-        df.loc[df.loc[:,c].apply(lambda x: x<1e-30),c] = 0.0
+        df.loc[df.loc[:,c] < 1e-30,c] = 0.0
         df.loc[df.loc[:, c] > 1e+30, c] = 1.0e+30
-    df.loc[:,"sfr_node"] = df.sfr_node.apply(np.int)
+    df.loc[:,"sfr_node"] = df.sfr_node.astype(int)
 
     df.to_csv(sft_file+".processed",sep=' ',index=False)
     return df
@@ -1590,6 +1586,7 @@ def setup_sfr_obs(sfr_out_file,seg_group_dict=None,ins_file=None,model=None,
         config_file = "sfr_obs.config"
     print("writing 'sfr_obs.config' to {0}".format(config_file))
     df_key.to_csv(config_file)
+    _save_plan(config_file,_sfr_obs_plan(config_file))
 
     bd = '.'
     if include_path:
@@ -1633,6 +1630,18 @@ def setup_sfr_obs(sfr_out_file,seg_group_dict=None,ins_file=None,model=None,
         return df
 
 
+def _sfr_obs_plan(config_file):
+    """build the extraction plan for `apply_sfr_obs()` from the config file"""
+    df_key = pd.read_csv(config_file,index_col=0)
+    assert df_key.iloc[0,0] == "sfr_out_file",df_key.iloc[0,:]
+    sfr_out_file = df_key.iloc[0,1]
+    df_key = df_key.iloc[1:,:]
+    obs_base,group = np.unique(df_key.obs_base.values.astype(str),return_inverse=True)
+    return {"sfr_out_file":np.array(sfr_out_file),"obs_base":obs_base,
+            "group":group.astype(np.int64),
+            "segment":df_key.segment.values.astype(np.int64)}
+
+
 def apply_sfr_obs():
     """apply the sfr observation process
 
@@ -1647,53 +1656,129 @@ def apply_sfr_obs():
         **pandas.DataFrame**: a dataframe of aggregrated sfr segment aquifer and outflow
     """
     assert os.path.exists("sfr_obs.config")
-    df_key = pd.read_csv("sfr_obs.config",index_col=0)
-
-    assert df_key.iloc[0,0] == "sfr_out_file",df_key.iloc[0,:]
-    sfr_out_file = df_key.iloc[0,1]
-    df_key = df_key.iloc[1:,:]
-    df_key.loc[:, "segment"] = df_key.segment.apply(np.int)
-    df_key.index = df_key.segment
-    seg_group_dict = df_key.groupby(df_key.obs_base).groups
+    plan = _get_plan("sfr_obs.config",_sfr_obs_plan)
+    sfr_out_file = str(plan["sfr_out_file"])
+    obs_base,group,segs = plan["obs_base"],plan["group"],plan["segment"]
 
     sfr_kper = load_sfr_out(sfr_out_file)
     kpers = list(sfr_kper.keys())
     kpers.sort()
-    #results = {o:[] for o in seg_group_dict.keys()}
     results = []
     for kper in kpers:
-        df = sfr_kper[kper]
-        for obs_base,segs in seg_group_dict.items():
-            agg = df.loc[segs.values,:].sum()  # still agg flout where seg groups are passed!
-            #print(obs_base,agg)
-            results.append([kper,obs_base,agg["flaqx"],agg["flout"]])
-    df = pd.DataFrame(data=results,columns=["kper","obs_base","flaqx","flout"])
-    df.sort_values(by=["kper","obs_base"],inplace=True)
+        vals = sfr_kper[kper].loc[segs,["flaqx","flout"]].values
+        # still agg flout where seg groups are passed!
+        results.append(pd.DataFrame({"kper":kper,"obs_base":obs_base,
+                                     "flaqx":np.bincount(group,weights=vals[:,0],
+                                                         minlength=obs_base.shape[0]),
+                                     "flout":np.bincount(group,weights=vals[:,1],
+                                                         minlength=obs_base.shape[0])}))
+    # the plan obs_base are sorted, so this is sorted by kper and obs_base
+    df = pd.concat(results,ignore_index=True)
     df.to_csv(sfr_out_file+".processed",sep=' ',index=False)
     return df
 
 
-def load_sfr_out(sfr_out_file, selection=None):
+# header line of a stress period block in the SFR ASCII output file
+_SFR_TAG = re.compile(rb"(?i)(?:\A|\n) stream listing[^\n]*")
+# the first blank line (or the end of the file) ends a block
+_SFR_BLANK = re.compile(rb"\n[ \t\r\f\v]*(?=\n|\Z)")
+
+
+def _sfr_out_blocks(buf, kpers=None):
+    """find the data blocks of an SFR ASCII output file in one scan of `buf` (the
+    memory-mapped file).  Returns a dict of {kper: (start,end)} byte offsets (the
+    last block of each kper)
+
+    """
+    blocks = {}
+    for m in _SFR_TAG.finditer(buf):
+        raw = m.group(0).split()
+        kper = int(raw[3]) - 1
+        if kpers is not None and kper not in kpers:
+            continue
+        # skip to where the data starts
+        start = m.end() + 1
+        for _ in range(4):
+            nl = buf.find(b"\n", start)
+            start = len(buf) if nl < 0 else nl + 1
+        blank = _SFR_BLANK.search(buf, start - 1)
+        end = len(buf) if blank is None else max(blank.start(), start)
+        if kper in blocks:
+            print("multiple entries found for kper {0}, "
+                  "replacing...".format(kper))
+        blocks[kper] = (start, end)
+    return blocks
+
+
+def _sfr_out_block_data(buf, blocks, batch_bytes=2**24):
+    """generator of (kper,segment,reach,flow to aquifer,flow out) for the `blocks`
+    byte ranges of the memory-mapped SFR ASCII output file `buf`.  Consecutive
+    blocks are parsed together in batches of about `batch_bytes`
+
+    """
+    items = list(blocks.items())
+    i = 0
+    while i < len(items):
+        chunks, nlines, size = [], [], 0
+        while i < len(items) and size < batch_bytes:
+            start, end = items[i][1]
+            chunk = buf[start:end].rstrip(b"\r\n")
+            chunks.append(chunk)
+            nlines.append(0 if len(chunk) == 0 else chunk.count(b"\n") + 1)
+            size += len(chunk) + 1
+            i += 1
+        kpers = [kper for kper, _ in items[i - len(chunks):i]]
+        chunks = [c for c in chunks if len(c) > 0]
+        if len(chunks) > 0:
+            data = pd.read_csv(io.BytesIO(b"\n".join(chunks)), delim_whitespace=True,
+                               header=None, usecols=[3, 4, 6, 7])
+            seg = data.iloc[:, 0].values.astype(int)
+            rch = data.iloc[:, 1].values.astype(int)
+            flaqx = data.iloc[:, 2].values.astype(float)
+            flout = data.iloc[:, 3].values.astype(float)
+            del data, chunks
+        else:
+            seg, rch = np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+            flaqx, flout = np.zeros(0), np.zeros(0)
+        offset = 0
+        for kper, n in zip(kpers, nlines):
+            yield kper, seg[offset:offset + n], rch[offset:offset + n], \
+                flaqx[offset:offset + n], flout[offset:offset + n]
+            offset += n
+
+
+def _sfr_seg_reach_id(segment, reach):
+    """the "sss_rrr" segment-reach string ids used to index SFR output"""
+    return pd.Series(segment).map("{0:03d}".format).values.astype(object) + "_" + \
+        pd.Series(reach).map("{0:03d}".format).values.astype(object)
+
+
+def load_sfr_out(sfr_out_file, selection=None, kpers=None):
     """load an ASCII SFR output file into a dictionary of kper: dataframes.
 
     Args:
         sfr_out_file (`str`): SFR ASCII output file
         selection (`pandas.DataFrame`): a dataframe of `reach` and `segment` pairs to
             load.  If `None`, all reach-segment pairs are loaded.  Default is `None`.
+        kpers ([`int`]): zero-based stress periods to load.  Only the blocks of these
+            stress periods are parsed.  If `None`, all stress periods are loaded.
+            Default is `None`.
 
     Note:
         aggregates flow to aquifer for segments and returns and flow out at
         downstream end of segment.
 
+        The file is memory-mapped: the block offsets are found in one
+        (case-insensitive) regex scan and the blocks are parsed directly from
+        their byte ranges in bounded batches, so the whole file is never held
+        in memory.
+
     Returns:
         **dict**: dictionary of {kper:`pandas.DataFrame`} of SFR output.
 
     """
     assert os.path.exists(sfr_out_file),"couldn't find sfr out file {0}".\
         format(sfr_out_file)
-    tag = " stream listing"
-    lcount = 0
-    sfr_dict = {}
     if selection is None:
         pass
     elif isinstance(selection, str):
@@ -1706,73 +1791,68 @@ def load_sfr_out(sfr_out_file, selection=None):
             "Type {} passed.".format(type(selection))
         assert np.all([sr in selection.columns for sr in ['segment', 'reach']]
                       ), "Either 'segment' or 'reach' not in selection columns"
-    with open(sfr_out_file) as f:
-        while True:
-            line = f.readline().lower()
-            lcount += 1
-            if line == '':
-                break
-            if line.startswith(tag):
-                raw = line.strip().split()
-                kper = int(raw[3]) - 1
-                kstp = int(raw[5]) - 1
-                [f.readline() for _ in range(4)] #skip to where the data starts
-                lcount += 4
-                dlines = []
-                while True:
-                    dline = f.readline()
-                    lcount += 1
-                    if dline.strip() == '':
-                        break
-                    draw = dline.strip().split()
-                    dlines.append(draw)
-                df = pd.DataFrame(data=np.array(dlines)).iloc[:, [3, 4, 6, 7]]
-                df.columns = ["segment", "reach", "flaqx", "flout"]
-                df["segment"] = df.segment.astype(np.int)
-                df["reach"] = df.reach.astype(np.int)
-                df["flaqx"] = df.flaqx.astype(np.float)
-                df["flout"] = df.flout.astype(np.float)
-                df.index = ["{0:03d}_{1:03d}".format(s, r) for s, r in
-                            np.array([df.segment.values, df.reach.values]).T]
-                # df.index = df.apply(
-                # lambda x: "{0:03d}_{1:03d}".format(
-                # int(x.segment), int(x.reach)), axis=1)
-                if selection is None:  # setup for all segs, aggregate
-                    gp = df.groupby(df.segment)
-                    bot_reaches = gp[['reach']].max().apply(
-                        lambda x: "{0:03d}_{1:03d}".format(
-                            int(x.name), int(x.reach)), axis=1)
-                    # only sum distributed output # take flow out of seg
-                    df2 = pd.DataFrame(
-                        {'flaqx':gp.flaqx.sum(),
-                         'flout': df.loc[bot_reaches, 'flout'].values},
-                        index=gp.groups.keys())
-                    # df = df.groupby(df.segment).sum()
-                    df2["segment"] = df2.index
-                elif isinstance(selection, str) and selection == 'all':
+    if kpers is not None:
+        kpers = set(int(kper) for kper in np.atleast_1d(kpers))
+    if os.path.getsize(sfr_out_file) == 0:
+        return {}
+    # most files list the same reaches for every kper, so the index and the
+    # selection are only built when the reach layout changes
+    layout, sel_idx = None, None
+    sfr_dict = {}
+    with open(sfr_out_file, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        blocks = _sfr_out_blocks(buf, kpers=kpers)
+        for kper, ks, kr, kflaqx, kflout in _sfr_out_block_data(buf, blocks):
+            if layout is None or not (np.array_equal(ks, layout[0]) and
+                                      np.array_equal(kr, layout[1])):
+                layout = (ks, kr, _sfr_seg_reach_id(ks, kr))
+                sel_idx = None
+            if selection is None:  # setup for all segs, aggregate
+                # only sum distributed output # take flow out of seg
+                usegs = np.unique(ks)
+                gp = pd.Series(kflaqx).groupby(ks)
+                # the row of the last (largest) reach of each segment
+                order = np.lexsort((kr, ks))
+                last = order[np.r_[np.nonzero(np.diff(ks[order]))[0], order.shape[0] - 1]]
+                df2 = pd.DataFrame({'flaqx': gp.sum().values, 'flout': kflout[last]},
+                                   index=usegs)
+                df2["segment"] = df2.index
+            else:
+                df = pd.DataFrame({"segment": ks, "reach": kr, "flaqx": kflaqx,
+                                   "flout": kflout}, index=layout[2])
+                if isinstance(selection, str) and selection == 'all':
                     df2 = df
                 else:
-                    seg_reach_id = selection.apply(
-                        lambda x: "{0:03d}_{1:03d}".format(
-                            int(x.segment), int(x.reach)), axis=1).values
-                    for sr in seg_reach_id:
-                        if sr not in df.index:
-                            s, r = [x.lstrip('0') for x in sr.split('_')]
-                            warnings.warn(
-                                "Requested segment reach pair ({0},{1}) "
-                                "is not in sfr output. Dropping...".format(
-                                    int(r), int(s)), PyemuWarning)
-                            seg_reach_id = np.delete(
-                                seg_reach_id,
-                                np.where(seg_reach_id == sr), axis=0)
-                    df2 = df.loc[seg_reach_id].copy()
-                if kper in sfr_dict.keys():
-                    print("multiple entries found for kper {0}, "
-                          "replacing...".format(kper))
-                sfr_dict[kper] = df2
+                    if sel_idx is None:
+                        sel_idx = _sfr_selection_index(selection, ks, kr)
+                    df2 = df.iloc[sel_idx].copy()
+            sfr_dict[kper] = df2
     return sfr_dict
 
 
+def _sfr_selection_index(selection, segment, reach):
+    """positions of the selected segment-reach pairs in a block, in selection
+    order.  Pairs not in the block are dropped with a warning
+
+    """
+    sel_seg = selection.segment.values.astype(int)
+    sel_rch = selection.reach.values.astype(int)
+    # integer segment-reach keys
+    keys = pd.Index(segment.astype(np.int64) * 2**32 + reach.astype(np.int64))
+    sel_keys = sel_seg.astype(np.int64) * 2**32 + sel_rch.astype(np.int64)
+    if keys.is_unique:
+        idx = keys.get_indexer(sel_keys)
+    else:
+        first = pd.Series(np.arange(keys.shape[0])).groupby(keys.values).first()
+        idx = first.reindex(sel_keys).fillna(-1).values.astype(int)
+    for s, r in zip(sel_seg[idx < 0], sel_rch[idx < 0]):
+        warnings.warn(
+            "Requested segment reach pair ({0},{1}) "
+            "is not in sfr output. Dropping...".format(
+                int(r), int(s)), PyemuWarning)
+    return idx[idx >= 0]
+
+
 def setup_sfr_reach_obs(sfr_out_file,seg_reach=None,ins_file=None,model=None,
                         include_path=False):
     """setup observations using the sfr ASCII output file.  Setups
@@ -1849,6 +1929,7 @@ def setup_sfr_reach_obs(sfr_out_file,seg_reach=None,ins_file=None,model=None,
         config_file = "sfr_reach_obs.config"
     print("writing 'sfr_reach_obs.config' to {0}".format(config_file))
     df_key.to_csv(config_file)
+    _save_plan(config_file,_sfr_reach_obs_plan(config_file))
 
     bd = '.'
     if include_path:
@@ -1896,6 +1977,21 @@ def setup_sfr_reach_obs(sfr_out_file,seg_reach=None,ins_file=None,model=None,
         return df
 
 
+def _sfr_reach_obs_plan(config_file):
+    """build the extraction plan for `apply_sfr_reach_obs()` from the config file"""
+    df_key = pd.read_csv(config_file, index_col=0)
+    assert df_key.iloc[0, 0] == "sfr_out_file", df_key.iloc[0, :]
+    sfr_out_file = df_key.iloc[0].reach
+    df_key = df_key.iloc[1:, :]
+    obs_base = df_key.obs_base.values.astype(str)
+    order = np.argsort(obs_base, kind="stable")
+    segment = df_key.segment.values.astype(np.int64)[order]
+    reach = df_key.reach.values.astype(np.int64)[order]
+    seg_reach_id = np.array(["{0:03d}_{1:03d}".format(s, r) for s, r in zip(segment, reach)])
+    return {"sfr_out_file": np.array(sfr_out_file), "obs_base": obs_base[order],
+            "segment": segment, "reach": reach, "seg_reach_id": seg_reach_id}
+
+
 def apply_sfr_reach_obs():
     """apply the sfr reach observation process.
 
@@ -1912,14 +2008,10 @@ def apply_sfr_reach_obs():
 
     """
     assert os.path.exists("sfr_reach_obs.config")
-    df_key = pd.read_csv("sfr_reach_obs.config", index_col=0)
-
-    assert df_key.iloc[0, 0] == "sfr_out_file", df_key.iloc[0, :]
-    sfr_out_file = df_key.iloc[0].reach
-    df_key = df_key.iloc[1:, :].copy()
-    df_key.loc[:, "segment"] = df_key.segment.apply(np.int)
-    df_key.loc[:, "reach"] = df_key.reach.apply(np.int)
-    df_key = df_key.set_index('obs_base')
+    plan = _get_plan("sfr_reach_obs.config", _sfr_reach_obs_plan)
+    sfr_out_file = str(plan["sfr_out_file"])
+    df_key = pd.DataFrame({"segment": plan["segment"], "reach": plan["reach"]},
+                          index=pd.Index(plan["obs_base"], name="obs_base"))
 
     sfr_kper = load_sfr_out(sfr_out_file, df_key)
     kpers = list(sfr_kper.keys())
@@ -1927,12 +2019,11 @@ def apply_sfr_reach_obs():
 
     results = []
     for kper in kpers:
-        df = sfr_kper[kper]
-        for sr in df_key.itertuples():
-            ob = df.loc["{0:03d}_{1:03d}".format(sr.segment, sr.reach), :]
-            results.append([kper, sr.Index, ob["flaqx"], ob["flout"]])
-    df = pd.DataFrame(data=results, columns=["kper", "obs_base", "flaqx", "flout"])
-    df.sort_values(by=["kper", "obs_base"], inplace=True)
+        vals = sfr_kper[kper].loc[plan["seg_reach_id"], ["flaqx", "flout"]].values
+        results.append(pd.DataFrame({"kper": kper, "obs_base": plan["obs_base"],
+                                     "flaqx": vals[:, 0], "flout": vals[:, 1]}))
+    # the plan obs_base are sorted, so this is sorted by kper and obs_base
+    df = pd.concat(results, ignore_index=True)
     df.to_csv(sfr_out_file+".reach_processed", sep=' ', index=False)
     return df
 
@@ -2065,6 +2156,7 @@ def setup_gage_obs(gage_file,ins_file=None,start_datetime=None,times=None):
     with open("gage_obs.config", 'w') as f:
         f.write(gage_file+'\n')
         [f.write("{0:15.10E}\n".format(t)) for t in times]
+    _save_plan("gage_obs.config", _gage_obs_plan("gage_obs.config"))
     # extract data for times: returns dataframe and saves a processed df - read by pest
     df, obs_file = apply_gage_obs(return_obs_file=True)
     utimes = df.time.unique()
@@ -2095,6 +2187,16 @@ def setup_gage_obs(gage_file,ins_file=None,start_datetime=None,times=None):
     return df, ins_file, obs_file
 
 
+def _gage_obs_plan(config_file):
+    """build the extraction plan for `apply_gage_obs()` from the config file"""
+    times = []
+    with open(config_file) as f:
+        gage_file = f.readline().strip()
+        for line in f:
+            times.append(float(line.strip()))
+    return {"gage_file": np.array(gage_file), "times": np.array(times, dtype=float)}
+
+
 def apply_gage_obs(return_obs_file=False):
     """apply the modflow gage obs post-processor
 
@@ -2108,11 +2210,8 @@ def apply_gage_obs(return_obs_file=False):
 
 
     """
-    times = []
-    with open("gage_obs.config") as f:
-        gage_file = f.readline().strip()
-        for line in f:
-            times.append(float(line.strip()))
+    plan = _get_plan("gage_obs.config", _gage_obs_plan)
+    gage_file = str(plan["gage_file"])
     obs_file = gage_file+".processed"
     with open(gage_file, 'r') as f:
         line1 = f.readline()
@@ -2122,7 +2221,7 @@ def apply_gage_obs(return_obs_file=False):
         line2 = f.readline()
         df = pd.read_csv(f, delim_whitespace=True, names=line2.replace('"', '').split()[1:])
     df.columns = [c.lower().replace("-", "_").replace('.', '_') for c in df.columns]
-    df = df.loc[df.time.apply(lambda x: np.isclose(x, times).any()), :]
+    df = df.loc[_isclose_any(df.time.values, plan["times"]), :]
     df.to_csv(obs_file, sep=' ', index=False)
     if return_obs_file:
         return df, obs_file
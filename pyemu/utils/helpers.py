@@ -23,9 +23,11 @@ except:
 
 import pyemu
 from pyemu.utils.os_utils import run, start_workers
+from pyemu.utils.array_utils import read_array, write_array
 
 
-def geostatistical_draws(pst, struct_dict,num_reals=100,sigma_range=4,verbose=True):
+def geostatistical_draws(pst, struct_dict,num_reals=100,sigma_range=4,verbose=True,
+                         method="auto",seed=None,num_threads=1):
     """construct a parameter ensemble from a prior covariance matrix
     implied by geostatistical structure(s) and parameter bounds.
 
@@ -43,6 +45,15 @@ def geostatistical_draws(pst, struct_dict,num_reals=100,sigma_range=4,verbose=Tr
             implied by parameter bounds. Default is 4.0, which implies 95% confidence parameter bounds.
         verbose (`bool`, optional): flag to control output to stdout.  Default is True.
             flag for stdout.
+        method (`str`, optional): how to draw each zone.  "eigen" uses an eigen
+            factorization of the dense zone covariance matrix, "specsim" uses
+            `pyemu.geostats.SpecSim2d` (the points of each zone must form a
+            complete regular grid and the variograms must be isotropic) and "auto" uses "specsim" for regular-grid zones with at
+            least `SPECSIM_MIN_POINTS` points and "eigen" otherwise.  Default is "auto"
+        seed (`int`, optional): seed for the random draws.  If None, the global
+            `numpy.random` stream is used.  Default is None
+        num_threads (`int`, optional): number of threads to use for the random draws
+            (with `seed`) and the `SpecSim2d` FFTs.  Default is 1
 
     Returns
         `pyemu.ParameterEnsemble`: the realized parameter ensemble.
@@ -53,6 +64,11 @@ def geostatistical_draws(pst, struct_dict,num_reals=100,sigma_range=4,verbose=Tr
         covariance matrix Therefore, the sill of the geostatistical structures
         in `struct_dict` should be 1.0
 
+        the factor of the (unit sill) covariance matrix is only calculated once for
+        zones that share a GeoStruct and the same points (e.g. the same pilot
+        points used for several properties) and is then scaled by the
+        standard deviation of each zone.
+
 
     Example::
 
@@ -68,15 +84,25 @@ def geostatistical_draws(pst, struct_dict,num_reals=100,sigma_range=4,verbose=Tr
         pst = pyemu.Pst(pst)
     assert isinstance(pst,pyemu.Pst),"pst arg must be a Pst instance, not {0}".\
         format(type(pst))
+    method = method.lower()
+    if method not in ["auto","eigen","specsim"]:
+        raise Exception("geostatistical_draws() error: unrecognized 'method': {0}".\
+                        format(method))
     if verbose: print("building diagonal cov")
 
     full_cov = pyemu.Cov.from_parameter_data(pst, sigma_range=sigma_range)
     full_cov_dict = {n: float(v) for n, v in zip(full_cov.col_names, full_cov.x)}
+    seed = pyemu.Ensemble._seed_sequence(seed)
 
-    # par_org = pst.parameter_data.copy  # not sure about the need or function of this line? (BH)
     par = pst.parameter_data
-    par_ens = []
+    mean_values = par.parval1.copy()
+    islog = (par.partrans == "log").values
+    mean_values.loc[islog] = np.log10(mean_values.loc[islog])
+    adj_names = pst.adj_par_names
+    # (name, value) blocks of the realized (transformed) values
+    par_names, par_reals = [], []
     pars_in_cov = set()
+    factors = {}
     keys = list(struct_dict.keys())
     keys.sort()
 
@@ -102,7 +128,7 @@ def geostatistical_draws(pst, struct_dict,num_reals=100,sigma_range=4,verbose=Tr
                     format(item)
                 if item.lower().endswith(".tpl"):
                     df = pyemu.pp_utils.pp_tpl_to_dataframe(item)
-                elif item.lower.endswith(".csv"):
+                elif item.lower().endswith(".csv"):
                     df = pd.read_csv(item)
             else:
                 df = item
@@ -111,44 +137,64 @@ def geostatistical_draws(pst, struct_dict,num_reals=100,sigma_range=4,verbose=Tr
             for req in ['x','y','parnme']:
                 if req not in df.columns:
                     raise Exception("{0} is not in the columns".format(req))
-            missing = df.loc[df.parnme.apply(
-                    lambda x : x not in par.parnme),"parnme"]
-            if len(missing) > 0:
+            in_pst = df.parnme.isin(par.parnme)
+            if not in_pst.all():
                 warnings.warn("the following parameters are not " + \
                               "in the control file: {0}".\
-                              format(','.join(missing)),PyemuWarning)
-                df = df.loc[df.parnme.apply(lambda x: x not in missing)]
+                              format(','.join(df.loc[~in_pst,"parnme"])),PyemuWarning)
+                df = df.loc[in_pst,:]
             if "zone" not in df.columns:
+                df = df.copy()
                 df.loc[:,"zone"] = 1
-            zones = df.zone.unique()
-            aset = set(pst.adj_par_names)
-            for zone in zones:
-                df_zone = df.loc[df.zone==zone,:].copy()
-                df_zone = df_zone.loc[df_zone.parnme.apply(lambda x: x in aset),:]
+            is_adj = df.parnme.isin(adj_names)
+            for zone in df.zone.unique():
+                df_zone = df.loc[(df.zone==zone) & is_adj,:]
                 if df_zone.shape[0] == 0:
                     warnings.warn("all parameters in zone {0} tied and/or fixed, skipping...".format(zone),PyemuWarning)
                     continue
 
-                #df_zone.sort_values(by="parnme",inplace=True)
-                df_zone.sort_index(inplace=True)
-                if verbose: print("build cov matrix")
-                cov = gs.covariance_matrix(df_zone.x,df_zone.y,df_zone.parnme)
-                if verbose: print("done")
+                df_zone = df_zone.sort_index()
+                names = df_zone.parnme.tolist()
+                x = df_zone.x.values.astype(np.float64)
+                y = df_zone.y.values.astype(np.float64)
 
                 if verbose: print("getting diag var cov",df_zone.shape[0])
-                #tpl_var = np.diag(full_cov.get(list(df_zone.parnme)).x).max()
-                tpl_var = max([full_cov_dict[pn] for pn in df_zone.parnme])
+                tpl_var = max([full_cov_dict[pn] for pn in names])
+                key = (id(gs),x.tobytes(),y.tobytes())
+                if key not in factors:
+                    factors[key] = _geostatistical_factor(gs,x,y,method,verbose)
+                kind,factor = factors[key]
+                if kind == "specsim":
+                    ss,rows,cols = factor
+                    if verbose: print("drawing {0} points with SpecSim2d".format(len(names)))
+                    reals = np.empty((num_reals,len(names)))
+                    i = 0
+                    ss_seed = pyemu.Ensemble._sub_seed(seed,"specsim:" + names[0])
+                    for block in ss.draw_arrays_iter(num_reals=num_reals,mean_value=0.0,
+                                                     num_threads=num_threads,
+                                                     dtype=np.float64,seed=ss_seed):
+                        reals[i:i + block.shape[0]] = block[:,rows,cols]
+                        i += block.shape[0]
+                    reals *= np.sqrt(tpl_var)
+                else:
+                    # scale the factor rather than the covariance matrix
+                    w,v = factor
+                    v = v * tpl_var
+                    v[v <= 1.0e-10] = 0.0
+                    snv = pyemu.Ensemble._standard_normal(num_reals,len(names),seed=seed,
+                                                          tag="geostat:" + names[0],
+                                                          num_threads=num_threads)
+                    reals = np.dot(snv * np.sqrt(v),w.T)
+                reals += mean_values.loc[names].values
+                par_names.extend(names)
+                par_reals.append(reals)
+                pars_in_cov.update(names)
 
-                if verbose: print("scaling full cov by diag var cov")
-                #cov.x *= tpl_var
-                for i in range(cov.shape[0]):
-                   cov.x[i,:] *= tpl_var
-                # no fixed values here
-                pe = pyemu.ParameterEnsemble.from_gaussian_draw(pst=pst,cov=cov,num_reals=num_reals,
-                                                                by_groups=False,fill=False)
-                #df = pe.iloc[:,:]
-                par_ens.append(pe._df)
-                pars_in_cov.update(set(pe.columns))
+    par_ens = []
+    if len(par_reals) > 0:
+        par_ens.append(pd.DataFrame(np.hstack(par_reals),columns=par_names))
+        li = islog[par.index.get_indexer(par_names)]
+        par_ens[0].loc[:,li] = 10.0**par_ens[0].loc[:,li]
 
     if verbose: print("adding remaining parameters to diagonal")
     fset = set(full_cov.row_names)
@@ -160,15 +206,74 @@ def geostatistical_draws(pst, struct_dict,num_reals=100,sigma_range=4,verbose=Tr
         #cov = full_cov.get(diff,diff)
         # here we fill in the fixed values
         pe = pyemu.ParameterEnsemble.from_gaussian_draw(pst,cov,num_reals=num_reals,
-                                                        fill=False)
+                                                        fill=False,seed=seed,
+                                                        num_threads=num_threads)
         par_ens.append(pe._df)
     par_ens = pd.concat(par_ens,axis=1)
     par_ens = pyemu.ParameterEnsemble(pst=pst,df=par_ens)
     return par_ens
 
 
+SPECSIM_MIN_POINTS = 2500
+
+
+def _regular_grid_index(x, y, tol=1.0e-6):
+    """row and column indices of points that form a complete regular
+    (square cell) grid, or None if the points are not such a grid
+    """
+    xs, cols = np.unique(x, return_inverse=True)
+    ys, rows = np.unique(y, return_inverse=True)
+    if xs.shape[0] < 2 or ys.shape[0] < 2 or xs.shape[0] * ys.shape[0] != x.shape[0]:
+        return None
+    # each grid node exactly once
+    if np.unique(rows * xs.shape[0] + cols).shape[0] != x.shape[0]:
+        return None
+    delx, dely = np.diff(xs), np.diff(ys)
+    scale = max(delx.mean(), dely.mean())
+    if not pyemu.geostats.SpecSim2d.grid_is_regular(delx / scale, dely / scale, tol=tol):
+        return None
+    dx = delx.mean()
+    return np.full(xs.shape[0], dx), np.full(ys.shape[0], dx), rows, cols
+
+
+def _geostatistical_factor(gs, x, y, method, verbose=False):
+    """factor the (unit sill) covariance matrix implied by `gs` at points `x`,`y`
+    for `geostatistical_draws()`.
+
+    Returns:
+        `tuple`: ("specsim",(`SpecSim2d`,rows,cols)) or ("eigen",(eigen vectors,eigen values))
+
+    """
+    if method != "eigen":
+        grid = None
+        if method == "specsim" or x.shape[0] >= SPECSIM_MIN_POINTS:
+            grid = _regular_grid_index(x, y)
+            if grid is not None:
+                for v in gs.variograms:
+                    # SpecSim2d does not apply grid-aligned anisotropy
+                    if v.bearing % 90.0 != 0.0 or v.anisotropy != 1.0:
+                        grid = None
+                        break
+        if grid is None:
+            if method == "specsim":
+                raise Exception("geostatistical_draws() error: 'specsim' requires points on a "
+                                "complete regular grid and isotropic variograms")
+        else:
+            delx, dely, rows, cols = grid
+            # draw zero-mean fields in arithmetic space
+            gs = copy.deepcopy(gs)
+            gs.transform = "none"
+            ss = pyemu.geostats.SpecSim2d(delx=delx, dely=dely, geostruct=gs)
+            return "specsim", (ss, rows, cols)
+    if verbose: print("build cov matrix")
+    cov = gs.covariance_matrix(x, y, names=["p{0}".format(i) for i in range(x.shape[0])])
+    if verbose: print("factoring cov matrix")
+    v, w = np.linalg.eigh(cov.as_2d)
+    return "eigen", (w, v)
+
+
 def geostatistical_prior_builder(pst, struct_dict,sigma_range=4,
-                                 verbose=False):
+                                 verbose=False,num_threads=1):
     """construct a full prior covariance matrix using geostastical structures
     and parameter bounds information.
 
@@ -183,6 +288,9 @@ def geostatistical_prior_builder(pst, struct_dict,sigma_range=4,
             implied by parameter bounds. Default is 4.0, which implies 95% confidence parameter bounds.
         verbose (`bool`, optional): flag to control output to stdout.  Default is True.
             flag for stdout.
+        num_threads (`int`, optional): number of threads used to assemble each
+            geostatistical covariance matrix (see `GeoStruct.covariance_matrix()`).
+            Default is 1.
 
     Returns:
         `pyemu.Cov`: a covariance matrix that includes all adjustable parameters in the control
@@ -259,7 +367,8 @@ def geostatistical_prior_builder(pst, struct_dict,sigma_range=4,
                 #df_zone.sort_values(by="parnme",inplace=True)
                 df_zone.sort_index(inplace=True)
                 if verbose: print("build cov matrix")
-                cov = gs.covariance_matrix(df_zone.x,df_zone.y,df_zone.parnme)
+                cov = gs.covariance_matrix(df_zone.x,df_zone.y,df_zone.parnme,
+                                           num_threads=num_threads)
                 if verbose: print("done")
                 # find the variance in the diagonal cov
                 if verbose: print("getting diag var cov",df_zone.shape[0])
@@ -328,10 +437,13 @@ def _condition_on_par_knowledge(cov,par_knowledge_dict):
 
 
 
+_KL_DENSE_MAX = 2000 # max number of nodes for which kl_setup() eigen-solves a dense covariance matrix
+
+
 def kl_setup(num_eig,sr,struct,prefixes,
              factors_file="kl_factors.dat",
              islog=True, basis_file=None,
-             tpl_dir="."):
+             tpl_dir=".",binary=False,num_threads=1):
 
     """setup a karhuenen-Loeve based parameterization for a given
     geostatistical structure.
@@ -349,16 +461,26 @@ def kl_setup(num_eig,sr,struct,prefixes,
             Default is "kl_factors.dat".
         islog (`bool`, optional): flag to indicate if the parameters are log transformed.
             Default is True
-        basis_file (`str`, optional): the name of the PEST-style binary (e.g. jco)
-            file to write the reduced basis vectors to.  Default is None (not saved).
+        basis_file (`str`, optional): the name of the compact binary file
+            (see `pyemu.geostats.KrigeFactors.to_binary()`) to write the reduced
+            basis vectors to.  Default is None (not saved).
         tpl_dir (`str`, optional): the directory to write the resulting
             template files to.  Default is "." (current directory).
+        binary (`bool`, optional): flag to write `factors_file` in the compact
+            binary format of `pyemu.geostats.KrigeFactors.to_binary()` instead of
+            the PEST-style text format.  The binary format can only be read by pyemu.
+            Default is False
+        num_threads (`int`, optional): number of FFT workers to use if `scipy.fft`
+            is available.  Default is 1
 
     Returns:
         `pandas.DataFrame`: a dataframe of parameter information.
 
     Note:
-        This is the companion function to `helpers.apply_kl()`
+        This is the companion function to `helpers.kl_apply()`
+
+        only the leading `num_eig` eigenpairs of the grid covariance matrix are
+        calculated (see `helpers.kl_eigen_basis()`)
 
     Example::
 
@@ -373,34 +495,19 @@ def kl_setup(num_eig,sr,struct,prefixes,
     except Exception as e:
         raise Exception("error import flopy: {0}".format(str(e)))
     assert isinstance(sr,flopy.utils.SpatialReference)
-    # for name,array in array_dict.items():
-    #     assert isinstance(array,np.ndarray)
-    #     assert array.shape[0] == sr.nrow
-    #     assert array.shape[1] == sr.ncol
-    #     assert len(name) + len(str(num_eig)) <= 12,"name too long:{0}".\
-    #         format(name)
 
     if isinstance(struct,str):
         assert os.path.exists(struct)
         gs = pyemu.utils.read_struct_file(struct)
     else:
         gs = struct
-    names = []
-    for i in range(sr.nrow):
-        names.extend(["i{0:04d}j{1:04d}".format(i,j) for j in range(sr.ncol)])
-
-    cov = gs.covariance_matrix(sr.xcentergrid.flatten(),
-                               sr.ycentergrid.flatten(),
-                               names=names)
-
-    eig_names = ["eig_{0:04d}".format(i) for i in range(cov.shape[0])]
-    trunc_basis = cov.u
-    trunc_basis.col_names = eig_names
-    #trunc_basis.col_names = [""]
+
+    _, basis = kl_eigen_basis(gs,sr.xcentergrid,sr.ycentergrid,num_eig,
+                              num_threads=num_threads)
+    num_eig = basis.shape[1]
+    eig_names = ["eig_{0:04d}".format(i) for i in range(num_eig)]
     if basis_file is not None:
-        trunc_basis.to_binary(basis_file)
-    trunc_basis = trunc_basis[:,:num_eig]
-    eig_names = eig_names[:num_eig]
+        _eigen_basis_to_factors(sr.nrow,sr.ncol,basis,eig_names).to_binary(basis_file)
 
     pp_df = pd.DataFrame({"name":eig_names},index=eig_names)
     pp_df.loc[:,"x"] = -1.0 * sr.ncol
@@ -409,9 +516,13 @@ def kl_setup(num_eig,sr,struct,prefixes,
     pp_df.loc[:,"parval1"] = 1.0
     pyemu.pp_utils.write_pp_file(os.path.join("temp.dat"),pp_df)
 
-
-    _eigen_basis_to_factor_file(sr.nrow, sr.ncol, trunc_basis,
-                                factors_file=factors_file, islog=islog)
+    kf = _eigen_basis_to_factors(sr.nrow,sr.ncol,basis,eig_names,
+                                 transform=1 if islog else 0,
+                                 points_file="junk.dat",zone_file="junk.zone.dat")
+    if binary:
+        kf.to_binary(factors_file)
+    else:
+        kf.to_text(factors_file)
     dfs = []
     for prefix in prefixes:
         tpl_file = os.path.join(tpl_dir,"{0}.dat_kl.tpl".format(prefix))
@@ -422,49 +533,246 @@ def kl_setup(num_eig,sr,struct,prefixes,
         df.loc[:,"prefix"] = prefix
         df.loc[:,"pargp"] = "kl_{0}".format(prefix)
         dfs.append(df)
-        #arr = pyemu.geostats.fac2real(df,factors_file=factors_file,out_file=None)
     df = pd.concat(dfs)
     df.loc[:,"parubnd"] = 10.0
     df.loc[:,"parlbnd"] = 0.1
     return pd.concat(dfs)
 
-    # back_array_dict = {}
-    # f = open(tpl_file,'w')
-    # f.write("ptf ~\n")
-    # f.write("name,org_val,new_val\n")
-    # for name,array in array_dict.items():
-    #     mname = name+"mean"
-    #     f.write("{0},{1:20.8E},~   {2}    ~\n".format(mname,0.0,mname))
-    #     #array -= array.mean()
-    #     array_flat = pyemu.Matrix(x=np.atleast_2d(array.flatten()).transpose()
-    #                               ,col_names=["flat"],row_names=names,
-    #                               isdiagonal=False)
-    #     factors = trunc_basis * array_flat
-    #     enames = ["{0}{1:04d}".format(name,i) for i in range(num_eig)]
-    #     for n,val in zip(enames,factors.x):
-    #        f.write("{0},{1:20.8E},~    {0}    ~\n".format(n,val[0]))
-    #     back_array_dict[name] = (factors.T * trunc_basis).x.reshape(array.shape)
-    #     print(array_back)
-    #     print(factors.shape)
-    #
-    # return back_array_dict
-
-
-def _eigen_basis_to_factor_file(nrow, ncol, basis, factors_file, islog=True):
-    assert nrow * ncol == basis.shape[0]
-    with open(factors_file,'w') as f:
-        f.write("junk.dat\n")
-        f.write("junk.zone.dat\n")
-        f.write("{0} {1}\n".format(ncol,nrow))
-        f.write("{0}\n".format(basis.shape[1]))
-        [f.write(name+"\n") for name in basis.col_names]
-        t = 0
-        if islog:
-            t = 1
-        for i in range(nrow * ncol):
-            f.write("{0} {1} {2} {3:8.5e}".format(i+1,t,basis.shape[1],0.0))
-            [f.write(" {0} {1:12.8g} ".format(i + 1, w)) for i, w in enumerate(basis.x[i,:])]
-            f.write("\n")
+
+def kl_eigen_basis(struct,x,y,num_eig,dense_max=_KL_DENSE_MAX,num_threads=1):
+    """get the leading eigenpairs of the covariance matrix implied by a
+    geostatistical structure, without a full eigen decomposition
+
+    Args:
+        struct (`pyemu.geostats.GeoStruct`): the geostatistical structure
+        x (`numpy.ndarray`): x-coordinates of the points.  A 2-D array of
+            (structured) grid node coordinates, such as `sr.xcentergrid`, allows
+            the FFT-based solution for regular grids
+        y (`numpy.ndarray`): y-coordinates of the points, with the same shape as `x`
+        num_eig (`int`): the number of (leading) eigenpairs to calculate
+        dense_max (`int`, optional): the maximum number of points for which the
+            dense covariance matrix is eigen-solved directly.  Default is `_KL_DENSE_MAX`
+        num_threads (`int`, optional): number of FFT workers to use if `scipy.fft`
+            is available.  Default is 1
+
+    Returns:
+        tuple containing
+
+        - **numpy.ndarray**: the `num_eig` largest eigenvalues, in descending order
+        - **numpy.ndarray**: the (number of points by `num_eig`) eigenvectors.  The
+          sign of each eigenvector is set so its (first) largest-magnitude component is positive
+
+    Note:
+        for more than `dense_max` points, the eigenpairs are found with the
+        iterative (Lanczos) solver `scipy.sparse.linalg.eigsh` and the dense
+        covariance matrix is never formed.  If `x` and `y` are 2-D and the grid
+        spacing is uniform (rotated grids are allowed), the covariance mat-vec
+        products are evaluated with FFTs of the (stationary) covariance function
+        embedded in a circulant matrix.  Otherwise, if all the variograms are
+        spherical (finite range), the sparse covariance matrix of the point pairs
+        within range is built with a KD-tree, else the mat-vec products are
+        accumulated one tile of point pairs at a time
+
+    Example::
+
+        gs = pyemu.geostats.read_struct_file("struct.dat")[0]
+        eig_vals, basis = pyemu.helpers.kl_eigen_basis(gs,sr.xcentergrid,sr.ycentergrid,100)
+
+    """
+    x = np.asarray(x,dtype=np.float64)
+    y = np.asarray(y,dtype=np.float64)
+    if x.shape != y.shape:
+        raise Exception("kl_eigen_basis() error: x and y have different shapes")
+    npts = x.size
+    num_eig = int(min(num_eig,npts))
+    op = None
+    if npts > dense_max and num_eig < npts - 1:
+        if x.ndim == 2:
+            op = _stationary_cov_operator(struct,x,y,num_threads=num_threads)
+        if op is None:
+            op = _irregular_cov_operator(struct,x.ravel(),y.ravel(),num_threads=num_threads)
+    if op is None:
+        cov = _dense_covariance(struct,x.ravel(),y.ravel())
+        try:
+            from scipy.linalg import eigh
+            eig_vals,eig_vecs = eigh(cov,subset_by_index=[npts - num_eig,npts - 1])
+        except ImportError:
+            eig_vals,eig_vecs = np.linalg.eigh(cov)
+            eig_vals,eig_vecs = eig_vals[npts - num_eig:],eig_vecs[:,npts - num_eig:]
+    else:
+        from scipy.sparse.linalg import eigsh
+        eig_vals,eig_vecs = eigsh(op,k=num_eig,which="LA")
+    order = np.argsort(eig_vals)[::-1]
+    eig_vals,eig_vecs = eig_vals[order],eig_vecs[:,order]
+    # the first of the (near-) largest components, since symmetric grids give
+    # eigenvectors with pairs of equal-magnitude components
+    abs_vecs = np.abs(eig_vecs)
+    imax = (abs_vecs >= abs_vecs.max(axis=0) * (1.0 - 1.0e-6)).argmax(axis=0)
+    eig_vecs *= np.sign(eig_vecs[imax,np.arange(num_eig)])
+    return eig_vals,eig_vecs
+
+
+def _dense_covariance(struct,x,y):
+    """private method to get the covariance matrix between points x,y as a
+    2-D `numpy.ndarray`"""
+    names = ["p{0}".format(i) for i in range(x.shape[0])]
+    return struct.covariance_matrix(x,y,names=names).x
+
+
+def _stationary_cov_operator(struct,xgrid,ygrid,num_threads=1,tol=1.0e-6):
+    """private method to get a `scipy.sparse.linalg.LinearOperator` of the
+    covariance matrix between the nodes of a regular (uniformly-spaced, possibly
+    rotated) grid.  The mat-vec product is a (zero-padded) FFT convolution with
+    the covariance function evaluated at the grid lags.  Returns None if the
+    grid is not regular"""
+    from scipy.sparse.linalg import LinearOperator
+    try:
+        import scipy.fft as fft
+        fft_kwargs = {"workers":num_threads}
+    except ImportError:
+        fft = np.fft
+        fft_kwargs = {}
+    nrow,ncol = xgrid.shape
+    # the grid node coordinates must be an affine function of row and column
+    col_step = np.array([xgrid[0,1] - xgrid[0,0],ygrid[0,1] - ygrid[0,0]]) \
+        if ncol > 1 else np.zeros(2)
+    row_step = np.array([xgrid[1,0] - xgrid[0,0],ygrid[1,0] - ygrid[0,0]]) \
+        if nrow > 1 else np.zeros(2)
+    ii,jj = np.meshgrid(np.arange(nrow),np.arange(ncol),indexing="ij")
+    scale = max(np.ptp(xgrid),np.ptp(ygrid),1.0)
+    for grid,k in zip([xgrid,ygrid],[0,1]):
+        affine = grid[0,0] + jj * col_step[k] + ii * row_step[k]
+        if np.abs(grid - affine).max() > tol * scale:
+            return None
+
+    # covariance at every lag, wrapped into the circulant embedding
+    shape = (2 * nrow,2 * ncol)
+    di,dj = np.meshgrid(np.arange(-(nrow - 1),nrow),np.arange(-(ncol - 1),ncol),indexing="ij")
+    lag_x = (dj * col_step[0] + di * row_step[0]).ravel()
+    lag_y = (dj * col_step[1] + di * row_step[1]).ravel()
+    c = np.zeros(lag_x.shape[0])
+    for v in struct.variograms:
+        c += v.covariance_points(0.0,0.0,lag_x,lag_y)
+    c = c.reshape(di.shape)
+    c[nrow - 1,ncol - 1] += struct.nugget
+    circ = np.zeros(shape)
+    circ[di % shape[0],dj % shape[1]] = c
+    fft_circ = fft.rfft2(circ,**fft_kwargs)
+
+    def matvec(v):
+        v = np.asarray(v,dtype=np.float64).reshape(nrow,ncol)
+        conv = fft.irfft2(fft.rfft2(v,s=shape,**fft_kwargs) * fft_circ,s=shape,**fft_kwargs)
+        return conv[:nrow,:ncol].ravel()
+
+    npts = nrow * ncol
+    return LinearOperator((npts,npts),matvec=matvec,dtype=np.float64)
+
+
+def _irregular_cov_operator(struct,x,y,num_threads=1,max_density=0.25):
+    """private method to get a matrix-free operator of the covariance matrix
+    between (irregularly-spaced) points.  For structures with finite range, this
+    is the sparse matrix of the point pairs in range (unless more than
+    `max_density` of the pairs are in range), otherwise a
+    `scipy.sparse.linalg.LinearOperator` that calculates the covariance tiles
+    during each product"""
+    radius = _covariance_range(struct)
+    if radius is not None:
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            cKDTree = None
+        if cKDTree is not None:
+            tree = cKDTree(np.column_stack((x,y)))
+            if tree.count_neighbors(tree,radius) <= max_density * x.shape[0] ** 2:
+                return _neighbourhood_covariance(struct,x,y,tree,radius)
+    return _tiled_cov_operator(struct,x,y,num_threads=num_threads)
+
+
+def _covariance_range(struct):
+    """private method to get the distance beyond which the covariance implied by
+    `struct` is zero, or None if the support of any variogram is infinite"""
+    radius = 0.0
+    for v in struct.variograms:
+        if not isinstance(v,pyemu.geostats.SphVario):
+            return None
+        # the anisotropy scales distances along the minor axis
+        radius = max(radius,v.a * max(1.0,1.0 / v.anisotropy))
+    return radius
+
+
+def _neighbourhood_covariance(struct,x,y,tree,radius,chunk_size=1000000):
+    """private method to get the sparse covariance matrix of the point pairs
+    within `radius` (found with the `scipy.spatial.cKDTree` `tree`)"""
+    import scipy.sparse as sparse
+    pairs = tree.query_pairs(radius,output_type="ndarray")
+    i,j = pairs[:,0],pairs[:,1]
+    vals = np.zeros(i.shape[0])
+    diag = struct.nugget
+    for v in struct.variograms:
+        diag += float(v._h_function(np.zeros(1))[0])
+        for s in range(0,i.shape[0],chunk_size):
+            ii,jj = i[s:s + chunk_size],j[s:s + chunk_size]
+            dxx,dyy = v._apply_rotation(x[ii] - x[jj],y[ii] - y[jj])
+            vals[s:s + chunk_size] += v._h_function(np.sqrt(dxx * dxx + dyy * dyy))
+    npts = x.shape[0]
+    idx = np.arange(npts)
+    return sparse.csr_matrix((np.concatenate((vals,vals,np.full(npts,diag))),
+                              (np.concatenate((i,j,idx)),np.concatenate((j,i,idx)))),
+                             shape=(npts,npts))
+
+
+def _tiled_cov_operator(struct,x,y,tile_size=None,num_threads=1):
+    """private method to get a `scipy.sparse.linalg.LinearOperator` of the
+    covariance matrix between points.  Each product accumulates the (symmetric)
+    covariance tiles of point pairs one at a time, so only `tile_size` by
+    `tile_size` (default `geostats.TILE_SIZE`) blocks of the matrix are ever
+    in memory"""
+    from scipy.sparse.linalg import LinearOperator
+    from pyemu.utils.geostats import _tile_pairs,TILE_SIZE
+    npts = x.shape[0]
+    pairs = _tile_pairs(npts,TILE_SIZE if tile_size is None else int(tile_size))
+
+    def tile_product(pair,v):
+        rs,re,cs,ce = pair
+        c = struct._covariance_tile(x[rs:re],y[rs:re],x[cs:ce],y[cs:ce])
+        if rs == cs:
+            c[np.diag_indices_from(c)] += struct.nugget
+            return c.dot(v[cs:ce]),None
+        return c.dot(v[cs:ce]),c.T.dot(v[rs:re])
+
+    def matmat(v):
+        v = np.asarray(v,dtype=np.float64)
+        shape = v.shape
+        v = v.reshape(npts,-1)
+        out = np.zeros_like(v)
+        if num_threads > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=num_threads) as pool:
+                results = pool.map(lambda pair: tile_product(pair,v),pairs)
+                for (rs,re,cs,ce),(upper,lower) in zip(pairs,results):
+                    out[rs:re] += upper
+                    if lower is not None:
+                        out[cs:ce] += lower
+        else:
+            for rs,re,cs,ce in pairs:
+                upper,lower = tile_product((rs,re,cs,ce),v)
+                out[rs:re] += upper
+                if lower is not None:
+                    out[cs:ce] += lower
+        return out.reshape(shape)
+
+    return LinearOperator((npts,npts),matvec=matmat,matmat=matmat,dtype=np.float64)
+
+
+def _eigen_basis_to_factors(nrow, ncol, basis, eig_names, **kwargs):
+    """private method to wrap a dense (nrow * ncol by number of eigen vectors)
+    basis in a `pyemu.geostats.KrigeFactors` instance"""
+    nnode,neig = basis.shape
+    assert nrow * ncol == nnode
+    indptr = np.arange(nnode + 1,dtype=np.int64) * neig
+    indices = np.tile(np.arange(neig,dtype=np.int32),nnode)
+    return pyemu.geostats.KrigeFactors(nrow,ncol,eig_names,indptr,indices,
+                                       basis.ravel(),**kwargs)
 
 
 def kl_apply(par_file, basis_file,par_to_file_dict,arr_shape):
@@ -474,16 +782,21 @@ def kl_apply(par_file, basis_file,par_to_file_dict,arr_shape):
     Args:
         par_file (`str`): the csv file to get factor values from.  Must contain
             the following columns: "name", "new_val", "org_val"
-        basis_file (`str`): the PEST-style binary file that contains the reduced
-            basis
+        basis_file (`str`): the binary file that contains the reduced
+            basis (see `helpers.kl_setup()`).  A PEST-style binary (e.g. jco) file
+            of the (grid node by eigen vector) basis is also accepted
         par_to_file_dict (`dict`): a mapping from KL parameter prefixes to array
             file names.
         arr_shape (tuple): a length 2 tuple of number of rows and columns
             the resulting arrays should have.
 
-        Note:
-            This is the companion function to kl_setup.
-            This function should be called during the forward run
+    Note:
+        This is the companion function to kl_setup.
+        This function should be called during the forward run
+
+        the factors of each prefix are matched to the basis vectors by the
+        integer suffix of the parameter names and all arrays are calculated
+        with a single basis-by-factors matrix product
 
     """
     df = pd.read_csv(par_file)
@@ -491,25 +804,48 @@ def kl_apply(par_file, basis_file,par_to_file_dict,arr_shape):
     assert "org_val" in df.columns
     assert "new_val" in df.columns
 
-    df.loc[:,"prefix"] = df.name.apply(lambda x: x[:-4])
-    for prefix in df.prefix.unique():
-        assert prefix in par_to_file_dict.keys(),"missing prefix:{0}".\
-            format(prefix)
-    basis = pyemu.Matrix.from_binary(basis_file)
-    assert basis.shape[1] == arr_shape[0] * arr_shape[1]
+    df = df.loc[~df.name.str.endswith("mean"),:]
+    names = df.name.values.astype(str)
+    prefix = np.empty(names.shape[0],dtype=object)
+    # longest matching prefix, so that overlapping prefixes are resolved
+    for p in sorted(par_to_file_dict.keys(),key=len):
+        rest = np.array([n[len(p):] for n in names],dtype=str)
+        match = np.char.startswith(names,p) & np.char.isdigit(rest)
+        prefix[match] = p
+    if pd.isnull(prefix).any():
+        raise Exception("kl_apply() error: missing prefix for pars: {0}".
+                        format(','.join(names[pd.isnull(prefix)])))
+
+    with open(basis_file,"rb") as f:
+        is_factors = f.read(len(pyemu.geostats.KrigeFactors.magic)) == \
+                     pyemu.geostats.KrigeFactors.magic
+    if is_factors:
+        kf = pyemu.geostats.KrigeFactors.from_binary(basis_file)
+        nnode,neig = kf.nnode,len(kf.point_names)
+    else:
+        basis = pyemu.Matrix.from_binary(basis_file).x
+        nnode,neig = basis.shape
+    if nnode != arr_shape[0] * arr_shape[1]:
+        raise Exception("kl_apply() error: basis has {0} nodes, not {1}".
+                        format(nnode,arr_shape[0] * arr_shape[1]))
     arr_min = 1.0e-10 # a temp hack
 
-    #means = df.loc[df.name.apply(lambda x: x.endswith("mean")),:]
-    #print(means)
-    df = df.loc[df.name.apply(lambda x: not x.endswith("mean")),:]
-    for prefix,filename in par_to_file_dict.items():
-        factors = pyemu.Matrix.from_dataframe(df.loc[df.prefix==prefix,["new_val"]])
-        factors.autoalign = False
-        basis_prefix = basis[:factors.shape[0],:]
-        arr = (factors.T * basis_prefix).x.reshape(arr_shape)
-        #arr += means.loc[means.prefix==prefix,"new_val"].values
+    prefixes = list(par_to_file_dict.keys())
+    factors = np.zeros((neig,len(prefixes)))
+    for j,p in enumerate(prefixes):
+        pdf = df.loc[prefix == p,:]
+        idx = np.array([int(n[len(p):]) for n in pdf.name.astype(str)],dtype=int)
+        if idx.shape[0] > 0 and idx.max() >= neig:
+            raise Exception("kl_apply() error: more factors than basis vectors for " +
+                            "prefix {0}".format(p))
+        factors[idx,j] = pdf.new_val.values
+    if is_factors:
+        arrs = kf.interpolate(factors)
+    else:
+        arrs = basis.dot(factors).T.reshape((len(prefixes),) + tuple(arr_shape))
+    for arr,filename in zip(arrs,par_to_file_dict.values()):
         arr[arr<arr_min] = arr_min
-        np.savetxt(filename,arr,fmt="%20.8E")
+        write_array(filename,arr,fmt="%20.8E")
 
 
 def zero_order_tikhonov(pst, parbounds=True,par_groups=None,
@@ -526,6 +862,9 @@ def zero_order_tikhonov(pst, parbounds=True,par_groups=None,
         reset (`bool`): a flag to remove any existing prior information equations
             in the control file.  Default is True
 
+    Note:
+        the equations are built in bulk from the `parameter_data` columns
+
     Example::
 
         pst = pyemu.Pst("my.pst")
@@ -537,44 +876,51 @@ def zero_order_tikhonov(pst, parbounds=True,par_groups=None,
     if par_groups is None:
         par_groups = pst.par_groups
 
-    pilbl, obgnme, weight, equation = [], [], [], []
-    for idx, row in pst.parameter_data.iterrows():
-        pt = row["partrans"].lower()
-        try:
-            pt = pt.decode()
-        except:
-            pass
-        if pt not in ["tied", "fixed"] and\
-            row["pargp"] in par_groups:
-            pilbl.append(row["parnme"])
-            weight.append(1.0)
-            ogp_name = "regul"+row["pargp"]
-            obgnme.append(ogp_name[:12])
-            parnme = row["parnme"]
-            parval1 = row["parval1"]
-            if pt == "log":
-                parnme = "log(" + parnme + ")"
-                parval1 = np.log10(parval1)
-            eq = "1.0 * " + parnme + " ={0:15.6E}".format(parval1)
-            equation.append(eq)
-
-    if reset:
-        pst.prior_information = pd.DataFrame({"pilbl": pilbl,
-                                               "equation": equation,
-                                               "obgnme": obgnme,
-                                               "weight": weight})
-    else:
-        pi = pd.DataFrame({"pilbl": pilbl,
-                          "equation": equation,
-                          "obgnme": obgnme,
-                          "weight": weight})
-        pst.prior_information = pst.prior_information.append(pi)
+    pdata = pst.parameter_data
+    ptrans = _decoded_partrans(pdata)
+    keep = (~ptrans.isin(["tied","fixed"]) & pdata.pargp.isin(par_groups)).values
+    parnme = pdata.parnme.values[keep].astype(str)
+    islog = (ptrans.values[keep] == "log")
+    parval1 = pdata.parval1.values[keep].astype(np.float64)
+    with np.errstate(divide="ignore",invalid="ignore"):
+        parval1 = np.where(islog,np.log10(parval1),parval1)
+    parnme_eq = np.where(islog,np.char.add(np.char.add("log(",parnme),")"),parnme)
+    equation = np.char.add(np.char.add("1.0 * ",parnme_eq),
+                           np.char.mod(" =%15.6E",parval1))
+    obgnme = pd.Series(pdata.pargp.values[keep].astype(str)).radd("regul").str[:12]
+    pi = _pi_dataframe(parnme,equation,obgnme.values,np.ones(parnme.shape[0]))
+    _add_pi(pst,pi,reset)
     if parbounds:
         _regweight_from_parbound(pst)
     if pst.control_data.pestmode == "estimation":
         pst.control_data.pestmode = "regularization"
 
 
+def _decoded_partrans(pdata):
+    """private method to get the (lower case) partrans values of
+    `parameter_data`, decoding any bytes"""
+    return pdata.partrans.apply(lambda x: x.decode() if isinstance(x,bytes) else str(x)).\
+        str.lower()
+
+
+def _pi_dataframe(pilbl,equation,obgnme,weight):
+    """private method to build a prior information dataframe from arrays"""
+    df = pd.DataFrame({"pilbl": pilbl,
+                       "equation": equation,
+                       "obgnme": obgnme,
+                       "weight": weight})
+    df.index = df.pilbl
+    return df
+
+
+def _add_pi(pst,pi,reset):
+    """private method to set or append prior information equations"""
+    if reset or pst.prior_information.shape[0] == 0:
+        pst.prior_information = pi
+    else:
+        pst.prior_information = pd.concat([pst.prior_information,pi])
+
+
 def _regweight_from_parbound(pst):
     """sets regularization weights from parameter bounds
     which approximates the KL expansion.  Called by
@@ -584,21 +930,24 @@ def _regweight_from_parbound(pst):
 
     pst.parameter_data.index = pst.parameter_data.parnme
     pst.prior_information.index = pst.prior_information.pilbl
-    for idx, parnme in enumerate(pst.prior_information.pilbl):
-        if parnme in pst.parameter_data.index:
-            row = pst.parameter_data.loc[parnme, :]
-            lbnd,ubnd = row["parlbnd"], row["parubnd"]
-            if row["partrans"].lower() == "log":
-                weight = 1.0 / (np.log10(ubnd) - np.log10(lbnd))
-            else:
-                weight = 1.0 / (ubnd - lbnd)
-            pst.prior_information.loc[parnme, "weight"] = weight
-        else:
-            print("prior information name does not correspond" +\
-                  " to a parameter: " + str(parnme))
-
-
-def first_order_pearson_tikhonov(pst,cov,reset=True,abs_drop_tol=1.0e-3):
+    pilbl = pst.prior_information.pilbl
+    is_par = pilbl.isin(pst.parameter_data.index).values
+    if (~is_par).any():
+        print("{0} prior information names do not correspond".format(int((~is_par).sum())) +\
+              " to a parameter, e.g. " + str(pilbl.values[~is_par][0]))
+    rows = pst.parameter_data.loc[pilbl.values[is_par],:]
+    lbnd,ubnd = rows.parlbnd.values.astype(np.float64),rows.parubnd.values.astype(np.float64)
+    islog = (_decoded_partrans(rows) == "log").values
+    with np.errstate(divide="ignore",invalid="ignore"):
+        weight = np.where(islog,1.0 / (np.log10(ubnd) - np.log10(lbnd)),
+                          1.0 / (ubnd - lbnd))
+    weights = pst.prior_information.weight.values.astype(np.float64)
+    weights[is_par] = weight
+    pst.prior_information.loc[:,"weight"] = weights
+
+
+def first_order_pearson_tikhonov(pst,cov,reset=True,abs_drop_tol=1.0e-3,
+                                 tile_size=1000):
     """setup preferred-difference regularization from a covariance matrix.
 
 
@@ -612,11 +961,17 @@ def first_order_pearson_tikhonov(pst,cov,reset=True,abs_drop_tol=1.0e-3):
             are written. If the absolute value of the Pearson CC is less than
             abs_drop_tol, the prior information equation will not be included in
             the control file.
+        tile_size (`int`, optional): number of rows of the correlation matrix that
+            are calculated and thresholded at once.  Default is 1000
 
     Note:
         The weights on the prior information equations are the Pearson
         correlation coefficients implied by covariance matrix.
 
+        the correlation matrix is never formed: the coefficients are calculated
+        and thresholded one block of rows at a time, so only the retained
+        (sparse) parameter pairs are stored
+
     Example::
 
         pst = pyemu.Pst("my.pst")
@@ -626,46 +981,37 @@ def first_order_pearson_tikhonov(pst,cov,reset=True,abs_drop_tol=1.0e-3):
 
     """
     assert isinstance(cov,pyemu.Cov)
-    print("getting CC matrix")
-    cc_mat = cov.to_pearson()
-    #print(pst.parameter_data.dtypes)
-    try:
-        ptrans = pst.parameter_data.partrans.apply(lambda x:x.decode()).to_dict()
-    except:
-        ptrans = pst.parameter_data.partrans.to_dict()
+    ptrans = _decoded_partrans(pst.parameter_data)
+    ptrans.index = pst.parameter_data.parnme.values
+    names = np.array(cov.row_names,dtype=str)
+    adj = np.where(pd.Index(names).isin(pst.adj_par_names))[0]
+    ii,jj,cc = [],[],[]
+    if not cov.isdiagonal and adj.shape[0] > 1:
+        std = np.sqrt(np.diag(cov.x)[adj])
+        for start in range(0,adj.shape[0],tile_size):
+            end = min(start + tile_size,adj.shape[0])
+            # only the upper triangle (in the order of cov) of each row block
+            block = cov.x[np.ix_(adj[start:end],adj[start + 1:])]
+            block = block / np.outer(std[start:end],std[start + 1:])
+            block[np.tril_indices(end - start,-1,m=block.shape[1])] = -np.inf
+            bi,bj = np.nonzero(block >= abs_drop_tol)
+            ii.append(bi + start)
+            jj.append(bj + start + 1)
+            cc.append(block[bi,bj])
+    ii = np.concatenate(ii) if len(ii) > 0 else np.zeros(0,dtype=int)
+    jj = np.concatenate(jj) if len(jj) > 0 else np.zeros(0,dtype=int)
+    cc = np.concatenate(cc) if len(cc) > 0 else np.zeros(0)
+
+    adj_names = names[adj]
+    islog = (ptrans.loc[adj_names] == "log").values
+    eq_names = np.where(islog,np.char.add(np.char.add("log(",adj_names),")"),adj_names)
     pi_num = pst.prior_information.shape[0] + 1
-    pilbl, obgnme, weight, equation = [], [], [], []
-    sadj_names = set(pst.adj_par_names)
-    print("processing")
-    for i,iname in enumerate(cc_mat.row_names):
-        if iname not in sadj_names:
-            continue
-        for j,jname in enumerate(cc_mat.row_names[i+1:]):
-            if jname not in sadj_names:
-                continue
-            #print(i,iname,i+j+1,jname)
-            cc = cc_mat.x[i,j+i+1]
-            if cc < abs_drop_tol:
-                continue
-            pilbl.append("pcc_{0}".format(pi_num))
-            iiname = str(iname)
-            if str(ptrans[iname]) == "log":
-                iiname = "log("+iname+")"
-            jjname = str(jname)
-            if str(ptrans[jname]) == "log":
-                jjname = "log("+jname+")"
-            equation.append("1.0 * {0} - 1.0 * {1} = 0.0".\
-                            format(iiname,jjname))
-            weight.append(cc)
-            obgnme.append("regul_cc")
-            pi_num += 1
-    df = pd.DataFrame({"pilbl": pilbl,"equation": equation,
-                       "obgnme": obgnme,"weight": weight})
-    df.index = df.pilbl
-    if reset:
-        pst.prior_information = df
-    else:
-        pst.prior_information = pst.prior_information.append(df)
+    pilbl = np.char.add("pcc_",np.arange(pi_num,pi_num + cc.shape[0]).astype(str))
+    equation = np.char.add(np.char.add(np.char.add("1.0 * ",eq_names[ii]),
+                                       np.char.add(" - 1.0 * ",eq_names[jj])),
+                           " = 0.0")
+    df = _pi_dataframe(pilbl,equation,"regul_cc",cc)
+    _add_pi(pst,df,reset)
 
     if pst.control_data.pestmode == "estimation":
         pst.control_data.pestmode = "regularization"
@@ -1650,8 +1996,8 @@ class PstFromFlopyModel(object):
 
         """
         filename = os.path.split(u2d.filename)[-1]
-        np.savetxt(os.path.join(self.m.model_ws,self.arr_org,filename),
-                   u2d.array,fmt="%15.6E")
+        write_array(os.path.join(self.m.model_ws,self.arr_org,filename),
+                    u2d.array,fmt="%15.6E")
         return filename
 
     def _write_const_tpl(self, name, tpl_file, zn_array):
@@ -1950,8 +2296,8 @@ class PstFromFlopyModel(object):
         self.log("calling kl_setup() with factors file {0}".format(fac_file))
 
         kl_df = kl_setup(self.kl_num_eig,self.m.sr,self.kl_geostruct,kl_prefix,
-                         factors_file=fac_file,basis_file=fac_file+".basis.jcb",
-                         tpl_dir=self.m.model_ws)
+                         factors_file=fac_file,basis_file=fac_file+".basis",
+                         tpl_dir=self.m.model_ws,binary=True)
         self.logger.statement("{0} kl parameters created".
                               format(kl_df.shape[0]))
         self.logger.statement("kl 'pargp':{0}".
@@ -2084,8 +2430,8 @@ class PstFromFlopyModel(object):
         ones = np.ones((self.m.nrow,self.m.ncol))
         for mlt_file in mlt_df.mlt_file.unique():
             self.log("save test mlt array {0}".format(mlt_file))
-            np.savetxt(os.path.join(self.m.model_ws,mlt_file),
-                       ones,fmt="%15.6E")
+            write_array(os.path.join(self.m.model_ws,mlt_file),
+                        ones,fmt="%15.6E")
             self.log("save test mlt array {0}".format(mlt_file))
             tpl_files = mlt_df.loc[mlt_df.mlt_file == mlt_file, "tpl_file"]
             if tpl_files.unique().shape[0] != 1:
@@ -2951,55 +3297,107 @@ class PstFromFlopyModel(object):
             self.frun_post_lines.append(line)
 
 def _process_chunk_fac2real(chunk):
+    # each args dict holds all the pp files that share a factors file
     for args in chunk:
         pyemu.geostats.fac2real(**args)
 
 
-def _process_chunk_model_files(chunk, df):
-    for model_file in chunk:
-        _process_model_file(model_file, df)
+# multiplier arrays used for more than one model file, filled by the
+# `apply_array_pars()` workers
+_MULT_CACHE = {}
 
 
-def _process_model_file(model_file,df):
-    # find all mults that need to be applied to this array
-    df_mf = df.loc[df.model_file==model_file,:]
-    results = []
-    org_file = df_mf.org_file.unique()
-    if org_file.shape[0] != 1:
-        raise Exception("wrong number of org_files for {0}".
-                        format(model_file))
-    org_arr = np.loadtxt(org_file[0])
+def _array_par_tasks(df, cache_dir=None):
+    """build one task tuple (model_file, org_file, mlt_files, cache_flags,
+    upper_bound, lower_bound, cache_dir) for each unique model file in the
+    `apply_array_pars()` dataframe
+    """
+    mlt_counts = df.mlt_file.value_counts()
+    shared = set(mlt_counts.index[mlt_counts > 1])
+    tasks = []
+    for model_file, df_mf in df.groupby("model_file", sort=False):
+        org_file = df_mf.org_file.unique()
+        if org_file.shape[0] != 1:
+            raise Exception("wrong number of org_files for {0}".
+                            format(model_file))
+        bounds = []
+        for col, tag in zip(["upper_bound", "lower_bound"], ["upper", "lower"]):
+            if col not in df.columns:
+                bounds.append(None)
+                continue
+            vals = df_mf.loc[:, col].dropna().unique()
+            if vals.shape[0] > 1:
+                print(vals)
+                raise Exception("different {0} bound values for {1}".format(tag, org_file))
+            bounds.append(vals[0] if vals.shape[0] == 1 else None)
+        mlt_files = df_mf.mlt_file.tolist()
+        tasks.append((model_file, org_file[0], mlt_files,
+                      [m in shared for m in mlt_files], bounds[0], bounds[1],
+                      cache_dir))
+    return tasks
+
+
+def _process_chunk_model_files(chunk):
+    for task in chunk:
+        _process_model_file(*task)
+
+
+def _process_model_file(model_file, org_file, mlt_files, cache_flags, ub=None, lb=None,
+                        cache_dir=None):
+    org_arr = read_array(org_file, cache_dir=cache_dir)
+    if cache_dir is not None:
+        # the cached array is a read-only memory map
+        org_arr = np.array(org_arr)
+
+    for mlt, cache in zip(mlt_files, cache_flags):
+        if not cache:
+            org_arr *= read_array(mlt)
+            continue
+        if mlt not in _MULT_CACHE:
+            _MULT_CACHE[mlt] = read_array(mlt)
+        org_arr *= _MULT_CACHE[mlt]
+    if ub is not None:
+        org_arr[org_arr > ub] = ub
+    if lb is not None:
+        org_arr[org_arr < lb] = lb
+
+    write_array(model_file, np.atleast_2d(org_arr), fmt="%15.6E", delimiter='')
 
-    for mlt in df_mf.mlt_file:
-        org_arr *= np.loadtxt(mlt)
-    if "upper_bound" in df.columns:
-        ub_vals = df_mf.upper_bound.value_counts().dropna().to_dict()
-        if len(ub_vals) == 0:
-            pass
-        elif len(ub_vals) > 1:
-            print(ub_vals)
-            raise Exception("different upper bound values for {0}".format(org_file))
-        else:
-            ub = list(ub_vals.keys())[0]
-            org_arr[org_arr>ub] = ub
-    if "lower_bound" in df.columns:
-        lb_vals = df_mf.lower_bound.value_counts().dropna().to_dict()
-        if len(lb_vals) == 0:
+
+def _run_chunks(func, items, num_threads):
+    """apply `func` to contiguous chunks of `items` with a pool of (at most)
+    `num_threads` processes, or in this process if only one is needed
+    """
+    if len(items) == 0:
+        return
+    num_threads = max(1, min(int(num_threads), len(items)))
+    if num_threads == 1:
+        func(items)
+        return
+    # a few chunks per process to balance the load
+    chunk_len = int(np.ceil(len(items) / float(num_threads * 4)))
+    chunks = [items[i:i + chunk_len] for i in range(0, len(items), chunk_len)]
+    pool = mp.Pool(processes=num_threads)
+    try:
+        for _ in pool.imap_unordered(func, chunks):
             pass
-        elif len(lb_vals) > 1:
-            raise Exception("different lower bound values for {0}".format(org_file))
-        else:
-            lb = list(lb_vals.keys())[0]
-            org_arr[org_arr < lb] = lb
+    finally:
+        pool.close()
+        pool.join()
 
-    np.savetxt(model_file,np.atleast_2d(org_arr),fmt="%15.6E",delimiter='')
 
-def apply_array_pars(arr_par_file="arr_pars.csv"):
+def apply_array_pars(arr_par_file="arr_pars.csv", num_threads=None, cache_dir=None):
     """ a function to apply array-based multipler parameters.
 
     Args:
         arr_par_file (`str`): path to csv file detailing parameter array multipliers.
             This file is written by PstFromFlopy.
+        num_threads (`int`, optional): maximum number of processes to use.  If None,
+            `multiprocessing.cpu_count()` is used.  Default is None
+        cache_dir (`str`, optional): directory to keep binary copies of the original
+            (`org_file`) arrays in so that they are only parsed again if they change.
+            See `pyemu.array_utils.read_array()`.  If None, the original arrays are
+            read every time.  Default is None
 
     Note:
         Used to implement the parameterization constructed by
@@ -3008,14 +3406,21 @@ def apply_array_pars(arr_par_file="arr_pars.csv"):
         This function should be added to the forward_run.py script but can
         be called on any correctly formatted csv
 
-        This function using multiprocessing, spawning one process for each
-        model input array (and optionally pp files).  This speeds up
-        execution time considerably but means you need to make sure your
-        forward run script uses the proper multiprocessing idioms for
-        freeze support and main thread handling.
+        This function uses a pool of (at most) `num_threads` processes to
+        interpolate the pilot point files and to produce the model input
+        arrays.  This speeds up execution time considerably but means you
+        need to make sure your forward run script uses the proper multiprocessing
+        idioms for freeze support and main thread handling.  If only one process
+        is needed, the work is done in the calling process.
+
+        multiplier arrays that are used for more than one model input array
+        (e.g. constant or zone multipliers shared across stress periods) are
+        only read once by each process.
 
     """
     df = pd.read_csv(arr_par_file,index_col=0)
+    if num_threads is None:
+        num_threads = mp.cpu_count()
     # for fname in df.model_file:
     #     try:
     #         os.remove(fname)
@@ -3027,48 +3432,36 @@ def apply_array_pars(arr_par_file="arr_pars.csv"):
         pp_df = df.loc[df.pp_file.notna(),
                        ['pp_file', 'fac_file', 'mlt_file']].rename(
             columns={'fac_file': 'factors_file', 'mlt_file': 'out_file'})
-        pp_df.loc[:, 'lower_lim'] = 1.0e-10
         # don't need to process all (e.g. if const. mults apply across kper...)
-        pp_args = pp_df.drop_duplicates().to_dict('records')
-        num_ppargs = len(pp_args)
-        chunk_len = 50
-        num_chunk_floor = num_ppargs // chunk_len
-        main_chunks = np.array(pp_args)[:num_chunk_floor * chunk_len].reshape(
-            [-1, chunk_len]).tolist()
-        remainder = np.array(pp_args)[num_chunk_floor * chunk_len:].tolist()
-        chunks = main_chunks + [remainder]
-        procs = []
-        for chunk in chunks:
-            p = mp.Process(target=_process_chunk_fac2real, args=[chunk])
-            p.start()
-            procs.append(p)
-        for p in procs:
-            p.join()
-
+        pp_df = pp_df.drop_duplicates()
+        # interpolate all the pp files that share a factors file in one pass
+        pp_args = [{"pp_file":list(g.pp_file),"factors_file":fac_file,
+                    "out_file":list(g.out_file),"lower_lim":1.0e-10}
+                   for fac_file,g in pp_df.groupby("factors_file",sort=False)]
+        _run_chunks(_process_chunk_fac2real, pp_args, num_threads)
         print("finished fac2real",datetime.now())
 
     print("starting arr mlt",datetime.now())
-    uniq = df.model_file.unique()  # unique model input files to be produced
-    num_uniq = len(uniq)  # number of input files to be produced
-    # number of files to send to each processor
-    chunk_len = 50  # - this may not be the optimum number,
-    # sure there is some cleverway of working it out
-    # lazy plitting the files to be processed into even chunks
-    num_chunk_floor = num_uniq // chunk_len  # number of whole chunks
-    main_chunks = uniq[:num_chunk_floor * chunk_len].reshape(
-        [-1, chunk_len]).tolist()  # the list of files broken down into chunks
-    remainder = uniq[num_chunk_floor * chunk_len:].tolist()  # remaining files
-    chunks = main_chunks + [remainder]
-    procs = []
-    for chunk in chunks:  # now only spawn processor for each chunk
-        p = mp.Process(target=_process_chunk_model_files, args=[chunk, df])
-        p.start()
-        procs.append(p)
-    for p in procs:
-        p.join()
+    # one task for each unique model input file to be produced
+    tasks = _array_par_tasks(df, cache_dir=cache_dir)
+    _MULT_CACHE.clear()
+    try:
+        _run_chunks(_process_chunk_model_files, tasks, num_threads)
+    finally:
+        _MULT_CACHE.clear()
     print("finished arr mlt", datetime.now())
 
 
+# the (zero-based) index columns of list-type boundary condition files
+_LIST_INDEX_COLS = ["k", "i", "j", "inode", 'irow1', 'icol1', 'irow2', 'icol2']
+
+
+def _list_kij_codes(k, i, j):
+    """unique integer codes for zero-based (k,i,j) cell indices"""
+    k, i, j = [np.asarray(a).astype(np.int64) for a in [k, i, j]]
+    return (k * 2 ** 21 + i) * 2 ** 21 + j
+
+
 def apply_list_pars():
     """ a function to apply boundary condition multiplier parameters.
 
@@ -3080,6 +3473,12 @@ def apply_list_pars():
 
         Should be added to the forward_run.py script
 
+        Boundary condition rows are matched to spatial multipliers with integer
+        (k,i,j) codes.  The multiplier lookup is reused across stress period files
+        that list the same cells, both temporal and spatial multipliers are applied
+        in one pass over each file and the files are written with
+        `pyemu.array_utils.write_array()`
+
 
     """
     temp_file = "temporal_list_pars.dat"
@@ -3106,71 +3505,65 @@ def apply_list_pars():
         for f in os.listdir(mlt_dir):
             pak = f.split(".")[0].lower()
             df = pd.read_csv(os.path.join(mlt_dir,f),index_col=0, delim_whitespace=True)
-            #if pak != 'hfb6':
-            df.index = df.apply(lambda x: "{0:02.0f}{1:04.0f}{2:04.0f}".format(x.k,x.i,x.j),axis=1)
-            # else:
-            #     df.index = df.apply(lambda x: "{0:02.0f}{1:04.0f}{2:04.0f}{2:04.0f}{2:04.0f}".format(x.k, x.irow1, x.icol1,
-            #                                                                      x.irow2, x.icol2), axis = 1)
             if pak in sp_mlts.keys():
                 raise Exception("duplicate multplier csv for pak {0}".format(pak))
             if df.shape[0] == 0:
                 raise Exception("empty dataframe for spatial list file: {0}".format(f))
-            sp_mlts[pak] = df
+            codes = pd.Index(_list_kij_codes(df.k.values, df.i.values, df.j.values))
+            if not codes.is_unique:
+                raise Exception("duplicate k,i,j entries in spatial list file: {0}".format(f))
+            sp_mlts[pak] = {"df":df, "codes":codes, "cache":None}
+
+    # the dtype names and temporal multipliers of each list file
+    names_dict, temp_mlts = {}, {}
+    if temp_df is not None:
+        for fname, temp_df_fname in temp_df.groupby("split_filename", sort=False):
+            names_dict[fname] = temp_df_fname.dtype_names.iloc[0].split(',')
+            temp_mlts[fname] = list(zip(temp_df_fname.col, temp_df_fname.val))
+    if spat_df is not None:
+        for fname, spat_df_fname in spat_df.groupby("split_filename", sort=False):
+            names_dict[fname] = spat_df_fname.dtype_names.iloc[0].split(',')
 
     org_files = os.listdir(org_dir)
-    #for fname in df.filename.unique():
     for fname in org_files:
-        # need to get the PAK name to handle stupid horrible expceptions for HFB...
-        # try:
-        #     pakspat = sum([True if fname in i else False for i in spat_df.filename])
-        #     if pakspat:
-        #         pak = spat_df.loc[spat_df.filename.str.contains(fname)].pak.values[0]
-        #     else:
-        #         pak = 'notHFB'
-        # except:
-        #     pak = "notHFB"
-
-        names = None
-        if temp_df is not None and fname in temp_df.split_filename.values:
-            temp_df_fname = temp_df.loc[temp_df.split_filename==fname,:]
-            if temp_df_fname.shape[0] > 0:
-                names = temp_df_fname.dtype_names.iloc[0].split(',')
-        if spat_df is not None and fname in spat_df.split_filename.values:
-            spat_df_fname = spat_df.loc[spat_df.split_filename == fname, :]
-            if spat_df_fname.shape[0] > 0:
-                names = spat_df_fname.dtype_names.iloc[0].split(',')
-        if names is not None:
-
-            df_list = pd.read_csv(os.path.join(org_dir, fname),
-                                  delim_whitespace=True, header=None, names=names)
-            df_list.loc[:, "idx"] = df_list.apply(lambda x: "{0:02.0f}{1:04.0f}{2:04.0f}".format(x.k-1, x.i-1, x.j-1), axis=1)
-
-
-            df_list.index = df_list.idx
-            pak_name = fname.split('_')[0].lower()
-            if pak_name in sp_mlts:
-                mlt_df = sp_mlts[pak_name]
-                mlt_df_ri = mlt_df.reindex(df_list.index)
-                for col in df_list.columns:
-                    if col in ["k","i","j","inode",'irow1','icol1','irow2','icol2','idx']:
+        names = names_dict.get(fname, None)
+        if names is None:
+            continue
+        df_list = pd.read_csv(os.path.join(org_dir, fname),
+                              delim_whitespace=True, header=None, names=names)
+        vals = df_list.values.astype(np.float64)
+        col_idx = {name: i for i, name in enumerate(names)}
+
+        pak_name = fname.split('_')[0].lower()
+        if pak_name in sp_mlts:
+            mlt = sp_mlts[pak_name]
+            codes = _list_kij_codes(vals[:, col_idx["k"]] - 1, vals[:, col_idx["i"]] - 1,
+                                    vals[:, col_idx["j"]] - 1)
+            # most stress periods list the same cells, so the aligned multipliers
+            # from the last file are reused
+            if mlt["cache"] is None or not np.array_equal(mlt["cache"][0], codes):
+                idx = mlt["codes"].get_indexer(codes)
+                aligned = {}
+                for col in names:
+                    if col in _LIST_INDEX_COLS or col not in mlt["df"].columns:
                         continue
-                    if col in mlt_df.columns:
-                       # print(mlt_df.loc[mlt_df.index.duplicated(),:])
-                       # print(df_list.loc[df_list.index.duplicated(),:])
-                        df_list.loc[:,col] *= mlt_df_ri.loc[:,col].values
-
-            if temp_df is not None and fname in temp_df.split_filename.values:
-                temp_df_fname = temp_df.loc[temp_df.split_filename == fname, :]
-                for col,val in zip(temp_df_fname.col,temp_df_fname.val):
-                     df_list.loc[:,col] *= val
-            fmts = ''
-            for name in names:
-                if name in ["i","j","k","inode",'irow1','icol1','irow2','icol2']:
-                    fmts += " %9d"
-                else:
-                    fmts += " %9G"
-        np.savetxt(os.path.join(model_ext_path, fname), df_list.loc[:, names].values, fmt=fmts)
-
+                    m = mlt["df"].loc[:, col].values.astype(np.float64)[idx]
+                    # cells without a multiplier get NaN, the same as reindex()
+                    m[idx < 0] = np.NaN
+                    aligned[col] = m
+                mlt["cache"] = (codes, aligned)
+            for col, m in mlt["cache"][1].items():
+                vals[:, col_idx[col]] *= m
+
+        for col, val in temp_mlts.get(fname, []):
+            vals[:, col_idx[col]] *= val
+        fmts = ''
+        for name in names:
+            if name in _LIST_INDEX_COLS:
+                fmts += " %9d"
+            else:
+                fmts += " %9G"
+        write_array(os.path.join(model_ext_path, fname), vals, fmt=fmts)
 
 
 def write_const_tpl(name, tpl_file, suffix, zn_array=None,
@@ -1,7 +1,7 @@
 """Pilot point support utilities
 """
 import os
-import copy
+import io
 import numpy as np
 import pandas as pd
 pd.options.display.max_colwidth = 100
@@ -79,7 +79,6 @@ def setup_pilotpoints_grid(ml=None,sr=None,ibound=None,prefix_dict=None,
         ycentergrid = sr.ycentergrid
     except Exception as e:
         raise Exception("error getting xcentergrid and/or ycentergrid from 'sr':{0}".format(str(e)))
-    start = int(float(every_n_cell) / 2.0)
 
     #build a generic prefix_dict
     if prefix_dict is None:
@@ -110,8 +109,6 @@ def setup_pilotpoints_grid(ml=None,sr=None,ibound=None,prefix_dict=None,
     #    raise Exception("error getting model.bas6.ibound:{0}".format(str(e)))
     par_info = []
     pp_files,tpl_files = [],[]
-    pp_names = copy.copy(PP_NAMES)
-    pp_names.extend(["k","i","j"])
 
     if not np.all([isinstance(v, dict) for v in ibound.values()]):
         ibound = {"general_zn": ibound}
@@ -119,41 +116,14 @@ def setup_pilotpoints_grid(ml=None,sr=None,ibound=None,prefix_dict=None,
     par_keys.sort()
     for par in par_keys:
         for k in range(len(ibound[par])):
-            pp_df = None
             ib = ibound[par][k]
             assert ib.shape == xcentergrid.shape,"ib.shape != xcentergrid.shape for k {0}".\
                 format(k)
-            pp_count = 0
             #skip this layer if not in prefix_dict
             if k not in prefix_dict.keys():
                 continue
-            #cycle through rows and cols
-            for i in range(start,ib.shape[0]-start,every_n_cell):
-                for j in range(start,ib.shape[1]-start,every_n_cell):
-                    # skip if this is an inactive cell
-                    if ib[i,j] == 0:
-                        continue
-
-                    # get the attributes we need
-                    x = xcentergrid[i,j]
-                    y = ycentergrid[i,j]
-                    name = "pp_{0:04d}".format(pp_count)
-                    parval1 = 1.0
-
-                    #decide what to use as the zone
-                    zone = 1
-                    if use_ibound_zones:
-                        zone = ib[i,j]
-                    #stick this pilot point into a dataframe container
-
-                    if pp_df is None:
-                        data = {"name": name, "x": x, "y": y, "zone": zone,
-                                "parval1": parval1, "k":k, "i":i, "j":j}
-                        pp_df = pd.DataFrame(data=data,index=[0],columns=pp_names)
-                    else:
-                        data = [name, x, y, zone, parval1, k, i, j]
-                        pp_df.loc[pp_count,:] = data
-                    pp_count += 1
+            pp_df = _grid_pilot_points(ib,xcentergrid,ycentergrid,k,every_n_cell,
+                                       use_ibound_zones)
             #if we found some acceptable locs...
             if pp_df is not None:
                 for prefix in prefix_dict[k]:
@@ -181,7 +151,7 @@ def setup_pilotpoints_grid(ml=None,sr=None,ibound=None,prefix_dict=None,
 
     par_info = pd.concat(par_info)
     for field in ["k","i","j"]:
-        par_info.loc[:,field] = par_info.loc[:,field].apply(np.int)
+        par_info.loc[:,field] = par_info.loc[:,field].astype(int)
     for key,default in pst_config["par_defaults"].items():
         if key in par_info.columns:
             continue
@@ -208,9 +178,9 @@ def setup_pilotpoints_grid(ml=None,sr=None,ibound=None,prefix_dict=None,
             else:
                 raise Exception("unrecognized field type in par_info:{0}:{1}".format(name,dtype))
 
-        #some pandas awesomeness..
-        par_info.apply(lambda x:shp.point(x.x,x.y), axis=1)
-        par_info.apply(lambda x:shp.record(*x),axis=1)
+        for rec in par_info.itertuples(index=False):
+            shp.point(rec.x,rec.y)
+            shp.record(*rec)
         try:
             shp.save(shapename)
         except:
@@ -221,6 +191,32 @@ def setup_pilotpoints_grid(ml=None,sr=None,ibound=None,prefix_dict=None,
     return par_info
 
 
+def _grid_pilot_points(ib,xcentergrid,ycentergrid,k,every_n_cell=4,
+                       use_ibound_zones=False):
+    """ the pilot points of one layer of a regularly-spaced grid: every
+    `every_n_cell` row and column, starting `every_n_cell`/2 cells from the
+    edges, in the active (non-zero) cells of `ib`.  Returns None if there are
+    no active pilot point locations.
+    """
+    start = int(float(every_n_cell) / 2.0)
+    ii,jj = np.meshgrid(np.arange(start,ib.shape[0]-start,every_n_cell),
+                        np.arange(start,ib.shape[1]-start,every_n_cell),indexing="ij")
+    ii,jj = ii.ravel(),jj.ravel()
+    active = ib[ii,jj] != 0
+    ii,jj = ii[active],jj[active]
+    if ii.shape[0] == 0:
+        return None
+    if use_ibound_zones:
+        zone = ib[ii,jj].astype(np.float64)
+    else:
+        zone = np.ones(ii.shape[0])
+    return pd.DataFrame({"name":["pp_{0:04d}".format(i) for i in range(ii.shape[0])],
+                         "x":xcentergrid[ii,jj],"y":ycentergrid[ii,jj],"zone":zone,
+                         "parval1":1.0,"k":float(k),"i":ii.astype(np.float64),
+                         "j":jj.astype(np.float64)},
+                        columns=PP_NAMES + ["k","i","j"])
+
+
 def pp_file_to_dataframe(pp_filename):
     """ read a pilot point file to a pandas Dataframe
 
@@ -238,7 +234,7 @@ def pp_file_to_dataframe(pp_filename):
 
     df = pd.read_csv(pp_filename, delim_whitespace=True,
                      header=None, names=PP_NAMES,usecols=[0,1,2,3,4])
-    df.loc[:,"name"] = df.name.apply(str).apply(str.lower)
+    df.loc[:,"name"] = df.name.astype(str).str.lower()
     return df
 
 def pp_tpl_to_dataframe(tpl_filename):
@@ -260,15 +256,16 @@ def pp_tpl_to_dataframe(tpl_filename):
         df = pyemu.pp_utils.pp_tpl_file_to_dataframe("my_pp.dat.tpl")
 
     """
-    inlines = open(tpl_filename, 'r').readlines()
-    header = inlines.pop(0)
+    with open(tpl_filename, 'r') as f:
+        header = f.readline()
+        body = f.read()
     marker = header.strip().split()[1]
     assert len(marker) == 1
     usecols = [0,1,2,3]
-    df = pd.read_csv(tpl_filename, delim_whitespace=True,skiprows=1,
+    df = pd.read_csv(io.StringIO(body), delim_whitespace=True,
                      header=None, names=PP_NAMES[:-1],usecols=usecols)
-    df.loc[:,"name"] = df.name.apply(str).apply(str.lower)
-    df["parnme"] = [i.split(marker)[1].strip() for i in inlines]
+    df.loc[:,"name"] = df.name.astype(str).str.lower()
+    df["parnme"] = [line.split(marker)[1].strip() for line in body.splitlines()]
 
 
     return df
@@ -345,12 +342,7 @@ def write_pp_file(filename,pp_df):
 
     """
     with open(filename,'w') as f:
-       f.write(pp_df.to_string(col_space=0,
-                                columns=PP_NAMES,
-                                formatters=PP_FMT,
-                                justify="right",
-                                header=False,
-                                index=False) + '\n')
+        f.write(_pp_to_string(pp_df,PP_NAMES,justify="right") + '\n')
 
 
 def pilot_points_to_tpl(pp_file,tpl_file=None,name_prefix=None):
@@ -385,31 +377,66 @@ def pilot_points_to_tpl(pp_file,tpl_file=None,name_prefix=None):
 
     if name_prefix is not None:
         digits = str(len(str(pp_df.shape[0])))
-        fmt = "{0:0"+digits+"d}"
-        names = [name_prefix+fmt.format(i) for i in range(pp_df.shape[0])]
+        fmt = name_prefix.replace('%','%%') + "%0" + digits + "d"
+        names = [fmt % i for i in range(pp_df.shape[0])]
     else:
         names = pp_df.name.copy()
 
-    too_long = []
-    for name in names:
-        if len(name) > 12:
-            too_long.append(name)
+    too_long = [name for name in names if len(name) > 12]
     if len(too_long) > 0:
         raise Exception("the following parameter names are too long:" +\
                         ",".join(too_long))
 
-    tpl_entries = ["~    {0}    ~".format(name) for name in names]
+    tpl_entries = ["~    %s    ~" % name for name in names]
     pp_df.loc[:,"tpl"] = tpl_entries
     pp_df.loc[:,"parnme"] = names
 
 
-    f_tpl = open(tpl_file,'w')
-    f_tpl.write("ptf ~\n")
-    f_tpl.write(pp_df.to_string(col_space=0,
-                              columns=["name","x","y","zone","tpl"],
-                              formatters=PP_FMT,
-                              justify="left",
-                              header=False,
-                              index=False) + '\n')
+    with open(tpl_file,'w') as f_tpl:
+        f_tpl.write("ptf ~\n")
+        f_tpl.write(_pp_to_string(pp_df,["name","x","y","zone","tpl"],justify="left") + '\n')
 
     return pp_df
+
+
+# "%" versions of the PP_FMT formatters
+_PP_PCT_FMT = {"name": "%-20s ", "x": "%-20.10E ", "y": "%-20.10E ", "zone": "%-10d ",
+               "tpl": "%-20s ", "parval1": "%-20.10E "}
+
+
+def _pp_to_string(pp_df,columns,justify):
+    """ the `pp_df.to_string()` of `columns` formatted with `PP_FMT`, without
+    header or index.  Columns that format to the same width for every row
+    (the usual case) are formatted in bulk; otherwise pandas does the
+    justification
+    """
+    strs = []
+    for col in columns:
+        values = pp_df.loc[:,col].values
+        if PP_FMT[col] is SFMT:
+            if values.dtype != object or \
+                    any(isinstance(v,bytes) for v in values):
+                strs = None
+                break
+            values = [str(v) for v in values]
+        elif pd.isnull(values).any():
+            strs = None
+            break
+        fmt = _PP_PCT_FMT[col]
+        try:
+            col_strs = [fmt % v for v in values]
+        except (TypeError,ValueError):
+            strs = None
+            break
+        if len(set(map(len,col_strs))) > 1:
+            strs = None
+            break
+        strs.append(col_strs)
+    if strs is None or len(strs[0]) == 0:
+        return pp_df.to_string(col_space=0,
+                               columns=columns,
+                               formatters=PP_FMT,
+                               justify=justify,
+                               header=False,
+                               index=False)
+    return '\n'.join(map(' '.join,zip(*strs)))
@@ -1,6 +1,7 @@
 """PEST-style site sample (smp) file support utilities
 """
 import os
+import re
 import sys
 import platform
 import shutil
@@ -12,6 +13,7 @@ from datetime import datetime
 import numpy as np
 import pandas as pd
 from ..pyemu_warnings import PyemuWarning
+from .array_utils import format_array
 
 def smp_to_ins(smp_filename,ins_filename=None,use_generic_names=False,
                gwutils_compliant=False, datetime_format=None,prefix=''):
@@ -49,23 +51,29 @@ def smp_to_ins(smp_filename,ins_filename=None,use_generic_names=False,
     if ins_filename is None:
         ins_filename = smp_filename+".ins"
     df = smp_to_dataframe(smp_filename,datetime_format=datetime_format)
-    df.loc[:,"ins_strings"] = None
-    df.loc[:,"observation_names"] = None
-    name_groups = df.groupby("name").groups
-    for name,idxs in name_groups.items():
-        if not use_generic_names and len(name) <= 11:
-            onames = df.loc[idxs,"datetime"].apply(lambda x: prefix+name+'_'+x.strftime("%d%m%Y")).values
-        else:
-            onames = [prefix+name+"_{0:d}".format(i) for i in range(len(idxs))]
-        if False in (map(lambda x :len(x) <= 20,onames)):
-            long_names = [oname for oname in onames if len(oname) > 20]
-            raise Exception("observation names longer than 20 chars:\n{0}".format(str(long_names)))
-        if gwutils_compliant:
-            ins_strs = ["l1  ({0:s})39:46".format(on) for on in onames]
-        else:
-            ins_strs = ["l1 w w w  !{0:s}!".format(on) for on in onames]
-        df.loc[idxs,"observation_names"] = onames
-        df.loc[idxs,"ins_strings"] = ins_strs
+    names = df.loc[:,"name"].astype(str)
+    prefixed = prefix + names + '_'
+    # sites with short names get a date suffix, the rest a counter
+    # that follows the order of the site's records in the file
+    use_date = names.str.len().values <= 11
+    if use_generic_names:
+        use_date[:] = False
+    onames = prefixed + df.groupby("name",sort=False).cumcount().astype(str)
+    if use_date.any():
+        onames.loc[use_date] = prefixed.loc[use_date] + \
+            _strftime(df.loc[use_date,"datetime"],"%d%m%Y")
+    too_long = onames.str.len().values > 20
+    if too_long.any():
+        # report the long names of the first offending site
+        site = df.loc[too_long,"name"].min()
+        long_names = list(onames.loc[too_long & (df.name.values == site)])
+        raise Exception("observation names longer than 20 chars:\n{0}".format(str(long_names)))
+    if gwutils_compliant:
+        ins_strs = "l1  (" + onames + ")39:46"
+    else:
+        ins_strs = "l1 w w w  !" + onames + "!"
+    df.loc[:,"ins_strings"] = ins_strs.values
+    df.loc[:,"observation_names"] = onames.values
 
     counts = df.observation_names.value_counts()
     dup_sites = [name for name in counts.index if counts[name] > 1]
@@ -75,7 +83,8 @@ def smp_to_ins(smp_filename,ins_filename=None,use_generic_names=False,
 
     with open(ins_filename,'w') as f:
         f.write("pif ~\n")
-        [f.write(ins_str+"\n") for ins_str in df.loc[:,"ins_strings"]]
+        if df.shape[0] > 0:
+            f.write('\n'.join(df.loc[:,"ins_strings"]) + '\n')
     return df
 
 
@@ -90,7 +99,7 @@ def dataframe_to_smp(dataframe,smp_filename,name_col="name",
         dataframe (`pandas.DataFrame`): the dataframe to write to an SMP
             file.  This dataframe should be in "long" form - columns for
             site name, datetime, and value.
-        smp_filename (`str`): smp file to write
+        smp_filename (`str` or file handle): smp file to write
         name_col (`str`,optional): the name of the dataframe column
             that contains the site name.  Default is "name"
         datetime_col (`str`): the column in the dataframe that the
@@ -102,13 +111,15 @@ def dataframe_to_smp(dataframe,smp_filename,name_col="name",
         value_format (`str`, optional):  a python float-compatible format.
             Default is "{0:15.6E}".
 
+    Note:
+        Each unique datetime is formatted once and simple `value_format`
+        values (e, E, g or G) are formatted with `pyemu.array_utils.format_array()`
+
     Example::
 
         pyemu.smp_utils.dataframe_to_smp(df,"my.smp")
 
     """
-    formatters = {"name":lambda x:"{0:<20s}".format(str(x)[:max_name_len]),
-                  "value":lambda x:value_format.format(x)}
     if datetime_format.lower().startswith("d"):
         dt_fmt = "%d/%m/%Y    %H:%M:%S"
     elif datetime_format.lower().startswith("m"):
@@ -120,20 +131,53 @@ def dataframe_to_smp(dataframe,smp_filename,name_col="name",
     for col in [name_col,datetime_col,value_col]:
         assert col in dataframe.columns
 
-    dataframe.loc[:,"datetime_str"] = dataframe.loc[:,"datetime"].\
-        apply(lambda x:x.strftime(dt_fmt))
+    codes,uniques = pd.factorize(dataframe.loc[:,name_col].astype(str))
+    names = np.asarray(pd.Series(uniques,dtype=object).str[:max_name_len].str.ljust(20),
+                       dtype=object)[codes]
+    dt_strs = _strftime(dataframe.loc[:,datetime_col],dt_fmt)
+    vals = dataframe.loc[:,value_col].values.astype(np.float64)
+    spec = _VALUE_FORMAT.match(value_format)
+    if spec is not None and vals.shape[0] > 0:
+        text = format_array(vals,fmt='%'+spec.group(1))
+        # None unless all the values have the same width
+        width = text.index('\n')
+        if len(text) != vals.shape[0] * (width + 1):
+            width = None
+        val_strs = np.array(text.split('\n')[:-1],dtype=object)
+    else:
+        val_strs = np.array([value_format.format(v) for v in vals],dtype=object)
+        width = None
+    isnan = np.isnan(vals)
+    val_strs[isnan] = "NaN"
+    # values are right justified in a common width
+    if width is None or isnan.any():
+        val_strs = np.asarray(pd.Series(val_strs,dtype=object).str.rjust(
+            max(map(len,val_strs),default=0)),dtype=object)
+    lines = [' '.join(items).strip() for items in zip(names,dt_strs,val_strs)]
+
+    f = smp_filename
     if isinstance(smp_filename,str):
-        smp_filename = open(smp_filename,'w')
-        # need this to remove the leading space that pandas puts in front
-        s = dataframe.loc[:,[name_col,"datetime_str",value_col]].\
-                to_string(col_space=0,
-                          formatters=formatters,
-                          justify=None,
-                          header=False,
-                          index=False)
-        for ss in s.split('\n'):
-            smp_filename.write("{0:<s}\n".format(ss.strip()))
-    dataframe.pop("datetime_str")
+        f = open(smp_filename,'w')
+    try:
+        if len(lines) > 0:
+            f.write('\n'.join(lines) + '\n')
+    finally:
+        if isinstance(smp_filename,str):
+            f.close()
+
+
+# value formats that can be passed to format_array() as "%" formats
+_VALUE_FORMAT = re.compile(r"^\{0?:(\d*(?:\.\d+)?[eEgG])\}$")
+
+
+def _strftime(datetimes,fmt):
+    """ format a series of datetimes, formatting each unique datetime once
+    """
+    codes,uniques = pd.factorize(pd.to_datetime(datetimes.values))
+    if (codes < 0).any():
+        raise Exception("missing datetime values")
+    return pd.Series(np.asarray(uniques.strftime(fmt),dtype=object)[codes],
+                     index=datetimes.index)
 
 
 def _date_parser(items):
@@ -150,6 +194,26 @@ def _date_parser(items):
     return dt
 
 
+def _parse_datetimes(strs,datetime_format=None):
+    """ parse an array of unique "date time" strings.  Without a format, "%d/%m/%Y %H:%M:%S"
+    is tried for all the strings at once and "%m/%d/%Y %H:%M:%S" for those that fail
+    """
+    if datetime_format is not None:
+        return pd.to_datetime(strs,format=datetime_format)
+    dts = pd.to_datetime(strs,format="%d/%m/%Y %H:%M:%S",errors="coerce")
+    failed = np.asarray(dts.isna())
+    if failed.any():
+        dts = pd.Series(dts)
+        dts.loc[failed] = pd.to_datetime(strs[failed],format="%m/%d/%Y %H:%M:%S",
+                                         errors="coerce")
+        failed = dts.isna().values
+        if failed.any():
+            # raises with the message for the first bad string
+            _date_parser(strs[failed][0])
+        dts = pd.DatetimeIndex(dts)
+    return dts
+
+
 def smp_to_dataframe(smp_filename,datetime_format=None):
     """ load an smp file into a pandas dataframe
 
@@ -164,20 +228,25 @@ def smp_to_dataframe(smp_filename,datetime_format=None):
         `pandas.DataFrame`: a dataframe with index of datetime and columns of
         site names.  Missing values are set to NaN.
 
+    Note:
+        Each unique date and time pair is only parsed once
+
     Example::
 
         df = smp_to_dataframe("my.smp")
 
     """
 
-    if datetime_format is not None:
-        date_func = lambda x: datetime.strptime(x,datetime_format)
-    else:
-        date_func = _date_parser
     df = pd.read_csv(smp_filename, delim_whitespace=True,
-                     parse_dates={"datetime":["date","time"]},
                      header=None,names=["name","date","time","value"],
-                     dtype={"name":object,"value":np.float64},
-                     na_values=["dry"],
-                     date_parser=date_func)
+                     dtype={"name":object,"date":object,"time":object,
+                            "value":np.float64},
+                     na_values=["dry"])
+    date_codes,date_uniques = pd.factorize(df.pop("date"))
+    time_codes,time_uniques = pd.factorize(df.pop("time"))
+    pair_codes,pair_uniques = pd.factorize(date_codes * max(len(time_uniques),1) + time_codes)
+    strs = np.asarray(date_uniques,dtype=object)[pair_uniques // max(len(time_uniques),1)] + \
+           ' ' + np.asarray(time_uniques,dtype=object)[pair_uniques % max(len(time_uniques),1)]
+    dts = _parse_datetimes(strs,datetime_format)
+    df.insert(0,"datetime",np.asarray(dts)[pair_codes])
     return df